@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark alert evaluation throughput (readings per second)
+
+Builds a fleet of devices spread over locations, a rule set mixing
+per-device, per-location and global threshold / hysteresis / rate rules
+(10k rules over 5k devices by default) and streams random-walk readings
+through AlertEngine. Reports readings/s, rule checks per reading and how
+many alert transitions were produced.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gas_sight.alerts import AlertEngine, Rule  # noqa: E402
+from gas_sight.metrics import MetricsRegistry  # noqa: E402
+
+
+def rules(devices, locations, count, rng):
+    out = [
+        Rule("global_battery", "battery", "equals", "Low", severity="warning"),
+        Rule("global_signal", "connection_strength", "below", 20, clear=30),
+    ]
+    for n in range(locations):
+        out.append(Rule(f"loc_{n}_leak", "measurement", "below", -5.0, kind="rate",
+                        location=f"site_{n}", severity="critical"))
+    while len(out) < count:
+        device = f"dev_{rng.randrange(devices)}"
+        low = rng.uniform(10, 30)
+        out.append(Rule(f"rule_{len(out)}", rng.choice(("measurement", "tank_level")), "below",
+                        low, clear=low + 5, device_id=device))
+    return out
+
+
+def readings(devices, count, rng):
+    start = datetime(2025, 8, 14, tzinfo=timezone.utc)
+    levels = [rng.uniform(5, 95) for _ in range(devices)]
+    signal = [rng.randint(10, 100) for _ in range(devices)]
+    battery = [rng.choice(("Full", "Ok", "Ok", "Low")) for _ in range(devices)]
+    for n in range(count):
+        device = n % devices
+        levels[device] = min(100.0, max(0.0, levels[device] + rng.uniform(-3, 2.5)))
+        signal[device] = min(100, max(0, signal[device] + rng.randint(-5, 5)))
+        yield {
+            "device_id": f"dev_{device}",
+            "created_at": (start + timedelta(seconds=n)).isoformat(),
+            "measurement": round(levels[device], 1),
+            "tank_level": round(levels[device] * 1.2, 1),
+            "connection_strength": signal[device],
+            "battery": battery[device],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=5000)
+    parser.add_argument("--locations", type=int, default=100)
+    parser.add_argument("--rules", type=int, default=10000)
+    parser.add_argument("--readings", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    engine = AlertEngine(
+        rules(args.devices, args.locations, args.rules, rng),
+        {f"dev_{n}": f"site_{n % args.locations}" for n in range(args.devices)},
+        registry=MetricsRegistry(),
+    )
+    stream = list(readings(args.devices, args.readings, rng))
+
+    start = time.perf_counter()
+    transitions = 0
+    for reading in stream:
+        transitions += len(engine.process(reading))
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.rules} rules, {args.devices} devices, {args.readings} readings")
+    print(f"  {args.readings / elapsed:10.0f} readings/s")
+    print(f"  {engine.checks.value() / args.readings:10.1f} rule checks per reading")
+    print(f"  {transitions:10d} transitions, {len(engine.active())} firing")
+
+
+if __name__ == "__main__":
+    main()
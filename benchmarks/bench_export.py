@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark sensor_data export throughput (rows/s)
+
+Runs the PostgREST keyset path against the in-process stand-in, and the
+COPY path as well when SUPABASE_DB_URL points at a local Postgres.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gas_sight import config  # noqa: E402
+from gas_sight.export import export_sensor_data  # noqa: E402
+from gas_sight.local import LocalDatabase, LocalTransport  # noqa: E402
+from gas_sight.rest import RestClient  # noqa: E402
+
+
+def seed(db, rows, devices=20):
+    db.execute("begin")
+    for n in range(devices):
+        db.execute(
+            "insert into devices (id, name, mac_address, title) values (?, ?, ?, ?)",
+            (f"bench_{n}", f"@BENCH{n}", f"AA:BB:CC:DD:{n // 256:02X}:{n % 256:02X}", f"Bench {n}"),
+        )
+    db.conn.executemany(
+        "insert into sensor_data (id, device_id, title_name, tank_level, updated_refresh,"
+        " battery, connection_strength, measurement, technical_data, created_at)"
+        " values (?, ?, 'Bench', ?, 'now', 'Ok', 80, ?, '{}', ?)",
+        (
+            (f"00000000-0000-4000-8000-{i:012x}", f"bench_{i % devices}", i % 100, (i * 7) % 100,
+             f"2025-08-{1 + i // 86400 % 28:02d}T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.000000+00:00")
+            for i in range(rows)
+        ),
+    )
+    db.execute("commit")
+
+
+def run(label, **kwargs):
+    out = io.BytesIO()
+    start = time.perf_counter()
+    count = export_sensor_data(out, **kwargs)
+    seconds = time.perf_counter() - start
+    print(f"{label:<28} {count:>9} rows  {seconds:7.2f}s  {count / seconds:>10,.0f} rows/s"
+          f"  {len(out.getvalue()) / 1e6:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    db = LocalDatabase()
+    seed(db, args.rows)
+    client = RestClient(transport=LocalTransport(db), observers=[])
+    for fmt in ("csv", "ndjson"):
+        for compression in ("none", "gzip"):
+            run(f"rest {fmt}/{compression}", client=client, fmt=fmt, compression=compression)
+
+    dsn = config.database_dsn()
+    if dsn:
+        for fmt in ("csv", "ndjson"):
+            run(f"copy {fmt}/gzip", dsn=dsn, fmt=fmt, compression="gzip")
+    else:
+        print("SUPABASE_DB_URL not set; skipping the COPY path")
+
+
+if __name__ == "__main__":
+    main()
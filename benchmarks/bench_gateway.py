@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark gateway scheduling throughput (readings per minute per radio)
+
+Polls a fleet of simulated tanks through SimulatedRadio on a ScaledClock,
+so an hour of radio time takes seconds, and reports throughput and how
+stale readings get for each number of radio slots.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gas_sight.gateway import GatewayDevice, GatewayScheduler, ScaledClock, SimulatedRadio  # noqa: E402
+from gas_sight.metrics import MetricsRegistry  # noqa: E402
+
+
+def fleet(size, seed=7):
+    rng = random.Random(seed)
+    return [GatewayDevice(f"bench_{n}", rssi=rng.randint(-95, -50)) for n in range(size)]
+
+
+def run(devices, slots, minutes, speedup, interval):
+    clock = ScaledClock(speedup)
+    radio = SimulatedRadio(clock, seed=slots)
+    scheduler = GatewayScheduler(
+        fleet(devices), radio, slots=slots, interval=interval, clock=clock,
+        registry=MetricsRegistry(),
+    )
+    asyncio.run(scheduler.run(duration=minutes * 60))
+    stats = scheduler.stats()
+    now = clock.now()
+    ages = sorted(
+        now - d.last_read if d.last_read is not None else float("inf")
+        for d in scheduler.devices.values()
+    )
+    p95 = ages[int(len(ages) * 0.95) - 1]
+    print(f"{slots:>3} slots  {stats['readings']:>7} readings  {stats['failures']:>5} failed"
+          f"  {stats['readings_per_minute_per_slot']:6.1f} /min/radio  p95 age {p95:7.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--slots", default="1,2,4,8")
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=60)
+    parser.add_argument("--speedup", type=float, default=200)
+    args = parser.parse_args()
+
+    for slots in (int(s) for s in args.slots.split(",")):
+        run(args.devices, slots, args.minutes, args.speedup, args.interval)
+
+
+if __name__ == "__main__":
+    main()
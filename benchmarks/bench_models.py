@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark memory and decode time of reading models against plain dicts
+
+Builds a PostgREST response of N readings (1M by default, the full
+sensor_data row without technical_data) and decodes it as:
+
+* dicts (json.loads, what the scripts do today)
+* SensorReading objects (gas_sight.models, __slots__)
+* a ReadingBatch (gas_sight.models, struct of arrays, chart_point columns)
+
+Memory is what the decoded result keeps alive (tracemalloc), not the
+transient peak.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gas_sight.models import ReadingBatch, SensorReading  # noqa: E402
+
+
+def readings(count, devices=20, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    for n in range(count):
+        at = (start + timedelta(seconds=3 * n)).isoformat()
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "device_id": f"tank_{n % devices:03d}",
+            "title_name": f"Gas Tank #{n % devices}",
+            "tank_level": round(rng.uniform(0, 120), 1),
+            "tank_level_unit": "cm",
+            "updated_refresh": "1 minute ago",
+            "battery": ("Full", "Ok", "Low")[n % 3],
+            "connection_strength": rng.randint(40, 100),
+            "measurement": round(rng.uniform(0, 100), 1),
+            "measurement_unit": "%",
+            "created_at": at,
+            "updated_at": at,
+            "packet_seq": n,
+        }
+
+
+def measure(decode, body):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = decode(body)
+    seconds = time.perf_counter() - start
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    return seconds, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--readings", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    body = json.dumps(list(readings(args.readings))).encode()
+    decoders = {
+        "dicts": json.loads,
+        "SensorReading": SensorReading.from_json,
+        "ReadingBatch": ReadingBatch.from_json,
+    }
+
+    print(f"{args.readings:,} readings, {len(body):,} bytes of JSON")
+    print(f"{'model':<16}{'decode s':>10}{'retained MB':>14}{'bytes/reading':>15}")
+    for name, decode in decoders.items():
+        # time without tracemalloc overhead, memory with it
+        start = time.perf_counter()
+        decode(body)
+        seconds = time.perf_counter() - start
+        _, retained = measure(decode, body)
+        print(f"{name:<16}{seconds:>10.2f}{retained / 1e6:>14.1f}{retained / args.readings:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
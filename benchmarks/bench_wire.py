@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark wire size and parse time of a 1 month chart range
+
+Builds a month of one-minute readings for one tank (43,200 rows, with the
+technical_data the gateway stores) and compares what the client receives
+and how long decoding takes for:
+
+* select=* as JSON (what the charts used to request)
+* the chart_point projection as JSON
+* the chart_point projection as CSV (Accept: text/csv)
+* packed-v1 from the sensor_columns RPC
+
+Sizes are shown raw and gzipped, since PostgREST responses are usually
+compressed on the way out.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gas_sight.local import LocalTransport  # noqa: E402
+from gas_sight.wire import PROJECTIONS, pack, parse_csv, unpack  # noqa: E402
+
+
+def month(minutes, seed=7):
+    rng = random.Random(seed)
+    start = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    gas = 90.0
+    for n in range(minutes):
+        gas = max(0.0, gas - rng.uniform(0, 0.004))
+        at = (start + timedelta(minutes=n)).isoformat()
+        raw = bytes([int(gas), int(gas * 1.2) & 0xFF, 90, n >> 8 & 0xFF, n & 0xFF])
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "device_id": "device_main_tank_001",
+            "title_name": "Main Gas Tank #1",
+            "tank_level": round(gas * 1.2, 1),
+            "tank_level_unit": "cm",
+            "updated_refresh": "1 minute ago",
+            "battery": "Full",
+            "connection_strength": rng.randint(60, 95),
+            "measurement": round(gas, 1),
+            "measurement_unit": "%",
+            "technical_data": {"_technical": {
+                "timestamp": at, "source": "gateway",
+                "raw_data": {"hex": raw.hex(), "int": list(raw), "bytes": len(raw)},
+                "parsed_data": {"gas_level": round(gas, 1), "tank_level": round(gas * 1.2, 1),
+                                "battery_level": 90},
+                "packet_number": n % 65536,
+            }},
+            "created_at": at,
+            "updated_at": at,
+            "backfill_batch_id": None,
+            "packet_seq": n,
+            "packet_number": n % 65536,
+        }
+
+
+def timed(decode, body, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(body)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=int, default=30 * 24 * 60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = list(month(args.minutes))
+    lean = PROJECTIONS["chart_point"].split(",")
+    bodies = {
+        "select=* json": (json.dumps(rows).encode(), json.loads),
+        "chart_point json": (json.dumps([{c: r[c] for c in lean} for r in rows]).encode(), json.loads),
+        "chart_point csv": (LocalTransport._csv(rows, lean), lambda b: parse_csv(b.decode())),
+        "packed-v1": (json.dumps(pack(rows, ["device_main_tank_001"])).encode(),
+                      lambda b: unpack(json.loads(b))),
+    }
+
+    print(f"{len(rows)} readings (1 month at one per minute)")
+    print(f"{'format':<18}{'bytes':>12}{'gzipped':>12}{'parse ms':>10}")
+    for name, (body, decode) in bodies.items():
+        print(f"{name:<18}{len(body):>12,}{len(gzip.compress(body, 6)):>12,}"
+              f"{timed(decode, body, args.repeat) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+// Frame-time benchmark for the Charts data pipeline (see index.html).
+// Run `npm run dev` and open http://localhost:8080/benchmarks/chart-pipeline/
+import { differenceInMinutes, format, parseISO } from 'date-fns';
+import { concatSeries, gapMinutesFor, type ChartRow, type SeriesColumns } from '@/lib/chartPipeline';
+import type { ChartWorkerReply, ChartWorkerRequest } from '@/workers/chartData.worker';
+
+interface Reading extends ChartRow {
+  device_id: string;
+}
+
+interface Comment {
+  id: string;
+  sensor_data_id: string;
+  comment_text: string;
+}
+
+interface Point {
+  timestamp: Date;
+  time: string;
+  [key: string]: unknown;
+}
+
+interface Run {
+  firstLayout: number;
+  frameTimes: number[];
+  work: number[];
+}
+
+const TIME_FORMAT = 'HH:mm';
+const APPEND_EVERY = 30;
+const GAP_MINUTES = gapMinutesFor(0);
+
+// One reading every 3 s per device slot, with an hour-long outage every 5,000 readings
+const readings = (count: number, devices: number, from = 0): Reading[] => {
+  const start = Date.UTC(2025, 7, 1);
+  return Array.from({ length: count }, (_, i) => {
+    const n = from + i;
+    const at = start + n * 3000 + Math.floor(n / 5000) * 3_600_000;
+    return {
+      id: `00000000-0000-4000-8000-${n.toString(16).padStart(12, '0')}`,
+      device_id: `tank_${(n % devices).toString().padStart(3, '0')}`,
+      created_at: new Date(at).toISOString().replace('Z', '123+00:00'),
+      measurement: (n * 37) % 100,
+      tank_level: 20 + (n % 80),
+      connection_strength: 40 + (n % 60),
+      battery: ['Full', 'Ok', 'Low'][n % 3],
+    };
+  });
+};
+
+const commentsFor = (rows: Reading[]): Comment[] =>
+  rows.filter((_, n) => n % 500 === 0).map((row, n) => ({
+    id: `comment-${n}`, sensor_data_id: row.id, comment_text: 'checked',
+  }));
+
+// The single-device branch of formatChartData as it was: runs on every render
+const legacyFormat = (data: Reading[], comments: Comment[]): Point[] => {
+  const sortedData = data.sort((a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime());
+  const result: Point[] = [];
+  for (let i = 0; i < sortedData.length; i++) {
+    const point = sortedData[i];
+    const timestamp = parseISO(point.created_at);
+    if (i > 0) {
+      const prevTimestamp = parseISO(sortedData[i - 1].created_at);
+      if (differenceInMinutes(timestamp, prevTimestamp) > GAP_MINUTES) {
+        result.push({ timestamp: new Date(prevTimestamp.getTime() + 5 * 60000), time: '', gasLevel: null });
+      }
+    }
+    result.push({
+      timestamp,
+      time: format(timestamp, TIME_FORMAT),
+      gasLevel: point.measurement,
+      tankLevel: point.tank_level,
+      connectionQuality: point.connection_strength,
+      batteryLevel: point.battery === 'Full' ? 100 : point.battery === 'Ok' ? 75 : 25,
+      raw_timestamp: point.created_at,
+      sensor_data_id: point.id,
+      comments: comments.filter(c => c.sensor_data_id === point.id),
+    });
+  }
+  return result;
+};
+
+// What the Charts page does with a new series version: label only the new points
+const materialize = (series: SeriesColumns, rows: Reading[], points: Point[], byReading: Map<string, Comment[]>) => {
+  for (let i = points.length; i < series.time.length; i++) {
+    const timestamp = new Date(series.time[i]);
+    const source = series.source[i];
+    if (source < 0) {
+      points.push({ timestamp, time: '', gasLevel: null });
+      continue;
+    }
+    const row = rows[source];
+    points.push({
+      timestamp,
+      time: format(timestamp, TIME_FORMAT),
+      gasLevel: series.gasLevel[i],
+      tankLevel: series.tankLevel[i],
+      connectionQuality: series.connectionQuality[i],
+      batteryLevel: series.batteryLevel[i],
+      raw_timestamp: row.created_at,
+      sensor_data_id: row.id,
+      comments: byReading.get(row.id) || [],
+    });
+  }
+  return points;
+};
+
+const runFrames = (frames: number, render: (frame: number) => void): Promise<Omit<Run, 'firstLayout'>> =>
+  new Promise(resolve => {
+    const frameTimes: number[] = [];
+    const work: number[] = [];
+    let frame = 0;
+    let last = 0;
+    const tick = (now: number) => {
+      if (frame > 0) frameTimes.push(now - last);
+      last = now;
+      if (frame === frames) {
+        resolve({ frameTimes, work });
+        return;
+      }
+      const start = performance.now();
+      render(frame++);
+      work.push(performance.now() - start);
+      requestAnimationFrame(tick);
+    };
+    requestAnimationFrame(tick);
+  });
+
+const runBefore = async (points: number, devices: number, frames: number): Promise<Run> => {
+  let rows = readings(points, devices);
+  const comments = commentsFor(rows);
+  const start = performance.now();
+  legacyFormat(rows, comments);
+  const firstLayout = performance.now() - start;
+  let next = points;
+  const result = await runFrames(frames, frame => {
+    if (frame > 0 && frame % APPEND_EVERY === 0) {
+      rows = [...rows, ...readings(1, devices, next++)];
+    }
+    legacyFormat(rows, comments);
+  });
+  return { firstLayout, ...result };
+};
+
+const runAfter = async (points: number, devices: number, frames: number): Promise<Run> => {
+  let rows = readings(points, devices);
+  const byReading = new Map(commentsFor(rows).map(c => [c.sensor_data_id, [c]]));
+  const worker = new Worker(new URL('../../src/workers/chartData.worker.ts', import.meta.url), { type: 'module' });
+  let pending: ChartWorkerReply | null = null;
+  let waiting: (() => void) | null = null;
+  worker.onmessage = (event: MessageEvent<ChartWorkerReply>) => {
+    pending = event.data;
+    waiting?.();
+  };
+
+  let version = 1;
+  let series: SeriesColumns | null = null;
+  let chartPoints: Point[] = [];
+  const apply = () => {
+    const reply = pending;
+    pending = null;
+    if (!reply || reply.type === 'rebuild') return;
+    series = reply.type === 'append' && series ? concatSeries(series, reply.series) : reply.series;
+    chartPoints = materialize(series, rows, reply.type === 'append' ? chartPoints.slice() : [], byReading);
+  };
+
+  const start = performance.now();
+  const build: ChartWorkerRequest = { type: 'build', version, rows, gapMinutes: GAP_MINUTES };
+  worker.postMessage(build);
+  await new Promise<void>(resolve => { waiting = resolve; });
+  waiting = null;
+  apply();
+  const firstLayout = performance.now() - start;
+
+  let next = points;
+  const result = await runFrames(frames, frame => {
+    if (frame > 0 && frame % APPEND_EVERY === 0) {
+      const tail = readings(1, devices, next++);
+      rows = [...rows, ...tail];
+      const append: ChartWorkerRequest = {
+        type: 'append', version: version + 1, base: version, rows: tail, gapMinutes: GAP_MINUTES,
+      };
+      version++;
+      worker.postMessage(append);
+    }
+    // a render: memoized points unless the worker has answered since the last one
+    if (pending) apply();
+  });
+  worker.terminate();
+  return { firstLayout, ...result };
+};
+
+const percentile = (values: number[], q: number) => {
+  const sorted = [...values].sort((a, b) => a - b);
+  return sorted[Math.min(sorted.length - 1, Math.floor(q * sorted.length))] ?? 0;
+};
+
+const row = (name: string, run: Run) => {
+  const mean = run.work.reduce((sum, ms) => sum + ms, 0) / Math.max(1, run.work.length);
+  return {
+    pipeline: name,
+    'first layout ms': run.firstLayout.toFixed(1),
+    'frame p50 ms': percentile(run.frameTimes, 0.5).toFixed(1),
+    'frame p95 ms': percentile(run.frameTimes, 0.95).toFixed(1),
+    'frame max ms': Math.max(...run.frameTimes).toFixed(1),
+    'frames > 50 ms': String(run.frameTimes.filter(ms => ms > 50).length),
+    'main-thread ms / frame': mean.toFixed(2),
+  };
+};
+
+const form = document.getElementById('options') as HTMLFormElement;
+const status = document.getElementById('status') as HTMLPreElement;
+const table = document.getElementById('results') as HTMLTableElement;
+
+form.addEventListener('submit', async event => {
+  event.preventDefault();
+  const options = new FormData(form);
+  const points = Number(options.get('points'));
+  const devices = Number(options.get('devices'));
+  const frames = Number(options.get('frames'));
+
+  status.textContent = `before: ${points.toLocaleString()} points, ${devices} devices, ${frames} frames...`;
+  const before = await runBefore(points, devices, frames);
+  status.textContent = 'after...';
+  const after = await runAfter(points, devices, frames);
+  status.textContent = '';
+
+  const rows = [row('before', before), row('after', after)];
+  console.table(rows);
+  const body = table.tBodies[0];
+  body.replaceChildren(...rows.map(values => {
+    const tr = document.createElement('tr');
+    Object.values(values).forEach(value => {
+      const td = document.createElement('td');
+      td.textContent = value;
+      tr.appendChild(td);
+    });
+    return tr;
+  }));
+  table.hidden = false;
+});
@@ -0,0 +1,15 @@
+"""
+Python tooling for the Gas Sight Stream database
+
+The REST client is imported on first use, so `python -m gas_sight --help`
+does not pay for urllib/http.client.
+"""
+__all__ = ["Response", "RestClient", "RestError"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        from . import rest
+
+        return getattr(rest, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,305 @@
+"""
+Incremental threshold alerting over the reading stream
+
+Low gas, a Low battery or a weak connection used to be visible only on the
+dashboard. AlertEngine checks every reading as it is ingested against the
+rules that apply to its device, instead of re-querying sensor_data on a
+schedule:
+
+* a Rule targets one device, every device at a location, or all devices;
+  rules are indexed by device id and by location, and each device's
+  combined rule list is cached, so a reading costs one dict lookup plus
+  one comparison per applicable rule
+* `threshold` rules compare the metric itself, `rate` rules its change per
+  hour since the device's previous reading
+* `clear` gives hysteresis: a firing alert resolves only once the value is
+  back past it, and an alert that is already firing is not raised again
+* battery levels compare by rank (Low < Ok < Full), so `below Ok` means
+  Low; thresholds must match their metric's type, and readings without a
+  usable value for a rule's metric are skipped by that rule
+
+Transitions (firing / resolved) are returned as Alert objects and, with an
+AlertStore, upserted into the `alerts` table keyed on (rule_id, device_id),
+which is what deduplicates them across restarts: the engine reloads the
+firing alerts on start. `benchmarks/bench_alerts.py` measures throughput
+with 10k rules over 5k devices.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from .backfill import reading_time
+from .metrics import REGISTRY
+
+METRICS = ("measurement", "tank_level", "connection_strength", "battery")
+KINDS = ("threshold", "rate")
+OPS = ("below", "above", "equals")
+SEVERITIES = ("info", "warning", "critical")
+BATTERY_LEVELS = {"Low": 0, "Ok": 1, "Full": 2}
+
+
+def metric_level(metric, value):
+    """A metric value as something rules can compare, or None if it is not one"""
+    if metric == "battery":
+        return BATTERY_LEVELS.get(value) if isinstance(value, str) else None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+@dataclass
+class Rule:
+    id: str
+    metric: str
+    op: str
+    threshold: object
+    clear: object = None
+    kind: str = "threshold"
+    device_id: str = None
+    location: str = None
+    severity: str = "warning"
+    name: str = ""
+
+    def __post_init__(self):
+        if self.metric not in METRICS:
+            raise ValueError(f"unknown metric {self.metric!r}")
+        if self.op not in OPS:
+            raise ValueError(f"unknown op {self.op!r}")
+        if self.kind not in KINDS:
+            raise ValueError(f"unknown rule kind {self.kind!r}")
+        if self.kind == "rate" and (self.op == "equals" or self.metric == "battery"):
+            raise ValueError("rate rules compare a numeric metric with below/above")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"unknown severity {self.severity!r}")
+        expected = "one of " + ", ".join(BATTERY_LEVELS) if self.metric == "battery" else "a number"
+        self._limit = metric_level(self.metric, self.threshold)
+        if self._limit is None:
+            raise ValueError(f"{self.metric} threshold must be {expected}, not {self.threshold!r}")
+        self._clear = self._limit if self.clear is None else metric_level(self.metric, self.clear)
+        if self._clear is None:
+            raise ValueError(f"{self.metric} clear threshold must be {expected}, not {self.clear!r}")
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row["id"], metric=row["metric"], op=row["op"], threshold=row["threshold"],
+            clear=row.get("clear_threshold"), kind=row.get("kind") or "threshold",
+            device_id=row.get("device_id"), location=row.get("location"),
+            severity=row.get("severity") or "warning", name=row.get("name") or "",
+        )
+
+    def to_row(self):
+        return {
+            "id": self.id, "name": self.name, "metric": self.metric, "kind": self.kind,
+            "op": self.op, "threshold": self.threshold, "clear_threshold": self.clear,
+            "device_id": self.device_id, "location": self.location, "severity": self.severity,
+        }
+
+    def fires(self, value):
+        """`value` as returned by metric_level (or a rate of change)"""
+        if self.op == "below":
+            return value < self._limit
+        if self.op == "above":
+            return value > self._limit
+        return value == self._limit
+
+    def clears(self, value):
+        """True once a firing alert may resolve (past `clear`, if set)"""
+        if self.op == "below":
+            return value >= self._clear
+        if self.op == "above":
+            return value <= self._clear
+        return value != self._clear
+
+
+@dataclass
+class Alert:
+    """A rule firing or resolving for one device"""
+
+    rule: Rule
+    device_id: str
+    state: str
+    value: object
+    fired_at: str
+    resolved_at: str = None
+
+    @property
+    def key(self):
+        return self.rule.id, self.device_id
+
+    @property
+    def message(self):
+        rule = self.rule
+        metric = f"{rule.metric} change per hour" if rule.kind == "rate" else rule.metric
+        value = round(self.value, 2) if isinstance(self.value, float) else self.value
+        return f"{rule.name or rule.id}: {metric} {value} is {rule.op} {rule.threshold}"
+
+    def to_row(self):
+        return {
+            "rule_id": self.rule.id, "device_id": self.device_id, "state": self.state,
+            "severity": self.rule.severity, "message": self.message, "value": self.value,
+            "fired_at": self.fired_at, "resolved_at": self.resolved_at,
+        }
+
+
+class AlertEngine:
+    """Evaluate rules per reading, keeping firing state in memory"""
+
+    def __init__(self, rules=(), locations=None, store=None, registry=REGISTRY):
+        self.locations = dict(locations or {})
+        self.store = store
+        self._rules = {}
+        self._by_device = defaultdict(dict)
+        self._by_location = defaultdict(dict)
+        self._global = {}
+        self._cache = {}
+        self._active = {}
+        self._previous = {}
+        self.transitions = registry.counter(
+            "gas_sight_alerts_total", "Alert transitions by new state", ("state",)
+        )
+        self.firing = registry.gauge("gas_sight_alerts_firing", "Alerts currently firing")
+        self.checks = registry.counter(
+            "gas_sight_alerts_rule_checks_total", "Rule evaluations against incoming readings"
+        )
+        for rule in rules:
+            self.add_rule(rule)
+
+    @classmethod
+    def from_store(cls, store, registry=REGISTRY):
+        """Engine with the enabled rules, device locations and firing alerts from the database"""
+        engine = cls(store.rules(), store.locations(), store=store, registry=registry)
+        engine.restore(store.active())
+        return engine
+
+    # -- rules ----------------------------------------------------------
+
+    def _index(self, rule):
+        if rule.device_id is not None:
+            return self._by_device[rule.device_id]
+        if rule.location is not None:
+            return self._by_location[rule.location]
+        return self._global
+
+    def add_rule(self, rule):
+        if rule.id in self._rules:
+            self.remove_rule(rule.id)
+        self._rules[rule.id] = rule
+        self._index(rule)[rule.id] = rule
+        self._cache.clear()
+
+    def remove_rule(self, rule_id):
+        rule = self._rules.pop(rule_id, None)
+        if rule is None:
+            return
+        self._index(rule).pop(rule_id, None)
+        for key in [k for k in self._active if k[0] == rule_id]:
+            del self._active[key]
+        self.firing.set(len(self._active))
+        self._cache.clear()
+
+    def set_location(self, device_id, location):
+        self.locations[device_id] = location
+        self._cache.pop(device_id, None)
+
+    def rules_for(self, device_id):
+        """(rules, has_rate): the device's own rules, its location's and global ones"""
+        entry = self._cache.get(device_id)
+        if entry is None:
+            location = self.locations.get(device_id)
+            rules = (
+                *self._by_device.get(device_id, {}).values(),
+                *(self._by_location.get(location, {}).values() if location is not None else ()),
+                *self._global.values(),
+            )
+            entry = self._cache[device_id] = (rules, any(rule.kind == "rate" for rule in rules))
+        return entry
+
+    # -- evaluation -----------------------------------------------------
+
+    def restore(self, rows):
+        """Mark alerts persisted as firing as active, so they are not raised again"""
+        for row in rows:
+            rule = self._rules.get(row["rule_id"])
+            if rule is not None and row.get("state", "firing") == "firing":
+                alert = Alert(rule, row["device_id"], "firing", row.get("value"), row["fired_at"])
+                self._active[alert.key] = alert
+        self.firing.set(len(self._active))
+
+    def active(self):
+        return list(self._active.values())
+
+    def process(self, reading):
+        """Evaluate one reading; returns the alerts that fired or resolved"""
+        device_id = reading["device_id"]
+        rules, has_rate = self.rules_for(device_id)
+        if not rules:
+            return []
+        at = reading_time(reading) or datetime.now(timezone.utc)
+        previous = self._previous.get(device_id) if has_rate else None
+        hours = (at - previous["at"]).total_seconds() / 3600 if previous else None
+        alerts = []
+        for rule in rules:
+            shown = reading.get(rule.metric)
+            value = metric_level(rule.metric, shown)
+            if value is None:
+                continue
+            if rule.kind == "rate":
+                before = metric_level(rule.metric, previous.get(rule.metric)) if previous else None
+                if before is None or not hours or hours < 0:
+                    continue
+                value = shown = (value - before) / hours
+            key = (rule.id, device_id)
+            alert = self._active.get(key)
+            if alert is None:
+                if rule.fires(value):
+                    alert = Alert(rule, device_id, "firing", shown, at.isoformat())
+                    self._active[key] = alert
+                    alerts.append(alert)
+            elif rule.clears(value):
+                del self._active[key]
+                alerts.append(Alert(rule, device_id, "resolved", shown, alert.fired_at, at.isoformat()))
+        if has_rate:
+            self._previous[device_id] = {"at": at, **{m: reading.get(m) for m in METRICS}}
+        self.checks.inc(len(rules))
+        for alert in alerts:
+            self.transitions.inc(state=alert.state)
+        if alerts:
+            self.firing.set(len(self._active))
+        return alerts
+
+    def process_many(self, readings):
+        """Evaluate readings in order and persist the transitions in one upsert"""
+        alerts = []
+        for reading in readings:
+            alerts.extend(self.process(reading))
+        if alerts and self.store is not None:
+            self.store.save(alerts)
+        return alerts
+
+
+class AlertStore:
+    """alert_rules and alerts tables through RestClient"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def rules(self):
+        rows = self.client.select("alert_rules", "*", {"enabled": "eq.true"}, order="id")
+        return [Rule.from_row(row) for row in rows]
+
+    def locations(self):
+        return {row["id"]: row["location"] for row in self.client.select("devices", "id,location")}
+
+    def active(self):
+        return self.client.select("alerts", "*", {"state": "eq.firing"})
+
+    def save(self, alerts):
+        """Upsert the latest state of each (rule, device) touched by `alerts`"""
+        latest = {}
+        for alert in alerts:
+            latest[alert.key] = alert.to_row()
+        self.client.insert(
+            "alerts", list(latest.values()), returning=False,
+            on_conflict="rule_id,device_id", resolution="merge",
+        )
@@ -0,0 +1,412 @@
+"""
+Bulk historical backfill for tanks that logged offline
+
+A backfill file (CSV, gzipped CSV or Parquet with sensor_data column
+names) is loaded in one go instead of one REST INSERT per reading:
+
+* With a direct connection the file is streamed with COPY into a temporary
+  staging table and merged into sensor_data by a single INSERT ... SELECT
+  that drops duplicates on (device_id, packet_number).
+* Without one, rows are de-duplicated client-side and posted in large
+  bulk inserts.
+
+A reading is a duplicate when the same device already has a reading with
+the same packet number within `window` of it, which tolerates the packet
+counter wrapping around. Quiet backfills stamp their rows with
+backfill_batch_id, which the realtime publication filters out, and
+announce themselves with one backfill_batches row instead.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from . import config
+from .postgrest import Filter
+from .rest import RestClient
+from .validate import validate_readings
+
+BACKFILL_COLUMNS = (
+    "device_id",
+    "created_at",
+    "title_name",
+    "tank_level",
+    "tank_level_unit",
+    "updated_refresh",
+    "battery",
+    "connection_strength",
+    "measurement",
+    "measurement_unit",
+    "technical_data",
+)
+_NUMERIC = {"tank_level": float, "measurement": float, "connection_strength": int}
+DEFAULT_WINDOW = timedelta(hours=1)
+
+
+@dataclass
+class BackfillResult:
+    batch_id: str
+    received: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    device_ids: set = field(default_factory=set)
+    first_reading_at: str = None
+    last_reading_at: str = None
+
+    def summary_row(self, source):
+        return {
+            "id": self.batch_id,
+            "source": source,
+            "device_ids": sorted(self.device_ids),
+            "rows_received": self.received,
+            "rows_inserted": self.inserted,
+            "rows_duplicate": self.duplicates,
+            "rows_rejected": self.rejected,
+            "first_reading_at": self.first_reading_at,
+            "last_reading_at": self.last_reading_at,
+        }
+
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def _parse_csv_row(row):
+    reading = {}
+    for column, value in row.items():
+        if column not in BACKFILL_COLUMNS or value in ("", None):
+            continue
+        if column in _NUMERIC:
+            value = _NUMERIC[column](value)
+        elif column == "technical_data":
+            value = json.loads(value)
+        reading[column] = value
+    return reading
+
+
+def read_rows(path):
+    """Yield readings from a CSV / CSV.gz / Parquet backfill file"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet backfills need pyarrow (pip install pyarrow)") from None
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=10_000):
+            for row in batch.to_pylist():
+                reading = {k: v for k, v in row.items() if k in BACKFILL_COLUMNS and v is not None}
+                if isinstance(reading.get("technical_data"), str):
+                    reading["technical_data"] = json.loads(reading["technical_data"])
+                if isinstance(reading.get("created_at"), datetime):
+                    reading["created_at"] = reading["created_at"].isoformat()
+                yield reading
+        return
+    with _open_text(path) as f:
+        for row in csv.DictReader(f):
+            yield _parse_csv_row(row)
+
+
+def packet_number(reading):
+    technical = (reading.get("technical_data") or {}).get("_technical") or {}
+    value = technical.get("packet_number")
+    return int(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def reading_time(reading):
+    """created_at, falling back to the logger's own timestamp"""
+    value = reading.get("created_at")
+    if not value:
+        value = ((reading.get("technical_data") or {}).get("_technical") or {}).get("timestamp")
+    if not value:
+        return None
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+class _Window:
+    """Last time each (device, packet) was seen, for wrap-tolerant dedupe"""
+
+    def __init__(self, window):
+        self.window = window
+        self.seen = {}
+
+    def is_duplicate(self, device_id, packet, at):
+        times = self.seen.setdefault((device_id, packet), [])
+        if any(abs(at - other) <= self.window for other in times):
+            return True
+        times.append(at)
+        return False
+
+
+def _rest_backfill(client, rows, result, window, quiet, chunk_size):
+    devices = {}
+    seen = _Window(window)
+
+    def load_devices(ids):
+        missing = [i for i in ids if i not in devices]
+        if missing:
+            found = client.select("devices", "id,title", [Filter("id", "in", tuple(missing))])
+            titles = {d["id"]: d["title"] for d in found}
+            for device_id in missing:
+                devices[device_id] = titles.get(device_id)
+
+    def existing_packets(chunk):
+        """Remember packets already stored within the window of this chunk"""
+        by_device = {}
+        for reading, packet, at in chunk:
+            if packet is not None:
+                by_device.setdefault(reading["device_id"], []).append((packet, at))
+        for device_id, packets in by_device.items():
+            times = [at for _, at in packets]
+            stored = client.select(
+                "sensor_data", "packet_number,created_at",
+                [Filter("device_id", "eq", device_id),
+                 Filter("packet_number", "in", tuple(sorted({p for p, _ in packets}))),
+                 Filter("created_at", "gte", (min(times) - window).isoformat()),
+                 Filter("created_at", "lte", (max(times) + window).isoformat())],
+            )
+            for row in stored:
+                seen.seen.setdefault((device_id, row["packet_number"]), []).append(
+                    datetime.fromisoformat(row["created_at"])
+                )
+
+    def flush(chunk):
+        load_devices({reading["device_id"] for reading, _, _ in chunk})
+        candidates = []
+        for reading, packet, at in chunk:
+            device_id = reading["device_id"]
+            if not devices.get(device_id):
+                result.rejected += 1
+                continue
+            row = {
+                **reading,
+                "created_at": at.isoformat(),
+                "title_name": reading.get("title_name") or devices[device_id],
+                "updated_refresh": reading.get("updated_refresh") or "backfill",
+            }
+            candidates.append((row, packet, at))
+        # rows that break a CHECK would fail the whole bulk insert
+        rejected = {r.index for r in validate_readings([row for row, _, _ in candidates]).rejected}
+        result.rejected += len(rejected)
+        candidates = [c for n, c in enumerate(candidates) if n not in rejected]
+        existing_packets(candidates)
+        payload = []
+        for row, packet, at in candidates:
+            device_id = row["device_id"]
+            if packet is not None and seen.is_duplicate(device_id, packet, at):
+                result.duplicates += 1
+                continue
+            if quiet:
+                row["backfill_batch_id"] = result.batch_id
+            payload.append(row)
+            result.device_ids.add(device_id)
+            stamp = row["created_at"]
+            result.first_reading_at = min(filter(None, (result.first_reading_at, stamp)))
+            result.last_reading_at = max(filter(None, (result.last_reading_at, stamp)))
+        if payload:
+            client.insert("sensor_data", payload, returning=False)
+            result.inserted += len(payload)
+
+    chunk = []
+    now = datetime.now(timezone.utc)
+    for reading in rows:
+        result.received += 1
+        if not reading.get("device_id"):
+            result.rejected += 1
+            continue
+        chunk.append((reading, packet_number(reading), reading_time(reading) or now))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return result
+
+
+# Staging keeps NOT NULL and CHECK constraints off so one bad row cannot
+# abort the COPY; MERGE_SQL counts such rows as rejected instead.
+STAGING_SQL = """
+create temp table sensor_data_backfill
+  (like public.sensor_data including defaults) on commit drop;
+alter table sensor_data_backfill
+  drop column packet_number,
+  alter column title_name drop not null,
+  alter column updated_refresh drop not null,
+  alter column tank_level drop not null,
+  alter column battery drop not null,
+  alter column connection_strength drop not null,
+  alter column measurement drop not null,
+  alter column created_at drop not null,
+  alter column created_at drop default;
+"""
+
+# The sensor_data CHECK constraints, as in validate.BATTERY_LEVELS / CONNECTION_RANGE
+VALID_SQL = (
+    "s.tank_level is not null and s.measurement is not null"
+    " and s.battery in ('Full', 'Ok', 'Low')"
+    " and s.connection_strength between 0 and 100"
+)
+
+# A packet repeats the last *kept* one of its (device, packet number) when
+# it falls within the window of it, so the walk over each chain is
+# recursive rather than a lag() against the previous row.
+MERGE_SQL = ("""
+with recursive staged as (
+  select s.*,
+    coalesce(s.created_at,
+             (s.technical_data -> '_technical' ->> 'timestamp')::timestamptz,
+             now()) as reading_at,
+    case when jsonb_typeof(s.technical_data -> '_technical' -> 'packet_number') = 'number'
+         then (s.technical_data -> '_technical' ->> 'packet_number')::numeric::bigint end as pkt
+  from sensor_data_backfill s
+  join public.devices d on d.id = s.device_id
+  where """ + VALID_SQL + """
+), chained as (
+  select id, device_id, pkt, reading_at,
+    row_number() over (partition by device_id, pkt order by reading_at, id) as n
+  from staged
+  where pkt is not null
+), walk as (
+  select id, device_id, pkt, n, true as kept, reading_at as kept_at
+  from chained where n = 1
+  union all
+  select c.id, c.device_id, c.pkt, c.n,
+    c.reading_at - w.kept_at > %(window)s::interval,
+    case when c.reading_at - w.kept_at > %(window)s::interval then c.reading_at else w.kept_at end
+  from walk w
+  join chained c on c.device_id = w.device_id and c.pkt = w.pkt and c.n = w.n + 1
+), inserted as (
+  insert into public.sensor_data (
+    device_id, title_name, tank_level, tank_level_unit, updated_refresh, battery,
+    connection_strength, measurement, measurement_unit, technical_data, created_at,
+    backfill_batch_id
+  )
+  select o.device_id, coalesce(o.title_name, d.title), o.tank_level,
+    coalesce(o.tank_level_unit, 'cm'), coalesce(o.updated_refresh, 'backfill'), o.battery,
+    o.connection_strength, o.measurement, coalesce(o.measurement_unit, '%%'),
+    o.technical_data, o.reading_at,
+    case when %(quiet)s then %(batch_id)s::uuid end
+  from staged o
+  join public.devices d on d.id = o.device_id
+  left join walk w on w.id = o.id
+  where o.pkt is null
+     or (w.kept
+         and not exists (
+           select 1 from public.sensor_data e
+           where e.device_id = o.device_id
+             and e.packet_number = o.pkt
+             and e.created_at between o.reading_at - %(window)s::interval
+                                  and o.reading_at + %(window)s::interval))
+  returning device_id, created_at
+)
+select
+  (select count(*) from sensor_data_backfill),
+  (select count(*) from inserted),
+  (select count(*) from sensor_data_backfill s
+    where not exists (select 1 from public.devices d where d.id = s.device_id)
+       or not coalesce(""" + VALID_SQL + """, false)),
+  (select coalesce(array_agg(distinct device_id), '{}') from inserted),
+  (select min(created_at) from inserted),
+  (select max(created_at) from inserted)
+""")
+
+
+def _copy_backfill(dsn, path, result, window, quiet, source):
+    try:
+        import psycopg
+    except ImportError:
+        raise RuntimeError("COPY backfills need psycopg (pip install 'psycopg[binary]')") from None
+    with psycopg.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute(STAGING_SQL)
+        if path.endswith(".parquet"):
+            with cur.copy(
+                f"copy sensor_data_backfill ({', '.join(BACKFILL_COLUMNS)}) from stdin"
+            ) as copy:
+                for reading in read_rows(path):
+                    copy.write_row([
+                        json.dumps(reading[c]) if c == "technical_data" and c in reading
+                        else reading.get(c)
+                        for c in BACKFILL_COLUMNS
+                    ])
+        else:
+            with _open_text(path) as f:
+                header = next(csv.reader(f))
+                unknown = [c for c in header if c not in BACKFILL_COLUMNS]
+                if unknown:
+                    raise ValueError(f"unknown backfill columns: {', '.join(unknown)}")
+                with cur.copy(
+                    f"copy sensor_data_backfill ({', '.join(header)}) from stdin with (format csv)"
+                ) as copy:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        copy.write(chunk)
+        cur.execute(MERGE_SQL, {
+            "quiet": quiet, "batch_id": result.batch_id, "window": f"{window.total_seconds()} seconds",
+        })
+        received, inserted, rejected, device_ids, first, last = cur.fetchone()
+        result.received, result.inserted, result.rejected = received, inserted, rejected
+        result.duplicates = received - inserted - rejected
+        result.device_ids = set(device_ids)
+        result.first_reading_at = first.isoformat() if first else None
+        result.last_reading_at = last.isoformat() if last else None
+        cur.execute(
+            "insert into public.backfill_batches (id, source, device_ids, rows_received,"
+            " rows_inserted, rows_duplicate, rows_rejected, first_reading_at, last_reading_at)"
+            " values (%(id)s, %(source)s, %(device_ids)s, %(rows_received)s, %(rows_inserted)s,"
+            " %(rows_duplicate)s, %(rows_rejected)s, %(first_reading_at)s, %(last_reading_at)s)",
+            result.summary_row(source),
+        )
+    return result
+
+
+def backfill(path, client=None, dsn=None, window=DEFAULT_WINDOW, quiet=True,
+             chunk_size=1000, source=None):
+    """Load one backfill file; returns a BackfillResult
+
+    The summary row is written to backfill_batches in the same run, so a
+    quiet backfill produces exactly one realtime event.
+    """
+    result = BackfillResult(batch_id=str(uuid.uuid4()))
+    source = source or path
+    if dsn:
+        return _copy_backfill(dsn, path, result, window, quiet, source)
+    client = client or RestClient()
+    _rest_backfill(client, read_rows(path), result, window, quiet, chunk_size)
+    client.insert("backfill_batches", result.summary_row(source), returning=False)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill logged sensor readings")
+    parser.add_argument("paths", nargs="+", help="CSV, CSV.gz or Parquet files")
+    parser.add_argument("--dsn", default=config.database_dsn(),
+                        help="direct Postgres connection for COPY (default $SUPABASE_DB_URL)")
+    parser.add_argument("--window-minutes", type=float, default=60,
+                        help="packet numbers repeat only outside this window (default 60)")
+    parser.add_argument("--broadcast", action="store_true",
+                        help="publish every row to realtime instead of one summary event")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        result = backfill(
+            path, dsn=args.dsn, window=timedelta(minutes=args.window_minutes),
+            quiet=not args.broadcast,
+        )
+        print(f"✅ {path}: {result.inserted} inserted, {result.duplicates} duplicates,"
+              f" {result.rejected} rejected (batch {result.batch_id})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Read cache invalidated by row changes instead of TTLs
+
+CachedClient has the RestClient interface. Selects (and the RPCs in
+CACHED_RPCS) are answered from a bounded LRU of responses keyed by the
+normalised query: relation, select, filters (sorted), order, limit,
+offset, count and Accept. An entry stays valid until a change that could
+alter its result arrives on the ChangeFeed (or is made through this
+client):
+
+* a change to the entry's own relation invalidates it only if the old or
+  new row satisfies the entry's filters, so a new tank_b reading leaves
+  `sensor_data?device_id=eq.tank_a` alone, and one from 09:00 leaves
+  `created_at=gte.10:00` alone. Filters that cannot be decided from the
+  row (like/ilike, negated groups, columns missing from the event)
+  invalidate conservatively
+* DEPENDENCIES maps a relation to the tables it is derived from and the
+  column linking them (device_stats rows follow devices.id and
+  sensor_data.device_id); an entry that pins that column with eq./in. is
+  only invalidated by changes to its own devices
+* embedded resources (`sensor_data(created_at)`) not listed in
+  DEPENDENCIES invalidate on any change to the embedded table
+* a stream gap clears the cache
+* WINDOWS lists relations with columns computed against now()
+  (device_stats' readings_last_24h and avg_measurement_24h). Those change
+  with no event as readings age out of the window, so their entries
+  expire when the oldest reading inside the window leaves it
+
+A read that races a change is not stored. Hits, misses, invalidations and
+evictions are counted in gas_sight_cache_*.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from .changes import Change
+from .metrics import REGISTRY
+from .postgrest import Filter, Logic, filter_params, parse_query
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+ALL_EVENTS = frozenset(("INSERT", "UPDATE", "DELETE"))
+
+# relation -> {changed table: (relation column, changed row column, events)}
+DEPENDENCIES = {
+    "device_stats": {
+        "devices": ("id", "id", ALL_EVENTS),
+        "sensor_data": ("id", "device_id", ALL_EVENTS),
+    },
+    # deleting a device cascades to its readings and their comments
+    "sensor_data": {"devices": ("device_id", "id", frozenset(("DELETE",)))},
+    # the chart comment projection embeds sensor_data(created_at)
+    "comments": {"sensor_data": ("sensor_data_id", "id", frozenset(("UPDATE", "DELETE")))},
+}
+# relation -> (table, its column linking the relation, its time column, window)
+WINDOWS = {"device_stats": ("sensor_data", "device_id", "created_at", timedelta(hours=24))}
+# RPCs whose results are cached like a select on a relation
+CACHED_RPCS = {"get_device_stats": "device_stats"}
+# RPCs that write, and the tables they write
+WRITING_RPCS = {"apply_device_counters": ("devices",)}
+
+_EMBEDDED = re.compile(r"(\w+)(?:!\w+)?\(")
+
+
+def _coerce(value, like):
+    """`value` (filter text) as the type of `like` (a row value), or raise ValueError"""
+    if isinstance(like, bool):
+        lowered = str(value).lower()
+        if lowered not in ("true", "false"):
+            raise ValueError(value)
+        return lowered == "true"
+    if isinstance(like, (int, float)):
+        return float(value)
+    return str(value)
+
+
+def _timestamp(text):
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def _compare(op, actual, expected):
+    if isinstance(actual, str):
+        times = _timestamp(actual), _timestamp(expected)
+        if times.count(None) == 1:
+            raise ValueError("cannot compare a timestamp with text")
+        if None not in times:
+            actual, expected = times  # naive vs aware raises TypeError: undecidable
+    return {
+        "eq": actual == expected, "neq": actual != expected,
+        "gt": actual > expected, "gte": actual >= expected,
+        "lt": actual < expected, "lte": actual <= expected,
+    }[op]
+
+
+def row_matches(item, row):
+    """Whether `row` satisfies a Filter or Logic: True, False or None (undecidable)"""
+    if isinstance(item, Logic):
+        if item.negate:
+            return None
+        results = [row_matches(i, row) for i in item.items]
+        if item.op == "and":
+            return False if False in results else (None if None in results else True)
+        return True if True in results else (None if None in results else False)
+    if item.column not in row or item.op in ("like", "ilike"):
+        return None
+    actual = row[item.column]
+    try:
+        if item.op == "is":
+            result = actual is item.value if item.value is None else actual == item.value
+        elif actual is None:
+            result = False  # NULL never satisfies eq/gt/in...
+        elif item.op == "in":
+            result = any(_coerce(v, actual) == actual for v in item.value)
+        else:
+            result = _compare(item.op, actual, _coerce(item.value, actual))
+    except (ValueError, TypeError):
+        return None
+    return (not result) if item.negate else result
+
+
+def _pinned(filters, column):
+    values = None
+    for f in filters:
+        if isinstance(f, Filter) and f.column == column and not f.negate and f.op in ("eq", "in"):
+            pinned = set(f.value) if f.op == "in" else {str(f.value)}
+            values = pinned if values is None else values & pinned
+    return values
+
+
+class Entry:
+    """A cached response and what it depends on"""
+
+    __slots__ = ("key", "relation", "filters", "embedded", "response", "size", "expires")
+
+    def __init__(self, key, relation, filters, embedded, response, expires=None):
+        self.key = key
+        self.relation = relation
+        self.filters = filters
+        self.embedded = embedded
+        self.response = response
+        self.size = len(response.body) + len(key[1])
+        self.expires = expires
+
+    def tables(self):
+        return {self.relation, *DEPENDENCIES.get(self.relation, {}), *self.embedded}
+
+    def affected_by(self, change):
+        if change.table == self.relation:
+            rows = [r for r in (change.record, change.old_record) if r]
+            if not rows or (change.type == "UPDATE" and not change.old_record):
+                return True  # the old values are unknown
+            return any(all(row_matches(f, row) is not False for f in self.filters) for row in rows)
+        dependency = DEPENDENCIES.get(self.relation, {}).get(change.table)
+        if dependency is not None:
+            column, row_column, events = dependency
+            if change.type not in events:
+                return False
+            pinned = _pinned(self.filters, column)
+            if pinned is None:
+                return True
+            keys = {str(r.get(row_column)) for r in (change.record, change.old_record) if r}
+            return bool(keys & pinned) or not all(
+                row_column in r for r in (change.record, change.old_record) if r
+            )
+        return change.table in self.embedded
+
+
+class CachedClient:
+    """RestClient-compatible wrapper serving repeated reads from memory"""
+
+    def __init__(self, client, feed=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 registry=REGISTRY, clock=time.time):
+        self.client = client
+        self.clock = clock
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._unsubscribe = feed.subscribe(self.on_change, on_gap=self.clear) if feed is not None else None
+        self.lookups = registry.counter(
+            "gas_sight_cache_lookups_total", "Cache lookups by relation and result", ("relation", "result")
+        )
+        self.invalidations = registry.counter(
+            "gas_sight_cache_invalidations_total", "Entries dropped by row changes", ("relation", "table")
+        )
+        self.evictions = registry.counter(
+            "gas_sight_cache_evictions_total", "Entries evicted to stay within the size bounds"
+        )
+        self.expirations = registry.counter(
+            "gas_sight_cache_expirations_total", "Entries dropped as readings left their time window",
+            ("relation",),
+        )
+        self.bytes = registry.gauge("gas_sight_cache_bytes", "Response bytes held by the cache")
+        self.entries = registry.gauge("gas_sight_cache_entries", "Responses held by the cache")
+
+    def close(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    # -- cache bookkeeping ----------------------------------------------
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires is not None and self.clock() >= entry.expires:
+                del self._entries[key]
+                self.size -= entry.size
+                self.expirations.inc(relation=entry.relation)
+                self._gauges()
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _versions_of(self, tables):
+        with self._lock:
+            return {table: self._versions.get(table, 0) for table in tables}
+
+    def _store(self, entry, versions):
+        with self._lock:
+            if any(self._versions.get(t, 0) != v for t, v in versions.items()):
+                return  # a change arrived while the read was in flight
+            if entry.size > self.max_bytes:
+                return
+            old = self._entries.pop(entry.key, None)
+            if old is not None:
+                self.size -= old.size
+            self._entries[entry.key] = entry
+            self.size += entry.size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+                self.evictions.inc()
+            self._gauges()
+
+    def _gauges(self):
+        self.bytes.set(self.size)
+        self.entries.set(len(self._entries))
+
+    def _expiry(self, relation, filters):
+        """When the oldest reading inside `relation`'s window leaves it (clock time), or None"""
+        if relation not in WINDOWS:
+            return None
+        table, column, time_column, window = WINDOWS[relation]
+        cutoff = datetime.fromtimestamp(self.clock() - window.total_seconds(), timezone.utc)
+        query = [Filter(time_column, "gte", cutoff.isoformat())]
+        pinned = _pinned(filters, DEPENDENCIES[relation][table][0])
+        if pinned is not None:
+            query.append(Filter(column, "in", tuple(sorted(pinned))))
+        rows = self.client.select(table, time_column, query, order=f"{time_column}.asc", limit=1)
+        oldest = _timestamp(rows[0][time_column]) if rows else None
+        if oldest is None:
+            return None  # nothing in the window; a new reading arrives as a change
+        if oldest.tzinfo is None:
+            oldest = oldest.replace(tzinfo=timezone.utc)
+        return (oldest + window).timestamp()
+
+    def _cached(self, relation, key, filters, embedded, fetch):
+        entry = self._lookup(key)
+        if entry is not None:
+            self.lookups.inc(relation=relation, result="hit")
+            return entry.response
+        self.lookups.inc(relation=relation, result="miss")
+        versions = self._versions_of({None, relation, *DEPENDENCIES.get(relation, {}), *embedded})
+        expires = self._expiry(relation, filters)
+        response = fetch()
+        self._store(Entry(key, relation, filters, embedded, response, expires), versions)
+        return response
+
+    def on_change(self, change):
+        """ChangeFeed subscriber: drop the entries `change` may affect"""
+        with self._lock:
+            self._versions[change.table] = self._versions.get(change.table, 0) + 1
+            stale = [
+                key for key, entry in self._entries.items()
+                if change.table in entry.tables() and entry.affected_by(change)
+            ]
+            for key in stale:
+                entry = self._entries.pop(key)
+                self.size -= entry.size
+                self.invalidations.inc(relation=entry.relation, table=change.table)
+            self._gauges()
+
+    def invalidate(self, table):
+        """Drop every entry that depends on `table`"""
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if table in entry.tables()]
+            for key in stale:
+                entry = self._entries.pop(key)
+                self.size -= entry.size
+                self.invalidations.inc(relation=entry.relation, table=table)
+            self._gauges()
+
+    def clear(self):
+        """Drop everything (after a change stream gap)"""
+        with self._lock:
+            self._versions[None] = self._versions.get(None, 0) + 1
+            self._entries.clear()
+            self.size = 0
+            self._gauges()
+
+    # -- RestClient interface -------------------------------------------
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Raw requests are not cached; writes through here clear the cache"""
+        response = self.client.request(method, path, params, body, headers)
+        if method not in ("GET", "HEAD"):
+            self.clear()
+        return response
+
+    def select(self, table, columns="*", filters=None, order=None, limit=None, offset=None,
+               count=None, headers=None):
+        return self.select_response(
+            table, columns, filters, order, limit, offset, count, headers
+        ).json() or []
+
+    def select_response(self, table, columns="*", filters=None, order=None, limit=None,
+                        offset=None, count=None, headers=None):
+        params = sorted(filter_params(filters))
+        key = (table, repr((columns, params, order, limit, offset, count,
+                            sorted((headers or {}).items()))))
+        return self._cached(
+            table, key, parse_query(params).filters, frozenset(_EMBEDDED.findall(columns)),
+            lambda: self.client.select_response(
+                table, columns, filters, order, limit, offset, count, headers
+            ),
+        )
+
+    def rpc(self, name, args=None):
+        relation = CACHED_RPCS.get(name)
+        if relation is not None:
+            key = (f"rpc/{name}", repr(sorted((args or {}).items())))
+            return self._cached(
+                relation, key, [], frozenset(),
+                lambda: self.client.request("POST", f"/rest/v1/rpc/{name}", body=args or {}),
+            ).json()
+        result = self.client.rpc(name, args)
+        for table in WRITING_RPCS.get(name, ()):
+            self.invalidate(table)
+        return result
+
+    def _written(self, table, kind, rows):
+        for row in rows:
+            if kind == "DELETE":
+                self.on_change(Change(table, kind, old_record=row))
+            else:
+                self.on_change(Change(table, kind, record=row))
+
+    def insert(self, table, rows, returning=True, on_conflict=None, resolution=None, columns=None):
+        stored = self.client.insert(table, rows, returning, on_conflict, resolution, columns)
+        if resolution == "merge" or not returning or columns:
+            # an upsert may have changed existing rows; narrowed rows cannot be matched
+            self.invalidate(table)
+        else:
+            self._written(table, "INSERT", stored)
+        return stored
+
+    def update(self, table, values, filters, returning=True):
+        updated = self.client.update(table, values, filters, returning)
+        self.invalidate(table)
+        return updated
+
+    def delete(self, table, filters, returning=False):
+        deleted = self.client.delete(table, filters, returning)
+        if returning:
+            self._written(table, "DELETE", deleted)
+        else:
+            self.invalidate(table)
+        return deleted
@@ -0,0 +1,187 @@
+"""
+Row change events from Supabase Realtime (or the local stand-in)
+
+ChangeFeed fans Change events out to subscribers, optionally filtered by
+table. Subscribers that keep derived state (live windows, caches, mirrors)
+can also register an `on_gap` callback: it runs whenever changes may have
+been missed, e.g. after the realtime socket reconnects, so they can resync.
+
+RealtimeFeed speaks the Realtime websocket protocol (Phoenix channels):
+it joins one channel with a `postgres_changes` subscription per table,
+sends heartbeats, and turns each `postgres_changes` message into a Change.
+The socket needs `websockets` (pip install websockets); `handle()` works
+without it. LocalDatabase publishes its inserts, updates and deletes on
+its own ChangeFeed (`db.changes`).
+"""
+import asyncio
+import json
+import threading
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+from . import config
+from .metrics import REGISTRY
+
+DEFAULT_TABLES = ("devices", "sensor_data", "comments")
+HEARTBEAT_INTERVAL = 25.0
+MAX_BACKOFF = 30.0
+
+
+@dataclass
+class Change:
+    """One INSERT, UPDATE or DELETE of a row"""
+
+    table: str
+    type: str
+    record: dict = field(default_factory=dict)
+    old_record: dict = field(default_factory=dict)
+    commit_timestamp: str = None
+    schema: str = "public"
+
+    @classmethod
+    def from_payload(cls, data):
+        """A Change from the `data` object of a postgres_changes message"""
+        return cls(
+            table=data["table"],
+            type=data.get("type") or data.get("eventType"),
+            record=data.get("record") or {},
+            old_record=data.get("old_record") or {},
+            commit_timestamp=data.get("commit_timestamp"),
+            schema=data.get("schema", "public"),
+        )
+
+    @property
+    def row(self):
+        """The row as it is now, or as it was for a DELETE"""
+        return self.old_record if self.type == "DELETE" else self.record
+
+
+class ChangeFeed:
+    """Publish/subscribe hub for Change events"""
+
+    def __init__(self, registry=REGISTRY):
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.received = registry.counter(
+            "gas_sight_changes_total", "Row changes delivered to subscribers", ("table", "type")
+        )
+        self.gaps = registry.counter(
+            "gas_sight_change_gaps_total", "Times the change stream may have dropped events"
+        )
+
+    def subscribe(self, callback, tables=None, on_gap=None):
+        """Call `callback(change)` for changes to `tables` (all by default); returns an unsubscribe function"""
+        entry = (callback, frozenset(tables) if tables else None, on_gap)
+        with self._lock:
+            self._subscribers.append(entry)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+
+        return unsubscribe
+
+    def publish(self, change):
+        self.received.inc(table=change.table, type=change.type)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, tables, _ in subscribers:
+            if tables is None or change.table in tables:
+                callback(change)
+
+    def gap(self):
+        """Tell subscribers that changes may have been missed"""
+        self.gaps.inc()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for _, _, on_gap in subscribers:
+            if on_gap is not None:
+                on_gap()
+
+
+class RealtimeFeed(ChangeFeed):
+    """ChangeFeed fed by the project's Realtime websocket"""
+
+    def __init__(self, url=None, key=None, tables=DEFAULT_TABLES, topic="realtime:gas-sight",
+                 heartbeat=HEARTBEAT_INTERVAL, registry=REGISTRY):
+        super().__init__(registry)
+        self.url = (url or config.supabase_url()).rstrip("/")
+        self.key = key or config.supabase_key()
+        self.tables = tuple(tables)
+        self.topic = topic
+        self.heartbeat = heartbeat
+        self.joined = False
+        self._ref = 0
+
+    def socket_url(self):
+        base = self.url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        return f"{base}/realtime/v1/websocket?" + urlencode({"apikey": self.key, "vsn": "1.0.0"})
+
+    def _message(self, event, payload, topic=None):
+        self._ref += 1
+        return {"topic": topic or self.topic, "event": event, "payload": payload, "ref": str(self._ref)}
+
+    def join_message(self):
+        return self._message("phx_join", {
+            "config": {"postgres_changes": [
+                {"event": "*", "schema": "public", "table": table} for table in self.tables
+            ]},
+            "access_token": self.key,
+        })
+
+    def heartbeat_message(self):
+        return self._message("heartbeat", {}, topic="phoenix")
+
+    def handle(self, message):
+        """Process one decoded socket message"""
+        event = message.get("event")
+        if event == "postgres_changes":
+            self.publish(Change.from_payload(message["payload"]["data"]))
+        elif event == "phx_reply" and message.get("topic") == self.topic:
+            status = message.get("payload", {}).get("status")
+            if status != "ok":
+                raise RuntimeError(f"realtime join failed: {message.get('payload')}")
+            self.joined = True
+        elif event in ("phx_error", "phx_close") and message.get("topic") == self.topic:
+            self.joined = False
+            raise ConnectionError(f"realtime channel {event}")
+
+    async def run(self, stop=None):
+        """Stream changes until `stop` (an asyncio.Event) is set, reconnecting with backoff"""
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError("the realtime feed needs websockets (pip install websockets)") from None
+        stop = stop or asyncio.Event()
+        backoff = 1.0
+        connected_before = False
+        while not stop.is_set():
+            try:
+                async with websockets.connect(self.socket_url()) as socket:
+                    await socket.send(json.dumps(self.join_message()))
+                    if connected_before:
+                        self.gap()
+                    connected_before = True
+                    backoff = 1.0
+                    await self._pump(socket, stop)
+            except (OSError, ConnectionError, websockets.WebSocketException):
+                self.joined = False
+                try:
+                    await asyncio.wait_for(stop.wait(), backoff)
+                except asyncio.TimeoutError:
+                    pass
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    async def _pump(self, socket, stop):
+        loop = asyncio.get_running_loop()
+        next_beat = loop.time() + self.heartbeat
+        while not stop.is_set():
+            if loop.time() >= next_beat:
+                await socket.send(json.dumps(self.heartbeat_message()))
+                next_beat = loop.time() + self.heartbeat
+            try:
+                text = await asyncio.wait_for(socket.recv(), next_beat - loop.time())
+            except asyncio.TimeoutError:
+                continue
+            self.handle(json.loads(text))
@@ -0,0 +1,301 @@
+"""
+gas-sight: one command line for the operational tooling
+
+    gas-sight provision      create the test devices (and one sample reading each)
+    gas-sight verify         check that the API key can read what the app reads
+    gas-sight schema-check   compare the live columns with the expected schema
+    gas-sight bench          time the dashboard's queries
+    gas-sight export ...     python -m gas_sight.export
+    gas-sight backfill ...   python -m gas_sight.backfill
+
+It replaces the standalone add_test_devices.py, check_rls_policies.py,
+check_view_columns.py, debug_device_fetch.py, fix_view_manually.py and
+test_rls_bypass.py scripts; connection settings come from gas_sight.config
+(SUPABASE_URL / SUPABASE_KEY) or --url / --key, or from a shard layout
+(GAS_SIGHT_SHARDS / --shards, see gas_sight.shards).
+
+Only argparse and json are imported up front; each subcommand imports what
+it needs when it runs, so `--help` and the cheap checks start in tens of
+milliseconds. With --json a command prints a single JSON object
+({"command", "ok", "checks": [...]}) instead of the emoji report, for cron
+jobs and monitoring. The exit status is 0 when every check passed, 1 when
+one failed and 2 for usage errors.
+
+The pass-through subcommands (export, backfill, mirror, purge, probe,
+workload) take their own options, so `gas-sight --url X export` is a usage
+error; write `gas-sight export --url X` where the subcommand supports it.
+"""
+import argparse
+import json
+import sys
+
+from . import config
+
+PASSTHROUGH = ("export", "backfill", "mirror", "purge", "probe", "workload")
+GLOBAL_OPTIONS = ("json", "url", "key", "shards", "timeout")
+BENCH_QUERIES = ("device_stats", "sensor_data", "get_device_stats")
+
+_UUIDS = {
+    "service_uuid": "0000fff0-0000-1000-8000-00805f9b34fb",
+    "data_characteristic_uuid": "0000fff1-0000-1000-8000-00805f9b34fb",
+}
+TEST_DEVICES = (
+    {"id": "device_main_tank_001", "name": "@TNK21B3A6", "mac_address": "C5:BA:A0:16:CF:65",
+     "title": "Main Gas Tank #1", "location": "Warehouse A - Section 1", "enabled": True,
+     "color": "#22c55e", **_UUIDS},
+    {"id": "device_backup_tank_002", "name": "@TNK98X5Z2", "mac_address": "D6:CB:B1:27:D0:76",
+     "title": "Backup Gas Tank #2", "location": "Warehouse B - Section 3", "enabled": True,
+     "color": "#3b82f6", **_UUIDS},
+    {"id": "device_emergency_tank_003", "name": "@TNK44K8M1", "mac_address": "E7:DC:C2:38:E1:87",
+     "title": "Emergency Gas Tank #3", "location": "Emergency Station - Floor 2", "enabled": False,
+     "color": "#f59e0b", **_UUIDS},
+)
+SAMPLE_READINGS = (
+    {"device_id": "device_main_tank_001", "title_name": "Main Gas Tank #1", "tank_level": 68.5,
+     "battery": "Full", "connection_strength": 95, "measurement": 82.3},
+    {"device_id": "device_backup_tank_002", "title_name": "Backup Gas Tank #2", "tank_level": 45.2,
+     "battery": "Ok", "connection_strength": 78, "measurement": 54.6},
+    {"device_id": "device_emergency_tank_003", "title_name": "Emergency Gas Tank #3",
+     "tank_level": 89.1, "battery": "Low", "connection_strength": 45, "measurement": 91.2},
+)
+VERIFY_PROBE_ID = "gas_sight_verify_probe"
+SCHEMA_RELATIONS = ("devices", "device_stats", "sensor_data", "comments", "backfill_batches")
+
+
+class Report:
+    """Collects check results and prints them as text or as one JSON object"""
+
+    def __init__(self, as_json=False, stream=None):
+        self.as_json = as_json
+        self.stream = stream or sys.stdout
+        self.checks = []
+        self.data = {}
+
+    def say(self, text):
+        if not self.as_json:
+            print(text, file=self.stream)
+
+    def check(self, name, ok, detail="", **data):
+        self.checks.append({"name": name, "ok": bool(ok), "detail": detail, **data})
+        self.say(f"{'✅' if ok else '❌'} {name}" + (f": {detail}" if detail else ""))
+        return ok
+
+    def run(self, name, probe):
+        """Record the outcome of `probe() -> (ok, detail)`; an exception fails the check"""
+        try:
+            ok, detail = probe()
+        except Exception as e:  # RestError, OSError, ... all mean the check failed
+            ok, detail = False, str(e)
+        return self.check(name, ok, detail)
+
+    @property
+    def ok(self):
+        return all(check["ok"] for check in self.checks)
+
+    def finish(self, command):
+        if self.as_json:
+            print(json.dumps({"command": command, "ok": self.ok, "checks": self.checks, **self.data}),
+                  file=self.stream)
+        return 0 if self.ok else 1
+
+
+def _count(client, relation, order=None):
+    """Total rows visible to this key, from Content-Range (one row transferred)"""
+    response = client.select_response(relation, "*", order=order, limit=1, count="exact")
+    return response.content_range[2]
+
+
+def cmd_provision(args, client, report):
+    """Create the test devices; devices that already exist are left alone"""
+    created = set()
+
+    def devices():
+        rows = client.insert("devices", list(TEST_DEVICES), on_conflict="id",
+                             resolution="ignore", columns="id")
+        created.update(row["id"] for row in rows)
+        return True, f"{len(created)} created, {len(TEST_DEVICES) - len(created)} already existed"
+
+    if not report.run("devices", devices):
+        return
+    for device in TEST_DEVICES:
+        report.check(device["id"], True, "created" if device["id"] in created else "already exists")
+    if args.readings:
+        report.run("sample readings", lambda: (
+            client.insert("sensor_data", [
+                {**reading, "updated_refresh": "provisioned",
+                 "technical_data": {"source": "gas-sight provision"}}
+                for reading in SAMPLE_READINGS
+            ], returning=False) is None,
+            f"{len(SAMPLE_READINGS)} added",
+        ))
+    report.data["created"] = sorted(created)
+
+
+def cmd_verify(args, client, report):
+    """Read (and optionally write) everything the dashboard touches"""
+    counts = {}
+
+    def readable(relation, order=None):
+        def probe():
+            counts[relation] = _count(client, relation, order)
+            return True, f"{counts[relation]} rows"
+        return probe
+
+    report.run("devices readable", readable("devices"))
+    # The dashboard lists devices from the view, newest first
+    report.run("device_stats readable", readable("device_stats", "device_created_at.desc"))
+    if "devices" in counts and "device_stats" in counts:
+        report.check(
+            "device_stats covers every device", counts["device_stats"] == counts["devices"],
+            f"{counts['device_stats']} of {counts['devices']}",
+        )
+    report.run("sensor_data readable", readable("sensor_data"))
+    report.run("comments readable", readable("comments"))
+
+    def rpc():
+        rows = client.rpc("get_device_stats")
+        expected = counts.get("devices")
+        return expected is None or len(rows) == expected, f"{len(rows)} rows"
+
+    report.run("get_device_stats callable", rpc)
+
+    if args.write:
+        def write():
+            probe = {**TEST_DEVICES[0], "id": VERIFY_PROBE_ID, "name": "@VERIFY",
+                     "mac_address": "00:00:00:00:00:00", "title": "gas-sight verify probe"}
+            client.insert("devices", probe, returning=False)
+            deleted = client.delete("devices", {"id": f"eq.{VERIFY_PROBE_ID}"}, returning=True)
+            return len(deleted) == 1, "insert and delete allowed"
+
+        report.run("devices writable", write)
+    report.data["counts"] = counts
+
+
+def cmd_schema_check(args, client, report):
+    """Compare PostgREST's column list with the schema the tooling is written against"""
+    from .local import LocalDatabase
+
+    expected = LocalDatabase()
+    live = {}
+
+    def describe():
+        live.update(client.request("GET", "/rest/v1/").json().get("definitions", {}))
+        return True, f"{len(live)} relations exposed"
+
+    if not report.run("API description", describe):
+        return
+    for relation in args.relations or SCHEMA_RELATIONS:
+        wanted = list(expected.column_kinds(relation))
+        if relation not in live:
+            report.check(relation, False, "not exposed by the API", missing=wanted, extra=[])
+            continue
+        present = live[relation].get("properties", {})
+        missing = [c for c in wanted if c not in present]
+        extra = [c for c in present if c not in wanted]
+        detail = f"missing {', '.join(missing)}" if missing else f"{len(wanted)} columns"
+        if extra:
+            detail += f" (extra: {', '.join(extra)})"
+        report.check(relation, not missing, detail, missing=missing, extra=extra)
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def cmd_bench(args, client, report):
+    """Time the queries the dashboard issues on load"""
+    import time
+
+    queries = {
+        "device_stats": lambda: client.select("device_stats", "*", order="device_created_at.desc"),
+        "sensor_data": lambda: client.select("sensor_data", "*", order="created_at.desc", limit=100),
+        "get_device_stats": lambda: client.rpc("get_device_stats"),
+    }
+    timings = {}
+    for name in args.queries or BENCH_QUERIES:
+        samples = []
+
+        def probe():
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                queries[name]()
+                samples.append((time.perf_counter() - start) * 1000)
+            p50, p95 = _percentile(samples, 0.5), _percentile(samples, 0.95)
+            timings[name] = {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2),
+                             "max_ms": round(max(samples), 2), "requests": len(samples)}
+            ok = args.max_p95 is None or p95 <= args.max_p95
+            return ok, f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, max {max(samples):.1f} ms"
+
+        report.run(name, probe)
+    report.data["timings"] = timings
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="gas-sight", description="Gas Sight Stream tooling")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per run")
+    parser.add_argument("--url", help="project URL (default $SUPABASE_URL)")
+    parser.add_argument("--key", help="API key (default $SUPABASE_KEY)")
+    parser.add_argument("--shards", default=config.shards_file(),
+                        help="JSON shard layout to route by location (default $GAS_SIGHT_SHARDS)")
+    parser.add_argument("--timeout", type=float, default=config.DEFAULT_TIMEOUT,
+                        help=f"per-request timeout in seconds (default {config.DEFAULT_TIMEOUT:g})")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    provision = commands.add_parser("provision", help="create the test devices")
+    provision.add_argument("--no-readings", dest="readings", action="store_false",
+                           help="do not add a sample reading per device")
+    provision.set_defaults(handler=cmd_provision)
+
+    verify = commands.add_parser("verify", help="check read access to tables, views and RPCs")
+    verify.add_argument("--write", action="store_true",
+                        help="also insert and delete a probe device")
+    verify.set_defaults(handler=cmd_verify)
+
+    schema = commands.add_parser("schema-check", help="compare live columns with the expected schema")
+    schema.add_argument("relations", nargs="*", metavar="relation",
+                        help=f"tables/views to check (default: {', '.join(SCHEMA_RELATIONS)})")
+    schema.set_defaults(handler=cmd_schema_check)
+
+    bench = commands.add_parser("bench", help="time the dashboard's queries")
+    bench.add_argument("-n", "--requests", type=int, default=20, help="requests per query (default 20)")
+    bench.add_argument("--query", action="append", dest="queries", choices=BENCH_QUERIES)
+    bench.add_argument("--max-p95", type=float, help="fail when a query's p95 exceeds this many ms")
+    bench.set_defaults(handler=cmd_bench)
+
+    for name in PASSTHROUGH:
+        commands.add_parser(name, add_help=False, help=f"run python -m gas_sight.{name}")
+    return parser
+
+
+def main(argv=None, client=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command in PASSTHROUGH:
+        given = [f"--{name}" for name in GLOBAL_OPTIONS if getattr(args, name) != parser.get_default(name)]
+        if given:
+            # These subcommands parse their own options and would silently ignore ours
+            parser.error(f"{', '.join(given)} must come after '{args.command}', which takes its own options")
+        import importlib
+
+        return importlib.import_module(f"{__package__}.{args.command}").main(extra)
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if client is None and args.shards:
+        from .shards import ShardedClient
+
+        client = ShardedClient.from_config(args.shards, timeout=args.timeout)
+    elif client is None:
+        from .rest import RestClient
+
+        client = RestClient(url=args.url, key=args.key, timeout=args.timeout)
+    report = Report(args.json)
+    args.handler(args, client, report)
+    return report.finish(args.command)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
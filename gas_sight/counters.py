@@ -0,0 +1,143 @@
+"""
+Write-behind aggregation of per-device counters
+
+`devices.total_packets_received`, `connection_attempts`, `last_connected`
+and `is_connected` change with every poll. Writing them per reading makes
+each device row a hot spot and fires `set_devices_updated_at` plus a
+`devices` realtime event that makes every dashboard refetch device_stats.
+
+DeviceCounters accumulates the changes in memory and applies them with
+the `apply_device_counters` RPC: one UPDATE ... FROM jsonb_to_recordset
+per flush for all devices. A flush happens every `interval` seconds (via
+flush_if_due() or the background thread from start()) or as soon as
+`max_pending` increments are buffered, so a crash loses at most
+`interval` seconds or `max_pending` increments, whichever comes first.
+A failed flush puts its batch back and is retried on the next one.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from .metrics import REGISTRY
+
+DEFAULT_INTERVAL = 15.0
+DEFAULT_MAX_PENDING = 1000
+
+
+class DeviceCounters:
+    """Buffer per-device counter updates and flush them as one batch"""
+
+    def __init__(self, client, interval=DEFAULT_INTERVAL, max_pending=DEFAULT_MAX_PENDING,
+                 registry=REGISTRY):
+        self.client = client
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._increments = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = registry.counter(
+            "gas_sight_counters_flushes_total", "Device counter flushes by outcome", ("result",)
+        )
+        self.flushed_rows = registry.counter(
+            "gas_sight_counters_rows_total", "Device rows updated by counter flushes"
+        )
+        self.pending = registry.gauge(
+            "gas_sight_counters_pending", "Increments buffered but not yet flushed"
+        )
+
+    def record(self, device_id, packets=0, attempts=0, connected=None, at=None):
+        """Add to one device's counters; flushes at once if max_pending is reached"""
+        with self._lock:
+            entry = self._pending.setdefault(device_id, {"id": device_id, "packets": 0, "attempts": 0})
+            entry["packets"] += packets
+            entry["attempts"] += attempts
+            if connected is not None:
+                entry["is_connected"] = connected
+            if connected:
+                stamp = (at or datetime.now(timezone.utc)).astimezone(timezone.utc).isoformat()
+                entry["last_connected"] = max(stamp, entry.get("last_connected") or stamp)
+            self._increments += packets + attempts
+            full = self._increments >= self.max_pending
+            self.pending.set(self._increments)
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                pass  # the batch was put back; the next flush retries it
+
+    def _merge_back(self, batch):
+        """Return a failed batch to the buffer without losing newer updates"""
+        for old in batch:
+            entry = self._pending.get(old["id"])
+            if entry is None:
+                self._pending[old["id"]] = old
+                continue
+            entry["packets"] += old["packets"]
+            entry["attempts"] += old["attempts"]
+            entry.setdefault("is_connected", old.get("is_connected"))
+            if old.get("last_connected"):
+                entry["last_connected"] = max(old["last_connected"], entry.get("last_connected") or "")
+            if entry.get("is_connected") is None:
+                entry.pop("is_connected")
+        self._increments += sum(e["packets"] + e["attempts"] for e in batch)
+
+    def flush(self):
+        """Apply everything buffered in one RPC; returns the number of device rows updated"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.values())
+                self._pending = {}
+                self._increments = 0
+                self._last_flush = time.monotonic()
+                self.pending.set(0)
+            if not batch:
+                return 0
+            try:
+                updated = self.client.rpc("apply_device_counters", {"counters": batch})
+            except Exception:
+                with self._lock:
+                    self._merge_back(batch)
+                    self.pending.set(self._increments)
+                self.flushes.inc(result="failed")
+                raise
+            self.flushes.inc(result="ok")
+            self.flushed_rows.inc(updated or 0)
+            return updated
+
+    def flush_if_due(self):
+        if time.monotonic() - self._last_flush >= self.interval:
+            return self.flush()
+        return 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                pass  # counted in gas_sight_counters_flushes_total; retried next interval
+
+    def start(self):
+        """Flush every `interval` seconds on a daemon thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="device-counters", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,239 @@
+"""
+Streaming export of sensor_data history to compressed CSV or NDJSON
+
+Rows are never collected into one list. With a direct Postgres connection
+(SUPABASE_DB_URL / --dsn) the server formats the rows itself through
+`COPY ... TO STDOUT` and the bytes go straight into the compressor.
+Without one, the export walks PostgREST with keyset pagination on
+(created_at, id), so memory stays bounded by the page size. Exports of
+the whole fleet leave out synthetic devices (devices.synthetic, e.g. the
+latency probe's canary); name a device to export it anyway.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+
+from . import config
+from .postgrest import Filter, Logic
+from .rest import RestClient
+
+EXPORT_COLUMNS = (
+    "id",
+    "device_id",
+    "created_at",
+    "title_name",
+    "tank_level",
+    "tank_level_unit",
+    "measurement",
+    "measurement_unit",
+    "battery",
+    "connection_strength",
+    "updated_refresh",
+    "technical_data",
+)
+FORMATS = ("csv", "ndjson")
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+
+class CompressedWriter:
+    """Binary writer that compresses into `out` (gzip, zstd or none)"""
+
+    def __init__(self, out, compression="gzip", level=None):
+        self._out = out
+        if compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=level or 6, mtime=0)
+        elif compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError(
+                    "zstd compression needs the 'zstandard' package (pip install zstandard)"
+                ) from None
+            self._stream = zstandard.ZstdCompressor(level=level or 3).stream_writer(
+                out, closefd=False
+            )
+        elif compression in ("none", None):
+            self._stream = out
+        else:
+            raise ValueError(f"unknown compression {compression!r}")
+
+    def write(self, data):
+        return self._stream.write(data)
+
+    def close(self):
+        if self._stream is not self._out:
+            self._stream.close()
+        self._out.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _range_filters(device_ids, start, end, exclude=()):
+    filters = []
+    if device_ids:
+        filters.append(Filter("device_id", "in", tuple(device_ids)))
+    if exclude:
+        filters.append(Filter("device_id", "in", tuple(exclude), negate=True))
+    if start:
+        filters.append(Filter("created_at", "gte", start))
+    if end:
+        filters.append(Filter("created_at", "lt", end))
+    return filters
+
+
+def iter_pages(client, device_ids=None, start=None, end=None, page_size=5000,
+               columns=EXPORT_COLUMNS, exclude=()):
+    """Yield pages of sensor_data rows in (created_at, id) order
+
+    Each page is fetched with a keyset condition on the last row seen, so
+    the cost per page does not grow with the offset.
+    """
+    select = ",".join(dict.fromkeys(tuple(columns) + ("created_at", "id")))
+    base = _range_filters(device_ids, start, end, exclude)
+    cursor = None
+    while True:
+        filters = list(base)
+        if cursor:
+            created_at, row_id = cursor
+            filters.append(Logic("or", (
+                Filter("created_at", "gt", created_at),
+                Logic("and", (Filter("created_at", "eq", created_at), Filter("id", "gt", row_id))),
+            )))
+        page = client.select(
+            "sensor_data", select, filters, order="created_at.asc,id.asc", limit=page_size
+        )
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        cursor = (page[-1]["created_at"], page[-1]["id"])
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+
+def synthetic_devices(client):
+    """Ids of synthetic devices (the latency probe's canary), left out of fleet-wide exports"""
+    return [row["id"] for row in client.select("devices", "id", {"synthetic": "eq.true"})]
+
+
+def _export_rest(stream, client, device_ids, start, end, fmt, page_size, columns):
+    count = 0
+    exclude = () if device_ids else synthetic_devices(client)
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for page in iter_pages(client, device_ids, start, end, page_size, columns, exclude):
+            writer.writerows([_csv_value(row.get(c)) for c in columns] for row in page)
+            stream.write(buffer.getvalue().encode("utf-8"))
+            buffer.seek(0)
+            buffer.truncate()
+            count += len(page)
+        if not count:
+            stream.write(buffer.getvalue().encode("utf-8"))
+    else:
+        for page in iter_pages(client, device_ids, start, end, page_size, columns, exclude):
+            lines = "".join(
+                json.dumps({c: row.get(c) for c in columns}, separators=(",", ":")) + "\n"
+                for row in page
+            )
+            stream.write(lines.encode("utf-8"))
+            count += len(page)
+    return count
+
+
+def copy_statement(fmt, columns=EXPORT_COLUMNS):
+    """The COPY statement used for direct exports (parameters: ids, start, end)"""
+    column_sql = ", ".join(columns)
+    select = (
+        f"select {column_sql} from public.sensor_data"
+        " where (%(ids)s::text[] is null or device_id = any(%(ids)s::text[]))"
+        " and (%(ids)s::text[] is not null"
+        " or device_id not in (select id from public.devices where synthetic))"
+        " and (%(start)s::timestamptz is null or created_at >= %(start)s::timestamptz)"
+        " and (%(end)s::timestamptz is null or created_at < %(end)s::timestamptz)"
+        " order by created_at, id"
+    )
+    if fmt == "csv":
+        return f"copy ({select}) to stdout with (format csv, header true)"
+    # One JSON document per line; the control-character quote/delimiter
+    # stop CSV mode from quoting or escaping the JSON text.
+    return (
+        f"copy (select row_to_json(t) from ({select}) t)"
+        " to stdout with (format csv, quote e'\\x01', delimiter e'\\x02')"
+    )
+
+
+def _export_copy(stream, dsn, device_ids, start, end, fmt, columns):
+    try:
+        import psycopg
+    except ImportError:
+        raise RuntimeError(
+            "direct exports need psycopg (pip install 'psycopg[binary]')"
+        ) from None
+    params = {"ids": list(device_ids) if device_ids else None, "start": start, "end": end}
+    with psycopg.connect(dsn) as conn, conn.cursor() as cur:
+        with cur.copy(copy_statement(fmt, columns), params) as copy:
+            for chunk in copy:
+                stream.write(chunk)
+        return cur.rowcount
+
+
+def export_sensor_data(out, device_ids=None, start=None, end=None, fmt="csv",
+                       compression="gzip", client=None, dsn=None, page_size=5000,
+                       columns=EXPORT_COLUMNS):
+    """Stream sensor_data rows to the binary file object `out`
+
+    `start` is inclusive and `end` exclusive (ISO-8601 strings). Uses COPY
+    when `dsn` is given, PostgREST keyset pages otherwise. Returns the
+    number of rows written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt!r}")
+    with CompressedWriter(out, compression) as stream:
+        if dsn:
+            return _export_copy(stream, dsn, device_ids, start, end, fmt, columns)
+        client = client or RestClient()
+        return _export_rest(stream, client, device_ids, start, end, fmt, page_size, columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sensor_data history")
+    parser.add_argument("-o", "--output", default="-", help="output file (default stdout)")
+    parser.add_argument("--device", action="append", dest="devices", help="device id (repeatable)")
+    parser.add_argument("--start", help="inclusive ISO-8601 start")
+    parser.add_argument("--end", help="exclusive ISO-8601 end")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--compress", choices=COMPRESSIONS, default="gzip")
+    parser.add_argument("--dsn", default=config.database_dsn(),
+                        help="direct Postgres connection for COPY (default $SUPABASE_DB_URL)")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        count = export_sensor_data(
+            out, args.devices, args.start, args.end, args.format, args.compress,
+            dsn=args.dsn, page_size=args.page_size,
+        )
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"✅ Exported {count} readings", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Conditional fleet stats: device_stats without re-shipping unchanged rows
+
+The `device_stats_since` RPC answers with a change token (etag) built from
+the highest per-device stats version (bumped by triggers on devices and
+sensor_data) and a BUCKET_SECONDS time bucket, since the 24 hour figures
+in device_stats move with the clock alone. (On Postgres the token carries
+the reader's transaction snapshot instead of the version, so a batch that
+commits after a later one is still shipped; clients treat it as opaque.)
+FleetStats keeps the last snapshot and passes its etag back:
+
+* unchanged -> `not_modified`, a few bytes and no aggregate query
+* same bucket -> only the devices whose stats changed, plus removed ids
+* otherwise -> the full device list
+"""
+import time
+
+from .metrics import REGISTRY
+
+BUCKET_SECONDS = 300
+
+
+def make_etag(version, now=None):
+    """Change token for a stats version in the current time bucket"""
+    bucket = int((time.time() if now is None else now) // BUCKET_SECONDS)
+    return f"{version}.{bucket}"
+
+
+def parse_etag(etag):
+    """(version, bucket) of a token, or None if it is not one"""
+    version, dot, bucket = (etag or "").partition(".")
+    if not (dot and version.isdigit() and bucket.isdigit()):
+        return None
+    return int(version), int(bucket)
+
+
+class FleetStats:
+    """device_stats snapshot refreshed with conditional device_stats_since calls"""
+
+    def __init__(self, client, registry=REGISTRY):
+        self.client = client
+        self.etag = None
+        self._rows = {}
+        self.refreshes = registry.counter(
+            "gas_sight_fleet_stats_refreshes_total", "device_stats refreshes by outcome", ("result",)
+        )
+
+    def refresh(self):
+        """Bring the snapshot up to date; returns True if anything changed"""
+        result = self.client.rpc("device_stats_since", {"since": self.etag})
+        self.etag = result["etag"]
+        if result.get("not_modified"):
+            self.refreshes.inc(result="not_modified")
+            return False
+        if result.get("full"):
+            self._rows = {}
+        for row in result.get("devices") or []:
+            self._rows[row["id"]] = row
+        for device_id in result.get("removed") or []:
+            self._rows.pop(device_id, None)
+        self.refreshes.inc(result="full" if result.get("full") else "diff")
+        return True
+
+    def devices(self):
+        """Current rows, newest device first (the dashboard's order)"""
+        return sorted(self._rows.values(), key=lambda r: r.get("device_created_at") or "", reverse=True)
+
+    def get(self, device_id):
+        return self._rows.get(device_id)
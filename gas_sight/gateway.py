@@ -0,0 +1,367 @@
+"""
+Asyncio BLE gateway: polls many tanks over a few radio slots
+
+GatewayScheduler runs one worker per radio slot. Each worker repeatedly
+picks the due device with the highest priority (how stale its last
+reading is, plus a bonus for a strong RSSI, which connects faster and
+fails less), connects through the radio transport, reads the data
+characteristic and hands the reading to `on_reading(reading)`, called
+with one sensor_data row dict (e.g. `lambda r: writer.write([r])` for a
+SensorWriter). Failed connections back off exponentially per device.
+Per-device counters (packets, connection attempts, last_connected) go to
+an optional write-behind DeviceCounters instead of the devices row.
+
+Sinks never hold up polling: plain callables (on_reading and
+DeviceCounters.record, which may flush over REST) run in order on one
+sink thread off the event loop, and coroutine functions run as their own
+tasks. run() waits for outstanding sink calls before returning; a
+sink that raises is logged and counted in gas_sight_gateway_sink_errors_total.
+
+Transports are objects with `async read(device) -> payload dict` that
+raise RadioError on failure. SimulatedRadio is an in-process backend with
+configurable connect times and RSSI-dependent failures, so scheduling
+throughput can be measured without hardware (benchmarks/bench_gateway.py).
+Time comes from a Clock; ScaledClock runs simulated time faster than the
+wall clock.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from .metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 60.0
+MIN_RSSI = -100
+
+
+class RadioError(Exception):
+    """A BLE connection or read that did not complete"""
+
+
+class Clock:
+    """Wall-clock time for the scheduler and transports"""
+
+    def now(self):
+        return time.monotonic()
+
+    def real(self, seconds):
+        """Wall-clock seconds corresponding to `seconds` of clock time"""
+        return max(0.0, seconds)
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(self.real(seconds))
+
+
+class ScaledClock(Clock):
+    """Simulated time running `speedup` times faster than the wall clock"""
+
+    def __init__(self, speedup=100.0):
+        self.speedup = speedup
+        self._origin = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._origin) * self.speedup
+
+    def real(self, seconds):
+        return max(0.0, seconds) / self.speedup
+
+
+@dataclass
+class GatewayDevice:
+    id: str
+    title: str = ""
+    mac_address: str = ""
+    service_uuid: str = ""
+    data_characteristic_uuid: str = ""
+    rssi: int = None
+    last_read: float = None
+    next_attempt: float = 0.0
+    failures: int = 0
+    connection_attempts: int = 0
+    packets_received: int = 0
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row["id"],
+            title=row.get("title") or "",
+            mac_address=row.get("mac_address") or "",
+            service_uuid=row.get("service_uuid") or "",
+            data_characteristic_uuid=row.get("data_characteristic_uuid") or "",
+            rssi=row.get("rssi"),
+        )
+
+
+def load_devices(client):
+    """Enabled devices from the devices table"""
+    rows = client.select(
+        "devices", "id,title,mac_address,service_uuid,data_characteristic_uuid,rssi",
+        {"enabled": "eq.true"}, order="id",
+    )
+    return [GatewayDevice.from_row(row) for row in rows]
+
+
+def _battery(level):
+    if level >= 70:
+        return "Full"
+    return "Ok" if level >= 30 else "Low"
+
+
+def build_reading(device, payload):
+    """Turn a transport payload into a sensor_data row"""
+    rssi = payload.get("rssi", device.rssi)
+    strength = 0 if rssi is None else int(min(100, max(0, (rssi - MIN_RSSI) * 100 / 70)))
+    raw = bytes(payload.get("raw", b""))
+    return {
+        "device_id": device.id,
+        "title_name": device.title,
+        "tank_level": payload["tank_level"],
+        "updated_refresh": "gateway",
+        "battery": _battery(payload["battery_level"]),
+        "connection_strength": strength,
+        "measurement": payload["gas_level"],
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "technical_data": {"_technical": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "source": "gateway",
+            "raw_data": {"hex": raw.hex(), "int": list(raw), "bytes": len(raw)},
+            "parsed_data": {
+                "gas_level": payload["gas_level"],
+                "tank_level": payload["tank_level"],
+                "battery_level": payload["battery_level"],
+            },
+            "packet_number": payload["packet_number"],
+        }},
+    }
+
+
+class SimulatedRadio:
+    """In-process radio: connect/read delays and RSSI-dependent failures"""
+
+    def __init__(self, clock=None, connect_time=(0.8, 2.5), read_time=0.2,
+                 failure_rate=0.02, weak_rssi=-85, weak_failure_rate=0.3, seed=None):
+        self.clock = clock or Clock()
+        self.connect_time = connect_time
+        self.read_time = read_time
+        self.failure_rate = failure_rate
+        self.weak_rssi = weak_rssi
+        self.weak_failure_rate = weak_failure_rate
+        self.random = random.Random(seed)
+        self.active = 0
+        self.max_active = 0
+        self._state = {}
+
+    def _rssi(self, device):
+        base = device.rssi if device.rssi is not None else self.random.randint(-95, -55)
+        return base + self.random.randint(-3, 3)
+
+    async def read(self, device):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            rssi = self._rssi(device)
+            failure_rate = self.weak_failure_rate if rssi < self.weak_rssi else self.failure_rate
+            await self.clock.sleep(self.random.uniform(*self.connect_time))
+            if self.random.random() < failure_rate:
+                raise RadioError(f"{device.mac_address or device.id}: connection failed")
+            await self.clock.sleep(self.read_time)
+            packet, gas = self._state.get(device.id, (self.random.randrange(1 << 16), 80.0))
+            packet = (packet + 1) % (1 << 16)
+            gas = max(0.0, gas - self.random.uniform(0, 0.05))
+            self._state[device.id] = (packet, gas)
+            tank = round(gas * 1.2, 1)
+            return {
+                "gas_level": round(gas, 1),
+                "tank_level": tank,
+                "battery_level": 90,
+                "rssi": rssi,
+                "packet_number": packet,
+                "raw": bytes([int(gas), int(tank) & 0xFF, 90, packet >> 8, packet & 0xFF]),
+            }
+        finally:
+            self.active -= 1
+
+
+class GatewayScheduler:
+    """Poll devices every `interval` seconds over `slots` concurrent radio slots"""
+
+    def __init__(self, devices, transport, slots=2, interval=DEFAULT_INTERVAL, backoff=5.0,
+                 max_backoff=600.0, rssi_weight=0.5, on_reading=None, counters=None,
+                 clock=None, registry=REGISTRY):
+        self.devices = {device.id: device for device in devices}
+        self.transport = transport
+        self.slots = slots
+        self.interval = interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rssi_weight = rssi_weight
+        self.on_reading = on_reading
+        self.counters = counters
+        self.clock = clock or Clock()
+        self.readings = 0
+        self.failures = 0
+        self._busy = set()
+        self._stopping = False
+        self._changed = None
+        self._started = None
+        self._sink_thread = None
+        self._sink_calls = set()
+        self.reads = registry.counter(
+            "gas_sight_gateway_reads_total", "Device polls by outcome", ("result",)
+        )
+        self.read_seconds = registry.histogram(
+            "gas_sight_gateway_read_seconds", "Connect-and-read time per device poll",
+            buckets=(0.5, 1, 2, 3, 5, 10, 30),
+        )
+        self.busy_slots = registry.gauge(
+            "gas_sight_gateway_busy_slots", "Radio slots currently connected"
+        )
+        self.sink_errors = registry.counter(
+            "gas_sight_gateway_sink_errors_total", "on_reading / counter calls that raised"
+        )
+
+    def priority(self, device, now):
+        """Higher polls first: seconds since the last reading plus an RSSI bonus"""
+        staleness = now - device.last_read if device.last_read is not None else now + self.interval * 10
+        rssi = device.rssi if device.rssi is not None else MIN_RSSI
+        return staleness + self.rssi_weight * (rssi - MIN_RSSI)
+
+    def next_device(self, now):
+        """The due, idle device with the highest priority (None if nothing is due)"""
+        due = [d for d in self.devices.values() if d.id not in self._busy and d.next_attempt <= now]
+        if not due:
+            return None
+        return max(due, key=lambda d: self.priority(d, now))
+
+    def _next_due(self, now):
+        waiting = [d.next_attempt for d in self.devices.values() if d.id not in self._busy]
+        return min(waiting) - now if waiting else self.interval
+
+    async def _idle(self, seconds):
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.clock.real(seconds))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _hand_off(self, sink, *args, **kwargs):
+        """Run a sink without holding up polling"""
+        if inspect.iscoroutinefunction(sink):
+            call = asyncio.ensure_future(sink(*args, **kwargs))
+        else:
+            call = asyncio.get_running_loop().run_in_executor(
+                self._sink_thread, functools.partial(sink, *args, **kwargs)
+            )
+        self._sink_calls.add(call)
+        call.add_done_callback(self._sink_done)
+
+    def _sink_done(self, call):
+        self._sink_calls.discard(call)
+        if call.cancelled():
+            return
+        error = call.exception()
+        if error is not None:
+            self.sink_errors.inc()
+            log.error("gateway sink failed", exc_info=error)
+            return
+        result = call.result()
+        if inspect.isawaitable(result):
+            # a plain callable that returned a coroutine
+            follow_up = asyncio.ensure_future(result)
+            self._sink_calls.add(follow_up)
+            follow_up.add_done_callback(self._sink_done)
+
+    async def _poll(self, device):
+        start = self.clock.now()
+        device.connection_attempts += 1
+        try:
+            payload = await self.transport.read(device)
+        except (RadioError, OSError, asyncio.TimeoutError):
+            self.failures += 1
+            device.failures += 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (device.failures - 1))
+            device.next_attempt = self.clock.now() + delay * random.uniform(0.8, 1.2)
+            self.reads.inc(result="failed")
+            if self.counters is not None:
+                self._hand_off(self.counters.record, device.id, attempts=1, connected=False)
+            return
+        finished = self.clock.now()
+        self.read_seconds.observe(finished - start)
+        self.reads.inc(result="ok")
+        self.readings += 1
+        device.failures = 0
+        device.rssi = payload.get("rssi", device.rssi)
+        device.last_read = finished
+        device.packets_received += 1
+        device.next_attempt = finished + self.interval
+        if self.counters is not None:
+            self._hand_off(self.counters.record, device.id, packets=1, attempts=1, connected=True)
+        if self.on_reading is not None:
+            self._hand_off(self.on_reading, build_reading(device, payload))
+
+    async def _worker(self):
+        while not self._stopping:
+            now = self.clock.now()
+            device = self.next_device(now)
+            if device is None:
+                await self._idle(self._next_due(now))
+                continue
+            self._busy.add(device.id)
+            self.busy_slots.set(len(self._busy))
+            try:
+                await self._poll(device)
+            finally:
+                self._busy.discard(device.id)
+                self.busy_slots.set(len(self._busy))
+                await self._notify()
+
+    async def run(self, duration=None):
+        """Poll until stop() is called or `duration` clock seconds have passed"""
+        self._stopping = False
+        self._changed = asyncio.Condition()
+        self._started = self.clock.now()
+        # one thread keeps sink calls in order and off the event loop
+        self._sink_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gateway-sink")
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.slots)]
+        try:
+            if duration is None:
+                await asyncio.gather(*workers)
+            else:
+                await self.clock.sleep(duration)
+                await self.stop()
+                await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            while self._sink_calls:
+                await asyncio.gather(*list(self._sink_calls), return_exceptions=True)
+            self._sink_thread.shutdown(wait=True)
+
+    async def stop(self):
+        self._stopping = True
+        await self._notify()
+
+    def stats(self):
+        """Throughput so far, in clock time"""
+        elapsed = self.clock.now() - self._started if self._started is not None else 0.0
+        minutes = elapsed / 60 or 1.0
+        return {
+            "devices": len(self.devices),
+            "slots": self.slots,
+            "elapsed_seconds": elapsed,
+            "readings": self.readings,
+            "failures": self.failures,
+            "readings_per_minute_per_slot": self.readings / minutes / self.slots,
+        }
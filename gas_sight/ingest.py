@@ -0,0 +1,240 @@
+"""
+Live ingest path for sensor_data with packet-level deduplication
+
+BLE gateways often deliver the same notification several times. Before a
+reading costs a database write, SensorWriter checks its
+`technical_data._technical.packet_number` against a bounded per-device
+window of recently seen packets:
+
+* PacketWindow is a sliding bitmap (like an anti-replay window) over the
+  packet counter unwrapped into an ever-increasing sequence, so a counter
+  wrapping from `modulus - 1` to 0 continues the sequence instead of
+  looking like a repeat. A jump backwards that is further back than the
+  window, or that arrives more than `horizon` seconds after the newest
+  packet, is taken as a device reboot and starts a new run (retransmitted
+  copies arrive within seconds of the original).
+* Deduplicator keeps one window per device in an LRU bounded by
+  `max_devices`; a device seen for the first time (or evicted) is seeded
+  from the packets of its most recent stored readings.
+
+Accepted readings are stamped with packet_seq and inserted with
+ON CONFLICT (device_id, packet_seq) DO NOTHING, so the unique index
+catches what the in-memory window cannot (other gateways, restarts).
+Outcomes are counted in gas_sight_ingest_readings_total{result}.
+Stored rows can also be pushed to an AlertEngine (`alerts=`) and a
+live.LiveBuffer (`live=`).
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .backfill import packet_number, reading_time
+from .metrics import REGISTRY
+from .postgrest import Filter
+from .rest import RestClient
+from .wire import PROJECTIONS
+
+DEFAULT_MODULUS = 1 << 16
+DEFAULT_WINDOW = 1024
+DEFAULT_HORIZON = 120.0
+
+
+class PacketWindow:
+    """Sliding bitmap of the last `size` packet sequence numbers of one device"""
+
+    def __init__(self, size=DEFAULT_WINDOW, modulus=DEFAULT_MODULUS, horizon=DEFAULT_HORIZON):
+        if not 0 < size < modulus // 2:
+            raise ValueError("window size must be positive and below half the modulus")
+        self.size = size
+        self.modulus = modulus
+        self.horizon = horizon
+        self.highest = None
+        self.highest_at = None
+        self.bits = 0
+
+    def sequence(self, packet, at=None):
+        """The unwrapped sequence number `packet` (seen at epoch `at`) most likely belongs to"""
+        packet %= self.modulus
+        if self.highest is None:
+            return packet
+        ahead = (packet - self.highest) % self.modulus
+        if ahead < self.modulus // 2:
+            return self.highest + ahead
+        behind = self.modulus - ahead
+        stale = at is not None and self.highest_at is not None and at - self.highest_at > self.horizon
+        if behind < self.size and not stale:
+            return self.highest - behind
+        # The device restarted its counter
+        return (self.highest // self.modulus + 1) * self.modulus + packet
+
+    def add(self, seq, at=None):
+        """Record `seq`; returns False if it was already in the window"""
+        if self.highest is None or seq > self.highest:
+            shift = 0 if self.highest is None else seq - self.highest
+            self.bits = ((self.bits << shift) | 1) & ((1 << self.size) - 1) if shift < self.size else 1
+            self.highest = seq
+            self.highest_at = at
+            return True
+        behind = self.highest - seq
+        if behind >= self.size:
+            return False
+        mask = 1 << behind
+        if self.bits & mask:
+            return False
+        self.bits |= mask
+        return True
+
+    def forget(self, seq):
+        """Undo add(seq) for a reading that was never stored"""
+        if self.highest is not None and 0 <= self.highest - seq < self.size:
+            self.bits &= ~(1 << (self.highest - seq))
+
+    def check(self, packet, at=None):
+        """(is_new, seq) for a raw packet counter value"""
+        seq = self.sequence(packet, at)
+        return self.add(seq, at), seq
+
+
+class Deduplicator:
+    """Per-device packet windows, LRU-bounded, with hit-rate metrics"""
+
+    def __init__(self, client=None, window=DEFAULT_WINDOW, modulus=DEFAULT_MODULUS,
+                 horizon=DEFAULT_HORIZON, max_devices=10000, registry=REGISTRY):
+        self.client = client
+        self.window = window
+        self.modulus = modulus
+        self.horizon = horizon
+        self.max_devices = max_devices
+        self._windows = OrderedDict()
+        self.readings = registry.counter(
+            "gas_sight_ingest_readings_total", "Ingested readings by dedup outcome", ("result",)
+        )
+        self.tracked = registry.gauge(
+            "gas_sight_ingest_dedup_devices", "Devices with an in-memory packet window"
+        )
+        self.hit_ratio = registry.gauge(
+            "gas_sight_ingest_dedup_hit_ratio", "Share of numbered readings dropped as duplicates"
+        )
+
+    def _window(self, device_id):
+        window = self._windows.get(device_id)
+        if window is not None:
+            self._windows.move_to_end(device_id)
+            return window
+        window = PacketWindow(self.window, self.modulus, self.horizon)
+        if self.client is not None:
+            self._seed(device_id, window)
+        self._windows[device_id] = window
+        if len(self._windows) > self.max_devices:
+            self._windows.popitem(last=False)
+        self.tracked.set(len(self._windows))
+        return window
+
+    def _seed(self, device_id, window):
+        """Load the packets of a device's most recent stored readings
+
+        Readings written without packet_seq (backfills, other writers) still
+        carry their packet_number and are unwrapped like live ones.
+        """
+        rows = self.client.select(
+            "sensor_data", "packet_seq,packet_number,created_at",
+            [Filter("device_id", "eq", device_id), Filter("packet_number", "is", None, negate=True)],
+            order="created_at.desc", limit=window.size,
+        )
+        for row in reversed(rows):
+            at = reading_time(row).timestamp()
+            if row["packet_seq"] is not None:
+                window.add(row["packet_seq"], at)
+            else:
+                window.check(row["packet_number"], at)
+
+    def check(self, device_id, packet, at=None):
+        """(is_new, seq) for one reading's packet number, `at` in epoch seconds"""
+        return self._window(device_id).check(packet, at)
+
+    def forget(self, device_id, seq):
+        window = self._windows.get(device_id)
+        if window is not None:
+            window.forget(seq)
+
+    def record(self, result, amount=1):
+        self.readings.inc(amount, result=result)
+        duplicate = self.readings.value(result="duplicate") + self.readings.value(result="conflict")
+        numbered = duplicate + self.readings.value(result="accepted")
+        if numbered:
+            self.hit_ratio.set(duplicate / numbered)
+
+
+@dataclass
+class IngestResult:
+    received: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    conflicts: int = 0
+
+
+class SensorWriter:
+    """Write live readings to sensor_data, dropping BLE retransmissions first"""
+
+    def __init__(self, client=None, dedup=None, batch_size=500, alerts=None, live=None):
+        self.client = client or RestClient()
+        self.dedup = dedup or Deduplicator(self.client)
+        self.batch_size = batch_size
+        self.alerts = alerts
+        self.live = live
+
+    def write(self, readings):
+        """Insert readings (dicts with sensor_data columns); returns an IngestResult"""
+        result = IngestResult()
+        batch = []
+        for reading in readings:
+            result.received += 1
+            packet = packet_number(reading)
+            if packet is None:
+                self.dedup.record("unnumbered")
+                batch.append({**reading, "packet_seq": None})
+            else:
+                at = reading_time(reading)
+                is_new, seq = self.dedup.check(
+                    reading["device_id"], packet, at.timestamp() if at else None
+                )
+                if not is_new:
+                    result.duplicates += 1
+                    self.dedup.record("duplicate")
+                    continue
+                batch.append({**reading, "packet_seq": seq})
+            if len(batch) >= self.batch_size:
+                self._flush(batch, result)
+                batch = []
+        if batch:
+            self._flush(batch, result)
+        return result
+
+    def _flush(self, batch, result):
+        numbered = sum(1 for row in batch if row["packet_seq"] is not None)
+        # Alerts and the live buffer see only the rows actually stored, with
+        # their id and created_at
+        stored_rows = self.live is not None or self.alerts is not None
+        columns = "packet_seq," + PROJECTIONS["chart_point"] if stored_rows else "packet_seq"
+        try:
+            stored = self.client.insert(
+                "sensor_data", batch, on_conflict="device_id,packet_seq", resolution="ignore",
+                columns=columns,
+            )
+        except Exception:
+            # Let a retry of the same readings through the window
+            for row in batch:
+                if row["packet_seq"] is not None:
+                    self.dedup.forget(row["device_id"], row["packet_seq"])
+            raise
+        stored_numbered = sum(1 for row in stored if row.get("packet_seq") is not None)
+        conflicts = numbered - stored_numbered
+        result.inserted += len(stored)
+        result.conflicts += conflicts
+        if stored_numbered:
+            self.dedup.record("accepted", stored_numbered)
+        if conflicts:
+            self.dedup.record("conflict", conflicts)
+        if self.alerts is not None:
+            self.alerts.process_many(stored)
+        if self.live is not None:
+            self.live.extend(stored)
@@ -0,0 +1,343 @@
+"""
+In-memory live windows: the last N readings of every device
+
+Live charts used to re-query `sensor_data ORDER BY created_at DESC LIMIT n`
+whenever one was opened or reconnected. LiveBuffer keeps a fixed-size ring
+per device instead, stored column-wise in `array` columns (timestamps as
+epoch microseconds, metrics as doubles, battery as a small code), and
+serves windows and deltas without touching the database:
+
+* every reading added gets the next value of one buffer-wide sequence
+  number; `window()` returns the latest rows and the current `seq`
+* a full ring evicts its oldest reading by created_at, and a reading older
+  than all of them (a late backfill) is not added
+* `since(seq)` returns the rows added after `seq`, or flags a device as
+  `reset` (with its whole window) when readings after `seq` were evicted,
+  deleted, or the client's `epoch` belongs to an earlier buffer
+* clients merge delta rows by `id` (an UPDATE re-sends a row) and keep the
+  newest `limit` rows
+
+The buffer is fed by SensorWriter(live=...) on the ingest path and/or by a
+ChangeFeed (`attach()`); `seed()` loads the rings from the database once at
+startup and again after a feed gap. `serve()` exposes it over HTTP:
+
+    GET /live?device=tank_a&limit=20                 -> {"epoch", "seq", "rows", "reset"}
+    GET /live?device=tank_a&since=1041&epoch=...     -> rows added after 1041
+"""
+import json
+import math
+import threading
+import uuid
+from array import array
+from datetime import datetime, timezone
+
+from .backfill import reading_time
+from .metrics import REGISTRY
+from .postgrest import Filter
+from .wire import PROJECTIONS
+
+DEFAULT_CAPACITY = 120
+DEFAULT_PORT = 9465
+BATTERY_LEVELS = ("Full", "Ok", "Low")
+_BATTERY_CODES = {level: code for code, level in enumerate(BATTERY_LEVELS)}
+
+
+def _micros(value):
+    at = reading_time({"created_at": value})
+    return int(at.timestamp()) * 1_000_000 + at.microsecond
+
+
+def _iso(micros):
+    seconds, fraction = divmod(micros, 1_000_000)
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=fraction).isoformat()
+
+
+def _number(value):
+    return math.nan if value is None else float(value)
+
+
+def _value(number):
+    return None if math.isnan(number) else number
+
+
+class DeviceRing:
+    """The last `capacity` readings of one device, one array per column"""
+
+    __slots__ = ("device_id", "capacity", "size", "head", "dropped", "index", "ids", "seqs",
+                 "times", "measurement", "tank_level", "connection", "battery")
+
+    def __init__(self, device_id, capacity=DEFAULT_CAPACITY):
+        self.device_id = device_id
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # next free slot while filling
+        self.dropped = 0  # highest seq no longer in the ring
+        self.index = {}  # reading id -> slot
+        self.ids = [None] * capacity
+        self.seqs = array("q", bytes(8 * capacity))
+        self.times = array("q", bytes(8 * capacity))
+        self.measurement = array("d", bytes(8 * capacity))
+        self.tank_level = array("d", bytes(8 * capacity))
+        self.connection = array("h", bytes(2 * capacity))
+        self.battery = array("b", bytes(capacity))
+
+    def put(self, seq, reading):
+        """Store a reading under `seq`, overwriting the same id or the oldest reading
+
+        When the ring is full a reading older than everything in it is not
+        stored (returns False): a late backfill must not evict newer points.
+        """
+        at = _micros(reading["created_at"])
+        slot = self.index.get(reading["id"])
+        if slot is None:
+            if self.size == self.capacity:
+                slot = min(range(self.capacity), key=lambda s: (self.times[s], self.seqs[s]))
+                if at < self.times[slot]:
+                    return False
+                self.dropped = max(self.dropped, self.seqs[slot])
+                del self.index[self.ids[slot]]
+            else:
+                slot = self.head
+                self.head += 1
+                self.size += 1
+            self.ids[slot] = reading["id"]
+            self.index[reading["id"]] = slot
+        self.seqs[slot] = seq
+        self.times[slot] = at
+        self.measurement[slot] = _number(reading.get("measurement"))
+        self.tank_level[slot] = _number(reading.get("tank_level"))
+        strength = reading.get("connection_strength")
+        self.connection[slot] = -1 if strength is None else strength
+        self.battery[slot] = _BATTERY_CODES.get(reading.get("battery"), -1)
+        return True
+
+    def slots(self):
+        """Occupied slots, oldest reading first"""
+        return sorted(
+            (slot for slot in range(self.capacity) if self.ids[slot] is not None),
+            key=lambda slot: (self.times[slot], self.seqs[slot]),
+        )
+
+    def row(self, slot):
+        return {
+            "id": self.ids[slot],
+            "device_id": self.device_id,
+            "created_at": _iso(self.times[slot]),
+            "measurement": _value(self.measurement[slot]),
+            "tank_level": _value(self.tank_level[slot]),
+            "connection_strength": None if self.connection[slot] < 0 else self.connection[slot],
+            "battery": BATTERY_LEVELS[self.battery[slot]] if self.battery[slot] >= 0 else None,
+            "seq": self.seqs[slot],
+        }
+
+    def rows(self, after=None, limit=None):
+        slots = self.slots()
+        if after is not None:
+            slots = [slot for slot in slots if self.seqs[slot] > after]
+        if limit is not None:
+            slots = slots[-limit:] if limit > 0 else []
+        return [self.row(slot) for slot in slots]
+
+
+class LiveBuffer:
+    """Ring buffers of recent readings for every device, with sequence-numbered deltas"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, client=None, registry=REGISTRY):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.client = client
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._rings = {}
+        self._lock = threading.Lock()
+        self.added = registry.counter(
+            "gas_sight_live_readings_total", "Readings added to the live buffer", ("source",)
+        )
+        self.requests = registry.counter(
+            "gas_sight_live_requests_total", "Live window requests served from memory", ("kind",)
+        )
+        self.tracked = registry.gauge(
+            "gas_sight_live_devices", "Devices with a live ring buffer"
+        )
+
+    def _ring(self, device_id):
+        ring = self._rings.get(device_id)
+        if ring is None:
+            ring = self._rings[device_id] = DeviceRing(device_id, self.capacity)
+            self.tracked.set(len(self._rings))
+        return ring
+
+    def extend(self, readings, source="ingest", overwrite=False):
+        """Add sensor_data rows (needs id, device_id, created_at); returns the number added
+
+        A reading already in the buffer (seen on both the ingest path and the
+        change stream) is skipped unless `overwrite` is set, as for an UPDATE.
+        """
+        added = 0
+        with self._lock:
+            for reading in readings:
+                if not (reading.get("id") and reading.get("device_id") and reading.get("created_at")):
+                    continue
+                ring = self._ring(reading["device_id"])
+                if reading["id"] in ring.index and not overwrite:
+                    continue
+                if ring.put(self.seq + 1, reading):
+                    self.seq += 1
+                    added += 1
+        if added:
+            self.added.inc(added, source=source)
+        return added
+
+    def add(self, reading, source="ingest", overwrite=False):
+        return self.extend([reading], source, overwrite) == 1
+
+    def replace(self, device_id, readings):
+        """Rebuild a device's ring from `readings` plus what it holds; clients behind get a reset"""
+        with self._lock:
+            old = self._rings.get(device_id)
+            merged = {row["id"]: row for row in readings}
+            if old is not None:
+                for row in old.rows():
+                    merged.setdefault(row["id"], row)
+            ordered = sorted(merged.values(), key=lambda row: (_micros(row["created_at"]), row["id"]))
+            ring = DeviceRing(device_id, self.capacity)
+            ring.dropped = self.seq
+            for row in ordered[-self.capacity:]:
+                self.seq += 1
+                ring.put(self.seq, row)
+            self._rings[device_id] = ring
+            self.tracked.set(len(self._rings))
+
+    def discard(self, device_id, reading_id=None):
+        """Forget a deleted reading (or the whole device when reading_id is None)"""
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return
+            if reading_id is None:
+                del self._rings[device_id]
+                self.tracked.set(len(self._rings))
+                return
+            if reading_id not in ring.index:
+                return
+            kept = [row for row in ring.rows() if row["id"] != reading_id]
+            fresh = DeviceRing(device_id, self.capacity)
+            fresh.dropped = self.seq
+            for row in kept:
+                self.seq += 1
+                fresh.put(self.seq, row)
+            self._rings[device_id] = fresh
+
+    def window(self, device_ids, limit=None):
+        """The latest `limit` rows of each device: {"epoch", "seq", "rows", "reset"}"""
+        self.requests.inc(kind="window")
+        with self._lock:
+            rows = []
+            for device_id in device_ids:
+                ring = self._rings.get(device_id)
+                if ring is not None:
+                    rows.extend(ring.rows(limit=limit))
+            return self._result(rows, list(device_ids))
+
+    def since(self, seq, device_ids, limit=None, epoch=None):
+        """Rows added after `seq`; devices that cannot be caught up are listed in reset, whole"""
+        if (epoch is not None and epoch != self.epoch) or seq > self.seq:
+            self.requests.inc(kind="reset")
+            return self.window(device_ids, limit)
+        self.requests.inc(kind="delta")
+        with self._lock:
+            rows, reset = [], []
+            for device_id in device_ids:
+                ring = self._rings.get(device_id)
+                if ring is None:
+                    continue
+                if ring.dropped > seq:
+                    reset.append(device_id)
+                    rows.extend(ring.rows(limit=limit))
+                else:
+                    rows.extend(ring.rows(after=seq, limit=limit))
+            return self._result(rows, reset)
+
+    def _result(self, rows, reset):
+        rows.sort(key=lambda row: (row["created_at"], row["seq"]))
+        return {"epoch": self.epoch, "seq": self.seq, "rows": rows, "reset": reset}
+
+    def seed(self, client=None, device_ids=None):
+        """Load the latest `capacity` readings of each device from the database"""
+        client = client or self.client
+        if device_ids is None:
+            device_ids = [row["id"] for row in client.select("devices", "id")]
+        for device_id in device_ids:
+            rows = client.select(
+                "sensor_data", PROJECTIONS["chart_point"], [Filter("device_id", "eq", device_id)],
+                order="created_at.desc", limit=self.capacity,
+            )
+            self.replace(device_id, rows)
+            self.added.inc(len(rows), source="seed")
+
+    def on_change(self, change):
+        """ChangeFeed subscriber for sensor_data and devices"""
+        if change.table == "sensor_data":
+            if change.type == "DELETE":
+                row = change.old_record
+                if row.get("device_id"):
+                    self.discard(row["device_id"], row.get("id"))
+            else:
+                self.extend([change.record], source="change", overwrite=change.type == "UPDATE")
+        elif change.table == "devices" and change.type == "DELETE":
+            if change.old_record.get("id"):
+                self.discard(change.old_record["id"])
+
+    def on_gap(self):
+        """The change stream dropped events: reload every ring"""
+        if self.client is not None:
+            self.seed()
+
+    def attach(self, feed):
+        """Follow a ChangeFeed; returns the unsubscribe function"""
+        return feed.subscribe(self.on_change, tables=("sensor_data", "devices"), on_gap=self.on_gap)
+
+    def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Serve GET /live from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs, urlsplit
+
+        buffer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path != "/live":
+                    self.send_error(404)
+                    return
+                params = parse_qs(url.query)
+                devices = [d for value in params.get("device", []) for d in value.split(",") if d]
+                try:
+                    limit = int(params["limit"][0]) if "limit" in params else None
+                    since = int(params["since"][0]) if "since" in params else None
+                except ValueError:
+                    self.send_error(400, "limit and since must be integers")
+                    return
+                if not devices:
+                    self.send_error(400, "at least one device is required")
+                    return
+                if since is None:
+                    result = buffer.window(devices, limit)
+                else:
+                    result = buffer.since(since, devices, limit, params.get("epoch", [None])[0])
+                body = json.dumps(result).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,1006 @@
+"""
+In-process stand-in for the Supabase database and its PostgREST API
+
+LocalDatabase keeps the devices / sensor_data / comments schema (plus the
+device_stats view and the RPCs the tooling calls) in SQLite, and
+LocalTransport answers RestClient requests against it with PostgREST
+status codes, error payloads and headers. Tests get a real database with
+constraints, cascades and triggers without a network round trip, and
+every test runs inside a savepoint that is rolled back afterwards. Writes
+made through LocalTransport are published on `db.changes` like the
+realtime publication would.
+"""
+import csv
+import io
+import json
+import pathlib
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from .changes import Change, ChangeFeed
+from .fleet import make_etag, parse_etag
+from .postgrest import Logic, QueryError, parse_query
+from .resample import METRICS, resample
+from .rest import Response
+from .tiers import (DEFAULT_MAX_POINTS, bucket_start, choose_tier, history_row, parse_interval,
+                    raw_history_row, rollup)
+from .wire import pack
+
+NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%f000+00:00', 'now')"
+DAY_AGO_SQL = "strftime('%Y-%m-%dT%H:%M:%f000+00:00', 'now', '-24 hours')"
+
+# Column types use the Postgres names; LocalDatabase reads them back with
+# PRAGMA table_info to convert booleans, timestamps and jsonb on the way
+# in and out.
+SCHEMA = f"""
+create table if not exists devices (
+  id text primary key,
+  name text not null,
+  mac_address text not null unique,
+  title text not null,
+  location text not null default '',
+  service_uuid text not null default '0000fff0-0000-1000-8000-00805f9b34fb',
+  data_characteristic_uuid text not null default '0000fff1-0000-1000-8000-00805f9b34fb',
+  enabled boolean not null default 1,
+  color text not null default '#22c55e',
+  rssi integer,
+  confidence_score numeric,
+  last_discovered timestamptz,
+  is_connected boolean not null default 0,
+  last_connected timestamptz,
+  connection_attempts integer not null default 0,
+  total_packets_received integer not null default 0,
+  created_at timestamptz not null default ({NOW_SQL}),
+  updated_at timestamptz not null default ({NOW_SQL}),
+  synthetic boolean not null default 0
+);
+
+create table if not exists sensor_data (
+  id uuid primary key,
+  device_id text not null references devices(id) on delete cascade,
+  title_name text not null,
+  tank_level numeric not null,
+  tank_level_unit text default 'cm',
+  updated_refresh text not null,
+  battery text not null check (battery in ('Full', 'Ok', 'Low')),
+  connection_strength integer not null check (connection_strength >= 0 and connection_strength <= 100),
+  measurement numeric not null,
+  measurement_unit text default '%',
+  technical_data jsonb,
+  created_at timestamptz not null default ({NOW_SQL}),
+  updated_at timestamptz not null default ({NOW_SQL}),
+  backfill_batch_id uuid,
+  packet_seq bigint,
+  packet_number bigint generated always as (
+    case when json_type(technical_data, '$._technical.packet_number') in ('integer', 'real')
+    then cast(json_extract(technical_data, '$._technical.packet_number') as integer) end
+  ) stored
+);
+
+create index if not exists sensor_data_device_packet_idx on sensor_data (device_id, packet_number, created_at)
+  where packet_number is not null;
+create unique index if not exists sensor_data_device_packet_seq_key on sensor_data (device_id, packet_seq);
+create index if not exists sensor_data_device_created_idx on sensor_data (device_id, created_at desc);
+create index if not exists sensor_data_created_at_idx on sensor_data (created_at desc);
+
+create table if not exists comments (
+  id uuid primary key,
+  sensor_data_id uuid not null references sensor_data(id) on delete cascade,
+  comment_text text not null,
+  user_name text not null default 'Anonymous',
+  created_at timestamptz not null default ({NOW_SQL}),
+  updated_at timestamptz not null default ({NOW_SQL})
+);
+
+create index if not exists idx_comments_sensor_data_id on comments (sensor_data_id);
+
+create table if not exists backfill_batches (
+  id uuid primary key,
+  source text not null,
+  device_ids text[] not null default '[]',
+  rows_received integer not null default 0,
+  rows_inserted integer not null default 0,
+  rows_duplicate integer not null default 0,
+  rows_rejected integer not null default 0,
+  first_reading_at timestamptz,
+  last_reading_at timestamptz,
+  created_at timestamptz not null default ({NOW_SQL})
+);
+
+create table if not exists device_purges (
+  id uuid primary key,
+  device_id text not null,
+  status text not null default 'pending' check (status in ('pending', 'running', 'done', 'failed')),
+  readings_total integer,
+  readings_deleted integer not null default 0,
+  batches integer not null default 0,
+  error text,
+  requested_at timestamptz not null default ({NOW_SQL}),
+  started_at timestamptz,
+  finished_at timestamptz,
+  lease_until timestamptz
+);
+
+create table if not exists alert_rules (
+  id text primary key,
+  name text not null default '',
+  metric text not null check (metric in ('measurement', 'tank_level', 'connection_strength', 'battery')),
+  kind text not null default 'threshold' check (kind in ('threshold', 'rate')),
+  op text not null check (op in ('below', 'above', 'equals')),
+  threshold jsonb not null,
+  clear_threshold jsonb,
+  device_id text references devices(id) on delete cascade,
+  location text,
+  severity text not null default 'warning' check (severity in ('info', 'warning', 'critical')),
+  enabled boolean not null default 1,
+  created_at timestamptz not null default ({NOW_SQL})
+);
+
+create table if not exists alerts (
+  rule_id text not null references alert_rules(id) on delete cascade,
+  device_id text not null references devices(id) on delete cascade,
+  state text not null check (state in ('firing', 'resolved')),
+  severity text not null default 'warning',
+  message text not null default '',
+  value jsonb,
+  fired_at timestamptz not null,
+  resolved_at timestamptz,
+  updated_at timestamptz not null default ({NOW_SQL}),
+  primary key (rule_id, device_id)
+);
+
+create trigger if not exists set_devices_updated_at after update on devices
+for each row when new.updated_at = old.updated_at begin
+  update devices set updated_at = {NOW_SQL} where id = new.id;
+end;
+
+create trigger if not exists set_updated_at after update on sensor_data
+for each row when new.updated_at = old.updated_at begin
+  update sensor_data set updated_at = {NOW_SQL} where id = new.id;
+end;
+
+create trigger if not exists update_comments_updated_at after update on comments
+for each row when new.updated_at = old.updated_at begin
+  update comments set updated_at = {NOW_SQL} where id = new.id;
+end;
+
+create trigger if not exists update_alerts_updated_at after update on alerts
+for each row when new.updated_at = old.updated_at begin
+  update alerts set updated_at = {NOW_SQL}
+  where rule_id = new.rule_id and device_id = new.device_id;
+end;
+
+-- Per-device stats versions for device_stats_since (one row per device)
+create table if not exists device_stats_versions (
+  device_id text primary key,
+  version bigint not null
+);
+create index if not exists device_stats_versions_version_idx on device_stats_versions (version);
+
+create trigger if not exists device_stats_version_devices_insert after insert on devices
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (new.id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+create trigger if not exists device_stats_version_devices_update after update on devices
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (new.id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+create trigger if not exists device_stats_version_devices_delete after delete on devices
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (old.id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+create trigger if not exists device_stats_version_sensor_data_insert after insert on sensor_data
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (new.device_id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+create trigger if not exists device_stats_version_sensor_data_update after update on sensor_data
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (old.device_id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+  insert into device_stats_versions (device_id, version)
+  values (new.device_id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+create trigger if not exists device_stats_version_sensor_data_delete after delete on sensor_data
+for each row begin
+  insert into device_stats_versions (device_id, version)
+  values (old.device_id, (select coalesce(max(version), 0) + 1 from device_stats_versions))
+  on conflict (device_id) do update set version = excluded.version;
+end;
+
+-- Multi-resolution history (see gas_sight/tiers.py)
+create table if not exists sensor_rollup_tiers (
+  resolution integer primary key check (resolution >= 0),
+  retention interval
+);
+insert or ignore into sensor_rollup_tiers (resolution, retention) values
+  (0, null), (60, '35 days'), (900, '400 days'), (3600, null);
+
+create table if not exists sensor_rollups (
+  device_id text not null references devices(id) on delete cascade,
+  resolution integer not null,
+  bucket timestamptz not null,
+  readings integer not null,
+  measurement_sum numeric not null,
+  measurement_min numeric not null,
+  measurement_max numeric not null,
+  tank_level_sum numeric not null,
+  tank_level_min numeric not null,
+  tank_level_max numeric not null,
+  connection_strength_sum bigint not null,
+  last_id uuid not null,
+  last_at timestamptz not null,
+  last_battery text not null,
+  primary key (device_id, resolution, bucket)
+);
+
+create trigger if not exists sensor_data_rollups after insert on sensor_data
+for each row begin
+  insert into sensor_rollups (device_id, resolution, bucket, readings,
+    measurement_sum, measurement_min, measurement_max,
+    tank_level_sum, tank_level_min, tank_level_max,
+    connection_strength_sum, last_id, last_at, last_battery)
+  select new.device_id, t.resolution,
+    strftime('%Y-%m-%dT%H:%M:%S.000000+00:00',
+      cast(strftime('%s', substr(new.created_at, 1, 19)) as integer) / t.resolution * t.resolution,
+      'unixepoch'),
+    1, new.measurement, new.measurement, new.measurement,
+    new.tank_level, new.tank_level, new.tank_level,
+    new.connection_strength, new.id, new.created_at, new.battery
+  from sensor_rollup_tiers t where t.resolution > 0
+  on conflict (device_id, resolution, bucket) do update set
+    readings = readings + 1,
+    measurement_sum = measurement_sum + excluded.measurement_sum,
+    measurement_min = min(measurement_min, excluded.measurement_min),
+    measurement_max = max(measurement_max, excluded.measurement_max),
+    tank_level_sum = tank_level_sum + excluded.tank_level_sum,
+    tank_level_min = min(tank_level_min, excluded.tank_level_min),
+    tank_level_max = max(tank_level_max, excluded.tank_level_max),
+    connection_strength_sum = connection_strength_sum + excluded.connection_strength_sum,
+    last_id = case when excluded.last_at >= last_at then excluded.last_id else last_id end,
+    last_battery = case when excluded.last_at >= last_at then excluded.last_battery else last_battery end,
+    last_at = max(last_at, excluded.last_at);
+end;
+
+create view if not exists device_stats as
+select d.id,
+  d.name,
+  d.title,
+  d.location,
+  d.color,
+  d.enabled,
+  d.is_connected,
+  d.last_connected,
+  d.mac_address,
+  d.service_uuid,
+  d.data_characteristic_uuid,
+  d.rssi,
+  d.confidence_score,
+  d.last_discovered,
+  d.connection_attempts,
+  d.total_packets_received,
+  d.created_at as device_created_at,
+  d.updated_at as device_updated_at,
+  latest.tank_level as latest_tank_level,
+  latest.measurement as latest_measurement,
+  latest.battery as latest_battery,
+  latest.connection_strength as latest_connection_strength,
+  latest.created_at as latest_reading_at,
+  latest.tank_level_unit,
+  latest.measurement_unit,
+  (select count(*) from sensor_data sd where sd.device_id = d.id) as total_readings,
+  (select count(*) from sensor_data sd
+    where sd.device_id = d.id and sd.created_at >= {DAY_AGO_SQL}) as readings_last_24h,
+  coalesce((select avg(sd.measurement) from sensor_data sd
+    where sd.device_id = d.id and sd.created_at >= {DAY_AGO_SQL}), 0) as avg_measurement_24h,
+  d.synthetic
+from devices d
+left join sensor_data latest on latest.id = (
+  select sd.id from sensor_data sd
+  where sd.device_id = d.id
+  order by sd.created_at desc
+  limit 1
+);
+"""
+
+# SQLite message prefix -> (HTTP status, Postgres SQLSTATE)
+_INTEGRITY_ERRORS = (
+    ("UNIQUE constraint failed", 409, "23505"),
+    ("FOREIGN KEY constraint failed", 409, "23503"),
+    ("CHECK constraint failed", 400, "23514"),
+    ("NOT NULL constraint failed", 400, "23502"),
+)
+
+
+def to_timestamp(value):
+    """Normalise an ISO-8601 string or datetime to the canonical UTC text form"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace(" ", "T", 1))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def utc_now():
+    return to_timestamp(datetime.now(timezone.utc))
+
+
+class LocalError(Exception):
+    """Carries a PostgREST-shaped error out of request handling"""
+
+    def __init__(self, status, code, message, details=None, hint=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"code": code, "message": message, "details": details, "hint": hint}
+
+
+def _sensor_matrix(db, args):
+    """sensor_matrix RPC: readings up to window_end, resampled in Python"""
+    device_ids = args.get("device_ids") or []
+    mode = args.get("mode", "locf")
+    try:
+        start = to_timestamp(args["window_start"])
+        end = to_timestamp(args["window_end"])
+        where = f'where device_id in ({", ".join("?" for _ in device_ids)}) and created_at < ?'
+        params = [*device_ids, end]
+        if mode == "mean":
+            where += " and created_at >= ?"
+            params.append(start)
+        readings = db.rows("sensor_data", where, params) if device_ids else []
+        return resample(readings, device_ids, start, end, args.get("step_seconds", 60), mode, METRICS)
+    except (KeyError, TypeError, ValueError) as e:
+        raise LocalError(400, "22023", str(e)) from None
+
+
+def _sensor_columns(db, args):
+    """sensor_columns RPC: readings in a window as a packed-v1 columnar payload"""
+    device_ids = args.get("device_ids") or []
+    try:
+        start = to_timestamp(args["window_start"])
+        end = to_timestamp(args["window_end"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise LocalError(400, "22023", str(e)) from None
+    rows = []
+    if device_ids:
+        marks = ", ".join("?" for _ in device_ids)
+        rows = db.rows(
+            "sensor_data",
+            f"where device_id in ({marks}) and created_at >= ? and created_at < ? order by created_at, id",
+            [*device_ids, start, end],
+        )
+    return pack(rows, device_ids)
+
+
+def _apply_device_counters(db, args):
+    """apply_device_counters RPC: one UPDATE ... FROM json_each for all devices"""
+    counters = [
+        {**c, "last_connected": to_timestamp(c.get("last_connected")),
+         "is_connected": None if c.get("is_connected") is None else int(bool(c["is_connected"]))}
+        for c in args.get("counters") or []
+    ]
+    cursor = db.execute(
+        """
+        update devices set
+          total_packets_received = total_packets_received + coalesce(c.packets, 0),
+          connection_attempts = connection_attempts + coalesce(c.attempts, 0),
+          is_connected = coalesce(c.is_connected, devices.is_connected),
+          last_connected = case
+            when devices.last_connected is null or c.last_connected > devices.last_connected
+            then coalesce(c.last_connected, devices.last_connected)
+            else devices.last_connected end
+        from (
+          select json_extract(value, '$.id') as id,
+            json_extract(value, '$.packets') as packets,
+            json_extract(value, '$.attempts') as attempts,
+            json_extract(value, '$.is_connected') as is_connected,
+            json_extract(value, '$.last_connected') as last_connected
+          from json_each(?)
+        ) c
+        where devices.id = c.id
+        """,
+        (json.dumps(counters),),
+    )
+    return cursor.rowcount
+
+
+def _device_stats_since(db, args):
+    """device_stats_since RPC: not modified, changed devices only, or everything"""
+    version = db.execute("select coalesce(max(version), 0) from device_stats_versions").fetchone()[0]
+    etag = make_etag(version)
+    since = args.get("since")
+    result = {"etag": etag, "not_modified": since == etag, "full": False, "devices": [], "removed": []}
+    if result["not_modified"]:
+        return result
+    parsed = parse_etag(since)
+    if parsed is None or parsed[1] != parse_etag(etag)[1] or parsed[0] > version:
+        result["full"] = True
+        result["devices"] = db.rows("device_stats", "where not synthetic order by device_created_at desc")
+        return result
+    # deleted devices have no row left and still count, for `removed`
+    changed = [row[0] for row in db.execute(
+        "select v.device_id from device_stats_versions v left join devices d on d.id = v.device_id"
+        " where v.version > ? and not coalesce(d.synthetic, 0)", (parsed[0],)
+    )]
+    if not changed:
+        result["not_modified"] = True
+        return result
+    marks = ", ".join("?" for _ in changed)
+    result["devices"] = db.rows("device_stats", f"where id in ({marks}) order by device_created_at desc", changed)
+    present = {row[0] for row in db.execute(f"select id from devices where id in ({marks})", changed)}
+    result["removed"] = [device_id for device_id in changed if device_id not in present]
+    return result
+
+
+def _rollup_tiers(db):
+    return {row["resolution"]: parse_interval(row["retention"]) for row in db.rows("sensor_rollup_tiers")}
+
+
+def _history_window(args):
+    try:
+        return to_timestamp(args["window_start"]), to_timestamp(args["window_end"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise LocalError(400, "22023", str(e)) from None
+
+
+def _sensor_history(db, args):
+    """sensor_history RPC: the window from the coarsest tier that meets max_points"""
+    device_ids = args.get("device_ids") or []
+    start, end = _history_window(args)
+    try:
+        tier = choose_tier(start, end, args.get("max_points", DEFAULT_MAX_POINTS), _rollup_tiers(db))
+    except ValueError as e:
+        raise LocalError(400, "22023", str(e)) from None
+    marks = ", ".join("?" for _ in device_ids)
+    if not device_ids:
+        rows = []
+    elif tier == 0:
+        rows = [raw_history_row(r) for r in db.rows(
+            "sensor_data",
+            f"where device_id in ({marks}) and created_at >= ? and created_at < ? order by created_at, id",
+            [*device_ids, start, end],
+        )]
+    else:
+        rows = [history_row(r) for r in db.rows(
+            "sensor_rollups",
+            f"where device_id in ({marks}) and resolution = ? and bucket >= ? and bucket < ?"
+            " order by bucket, device_id",
+            [*device_ids, tier, to_timestamp(bucket_start(start, tier)), end],
+        )]
+    return {"resolution": tier, "rows": rows}
+
+
+def _rebuild_sensor_rollups(db, args):
+    """rebuild_sensor_rollups RPC: recompute whole coarsest-tier buckets from raw rows"""
+    device_ids = args.get("device_ids") or []
+    start, end = _history_window(args)
+    tiers = [t for t in _rollup_tiers(db) if t > 0]
+    coarsest = max(tiers)
+    first, last = bucket_start(start, coarsest), bucket_start(end, coarsest)
+    if last < datetime.fromisoformat(end):
+        last += timedelta(seconds=coarsest)
+    start, end = to_timestamp(first), to_timestamp(last)
+    marks = ", ".join("?" for _ in device_ids)
+    where = f"where device_id in ({marks})"
+    db.execute(f"delete from sensor_rollups {where} and bucket >= ? and bucket < ?", [*device_ids, start, end])
+    readings = db.rows("sensor_data", f"{where} and created_at >= ? and created_at < ?", [*device_ids, start, end])
+    for resolution in tiers:
+        for row in rollup(readings, resolution):
+            db.insert_row("sensor_rollups", row)
+    return len(readings)
+
+
+def _prune_sensor_rollups(db, args):
+    """prune_sensor_rollups RPC: drop buckets past their tier's retention"""
+    removed = 0
+    now = datetime.now(timezone.utc)
+    for resolution, retention in _rollup_tiers(db).items():
+        if retention is not None and resolution > 0:
+            removed += db.execute(
+                "delete from sensor_rollups where resolution = ? and bucket < ?",
+                (resolution, to_timestamp(now - retention)),
+            ).rowcount
+    return removed
+
+
+def _purge_sensor_data(db, args):
+    """purge_sensor_data RPC: delete one batch of the oldest matching readings"""
+    device_id, older_than = args.get("target_device_id"), args.get("older_than")
+    batch_size = args.get("batch_size", 1000)
+    if device_id is None and older_than is None:
+        raise LocalError(400, "22023", "purge_sensor_data needs target_device_id or older_than")
+    if not isinstance(batch_size, int) or not 1 <= batch_size <= 50000:
+        raise LocalError(400, "22023", "batch_size must be between 1 and 50000")
+    conditions, params = [], []
+    if device_id is not None:
+        conditions.append("device_id = ?")
+        params.append(device_id)
+    if older_than is not None:
+        conditions.append("created_at < ?")
+        params.append(to_timestamp(older_than))
+    return db.execute(
+        "delete from sensor_data where id in (select id from sensor_data"
+        f" where {' and '.join(conditions)} order by created_at limit ?)",
+        [*params, batch_size],
+    ).rowcount
+
+
+class LocalDatabase:
+    """SQLite copy of the public schema with PostgREST-compatible semantics"""
+
+    def __init__(self, path=":memory:", readonly=False):
+        if readonly:
+            # An existing file that already has the schema, e.g. a mirror's
+            path = f"{pathlib.Path(path).absolute().as_uri()}?mode=ro"
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, uri=readonly)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self.conn.execute("pragma foreign_keys = on")
+        self.conn.execute("pragma case_sensitive_like = on")
+        if not readonly:
+            self.conn.executescript(SCHEMA)
+        self.functions = {
+            "get_device_stats": lambda db, args: db.rows("device_stats"),
+            "sensor_matrix": _sensor_matrix,
+            "sensor_columns": _sensor_columns,
+            "apply_device_counters": _apply_device_counters,
+            "device_stats_since": _device_stats_since,
+            "replication_lag": lambda db, args: db.replication_lag,
+            "sensor_history": _sensor_history,
+            "rebuild_sensor_rollups": _rebuild_sensor_rollups,
+            "prune_sensor_rollups": _prune_sensor_rollups,
+            "purge_sensor_data": _purge_sensor_data,
+        }
+        # Seconds behind the primary this copy reports (tests simulate replicas)
+        self.replication_lag = 0.0
+        # Row changes made through LocalTransport, like the realtime publication
+        self.changes = ChangeFeed()
+        self._kinds = {}
+        self._savepoints = 0
+
+    # -- schema helpers -------------------------------------------------
+
+    def relations(self):
+        cursor = self.conn.execute(
+            "select name from sqlite_master where type in ('table', 'view')"
+            " and name not like 'sqlite_%'"
+        )
+        return {row[0] for row in cursor}
+
+    def column_kinds(self, relation):
+        """Map column name -> declared Postgres type for a table or view"""
+        if relation not in self._kinds:
+            info = self.conn.execute(f'pragma table_xinfo("{relation}")').fetchall()
+            self._kinds[relation] = {row["name"]: (row["type"] or "").lower() for row in info}
+        return self._kinds[relation]
+
+    def primary_key(self, table):
+        info = self.conn.execute(f'pragma table_info("{table}")').fetchall()
+        return [row["name"] for row in sorted(info, key=lambda r: r["pk"]) if row["pk"]]
+
+    def is_view(self, relation):
+        row = self.conn.execute(
+            "select type from sqlite_master where name = ?", (relation,)
+        ).fetchone()
+        return row is not None and row[0] == "view"
+
+    # -- value conversion -----------------------------------------------
+
+    @staticmethod
+    def to_sql(kind, value):
+        if value is None:
+            return None
+        if kind == "boolean":
+            if isinstance(value, str):
+                return 1 if value.lower() in ("true", "t", "1") else 0
+            return 1 if value else 0
+        if kind == "timestamptz":
+            return to_timestamp(value)
+        if kind == "jsonb" or kind.endswith("[]"):
+            return json.dumps(value)
+        return value
+
+    @staticmethod
+    def from_sql(kind, value):
+        if value is None:
+            return None
+        if kind == "boolean":
+            return bool(value)
+        if kind == "jsonb" or kind.endswith("[]"):
+            return json.loads(value) if isinstance(value, str) else value
+        return value
+
+    def decode_row(self, relation, row, columns=None):
+        kinds = self.column_kinds(relation)
+        keys = row.keys()
+        result = {}
+        for index, key in enumerate(keys):
+            source = columns[index] if columns else key
+            result[key] = self.from_sql(kinds.get(source, ""), row[index])
+        return result
+
+    # -- transactions ---------------------------------------------------
+
+    @contextmanager
+    def savepoint(self):
+        """Run a block atomically; nested blocks become nested savepoints"""
+        with self.lock:
+            self._savepoints += 1
+            name = f"sp_{self._savepoints}"
+            self.conn.execute(f"savepoint {name}")
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute(f"rollback to {name}")
+                self.conn.execute(f"release {name}")
+                raise
+            else:
+                self.conn.execute(f"release {name}")
+            finally:
+                self._savepoints -= 1
+
+    @contextmanager
+    def rollback(self):
+        """Run a block and discard everything it wrote (test isolation)"""
+        with self.lock:
+            self._savepoints += 1
+            name = f"sp_{self._savepoints}"
+            self.conn.execute(f"savepoint {name}")
+            try:
+                yield self
+            finally:
+                self.conn.execute(f"rollback to {name}")
+                self.conn.execute(f"release {name}")
+                self._savepoints -= 1
+
+    # -- direct access --------------------------------------------------
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def rows(self, relation, where="", params=()):
+        """Decoded rows of a table or view (used by RPC handlers and tests)"""
+        with self.lock:
+            cursor = self.conn.execute(f'select * from "{relation}" {where}', params)
+            return [self.decode_row(relation, row) for row in cursor.fetchall()]
+
+    def insert_row(self, table, values, conflict=""):
+        """Insert one dict, filling uuid / timestamp defaults; returns the stored row"""
+        kinds = self.column_kinds(table)
+        values = dict(values)
+        for column in self.primary_key(table):
+            if kinds[column] == "uuid" and values.get(column) is None:
+                values[column] = str(uuid.uuid4())
+        unknown = [c for c in values if c not in kinds]
+        if unknown:
+            raise LocalError(
+                400, "PGRST204",
+                f"Could not find the '{unknown[0]}' column of '{table}' in the schema cache",
+            )
+        columns = list(values)
+        placeholders = ", ".join("?" for _ in columns)
+        column_sql = ", ".join(f'"{c}"' for c in columns)
+        sql = f'insert into "{table}" ({column_sql}) values ({placeholders}) {conflict} returning *'
+        params = [self.to_sql(kinds[c], values[c]) for c in columns]
+        with self.lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return None if row is None else self.decode_row(table, row)
+
+
+class LocalTransport:
+    """RestClient transport that executes PostgREST requests on a LocalDatabase"""
+
+    def __init__(self, db):
+        self.db = db
+        self._pending = []
+
+    def __call__(self, method, path, query, headers, body):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        try:
+            with self.db.savepoint():
+                self._pending = []
+                status, payload, extra = self._dispatch(method, path, query, headers, body)
+                changes, self._pending = self._pending, []
+        except LocalError as e:
+            return self._json(e.status, e.payload)
+        except QueryError as e:
+            return self._json(400, {"code": "PGRST100", "message": str(e), "details": None, "hint": None})
+        except sqlite3.IntegrityError as e:
+            return self._json(*self._integrity_error(e))
+        except sqlite3.OperationalError as e:
+            return self._json(400, {"code": "42703", "message": str(e), "details": None, "hint": None})
+        for change in changes:
+            self.db.changes.publish(change)
+        if payload is None:
+            return Response(status, extra, b"")
+        if isinstance(payload, bytes):
+            return Response(status, extra, payload)
+        return self._json(status, payload, extra)
+
+    @staticmethod
+    def _json(status, payload, extra=None):
+        headers = {"Content-Type": "application/json; charset=utf-8", **(extra or {})}
+        return Response(status, headers, json.dumps(payload).encode("utf-8"))
+
+    @staticmethod
+    def _integrity_error(error):
+        message = str(error)
+        for prefix, status, code in _INTEGRITY_ERRORS:
+            if message.startswith(prefix):
+                return status, {"code": code, "message": message, "details": None, "hint": None}
+        return 400, {"code": "23000", "message": message, "details": None, "hint": None}
+
+    def _dispatch(self, method, path, query, headers, body):
+        if not path.startswith("/rest/v1/"):
+            raise LocalError(404, "PGRST000", f"Unknown path {path}")
+        name = path[len("/rest/v1/"):]
+        if name == "" and method in ("GET", "HEAD"):
+            return 200, self._openapi(), {}
+        prefer = self._prefer(headers)
+        payload = json.loads(body) if body else None
+        if name.startswith("rpc/"):
+            return self._rpc(name[4:], payload, headers)
+        if name not in self.db.relations():
+            raise LocalError(
+                404, "PGRST205", f"Could not find the table 'public.{name}' in the schema cache"
+            )
+        parsed = parse_query(query)
+        if method in ("GET", "HEAD"):
+            return self._select(name, parsed, prefer, headers)
+        if self.db.is_view(name):
+            raise LocalError(405, "PGRST103", f"cannot modify view {name}")
+        if method == "POST":
+            return self._insert(name, parsed, payload, prefer)
+        if method == "PATCH":
+            return self._update(name, parsed, payload, prefer)
+        if method == "DELETE":
+            return self._delete(name, parsed, prefer)
+        raise LocalError(405, "PGRST117", f"Unsupported HTTP method: {method}")
+
+    def _openapi(self):
+        """The parts of PostgREST's OpenAPI description the tooling reads"""
+        return {
+            "swagger": "2.0",
+            "definitions": {
+                relation: {"properties": {
+                    column: {"format": kind} for column, kind in self.db.column_kinds(relation).items()
+                }}
+                for relation in sorted(self.db.relations())
+            },
+        }
+
+    @staticmethod
+    def _prefer(headers):
+        prefer = {}
+        for part in headers.get("prefer", "").split(","):
+            key, _, value = part.strip().partition("=")
+            if key:
+                prefer[key] = value
+        return prefer
+
+    # -- query compilation ----------------------------------------------
+
+    def _column(self, relation, column):
+        if column not in self.db.column_kinds(relation):
+            raise LocalError(400, "42703", f"column {relation}.{column} does not exist")
+        return f'"{column}"'
+
+    def _where(self, relation, filters):
+        clauses, params = [], []
+        for f in filters:
+            sql, values = self._condition(relation, f)
+            clauses.append(sql)
+            params.extend(values)
+        if not clauses:
+            return "", params
+        return "where " + " and ".join(clauses), params
+
+    def _condition(self, relation, f):
+        if isinstance(f, Logic):
+            parts, params = [], []
+            for item in f.items:
+                sql, values = self._condition(relation, item)
+                parts.append(sql)
+                params.extend(values)
+            sql = "(" + f" {f.op} ".join(parts) + ")" if parts else "1"
+            return (f"not {sql}" if f.negate else sql), params
+        column = self._column(relation, f.column)
+        kind = self.db.column_kinds(relation)[f.column]
+        params = []
+        if f.op == "is":
+            sql = f"{column} is ?"
+            params.append(None if f.value is None else int(f.value))
+        elif f.op == "in":
+            if not f.value:
+                sql = "0"
+            else:
+                sql = f"{column} in ({', '.join('?' for _ in f.value)})"
+                params.extend(self._literal(kind, v) for v in f.value)
+        elif f.op in ("like", "ilike"):
+            pattern = str(f.value).replace("*", "%")
+            sql = f"{column} like ?" if f.op == "like" else f"lower({column}) like lower(?)"
+            params.append(pattern)
+        else:
+            operator = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}[f.op]
+            sql = f"{column} {operator} ?"
+            params.append(self._literal(kind, f.value))
+        return (f"not ({sql})" if f.negate else sql), params
+
+    def _literal(self, kind, value):
+        if kind == "jsonb":
+            return value
+        try:
+            return self.db.to_sql(kind, value)
+        except ValueError:
+            raise LocalError(400, "22007", f'invalid input syntax for type {kind}: "{value}"') from None
+
+    def _order(self, relation, orders):
+        if not orders:
+            return ""
+        parts = []
+        for o in orders:
+            nulls_first = o.descending if o.nulls_first is None else o.nulls_first
+            parts.append(
+                f"{self._column(relation, o.column)} {'desc' if o.descending else 'asc'}"
+                f" nulls {'first' if nulls_first else 'last'}"
+            )
+        return "order by " + ", ".join(parts)
+
+    def _projection(self, relation, parsed):
+        if not parsed.select or parsed.select == [("*", "*")]:
+            return "*", None
+        parts, sources = [], []
+        for alias, column in parsed.select:
+            if column == "*":
+                for name in self.db.column_kinds(relation):
+                    parts.append(f'"{name}"')
+                    sources.append(name)
+                continue
+            parts.append(f'{self._column(relation, column)} as "{alias}"')
+            sources.append(column)
+        return ", ".join(parts), sources
+
+    def _returning(self, relation, rows, parsed, prefer, status):
+        if prefer.get("return") != "representation":
+            return status, None, {}
+        if parsed.select and parsed.select != [("*", "*")]:
+            rows = [{alias: row.get(column) for alias, column in parsed.select} for row in rows]
+        return status, rows, {}
+
+    @staticmethod
+    def _csv(rows, columns):
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([
+                "" if value is None
+                else json.dumps(value) if isinstance(value, (dict, list))
+                else str(value).lower() if isinstance(value, bool)
+                else value
+                for value in (row.get(c) for c in columns)
+            ])
+        return out.getvalue().encode("utf-8")
+
+    # -- verbs ----------------------------------------------------------
+
+    def _select(self, relation, parsed, prefer, headers):
+        projection, sources = self._projection(relation, parsed)
+        where, params = self._where(relation, parsed.filters)
+        sql = f'select {projection} from "{relation}" {where} {self._order(relation, parsed.order)}'
+        limit_params = []
+        if parsed.limit is not None or parsed.offset is not None:
+            sql += " limit ? offset ?"
+            limit_params = [-1 if parsed.limit is None else parsed.limit, parsed.offset or 0]
+        cursor = self.db.conn.execute(sql, params + limit_params)
+        rows = [self.db.decode_row(relation, row, sources) for row in cursor.fetchall()]
+        total = "*"
+        if prefer.get("count") in ("exact", "planned", "estimated"):
+            total = self.db.conn.execute(
+                f'select count(*) from "{relation}" {where}', params
+            ).fetchone()[0]
+        start = parsed.offset or 0
+        span = f"{start}-{start + len(rows) - 1}" if rows else "*"
+        extra = {"Content-Range": f"{span}/{total}"}
+        if headers.get("accept") == "text/csv":
+            extra["Content-Type"] = "text/csv; charset=utf-8"
+            return 200, self._csv(rows, sources or list(self.db.column_kinds(relation))), extra
+        if headers.get("accept") == "application/vnd.pgrst.object+json":
+            if len(rows) != 1:
+                raise LocalError(
+                    406, "PGRST116", "JSON object requested, multiple (or no) rows returned",
+                    f"The result contains {len(rows)} rows",
+                )
+            return 200, rows[0], extra
+        return (206 if total != "*" and len(rows) < total and rows else 200), rows, extra
+
+    def _insert(self, table, parsed, payload, prefer):
+        rows = payload if isinstance(payload, list) else [payload]
+        conflict = ""
+        resolution = prefer.get("resolution")
+        if resolution:
+            target = parsed.on_conflict or self.db.primary_key(table)
+            for column in target:
+                self._column(table, column)
+            target_sql = ", ".join(f'"{c}"' for c in target)
+            if resolution == "ignore-duplicates":
+                conflict = f"on conflict ({target_sql}) do nothing"
+        inserted = []
+        for row in rows:
+            if resolution == "merge-duplicates":
+                updates = [c for c in row if c not in target]
+                action = (
+                    "do update set " + ", ".join(f'"{c}" = excluded."{c}"' for c in updates)
+                    if updates else "do nothing"
+                )
+                conflict = f"on conflict ({target_sql}) {action}"
+            stored = self.db.insert_row(table, row, conflict)
+            if stored is not None:
+                inserted.append(stored)
+        self._record(table, "INSERT", inserted)
+        return self._returning(table, inserted, parsed, prefer, 201)
+
+    def _update(self, table, parsed, payload, prefer):
+        kinds = self.db.column_kinds(table)
+        status = 200 if prefer.get("return") == "representation" else 204
+        if not payload:
+            return self._returning(table, [], parsed, prefer, status)
+        assignments = ", ".join(f"{self._column(table, c)} = ?" for c in payload)
+        values = [self.db.to_sql(kinds[c], v) for c, v in payload.items()]
+        where, params = self._where(table, parsed.filters)
+        cursor = self.db.conn.execute(
+            f'update "{table}" set {assignments} {where} returning *', values + params
+        )
+        rows = [self.db.decode_row(table, row) for row in cursor.fetchall()]
+        if rows and "updated_at" in kinds:
+            # The updated_at triggers fire after RETURNING is evaluated
+            pk = self.db.primary_key(table)[0]
+            ids = [row[pk] for row in rows]
+            rows = self.db.rows(table, f'where "{pk}" in ({", ".join("?" for _ in ids)})', ids)
+        self._record(table, "UPDATE", rows)
+        return self._returning(table, rows, parsed, prefer, status)
+
+    def _delete(self, table, parsed, prefer):
+        where, params = self._where(table, parsed.filters)
+        cursor = self.db.conn.execute(f'delete from "{table}" {where} returning *', params)
+        rows = [self.db.decode_row(table, row) for row in cursor.fetchall()]
+        self._record(table, "DELETE", rows)
+        status = 200 if prefer.get("return") == "representation" else 204
+        return self._returning(table, rows, parsed, prefer, status)
+
+    def _record(self, table, kind, rows):
+        """Queue change events, published once the request's savepoint is released"""
+        at = datetime.now(timezone.utc).isoformat()
+        for row in rows:
+            if kind == "DELETE":
+                self._pending.append(Change(table, kind, old_record=row, commit_timestamp=at))
+            else:
+                self._pending.append(Change(table, kind, record=row, commit_timestamp=at))
+
+    def _rpc(self, name, args, headers):
+        handler = self.db.functions.get(name)
+        if handler is None:
+            raise LocalError(
+                404, "PGRST202",
+                f"Could not find the function public.{name} without parameters in the schema cache",
+            )
+        return 200, handler(self.db, args or {}), {}
@@ -0,0 +1,345 @@
+"""
+In-process metrics with Prometheus text and JSON export
+
+A deliberately small subset of prometheus_client: labelled counters,
+gauges and fixed-bucket histograms, a registry that renders them, and
+RestMetrics, the RestClient observer that records per-endpoint and
+per-filter-shape latency, payload sizes, retries and Content-Range totals.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+from .postgrest import query_shape
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def series(self):
+        with self._lock:
+            return list(self._series.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+    def render(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in self.series()]
+
+    def to_dict(self):
+        return [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in self.series()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile by interpolating inside the matching bucket"""
+        series = self._series.get(self._key(labels))
+        if not series or not series[2]:
+            return None
+        with self._lock:
+            counts, total = list(series[0]), series[2]
+        rank = q * total
+        seen, lower = 0, 0.0
+        for bound, count in zip(self.buckets, counts):
+            if count and seen + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * ((rank - seen) / count)
+            seen += count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+    def render(self):
+        lines = []
+        for key, (counts, total, count) in self.series():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def to_dict(self):
+        result = []
+        for key, (counts, total, count) in self.series():
+            labels = dict(zip(self.labelnames, key))
+            result.append({
+                "labels": labels,
+                "count": count,
+                "sum": total,
+                "buckets": {_format_value(float(b)): c for b, c in zip(self.buckets, counts)},
+                "p50": self.quantile(0.5, **labels),
+                "p95": self.quantile(0.95, **labels),
+                "p99": self.quantile(0.99, **labels),
+            })
+        return result
+
+
+class MetricsRegistry:
+    """Named metrics plus bounded sample logs, exportable as text or JSON"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._samples = {}
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def samples(self, name, maxlen=100):
+        """A bounded deque of free-form records (e.g. slow calls) exported in JSON"""
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=maxlen)
+            return self._samples[name]
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            samples = {name: list(log) for name, log in self._samples.items()}
+        return {
+            "metrics": {m.name: {"type": m.kind, "help": m.help, "series": m.to_dict()}
+                        for m in metrics},
+            "samples": samples,
+        }
+
+    def dump_json(self, path=None):
+        text = json.dumps(self.to_dict(), indent=2, default=str)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+    def serve(self, host="127.0.0.1", port=9464):
+        """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body = registry.render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path.split("?")[0] == "/metrics.json":
+                    body = registry.dump_json().encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+REGISTRY = MetricsRegistry()
+
+
+class RestMetrics:
+    """RestClient observer feeding request metrics into a registry
+
+    Latency histograms are labelled with the endpoint and the filter shape
+    (column/operator names without values), so `device_stats?id=eq.x` and
+    `device_stats?id=eq.y` share a series. Calls slower than
+    `slow_threshold` seconds are sampled with their full query string.
+    """
+
+    def __init__(self, registry=REGISTRY, slow_threshold=1.0, slow_sample_rate=1.0,
+                 max_slow_samples=100, max_shapes=200):
+        self.registry = registry
+        self.slow_threshold = slow_threshold
+        self.slow_sample_rate = slow_sample_rate
+        self.max_shapes = max_shapes
+        self._shapes = set()
+        self._shapes_lock = threading.Lock()
+        self.duration = registry.histogram(
+            "gas_sight_rest_request_duration_seconds",
+            "PostgREST request latency including retries",
+            ("endpoint", "method", "shape"),
+        )
+        self.requests = registry.counter(
+            "gas_sight_rest_requests_total", "PostgREST requests by status",
+            ("endpoint", "method", "status"),
+        )
+        self.request_bytes = registry.counter(
+            "gas_sight_rest_request_bytes_total", "Request payload bytes sent",
+            ("endpoint", "method"),
+        )
+        self.response_bytes = registry.counter(
+            "gas_sight_rest_response_bytes_total", "Response payload bytes received",
+            ("endpoint", "method"),
+        )
+        self.retries = registry.counter(
+            "gas_sight_rest_retries_total", "Retried PostgREST attempts",
+            ("endpoint", "method"),
+        )
+        self.content_range = registry.gauge(
+            "gas_sight_rest_content_range_total",
+            "Last Content-Range total reported for an endpoint and filter shape",
+            ("endpoint", "shape"),
+        )
+        self.slow_calls = registry.samples("gas_sight_rest_slow_calls", max_slow_samples)
+
+    def _shape(self, query):
+        try:
+            shape = query_shape(query)
+        except ValueError:
+            # a malformed query PostgREST rejected; it still gets counted
+            return "other"
+        with self._shapes_lock:
+            if shape in self._shapes:
+                return shape
+            if len(self._shapes) >= self.max_shapes:
+                return "other"
+            self._shapes.add(shape)
+        return shape
+
+    def __call__(self, event):
+        endpoint = event.endpoint
+        shape = self._shape(event.query)
+        self.duration.observe(event.seconds, endpoint=endpoint, method=event.method, shape=shape)
+        self.requests.inc(endpoint=endpoint, method=event.method, status=event.status)
+        if event.request_bytes:
+            self.request_bytes.inc(event.request_bytes, endpoint=endpoint, method=event.method)
+        if event.response_bytes:
+            self.response_bytes.inc(event.response_bytes, endpoint=endpoint, method=event.method)
+        if event.retries:
+            self.retries.inc(event.retries, endpoint=endpoint, method=event.method)
+        if event.total_rows is not None:
+            self.content_range.set(event.total_rows, endpoint=endpoint, shape=shape)
+        if (event.seconds >= self.slow_threshold
+                and (self.slow_sample_rate >= 1.0 or random.random() < self.slow_sample_rate)):
+            self.slow_calls.append({
+                "at": time.time(),
+                "method": event.method,
+                "endpoint": endpoint,
+                "query": event.query,
+                "status": event.status,
+                "seconds": event.seconds,
+                "retries": event.retries,
+            })
+
+
+_default_rest_metrics = None
+
+
+def default_rest_metrics():
+    """The process-wide RestMetrics observer on REGISTRY"""
+    global _default_rest_metrics
+    if _default_rest_metrics is None:
+        _default_rest_metrics = RestMetrics()
+    return _default_rest_metrics
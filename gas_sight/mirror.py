@@ -0,0 +1,398 @@
+"""
+Local SQLite mirror for offline and edge dashboards
+
+A control room that loses its WAN link still needs its dashboard. Mirror
+keeps a SQLite copy of `devices`, the last `retention` of `sensor_data`
+and the comments on those readings, and answers the same PostgREST reads
+as the hosted project: `mirror.client()` is a RestClient over the copy,
+and `mirror.serve()` exposes GET/HEAD /rest/v1/... plus the read-only RPCs
+over HTTP, so the web app can point VITE_SUPABASE_URL at the edge box.
+The file is in WAL mode and serve() answers from a pool of read-only
+connections, so HTTP readers do not wait for the sync writer or for each
+other. mirror.client() shares the writer's connection and its lock.
+
+Sync has two halves:
+
+* catch_up() pulls the rows changed since a per-table cursor (the highest
+  updated_at and id applied) with keyset pages. The cursors live in the
+  mirror file, so a restarted agent resumes where it stopped. Each
+  catch-up starts `overlap` before the cursor to cover transactions that
+  committed out of order; applying a row is an upsert that only ever
+  moves updated_at forward, so replayed rows are no-ops. Devices deleted
+  while disconnected are found by comparing ids, and their readings and
+  comments go with them through the cascades.
+* attach(feed) applies ChangeFeed events (RealtimeFeed, or `db.changes`
+  of the local stand-in) as they arrive and runs a catch-up whenever the
+  feed reports a gap.
+
+Readings deleted upstream while the mirror was disconnected stay until
+they age out, and device_stats and the other aggregates only cover the
+mirrored window.
+
+`python -m gas_sight.mirror mirror.db` runs the agent: a catch-up every
+few minutes, realtime changes in between, pruning and the HTTP API.
+"""
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+from .local import LocalDatabase, LocalTransport, to_timestamp
+from .metrics import REGISTRY
+from .postgrest import Filter, Logic
+from .rest import RestClient, RestError
+
+TABLES = ("devices", "sensor_data", "comments")
+DEFAULT_RETENTION = timedelta(days=7)
+DEFAULT_OVERLAP = timedelta(minutes=5)
+DEFAULT_INTERVAL = 300.0
+DEFAULT_PORT = 9466
+READ_RPCS = frozenset({
+    "get_device_stats", "device_stats_since", "sensor_matrix", "sensor_columns", "sensor_history",
+})
+
+CURSOR_SCHEMA = """
+create table if not exists mirror_cursors (
+  relation text primary key,
+  updated_at timestamptz not null,
+  id text not null
+);
+"""
+
+
+class Mirror:
+    """SQLite copy of the dashboard's tables, kept current from a source client and a ChangeFeed"""
+
+    def __init__(self, path, source=None, retention=DEFAULT_RETENTION, overlap=DEFAULT_OVERLAP,
+                 page_size=1000, registry=REGISTRY):
+        self.path = path
+        self.db = LocalDatabase(path)
+        self.journal_mode = self.db.execute("pragma journal_mode = wal").fetchone()[0]
+        self.db.execute("pragma synchronous = normal")
+        self.db.conn.executescript(CURSOR_SCHEMA)
+        self.source = source
+        self.retention = retention
+        self.overlap = overlap
+        self.page_size = page_size
+        self._transport = LocalTransport(self.db)
+        self._sync = threading.Lock()
+        self._writable = {}
+        self.applied = registry.counter(
+            "gas_sight_mirror_rows_total", "Rows written to the mirror", ("table", "source")
+        )
+        self.skipped = registry.counter(
+            "gas_sight_mirror_skipped_total", "Rows the mirror did not apply", ("table", "reason")
+        )
+        self.failures = registry.counter(
+            "gas_sight_mirror_sync_failures_total", "Catch-ups that could not reach the source"
+        )
+        self.lag = registry.gauge(
+            "gas_sight_mirror_lag_seconds", "Age of the newest change applied to the mirror"
+        )
+
+    def client(self):
+        """RestClient that reads (and, for tests, writes) the mirror"""
+        return RestClient(transport=self._transport, observers=[])
+
+    def cutoff(self):
+        """Oldest created_at of the readings kept"""
+        return to_timestamp(datetime.now(timezone.utc) - self.retention)
+
+    # -- cursors ----------------------------------------------------------
+
+    def cursor(self, table):
+        """(updated_at, id) of the newest row of `table` applied, or None"""
+        row = self.db.execute(
+            "select updated_at, id from mirror_cursors where relation = ?", (table,)
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def _advance(self, table, row):
+        if row.get("updated_at") is None:
+            return
+        self.db.execute(
+            "insert into mirror_cursors (relation, updated_at, id) values (?, ?, ?)"
+            " on conflict (relation) do update set updated_at = excluded.updated_at, id = excluded.id"
+            " where (excluded.updated_at, excluded.id) > (mirror_cursors.updated_at, mirror_cursors.id)",
+            (table, to_timestamp(row["updated_at"]), str(row["id"])),
+        )
+
+    # -- applying rows ----------------------------------------------------
+
+    def _columns(self, table):
+        """Stored columns of `table` (generated ones like packet_number are recomputed)"""
+        if table not in self._writable:
+            info = self.db.execute(f'pragma table_info("{table}")').fetchall()
+            self._writable[table] = {row["name"] for row in info}
+        return self._writable[table]
+
+    def _parent_missing(self, table, row):
+        if table == "sensor_data":
+            parent, key = "devices", row.get("device_id")
+        elif table == "comments":
+            parent, key = "sensor_data", row.get("sensor_data_id")
+        else:
+            return False
+        return self.db.execute(f'select 1 from "{parent}" where id = ?', (key,)).fetchone() is None
+
+    def _store(self, table, row, source):
+        """Upsert one row unless the mirror already has it at the same or a newer updated_at"""
+        if table == "sensor_data" and row.get("created_at") and to_timestamp(row["created_at"]) < self.cutoff():
+            self.skipped.inc(table=table, reason="retention")
+            return False
+        if self._parent_missing(table, row):
+            self.skipped.inc(table=table, reason="orphan")
+            return False
+        writable = self._columns(table)
+        row = {column: value for column, value in row.items() if column in writable}
+        updates = ", ".join(f'"{c}" = excluded."{c}"' for c in row if c != "id")
+        stored = self.db.insert_row(
+            table, row,
+            f'on conflict ("id") do update set {updates}'
+            f' where excluded."updated_at" > "{table}"."updated_at"',
+        )
+        if stored is None:
+            self.skipped.inc(table=table, reason="stale")
+            return False
+        self._advance(table, stored)
+        self.applied.inc(table=table, source=source)
+        return True
+
+    def apply(self, change):
+        """Apply one Change; returns whether the mirror changed"""
+        if change.table not in TABLES:
+            return False
+        with self.db.savepoint():
+            if change.type == "DELETE":
+                cursor = self.db.execute(
+                    f'delete from "{change.table}" where id = ?', (change.old_record.get("id"),)
+                )
+                applied = cursor.rowcount > 0
+                if applied:
+                    self.applied.inc(table=change.table, source="change")
+            else:
+                applied = self._store(change.table, change.record, "change")
+        if change.commit_timestamp:
+            committed = datetime.fromisoformat(to_timestamp(change.commit_timestamp))
+            self.lag.set(max(0.0, (datetime.now(timezone.utc) - committed).total_seconds()))
+        return applied
+
+    # -- catching up ------------------------------------------------------
+
+    def _pages(self, table):
+        base = [Filter("created_at", "gte", self.cutoff())] if table == "sensor_data" else []
+        cursor = self.cursor(table)
+        if cursor is not None:
+            start = datetime.fromisoformat(cursor[0]) - self.overlap
+            base.append(Filter("updated_at", "gte", to_timestamp(start)))
+        last = None
+        while True:
+            filters = list(base)
+            if last is not None:
+                filters.append(Logic("or", (
+                    Filter("updated_at", "gt", last[0]),
+                    Logic("and", (Filter("updated_at", "eq", last[0]), Filter("id", "gt", last[1]))),
+                )))
+            page = self.source.select(
+                table, "*", filters, order="updated_at.asc,id.asc", limit=self.page_size
+            )
+            if not page:
+                return
+            yield page
+            if len(page) < self.page_size:
+                return
+            last = (page[-1]["updated_at"], page[-1]["id"])
+
+    def catch_up(self):
+        """Pull everything changed since the cursors from the source; returns rows applied per table"""
+        applied = {}
+        with self._sync:
+            for table in TABLES:
+                applied[table] = 0
+                for page in self._pages(table):
+                    with self.db.savepoint():
+                        applied[table] += sum(self._store(table, row, "catch_up") for row in page)
+                if table == "devices":
+                    applied[table] += self._drop_deleted_devices()
+        return applied
+
+    def _drop_deleted_devices(self):
+        upstream = {row["id"] for row in self.source.select("devices", "id")}
+        with self.db.savepoint():
+            gone = [row[0] for row in self.db.execute("select id from devices")
+                    if row[0] not in upstream]
+            for device_id in gone:
+                self.db.execute("delete from devices where id = ?", (device_id,))
+        if gone:
+            self.applied.inc(len(gone), table="devices", source="catch_up")
+        return len(gone)
+
+    def sync(self):
+        """catch_up() that records a failure instead of raising when the source is unreachable"""
+        try:
+            self.catch_up()
+        except (OSError, RestError):
+            self.failures.inc()
+            return False
+        return True
+
+    def prune(self):
+        """Delete readings (and their comments) older than the retention; returns how many"""
+        with self.db.savepoint():
+            cursor = self.db.execute("delete from sensor_data where created_at < ?", (self.cutoff(),))
+        return cursor.rowcount
+
+    def attach(self, feed):
+        return feed.subscribe(self.apply, tables=TABLES, on_gap=self.sync)
+
+    async def run(self, feed=None, interval=DEFAULT_INTERVAL, stop=None):
+        """Keep the mirror current until `stop` (an asyncio.Event) is set
+
+        Changes from `feed` are applied as they arrive; every `interval`
+        seconds the mirror catches up with the source and drops expired
+        readings.
+        """
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        unsubscribe = self.attach(feed) if feed is not None else None
+        tasks = [asyncio.ensure_future(feed.run(stop))] if feed is not None else []
+        try:
+            while not stop.is_set():
+                await loop.run_in_executor(None, self.sync)
+                self.prune()
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+                for task in tasks:
+                    if task.done():
+                        task.result()
+        finally:
+            stop.set()
+            if unsubscribe is not None:
+                unsubscribe()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # -- HTTP -------------------------------------------------------------
+
+    def serve(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Serve the read side of /rest/v1 from a daemon thread"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlsplit
+
+        path, writer = self.path, self._transport
+        readers = queue.SimpleQueue()
+
+        def reader():
+            """A pooled read-only transport (the writer's own for an in-memory mirror)"""
+            if path == ":memory:":
+                return writer
+            try:
+                return readers.get_nowait()
+            except queue.Empty:
+                return LocalTransport(LocalDatabase(path, readonly=True))
+
+        class Handler(BaseHTTPRequestHandler):
+            def _cors(self):
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header("Access-Control-Expose-Headers", "Content-Range")
+
+            def _forward(self, method):
+                url = urlsplit(self.path)
+                rpc = url.path[len("/rest/v1/rpc/"):] if url.path.startswith("/rest/v1/rpc/") else None
+                if not (method in ("GET", "HEAD") or method == "POST" and rpc in READ_RPCS):
+                    body = json.dumps({"code": "PGRST000", "message": "the mirror is read-only",
+                                       "details": None, "hint": None}).encode("utf-8")
+                    self.send_response(405)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self._cors()
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                transport = reader()
+                try:
+                    response = transport(method, url.path, url.query, dict(self.headers),
+                                         self.rfile.read(length) if length else None)
+                finally:
+                    if transport is not writer:
+                        readers.put(transport)
+                self.send_response(response.status)
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(response.body)))
+                self._cors()
+                self.end_headers()
+                if method != "HEAD":
+                    self.wfile.write(response.body)
+
+            def do_GET(self):
+                self._forward("GET")
+
+            def do_HEAD(self):
+                self._forward("HEAD")
+
+            def do_POST(self):
+                self._forward("POST")
+
+            def do_PATCH(self):
+                self._forward("PATCH")
+
+            def do_DELETE(self):
+                self._forward("DELETE")
+
+            def do_OPTIONS(self):
+                self.send_response(204)
+                self._cors()
+                self.send_header("Access-Control-Allow-Methods", "GET, HEAD, POST, OPTIONS")
+                self.send_header("Access-Control-Allow-Headers",
+                                 self.headers.get("Access-Control-Request-Headers") or "*")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def main(argv=None):
+    from . import config
+    from .changes import RealtimeFeed
+
+    parser = argparse.ArgumentParser(description="Keep a local SQLite mirror for offline dashboards")
+    parser.add_argument("path", help="SQLite file to keep the mirror in")
+    parser.add_argument("--url", help="project URL (default $SUPABASE_URL)")
+    parser.add_argument("--key", help="API key (default $SUPABASE_KEY)")
+    parser.add_argument("--retention-days", type=float, default=DEFAULT_RETENTION.days,
+                        help=f"days of readings to keep (default {DEFAULT_RETENTION.days})")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"seconds between catch-ups (default {DEFAULT_INTERVAL:g})")
+    parser.add_argument("--host", default="127.0.0.1", help="address to serve the API on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"port to serve the API on (default {DEFAULT_PORT})")
+    parser.add_argument("--no-realtime", dest="realtime", action="store_false",
+                        help="only poll; do not open the realtime socket")
+    args = parser.parse_args(argv)
+
+    url = args.url or config.supabase_url()
+    mirror = Mirror(args.path, RestClient(url=url, key=args.key),
+                    retention=timedelta(days=args.retention_days))
+    mirror.serve(args.host, args.port)
+    print(f"✅ mirroring {url} into {args.path} ({mirror.journal_mode}),"
+          f" serving http://{args.host}:{args.port}/rest/v1/")
+    feed = RealtimeFeed(url, args.key) if args.realtime else None
+    try:
+        asyncio.run(mirror.run(feed, args.interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
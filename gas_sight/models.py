@@ -0,0 +1,253 @@
+"""
+Compact row models for devices, readings and comments
+
+Rows decoded with `json.loads` are dicts: a few hundred bytes of hash
+table per reading, plus boxed floats. The models here keep the same data
+in less memory:
+
+* Device, SensorReading and Comment are `__slots__` classes with one
+  attribute per column (missing columns are None). `get()` and `to_dict()`
+  keep dict-style callers working. `from_json(body)` decodes response
+  bytes into models; the row dicts the C decoder builds are dropped as
+  soon as each model is made, and repeated labels (device_id, units,
+  battery) are interned so all readings share one string. json has no
+  streaming decoder, so peak memory while decoding is still the whole
+  body as dicts; the savings are in what is kept afterwards. Page large
+  reads (limit/offset or a created_at cursor) to bound the peak.
+* ReadingBatch holds many readings as columns: ids as 16-byte UUIDs in
+  one bytes object, created_at as epoch microseconds, metrics as doubles,
+  device_id and battery as small integer codes into label lists. It
+  decodes PostgREST JSON, plain rows or a packed-v1 payload and gives
+  back SensorReading objects on indexing.
+
+`python benchmarks/bench_models.py` compares memory and decode time with
+the dict baseline at 1M readings.
+"""
+import json
+import math
+import sys
+from array import array
+from datetime import datetime, timezone
+
+from .wire import BATTERY_LABELS, unpack
+
+
+def decode(body):
+    """JSON from response bytes, a str or a rest.Response"""
+    if hasattr(body, "body"):
+        body = body.body
+    return json.loads(body)
+
+
+class Model:
+    """Base class: one slot per column"""
+
+    __slots__ = ()
+    # low-cardinality text columns shared between rows
+    SHARED = ()
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.__slots__)
+        if unknown:
+            raise TypeError(f"{type(self).__name__} has no column(s) {', '.join(sorted(unknown))}")
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_row(cls, row):
+        """A model from a dict row; columns the model does not know are ignored"""
+        model = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(model, name, row.get(name))
+        for name in cls.SHARED:
+            value = getattr(model, name)
+            if type(value) is str:
+                setattr(model, name, sys.intern(value))
+        return model
+
+    @classmethod
+    def from_json(cls, body):
+        """Decode a response body (bytes, str or Response): one model for an object, a list for an array
+
+        The whole body is decoded to dicts first, so the peak is that of
+        `json.loads`; only the retained result is compact.
+        """
+        data = decode(body)
+        if isinstance(data, dict):
+            return cls.from_row(data)
+        # pop the rows as they are converted so their dicts are freed early
+        data.reverse()
+        models = []
+        while data:
+            models.append(cls.from_row(data.pop()))
+        return models
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[:3])
+        return f"{type(self).__name__}({fields}, ...)"
+
+
+class Device(Model):
+    __slots__ = (
+        "id", "name", "mac_address", "title", "location", "service_uuid",
+        "data_characteristic_uuid", "enabled", "color", "rssi", "confidence_score",
+        "last_discovered", "is_connected", "last_connected", "connection_attempts",
+        "total_packets_received", "created_at", "updated_at",
+    )
+    SHARED = ("location", "service_uuid", "data_characteristic_uuid", "color")
+
+
+class SensorReading(Model):
+    __slots__ = (
+        "id", "device_id", "created_at", "title_name", "tank_level", "tank_level_unit",
+        "updated_refresh", "battery", "connection_strength", "measurement", "measurement_unit",
+        "technical_data", "updated_at", "packet_seq",
+    )
+    SHARED = ("device_id", "title_name", "tank_level_unit", "updated_refresh", "battery",
+              "measurement_unit")
+
+
+class Comment(Model):
+    __slots__ = ("id", "sensor_data_id", "comment_text", "user_name", "created_at", "updated_at")
+    SHARED = ("user_name",)
+
+
+def _uuid_bytes(value):
+    return bytes.fromhex(value.replace("-", ""))
+
+
+def _uuid_text(raw):
+    text = raw.hex()
+    return f"{text[:8]}-{text[8:12]}-{text[12:16]}-{text[16:20]}-{text[20:]}"
+
+
+def _micros(value):
+    at = datetime.fromisoformat(value)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return int(at.timestamp()) * 1_000_000 + at.microsecond
+
+
+def _codes(values, labels):
+    """Integer codes of `values` in `labels` (extended as needed); None is -1"""
+    index = {label: n for n, label in enumerate(labels)}
+    codes = array("i")
+    for value in values:
+        if value is None:
+            codes.append(-1)
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(labels)
+            labels.append(value)
+        codes.append(code)
+    return codes
+
+
+class ReadingBatch:
+    """Readings stored column-wise (the chart_point columns)"""
+
+    COLUMNS = ("id", "device_id", "created_at", "measurement", "tank_level",
+               "connection_strength", "battery")
+
+    __slots__ = ("ids", "devices", "device_codes", "created_at", "measurement", "tank_level",
+                 "connection_strength", "battery_codes")
+
+    def __init__(self):
+        self.ids = b""
+        self.devices = []
+        self.device_codes = array("i")
+        self.created_at = array("q")
+        self.measurement = array("d")
+        self.tank_level = array("d")
+        self.connection_strength = array("h")
+        self.battery_codes = array("b")
+
+    @classmethod
+    def from_columns(cls, columns, created_at_ms=False):
+        """Build from {column: sequence}; created_at as ISO text (or epoch ms with created_at_ms)"""
+        batch = cls()
+        batch.ids = b"".join(_uuid_bytes(value) for value in columns["id"])
+        batch.device_codes = _codes(columns["device_id"], batch.devices)
+        stamps = columns["created_at"]
+        batch.created_at = array("q", (int(ms) * 1000 for ms in stamps) if created_at_ms
+                                 else map(_micros, stamps))
+        nan = math.nan
+        batch.measurement = array("d", (nan if v is None else v for v in columns["measurement"]))
+        batch.tank_level = array("d", (nan if v is None else v for v in columns["tank_level"]))
+        batch.connection_strength = array(
+            "h", (-1 if v is None else v for v in columns["connection_strength"])
+        )
+        battery = list(BATTERY_LABELS)
+        batch.battery_codes = array("b", _codes(columns["battery"], battery))
+        if battery != list(BATTERY_LABELS):
+            raise ValueError(f"unknown battery level {battery[len(BATTERY_LABELS)]!r}")
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls.from_columns({name: [row.get(name) for row in rows] for name in cls.COLUMNS})
+
+    @classmethod
+    def from_json(cls, body):
+        """Decode a PostgREST array of readings (peak memory is that of json.loads on `body`)"""
+        return cls.from_rows(decode(body))
+
+    @classmethod
+    def from_packed(cls, payload):
+        """Decode a packed-v1 payload (the sensor_columns RPC)"""
+        columns = unpack(payload)
+        columns["device_id"] = columns.pop("device")
+        return cls.from_columns(columns, created_at_ms=True)
+
+    def __len__(self):
+        return len(self.created_at)
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("reading index out of range")
+        measurement, tank_level = self.measurement[n], self.tank_level[n]
+        strength, battery, device = self.connection_strength[n], self.battery_codes[n], self.device_codes[n]
+        micros = self.created_at[n]
+        seconds, fraction = divmod(micros, 1_000_000)
+        return SensorReading(
+            id=_uuid_text(self.ids[16 * n:16 * n + 16]),
+            device_id=self.devices[device] if device >= 0 else None,
+            created_at=datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=fraction).isoformat(),
+            measurement=None if measurement != measurement else measurement,
+            tank_level=None if tank_level != tank_level else tank_level,
+            connection_strength=None if strength < 0 else strength,
+            battery=BATTERY_LABELS[battery] if battery >= 0 else None,
+        )
+
+    def __iter__(self):
+        return (self[n] for n in range(len(self)))
+
+    def nbytes(self):
+        """Bytes held by the column buffers"""
+        return len(self.ids) + sum(
+            len(column) * column.itemsize for column in (
+                self.device_codes, self.created_at, self.measurement, self.tank_level,
+                self.connection_strength, self.battery_codes,
+            )
+        )
+
+    def device_indexes(self, device_id):
+        """Positions of one device's readings"""
+        try:
+            code = self.devices.index(device_id)
+        except ValueError:
+            return []
+        return [n for n, c in enumerate(self.device_codes) if c == code]
@@ -0,0 +1,310 @@
+"""
+PostgREST query-string parsing and building
+
+Only the subset of the PostgREST grammar that the dashboard and the
+Python tooling actually use is supported: column filters, `and`/`or`
+groups, `select`, `order`, `limit`, `offset` and `on_conflict`.
+"""
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+OPERATORS = ("eq", "neq", "gt", "gte", "lt", "lte", "like", "ilike", "in", "is")
+RESERVED_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns")
+
+
+class QueryError(ValueError):
+    """Raised for query strings PostgREST would reject with 400"""
+
+
+@dataclass(frozen=True)
+class Filter:
+    column: str
+    op: str
+    value: object
+    negate: bool = False
+
+    def to_param(self):
+        if self.op == "in":
+            value = "(" + ",".join(_quote_list_item(v) for v in self.value) + ")"
+        elif self.value is None:
+            value = "null"
+        elif self.value is True or self.value is False:
+            value = str(self.value).lower()
+        else:
+            value = str(self.value)
+        prefix = "not." if self.negate else ""
+        return (self.column, f"{prefix}{self.op}.{value}")
+
+
+@dataclass(frozen=True)
+class Logic:
+    """An `or=(...)` / `and=(...)` group of filters (possibly nested)"""
+    op: str
+    items: Tuple[object, ...]
+    negate: bool = False
+
+    def to_param(self):
+        prefix = "not." if self.negate else ""
+        return (f"{prefix}{self.op}", "(" + ",".join(_logic_item(i) for i in self.items) + ")")
+
+
+def _logic_item(item):
+    if isinstance(item, Logic):
+        key, value = item.to_param()
+        return f"{key}{value}"
+    column, expression = item.to_param()
+    return f"{column}.{expression}"
+
+
+@dataclass(frozen=True)
+class Order:
+    column: str
+    descending: bool = False
+    nulls_first: Optional[bool] = None
+
+    def to_param(self):
+        text = f"{self.column}.{'desc' if self.descending else 'asc'}"
+        if self.nulls_first is not None:
+            text += ".nullsfirst" if self.nulls_first else ".nullslast"
+        return text
+
+
+@dataclass
+class Query:
+    select: List[Tuple[str, str]] = field(default_factory=list)
+    filters: List[Filter] = field(default_factory=list)
+    order: List[Order] = field(default_factory=list)
+    limit: Optional[int] = None
+    offset: Optional[int] = None
+    on_conflict: Optional[List[str]] = None
+
+    def to_params(self):
+        """Render back into ordered (key, value) query parameters"""
+        params = []
+        if self.select:
+            params.append(("select", ",".join(
+                column if alias == column else f"{alias}:{column}"
+                for alias, column in self.select
+            )))
+        params.extend(f.to_param() for f in self.filters)
+        if self.order:
+            params.append(("order", ",".join(o.to_param() for o in self.order)))
+        if self.limit is not None:
+            params.append(("limit", str(self.limit)))
+        if self.offset is not None:
+            params.append(("offset", str(self.offset)))
+        if self.on_conflict:
+            params.append(("on_conflict", ",".join(self.on_conflict)))
+        return params
+
+
+def _quote_list_item(value):
+    text = str(value)
+    if any(ch in text for ch in ',()"'):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+def _split_list(text):
+    """Split the body of an `in.(...)` list, honouring double quotes"""
+    items, current, quoted, escaped = [], [], False, False
+    for ch in text:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == "\\" and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current or items:
+        items.append("".join(current))
+    return items
+
+
+def parse_filter(column, expression):
+    """Parse `gte.2025-01-01` / `not.in.(a,b)` into a Filter"""
+    negate = False
+    if expression.startswith("not."):
+        negate = True
+        expression = expression[4:]
+    op, sep, value = expression.partition(".")
+    if not sep or op not in OPERATORS:
+        raise QueryError(f'"failed to parse filter ({expression})"')
+    if op == "in":
+        if not (value.startswith("(") and value.endswith(")")):
+            raise QueryError(f'"failed to parse filter (in.{value})"')
+        value = tuple(_split_list(value[1:-1]))
+    elif op == "is":
+        lowered = value.lower()
+        if lowered not in ("null", "true", "false", "unknown"):
+            raise QueryError(f'"failed to parse filter (is.{value})"')
+        value = {"null": None, "unknown": None, "true": True, "false": False}[lowered]
+    return Filter(column, op, value, negate)
+
+
+def _split_top(text):
+    """Split on commas that are not inside parentheses or double quotes"""
+    items, current, depth, quoted = [], [], 0, False
+    for ch in text:
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            items.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    if current:
+        items.append("".join(current))
+    return items
+
+
+def parse_logic(key, value):
+    """Parse `or=(a.eq.1,and(b.gt.2,c.lt.3))` into a Logic tree"""
+    negate = key.startswith("not.")
+    op = key[4:] if negate else key
+    if op not in ("and", "or") or not (value.startswith("(") and value.endswith(")")):
+        raise QueryError(f'"failed to parse logic tree ({key}={value})"')
+    items = []
+    for item in _split_top(value[1:-1]):
+        head = item.split("(", 1)[0]
+        if head in ("and", "or", "not.and", "not.or"):
+            items.append(parse_logic(head, item[len(head):]))
+        else:
+            column, sep, expression = item.partition(".")
+            if not sep:
+                raise QueryError(f'"failed to parse logic tree ({item})"')
+            items.append(parse_filter(column, expression))
+    return Logic(op, tuple(items), negate)
+
+
+def parse_select(text):
+    columns = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        alias, sep, column = item.partition(":")
+        if not sep:
+            alias = column = item
+        columns.append((alias, column.split("::")[0]))
+    return columns
+
+
+def parse_order(text):
+    orders = []
+    for item in text.split(","):
+        parts = item.strip().split(".")
+        column, descending, nulls_first = parts[0], False, None
+        for modifier in parts[1:]:
+            if modifier == "desc":
+                descending = True
+            elif modifier == "asc":
+                descending = False
+            elif modifier == "nullsfirst":
+                nulls_first = True
+            elif modifier == "nullslast":
+                nulls_first = False
+            else:
+                raise QueryError(f'"failed to parse order ({item})"')
+        orders.append(Order(column, descending, nulls_first))
+    return orders
+
+
+def parse_query(params):
+    """Parse a query string or a sequence of (key, value) pairs"""
+    if isinstance(params, str):
+        params = urllib.parse.parse_qsl(params, keep_blank_values=True)
+    query = Query()
+    for key, value in params:
+        if key == "select":
+            query.select = parse_select(value)
+        elif key == "order":
+            query.order = parse_order(value)
+        elif key == "limit":
+            query.limit = _parse_int(key, value)
+        elif key == "offset":
+            query.offset = _parse_int(key, value)
+        elif key == "on_conflict":
+            query.on_conflict = [c.strip() for c in value.split(",") if c.strip()]
+        elif key == "columns":
+            continue
+        elif key in ("and", "or", "not.and", "not.or"):
+            query.filters.append(parse_logic(key, value))
+        else:
+            query.filters.append(parse_filter(key, value))
+    return query
+
+
+def _parse_int(key, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f'"failed to parse {key} ({value})"') from None
+
+
+def filter_params(filters):
+    """Normalise the filters argument accepted by RestClient methods
+
+    Accepts a dict ({"id": "eq.abc"}), a list of (column, expression)
+    pairs or a list of Filter / Logic objects.
+    """
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        filters = list(filters.items())
+    params = []
+    for item in filters:
+        if isinstance(item, (Filter, Logic)):
+            params.append(item.to_param())
+        else:
+            column, expression = item
+            params.append((column, expression))
+    return params
+
+
+def encode(params):
+    """Encode parameters the way supabase-js does (readable filter syntax)"""
+    return urllib.parse.urlencode(params, safe="(),.:*\"")
+
+
+def query_shape(query):
+    """Describe a query without its values, e.g. `select=*&device_id=eq&order=created_at.desc&limit`
+
+    Filters keep their column and operator, `select`/`order` keep their
+    text (they have low cardinality), paging parameters keep only their
+    name. Used to group request metrics.
+    """
+    if isinstance(query, str):
+        query = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    parts = []
+    for key, value in query:
+        if key in ("select", "order", "on_conflict", "columns"):
+            parts.append(f"{key}={value}")
+        elif key in ("limit", "offset"):
+            parts.append(key)
+        elif key in ("and", "or", "not.and", "not.or"):
+            parts.append(f"{key}={_logic_shape(parse_logic(key, value))}")
+        else:
+            op = value.split(".", 2)
+            parts.append(f"{key}={op[0]}.{op[1]}" if op[0] == "not" and len(op) > 1 else f"{key}={op[0]}")
+    return "&".join(parts)
+
+
+def _logic_shape(logic):
+    items = []
+    for item in logic.items:
+        if isinstance(item, Logic):
+            items.append(f"{'not.' if item.negate else ''}{item.op}{_logic_shape(item)}")
+        else:
+            items.append(f"{item.column}.{'not.' if item.negate else ''}{item.op}")
+    return "(" + ",".join(items) + ")"
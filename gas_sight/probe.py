@@ -0,0 +1,336 @@
+"""
+End-to-end latency probe: from a sensor_data insert to what dashboards see
+
+LatencyProbe writes a synthetic reading for a canary device, tagged in
+technical_data with a random probe id, and times three stages from the
+moment it starts the insert:
+
+* insert_ack: the INSERT returns (PostgREST round trip and commit)
+* realtime: the INSERT arrives on a ChangeFeed (the postgres_changes
+  stream a dashboard subscribes to)
+* stats: device_stats shows the reading as the canary's latest
+
+Each stage goes into a cumulative Prometheus histogram
+(gas_sight_probe_latency_seconds) and a rolling window whose p50/p95/p99
+are exported as gauges (gas_sight_probe_latency_window_seconds), so SLO
+dashboards can alert on the last 15 minutes instead of all-time buckets.
+A stage that does not complete within `timeout` counts as a timeout.
+
+The canary device is created disabled (the gateway never polls it) and
+flagged `synthetic`, which keeps it out of the dashboard's device list,
+device_stats_since and fleet-wide exports (device_stats itself still has
+its row, for the stats stage). Its probe readings are deleted once they
+are older than `keep`.
+
+`python -m gas_sight.probe` probes production every 30 seconds over the
+realtime websocket and serves /metrics; `--local --count 20` runs against
+an in-process stand-in and prints a summary, for CI.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from .metrics import REGISTRY
+from .rest import RestClient, RestError
+
+CANARY_DEVICE = {
+    "id": "latency_probe_canary",
+    "name": "@PROBE",
+    "mac_address": "02:00:00:00:00:01",
+    "title": "Latency probe (synthetic)",
+    "location": "Synthetic",
+    "enabled": False,
+    "synthetic": True,
+}
+STAGES = ("insert_ack", "realtime", "stats")
+QUANTILES = (0.5, 0.95, 0.99)
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+DEFAULT_INTERVAL = 30.0
+DEFAULT_PORT = 9467
+
+
+def _parse(value):
+    at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class ProbeResult:
+    """Seconds from the start of the insert to each stage; None when it timed out"""
+
+    probe_id: str
+    insert_ack: Optional[float] = None
+    realtime: Optional[float] = None
+    stats: Optional[float] = None
+    error: Optional[str] = None
+
+
+class RollingQuantiles:
+    """Exact quantiles over the values of the last `window` seconds"""
+
+    def __init__(self, window=900.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._values = deque()
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self._values.append((self.clock(), value))
+            self._expire()
+
+    def _expire(self):
+        horizon = self.clock() - self.window
+        while self._values and self._values[0][0] < horizon:
+            self._values.popleft()
+
+    def __len__(self):
+        with self._lock:
+            self._expire()
+            return len(self._values)
+
+    def quantiles(self, qs=QUANTILES):
+        """{q: value} by nearest rank; empty when the window is empty"""
+        with self._lock:
+            self._expire()
+            values = sorted(value for _, value in self._values)
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))] for q in qs}
+
+
+class LatencyProbe:
+    """Writes tagged canary readings and times insert, realtime delivery and stats visibility"""
+
+    def __init__(self, client, feed=None, device=CANARY_DEVICE, timeout=10.0, poll=0.05,
+                 window=900.0, keep=timedelta(hours=1), registry=REGISTRY):
+        self.client = client
+        self.feed = feed
+        self.device = dict(device)
+        self.timeout = timeout
+        self.poll = poll
+        self.keep = keep
+        self.rolling = {stage: RollingQuantiles(window) for stage in STAGES}
+        self._arrivals = {}
+        self._lock = threading.Lock()
+        self._unsubscribe = None
+        self.latency = registry.histogram(
+            "gas_sight_probe_latency_seconds", "Seconds from a probe insert to each stage",
+            ("stage",), buckets=LATENCY_BUCKETS,
+        )
+        self.window_latency = registry.gauge(
+            "gas_sight_probe_latency_window_seconds",
+            "Probe latency quantiles over the rolling window", ("stage", "quantile"),
+        )
+        self.timeouts = registry.counter(
+            "gas_sight_probe_timeouts_total", "Probe stages that did not complete in time", ("stage",)
+        )
+        self.probes = registry.counter(
+            "gas_sight_probes_total", "Probes run", ("result",)
+        )
+
+    # -- setup ------------------------------------------------------------
+
+    def ensure_device(self):
+        self.client.insert("devices", self.device, on_conflict="id", resolution="merge",
+                           returning=False)
+
+    def attach(self):
+        """Start listening on the feed for probe readings"""
+        if self.feed is not None and self._unsubscribe is None:
+            self._unsubscribe = self.feed.subscribe(self._on_change, tables=("sensor_data",))
+
+    def close(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def _on_change(self, change):
+        if change.type != "INSERT":
+            return
+        technical = change.record.get("technical_data")
+        if isinstance(technical, str):
+            try:
+                technical = json.loads(technical)
+            except ValueError:
+                return
+        probe_id = (technical or {}).get("probe")
+        if probe_id is None:
+            return
+        with self._lock:
+            waiting = self._arrivals.get(probe_id)
+        if waiting is not None:
+            waiting[1] = time.perf_counter()
+            waiting[0].set()
+
+    # -- probing ----------------------------------------------------------
+
+    def reading(self, probe_id):
+        return {
+            "device_id": self.device["id"],
+            "title_name": self.device["title"],
+            "tank_level": 0,
+            "updated_refresh": "probe",
+            "battery": "Full",
+            "connection_strength": 100,
+            "measurement": 0,
+            "technical_data": {"probe": probe_id, "synthetic": True},
+        }
+
+    def _stats_visible(self, created_at, deadline):
+        """Poll device_stats until it reports this reading; returns when, or None"""
+        target = _parse(created_at)
+        while True:
+            rows = self.client.select("device_stats", "latest_reading_at",
+                                      {"id": f"eq.{self.device['id']}"})
+            seen = time.perf_counter()
+            latest = rows[0]["latest_reading_at"] if rows else None
+            if latest and _parse(latest) >= target:
+                return seen
+            if seen >= deadline:
+                return None
+            time.sleep(self.poll)
+
+    def _record(self, result, stage, seconds):
+        if seconds is None:
+            self.timeouts.inc(stage=stage)
+            return
+        setattr(result, stage, seconds)
+        self.latency.observe(seconds, stage=stage)
+        self.rolling[stage].add(seconds)
+        for q, value in self.rolling[stage].quantiles().items():
+            self.window_latency.set(value, stage=stage, quantile=str(q))
+
+    def probe_once(self):
+        """Run one probe; returns a ProbeResult"""
+        probe_id = str(uuid.uuid4())
+        result = ProbeResult(probe_id)
+        arrival = [threading.Event(), None]
+        with self._lock:
+            self._arrivals[probe_id] = arrival
+        try:
+            start = time.perf_counter()
+            stored = self.client.insert("sensor_data", self.reading(probe_id))[0]
+            acked = time.perf_counter()
+            deadline = start + self.timeout
+            self._record(result, "insert_ack", acked - start)
+
+            if self.feed is not None:
+                arrival[0].wait(max(0.0, deadline - time.perf_counter()))
+                self._record(result, "realtime", arrival[1] - start if arrival[0].is_set() else None)
+
+            visible = self._stats_visible(stored["created_at"], deadline)
+            self._record(result, "stats", None if visible is None else visible - start)
+        except (OSError, RestError) as e:
+            result.error = str(e)
+        finally:
+            with self._lock:
+                self._arrivals.pop(probe_id, None)
+        complete = result.error is None and None not in (
+            result.insert_ack, result.stats, result.realtime if self.feed is not None else 0,
+        )
+        self.probes.inc(result="ok" if complete else "error" if result.error else "timeout")
+        return result
+
+    def prune(self):
+        """Delete probe readings older than `keep`"""
+        cutoff = (datetime.now(timezone.utc) - self.keep).isoformat()
+        self.client.delete("sensor_data", {"device_id": f"eq.{self.device['id']}",
+                                           "created_at": f"lt.{cutoff}"})
+
+    def summary(self):
+        """{stage: {"count": n, "p50": s, "p95": s, "p99": s}} over the rolling window"""
+        out = {}
+        for stage, rolling in self.rolling.items():
+            quantiles = rolling.quantiles()
+            out[stage] = {"count": len(rolling),
+                          **{f"p{round(q * 100)}": quantiles.get(q) for q in QUANTILES}}
+        return out
+
+    def run(self, interval=DEFAULT_INTERVAL, count=None, stop=None, on_result=None):
+        """Probe every `interval` seconds until `count` probes have run or `stop` is set"""
+        stop = stop or threading.Event()
+        self.ensure_device()
+        self.attach()
+        done = 0
+        while not stop.is_set() and (count is None or done < count):
+            started = time.monotonic()
+            result = self.probe_once()
+            done += 1
+            if on_result is not None:
+                on_result(result)
+            try:
+                self.prune()
+            except (OSError, RestError):
+                pass
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
+        return self.summary()
+
+
+def _start_realtime(feed):
+    """Run a RealtimeFeed on its own event loop in a daemon thread"""
+    threading.Thread(target=lambda: asyncio.run(feed.run()), daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure ingest-to-dashboard latency with canary readings")
+    parser.add_argument("--url", help="project URL (default $SUPABASE_URL)")
+    parser.add_argument("--key", help="API key (default $SUPABASE_KEY)")
+    parser.add_argument("--local", action="store_true", help="probe an in-process stand-in instead")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"seconds between probes (default {DEFAULT_INTERVAL:g})")
+    parser.add_argument("--count", type=int, help="stop after this many probes and print a summary")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for each stage")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"serve /metrics on this port (default {DEFAULT_PORT}; 0 to disable)")
+    parser.add_argument("--no-realtime", dest="realtime", action="store_false",
+                        help="skip the realtime stage")
+    args = parser.parse_args(argv)
+
+    if args.local:
+        from .local import LocalDatabase, LocalTransport
+
+        db = LocalDatabase()
+        client, feed = RestClient(transport=LocalTransport(db)), db.changes
+    else:
+        from .changes import RealtimeFeed
+
+        client = RestClient(url=args.url, key=args.key)
+        feed = RealtimeFeed(args.url, args.key, tables=("sensor_data",)) if args.realtime else None
+        if feed is not None:
+            _start_realtime(feed)
+    if not args.realtime:
+        feed = None
+    if args.port:
+        REGISTRY.serve(port=args.port)
+
+    probe = LatencyProbe(client, feed, timeout=args.timeout)
+
+    def report(result):
+        stages = ", ".join(
+            f"{stage} {getattr(result, stage) * 1000:.1f}ms" if getattr(result, stage) is not None
+            else f"{stage} timeout" for stage in STAGES if stage != "realtime" or feed is not None
+        )
+        print(f"{'❌' if result.error else '✅'} {result.probe_id[:8]}: {result.error or stages}", flush=True)
+
+    try:
+        summary = probe.run(args.interval if args.count is None or not args.local else 0,
+                            count=args.count, on_result=report)
+    except KeyboardInterrupt:
+        summary = probe.summary()
+    finally:
+        probe.close()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
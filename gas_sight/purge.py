@@ -0,0 +1,256 @@
+"""
+Batched purges of device history and expired readings
+
+`DELETE FROM devices` cascades into every reading and comment of the
+device in one transaction: sensor_data rows stay locked until it commits
+and realtime gets one event per row at once. A purge instead
+
+1. disables the device straight away (the gateway stops polling it),
+2. deletes its readings oldest first, `batch_size` at a time, through the
+   purge_sensor_data RPC (one short transaction per batch; comments go
+   with their readings), sleeping `pause` seconds between batches so the
+   database and realtime see a steady trickle,
+3. deletes the empty device row.
+
+Purges are recorded in device_purges: the dashboard queues one by
+disabling the device and inserting a row, and Purger.run_pending() (or
+`python -m gas_sight.purge pending --watch 30`) works through the open
+rows, writes progress back after every batch and resumes purges that were
+interrupted. Nothing is deleted unless such a worker runs. A worker claims
+a row with one conditional UPDATE that only matches when no other worker
+holds an unexpired lease on it, and renews the lease after every batch, so
+several workers can watch the same queue; the purge of a worker that died
+is taken over once its lease runs out. A purge that fails is recorded on
+its row and the worker moves on to the next. purge_older_than() deletes
+readings past a retention cutoff the same way.
+"""
+import argparse
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from .metrics import REGISTRY
+from .rest import RestClient, RestError
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_PAUSE = 0.5
+DEFAULT_LEASE = timedelta(minutes=5)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass
+class PurgeProgress:
+    """Where a purge has got to; device_id is None for retention purges"""
+
+    device_id: Optional[str]
+    deleted: int = 0
+    total: Optional[int] = None
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return None
+        return min(1.0, self.deleted / self.total)
+
+
+class Purger:
+    """Deletes readings in bounded, throttled batches and reports progress"""
+
+    def __init__(self, client, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE, progress=None,
+                 sleep=time.sleep, lease=DEFAULT_LEASE, registry=REGISTRY):
+        self.client = client
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress
+        self.sleep = sleep
+        self.lease = lease
+        self.deleted = registry.counter(
+            "gas_sight_purged_readings_total", "Readings deleted by purges", ("kind",)
+        )
+        self.batch_count = registry.counter(
+            "gas_sight_purge_batches_total", "purge_sensor_data calls", ("kind",)
+        )
+        self.failures = registry.counter(
+            "gas_sight_purge_failures_total", "Device purges that stopped with an error"
+        )
+
+    def count(self, device_id=None, older_than=None):
+        """Readings a purge would delete"""
+        filters = {}
+        if device_id is not None:
+            filters["device_id"] = f"eq.{device_id}"
+        if older_than is not None:
+            filters["created_at"] = f"lt.{older_than}"
+        response = self.client.select_response("sensor_data", "id", filters, limit=1, count="exact")
+        return response.content_range[2]
+
+    def _batches(self, progress, device_id=None, older_than=None, on_batch=None):
+        """Call purge_sensor_data until a batch comes back short"""
+        kind = "retention" if device_id is None else "device"
+        start = time.monotonic() - progress.seconds
+        while True:
+            deleted = self.client.rpc("purge_sensor_data", {
+                "target_device_id": device_id, "older_than": older_than, "batch_size": self.batch_size,
+            })
+            progress.deleted += deleted
+            progress.batches += 1
+            progress.seconds = time.monotonic() - start
+            self.deleted.inc(deleted, kind=kind)
+            self.batch_count.inc(kind=kind)
+            if on_batch is not None:
+                on_batch(progress)
+            if self.progress is not None:
+                self.progress(progress)
+            if deleted < self.batch_size:
+                return progress
+            self.sleep(self.pause)
+
+    # -- device purges ----------------------------------------------------
+
+    def request(self, device_id):
+        """Disable the device and queue its purge; returns the device_purges row"""
+        self.client.update("devices", {"enabled": False}, {"id": f"eq.{device_id}"}, returning=False)
+        return self.client.insert("device_purges", {"device_id": device_id})[0]
+
+    def claim(self, purge):
+        """Take a device_purges row for this worker; None if it is finished or leased to another"""
+        now = datetime.now(timezone.utc)
+        rows = self.client.update("device_purges", {
+            "status": "running", "started_at": purge.get("started_at") or now.isoformat(),
+            "lease_until": (now + self.lease).isoformat(), "error": None,
+        }, {
+            "id": f"eq.{purge['id']}", "finished_at": "is.null",
+            "or": f"(lease_until.is.null,lease_until.lt.{now.isoformat()})",
+        })
+        return rows[0] if rows else None
+
+    def run(self, purge):
+        """Claim and carry out (or resume) one device_purges row
+
+        Returns its PurgeProgress, or None when another worker has it.
+        """
+        purge = self.claim(purge)
+        if purge is None:
+            return None
+        device_id = purge["device_id"]
+        match = {"id": f"eq.{purge['id']}"}
+        progress = PurgeProgress(device_id, deleted=purge.get("readings_deleted") or 0,
+                                 batches=purge.get("batches") or 0)
+
+        def report(progress):
+            self.client.update("device_purges", {
+                "readings_deleted": progress.deleted, "batches": progress.batches,
+                "lease_until": (datetime.now(timezone.utc) + self.lease).isoformat(),
+            }, match, returning=False)
+
+        try:
+            progress.total = progress.deleted + self.count(device_id=device_id)
+            self.client.update("device_purges", {"readings_total": progress.total}, match, returning=False)
+            self._batches(progress, device_id=device_id, on_batch=report)
+            # nothing left to cascade into but rollups and alerts
+            self.client.delete("devices", {"id": f"eq.{device_id}"})
+        except (OSError, RestError) as e:
+            self.failures.inc()
+            try:
+                self.client.update("device_purges", {"status": "failed", "error": str(e), "lease_until": None},
+                                   match, returning=False)
+            except (OSError, RestError):
+                pass
+            raise
+        self.client.update("device_purges", {"status": "done", "finished_at": _now(), "lease_until": None},
+                           match, returning=False)
+        return progress
+
+    def purge_device(self, device_id):
+        """Disable, empty and delete one device now"""
+        return self.run(self.request(device_id))
+
+    def run_pending(self):
+        """Run every purge that has not finished (queued, interrupted or failed), oldest first
+
+        Returns the progress of the purges this worker completed; ones held
+        by another worker are skipped and failures stay recorded on their rows.
+        """
+        purges = self.client.select("device_purges", "*", {"finished_at": "is.null"},
+                                    order="requested_at.asc")
+        done = []
+        for purge in purges:
+            try:
+                progress = self.run(purge)
+            except (OSError, RestError) as e:
+                log.warning("purge of %s failed: %s", purge["device_id"], e)
+                continue
+            if progress is not None:
+                done.append(progress)
+        return done
+
+    # -- retention --------------------------------------------------------
+
+    def purge_older_than(self, cutoff):
+        """Delete every reading created before `cutoff` (a datetime or ISO string)"""
+        if isinstance(cutoff, datetime):
+            cutoff = cutoff.isoformat()
+        progress = PurgeProgress(None, total=self.count(older_than=cutoff))
+        return self._batches(progress, older_than=cutoff)
+
+
+def _print_progress(progress):
+    share = f" ({progress.fraction:.0%})" if progress.fraction is not None else ""
+    print(f"   {progress.device_id or 'retention'}: {progress.deleted:,} deleted{share},"
+          f" {progress.batches} batches, {progress.seconds:.1f}s", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Purge device history in bounded batches")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"readings per transaction (default {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--pause", type=float, default=DEFAULT_PAUSE,
+                        help=f"seconds between batches (default {DEFAULT_PAUSE:g})")
+    parser.add_argument("--quiet", action="store_true", help="no per-batch progress")
+    commands = parser.add_subparsers(dest="command", required=True)
+    device = commands.add_parser("device", help="disable, empty and delete devices now")
+    device.add_argument("device_ids", nargs="+", metavar="device_id")
+    pending = commands.add_parser("pending", help="run the purges queued in device_purges")
+    pending.add_argument("--watch", type=float, metavar="SECONDS",
+                         help="keep polling for new purges every SECONDS")
+    retention = commands.add_parser("retention", help="delete readings older than a number of days")
+    retention.add_argument("--days", type=float, required=True)
+    args = parser.parse_args(argv)
+
+    purger = Purger(RestClient(), args.batch_size, args.pause,
+                    progress=None if args.quiet else _print_progress)
+    if args.command == "device":
+        for device_id in args.device_ids:
+            progress = purger.purge_device(device_id)
+            print(f"✅ {device_id}: {progress.deleted:,} readings in {progress.batches} batches")
+    elif args.command == "retention":
+        cutoff = datetime.now(timezone.utc) - timedelta(days=args.days)
+        progress = purger.purge_older_than(cutoff)
+        print(f"✅ {progress.deleted:,} readings older than {cutoff:%Y-%m-%d %H:%M} deleted")
+    else:
+        while True:
+            try:
+                for progress in purger.run_pending():
+                    print(f"✅ {progress.device_id}: {progress.deleted:,} readings in {progress.batches} batches")
+            except (OSError, RestError) as e:
+                if args.watch is None:
+                    raise
+                print(f"❌ could not read device_purges: {e}", flush=True)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
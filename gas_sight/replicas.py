@@ -0,0 +1,172 @@
+"""
+Primary plus read-replica routing with bounded staleness
+
+ReplicatedClient has the RestClient interface. Writes (insert, update,
+delete and writing RPCs) go to the primary; reads go to a replica when one
+is fresh enough for the query:
+
+* each read has a staleness bound in seconds: `max_staleness=` on the
+  call, else the relation's entry in `staleness` (e.g. {"device_stats": 30}),
+  else the client default
+* a replica's lag comes from the `replication_lag` RPC, probed at most
+  every `lag_interval` seconds. A replica that lags more than the bound,
+  fails the probe, reports no lag (NULL: it is not streaming from the
+  primary) or fails the read (connection error or 5xx) is skipped,
+  and the read falls back to the primary
+* `read_your_writes=True` also requires the replica's lag to be shorter
+  than the time since this client's last write, so the caller sees what
+  it wrote; `consistent=True` always reads the primary
+
+Replicas that qualify are used in turn.
+"""
+import threading
+import time
+
+from . import config
+from .metrics import REGISTRY
+from .rest import IDEMPOTENT_METHODS, RestClient, RestError
+
+READ_RPCS = ("get_device_stats", "device_stats_since", "sensor_matrix", "sensor_columns", "sensor_history")
+DEFAULT_MAX_STALENESS = 5.0
+
+
+class Replica:
+    """A read replica and its last measured lag"""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.lag = None
+        self.checked = None
+
+
+class ReplicatedClient:
+    """RestClient-compatible router over one primary and its read replicas"""
+
+    def __init__(self, primary, replicas, max_staleness=DEFAULT_MAX_STALENESS, staleness=None,
+                 lag_interval=1.0, read_your_writes=False, clock=time.monotonic, registry=REGISTRY):
+        self.primary = primary
+        self.replicas = [
+            r if isinstance(r, Replica) else Replica(f"replica{n}", r) for n, r in enumerate(replicas, 1)
+        ]
+        self.max_staleness = max_staleness
+        self.staleness = dict(staleness or {})
+        self.lag_interval = lag_interval
+        self.read_your_writes = read_your_writes
+        self.clock = clock
+        self.last_write = None
+        self._turn = 0
+        self._lock = threading.Lock()
+        self.reads = registry.counter(
+            "gas_sight_replica_reads_total", "Reads by target and routing reason", ("target", "reason")
+        )
+        self.lag_seconds = registry.gauge(
+            "gas_sight_replica_lag_seconds", "Last measured replica lag", ("replica",)
+        )
+
+    @classmethod
+    def from_config(cls, spec, timeout=config.DEFAULT_TIMEOUT, registry=REGISTRY):
+        """Build from {"url", "key", "replicas": [{"name", "url", "key"}], "max_staleness", "staleness"}"""
+        primary = RestClient(url=spec.get("url"), key=spec.get("key"), timeout=timeout)
+        replicas = [
+            Replica(r.get("name") or f"replica{n}",
+                    RestClient(url=r["url"], key=r.get("key") or spec.get("key"), timeout=timeout))
+            for n, r in enumerate(spec.get("replicas") or (), 1)
+        ]
+        return cls(primary, replicas, spec.get("max_staleness", DEFAULT_MAX_STALENESS),
+                   spec.get("staleness"), registry=registry)
+
+    # -- routing --------------------------------------------------------
+
+    def lag(self, replica):
+        """The replica's lag in seconds (re-probed every lag_interval), None if unreachable"""
+        now = self.clock()
+        if replica.checked is None or now - replica.checked >= self.lag_interval:
+            try:
+                replica.lag = float(replica.client.rpc("replication_lag"))
+                self.lag_seconds.set(replica.lag, replica=replica.name)
+            except (OSError, RestError, TypeError, ValueError):
+                replica.lag = None
+            replica.checked = now
+        return replica.lag
+
+    def route(self, relation, max_staleness=None, read_your_writes=None, consistent=False):
+        """(replica or None, reason) for a read of `relation`"""
+        if consistent:
+            return None, "consistent"
+        if not self.replicas:
+            return None, "no_replica"
+        bound = self.staleness.get(relation, self.max_staleness) if max_staleness is None else max_staleness
+        if read_your_writes is None:
+            read_your_writes = self.read_your_writes
+        if read_your_writes and self.last_write is not None:
+            bound = min(bound, self.clock() - self.last_write)
+        with self._lock:
+            start = self._turn
+            self._turn = (self._turn + 1) % len(self.replicas)
+        for n in range(len(self.replicas)):
+            replica = self.replicas[(start + n) % len(self.replicas)]
+            lag = self.lag(replica)
+            if lag is not None and lag <= bound:
+                return replica, "fresh"
+        return None, "read_your_writes" if read_your_writes and self.last_write is not None else "lagging"
+
+    def _read(self, relation, call, max_staleness, read_your_writes, consistent):
+        replica, reason = self.route(relation, max_staleness, read_your_writes, consistent)
+        if replica is not None:
+            try:
+                result = call(replica.client)
+            except OSError:
+                reason = "error"
+            except RestError as e:
+                if e.status < 500:
+                    raise
+                reason = "error"
+            else:
+                self.reads.inc(target=replica.name, reason=reason)
+                return result
+            replica.lag, replica.checked = None, self.clock()
+        self.reads.inc(target="primary", reason=reason)
+        return call(self.primary)
+
+    def _write(self, call):
+        try:
+            return call(self.primary)
+        finally:
+            self.last_write = self.clock()
+
+    # -- RestClient interface -------------------------------------------
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Raw request against the primary"""
+        if method in IDEMPOTENT_METHODS:
+            return self.primary.request(method, path, params, body, headers)
+        return self._write(lambda c: c.request(method, path, params, body, headers))
+
+    def select(self, table, columns="*", filters=None, order=None, limit=None, offset=None,
+               count=None, headers=None, *, max_staleness=None, read_your_writes=None, consistent=False):
+        return self._read(table, lambda c: c.select(
+            table, columns, filters, order, limit, offset, count, headers
+        ), max_staleness, read_your_writes, consistent)
+
+    def select_response(self, table, columns="*", filters=None, order=None, limit=None, offset=None,
+                        count=None, headers=None, *, max_staleness=None, read_your_writes=None,
+                        consistent=False):
+        return self._read(table, lambda c: c.select_response(
+            table, columns, filters, order, limit, offset, count, headers
+        ), max_staleness, read_your_writes, consistent)
+
+    def insert(self, table, rows, returning=True, on_conflict=None, resolution=None, columns=None):
+        return self._write(lambda c: c.insert(table, rows, returning, on_conflict, resolution, columns))
+
+    def update(self, table, values, filters, returning=True):
+        return self._write(lambda c: c.update(table, values, filters, returning))
+
+    def delete(self, table, filters, returning=False):
+        return self._write(lambda c: c.delete(table, filters, returning))
+
+    def rpc(self, name, args=None, *, max_staleness=None, read_your_writes=None, consistent=False):
+        """Read-only RPCs (READ_RPCS) may use a replica; the rest run on the primary"""
+        if name in READ_RPCS:
+            return self._read(name, lambda c: c.rpc(name, args), max_staleness, read_your_writes, consistent)
+        return self._write(lambda c: c.rpc(name, args))
@@ -0,0 +1,185 @@
+"""
+Time-aligned device x time matrix for comparison charts
+
+Reference implementation of the `sensor_matrix` RPC (see
+supabase/migrations/20261019100000_sensor_matrix.sql). A window
+[start, end) is cut into buckets of `step` seconds and every device gets
+one value per bucket and metric:
+
+- locf: the last reading taken before the end of the bucket (readings
+  before the window seed the first buckets), None until the first one
+- mean: the average of the readings inside the bucket, rounded to
+  MEAN_DECIMALS, None for empty buckets
+
+The result is one compact document:
+
+    {"t0": "...", "step": 60, "mode": "locf", "devices": ["a", "b"],
+     "values": {"measurement": [[a0, b0], [a1, b1], ...], ...}}
+
+NumPy is used when it is installed; the pure-Python path gives the same
+answer.
+"""
+import bisect
+import math
+from datetime import datetime, timezone
+
+try:
+    import numpy
+except ImportError:  # optional speed-up
+    numpy = None
+
+METRICS = ("measurement", "tank_level", "connection_strength", "battery_level")
+# battery_level is derived from the battery text the way the charts draw it
+BATTERY_LEVELS = {"Full": 100, "Ok": 75, "Low": 25}
+MODES = ("locf", "mean")
+MAX_BUCKETS = 10000
+MEAN_DECIMALS = 2
+
+
+def _parse_time(value):
+    parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def bucket_count(start, end, step):
+    """Number of `step`-second buckets needed to cover [start, end)"""
+    if step is None or step <= 0:
+        raise ValueError("step must be a positive number of seconds")
+    span = (_parse_time(end) - _parse_time(start)).total_seconds()
+    if span <= 0:
+        raise ValueError("window end must be after window start")
+    buckets = math.ceil(span / step)
+    if buckets > MAX_BUCKETS:
+        raise ValueError(f"window needs {buckets} buckets (limit {MAX_BUCKETS}); use a larger step")
+    return buckets
+
+
+def _metric(reading, metric):
+    if metric == "battery_level":
+        return BATTERY_LEVELS.get(reading.get("battery"))
+    return reading.get(metric)
+
+
+def _series(readings, device_ids, end, metrics):
+    """Per device: sorted epoch seconds and one value list per metric"""
+    wanted = set(device_ids)
+    rows = {device_id: [] for device_id in device_ids}
+    for reading in readings:
+        if reading["device_id"] not in wanted:
+            continue
+        created_at = _parse_time(reading["created_at"])
+        if created_at >= end:
+            continue
+        rows[reading["device_id"]].append(
+            (created_at.timestamp(), [_metric(reading, m) for m in metrics])
+        )
+    series = {}
+    for device_id, items in rows.items():
+        items.sort(key=lambda item: item[0])
+        series[device_id] = (
+            [t for t, _ in items],
+            [[values[i] for _, values in items] for i in range(len(metrics))],
+        )
+    return series
+
+
+def _number(value):
+    return None if value is None else float(value)
+
+
+def _resample_python(series, device_ids, t0, step, buckets, mode, metrics):
+    matrices = {m: [[None] * len(device_ids) for _ in range(buckets)] for m in metrics}
+    for column, device_id in enumerate(device_ids):
+        times, values = series[device_id]
+        if mode == "locf":
+            for bucket in range(buckets):
+                index = bisect.bisect_left(times, t0 + (bucket + 1) * step) - 1
+                if index < 0:
+                    continue
+                for metric, metric_values in zip(metrics, values):
+                    matrices[metric][bucket][column] = metric_values[index]
+        else:
+            for m, metric in enumerate(metrics):
+                sums, counts = [0.0] * buckets, [0] * buckets
+                for t, value in zip(times, values[m]):
+                    bucket = math.floor((t - t0) / step)
+                    if 0 <= bucket < buckets and value is not None:
+                        sums[bucket] += float(value)
+                        counts[bucket] += 1
+                for bucket in range(buckets):
+                    if counts[bucket]:
+                        matrices[metric][bucket][column] = round(
+                            sums[bucket] / counts[bucket], MEAN_DECIMALS
+                        )
+    return matrices
+
+
+def _resample_numpy(series, device_ids, t0, step, buckets, mode, metrics):
+    matrices = {m: numpy.full((buckets, len(device_ids)), numpy.nan) for m in metrics}
+    edges = t0 + (numpy.arange(buckets) + 1) * step
+    for column, device_id in enumerate(device_ids):
+        times, values = series[device_id]
+        times = numpy.asarray(times, dtype=float)
+        for m, metric in enumerate(metrics):
+            metric_values = numpy.array([_number(v) for v in values[m]], dtype=float)
+            if mode == "locf":
+                index = numpy.searchsorted(times, edges, side="left") - 1
+                seen = index >= 0
+                matrices[metric][seen, column] = metric_values[index[seen]]
+            else:
+                bucket = numpy.floor((times - t0) / step).astype(int)
+                keep = (bucket >= 0) & (bucket < buckets) & ~numpy.isnan(metric_values)
+                sums = numpy.bincount(bucket[keep], metric_values[keep], minlength=buckets)
+                counts = numpy.bincount(bucket[keep], minlength=buckets)
+                filled = counts > 0
+                matrices[metric][filled, column] = numpy.round(
+                    sums[filled] / counts[filled], MEAN_DECIMALS
+                )
+    return {
+        metric: [[None if math.isnan(v) else v for v in row] for row in matrix.tolist()]
+        for metric, matrix in matrices.items()
+    }
+
+
+def resample(readings, device_ids, start, end, step, mode="locf", metrics=METRICS,
+              use_numpy=None):
+    """Build the sensor_matrix document from an iterable of sensor_data rows
+
+    For locf, pass the readings before `start` as well (at least the last
+    one per device) so the first buckets are seeded.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r} (expected one of {', '.join(MODES)})")
+    unknown = [m for m in metrics if m not in METRICS]
+    if unknown:
+        raise ValueError(f"unknown metric {unknown[0]!r}")
+    device_ids = list(dict.fromkeys(device_ids))
+    buckets = bucket_count(start, end, step)
+    start, end = _parse_time(start), _parse_time(end)
+    series = _series(readings, device_ids, end, metrics)
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    elif use_numpy and numpy is None:
+        raise RuntimeError("the NumPy path needs numpy (pip install numpy)")
+    build = _resample_numpy if use_numpy else _resample_python
+    values = build(series, device_ids, start.timestamp(), step, buckets, mode, tuple(metrics))
+    return {
+        "t0": start.isoformat(),
+        "step": step,
+        "mode": mode,
+        "devices": device_ids,
+        "values": values,
+    }
+
+
+def sensor_matrix(client, device_ids, start, end, step=60, mode="locf"):
+    """Call the sensor_matrix RPC through a RestClient"""
+    return client.rpc("sensor_matrix", {
+        "device_ids": list(device_ids),
+        "window_start": _parse_time(start).isoformat(),
+        "window_end": _parse_time(end).isoformat(),
+        "step_seconds": step,
+        "mode": mode,
+    })
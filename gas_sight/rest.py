@@ -0,0 +1,266 @@
+"""
+Shared REST access layer for the Supabase PostgREST API
+
+Every Python tool talks to the database through RestClient. The actual
+HTTP exchange is delegated to a transport callable so the same client
+code runs against the hosted project (UrllibTransport) or against the
+in-process stand-in used by the test suite (gas_sight.local).
+
+Each completed request is reported to the client's observers as a
+RequestEvent; by default that is the process-wide RestMetrics recorder,
+plus a WorkloadRecorder when $GAS_SIGHT_RECORD names a trace file.
+"""
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from . import config
+from .metrics import default_rest_metrics
+from .postgrest import encode, filter_params
+
+log = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+RETRY_STATUSES = (502, 503, 504)
+
+
+class Response:
+    """Status, lower-cased headers and raw body of one PostgREST call"""
+
+    def __init__(self, status, headers=None, body=b""):
+        self.status = status
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self.body = body or b""
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        if not self.body:
+            return None
+        return json.loads(self.body)
+
+    @property
+    def content_range(self):
+        """Parse `Content-Range: 0-24/3573` into (start, end, total)
+
+        Missing parts are returned as None (e.g. `*/0` or `0-24/*`).
+        """
+        value = self.headers.get("content-range")
+        if not value:
+            return None
+        span, _, total = value.partition("/")
+        start = end = None
+        if span != "*":
+            first, _, last = span.partition("-")
+            start, end = int(first), int(last)
+        return start, end, (None if total in ("", "*") else int(total))
+
+
+class RestError(Exception):
+    """A non-2xx PostgREST response"""
+
+    def __init__(self, status, code=None, message=None, details=None, hint=None):
+        super().__init__(f"{status} {code or ''} {message or ''}".strip())
+        self.status = status
+        self.code = code
+        self.message = message
+        self.details = details
+        self.hint = hint
+
+    @classmethod
+    def from_response(cls, response):
+        try:
+            payload = response.json() or {}
+        except ValueError:
+            payload = {"message": response.body.decode("utf-8", "replace")}
+        if not isinstance(payload, dict):
+            payload = {"message": str(payload)}
+        return cls(
+            response.status,
+            payload.get("code"),
+            payload.get("message"),
+            payload.get("details"),
+            payload.get("hint"),
+        )
+
+
+@dataclass
+class RequestEvent:
+    """What observers learn about one request (after any retries)"""
+    method: str
+    path: str
+    query: str
+    status: int
+    seconds: float
+    request_bytes: int
+    response_bytes: int
+    retries: int = 0
+    total_rows: Optional[int] = None
+    error: Optional[str] = None
+    # what is needed to issue the request again (gas_sight.workload); never auth headers
+    body: Optional[bytes] = None
+    prefer: Optional[str] = None
+
+    @property
+    def endpoint(self):
+        return self.path[len("/rest/v1/"):] if self.path.startswith("/rest/v1/") else self.path
+
+
+class UrllibTransport:
+    """Talk to a real PostgREST endpoint with urllib"""
+
+    def __init__(self, base_url=None, timeout=config.DEFAULT_TIMEOUT):
+        self.base_url = (base_url or config.supabase_url()).rstrip("/")
+        self.timeout = timeout
+
+    def __call__(self, method, path, query, headers, body):
+        import urllib.error
+        import urllib.request  # deferred: http.client/email add ~40ms to CLI startup
+
+        url = f"{self.base_url}{path}"
+        if query:
+            url = f"{url}?{query}"
+        req = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return Response(response.getcode(), dict(response.headers), response.read())
+        except urllib.error.HTTPError as e:
+            return Response(e.code, dict(e.headers or {}), e.read())
+
+
+class RestClient:
+    """Thin PostgREST client mirroring the supabase-js calls used by the app"""
+
+    def __init__(self, url=None, key=None, transport=None, timeout=config.DEFAULT_TIMEOUT,
+                 retries=0, backoff=0.2, observers=None):
+        self.transport = transport or UrllibTransport(url, timeout)
+        self.headers = config.auth_headers(key)
+        self.retries = retries
+        self.backoff = backoff
+        if observers is None:
+            observers = [default_rest_metrics()]
+            if config.record_file():
+                from .workload import default_recorder
+
+                observers.append(default_recorder())
+        self.observers = list(observers)
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Issue one request and return the Response, raising RestError on failure
+
+        Idempotent reads are retried up to `retries` times on connection
+        errors and 502/503/504, with exponential backoff.
+        """
+        query = encode(params) if params else ""
+        if body is not None and not isinstance(body, (bytes, bytearray)):
+            body = json.dumps(body).encode("utf-8")
+        headers = {**self.headers, **(headers or {})}
+        retryable = method in IDEMPOTENT_METHODS
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                response = self.transport(method, path, query, headers, body)
+            except OSError as e:
+                if retryable and attempt < self.retries:
+                    attempt += 1
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                self._notify(method, path, query, headers, body, None, start, attempt, repr(e))
+                raise
+            if response.status in RETRY_STATUSES and retryable and attempt < self.retries:
+                attempt += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+                continue
+            break
+        self._notify(method, path, query, headers, body, response, start, attempt)
+        if not response.ok:
+            raise RestError.from_response(response)
+        return response
+
+    def _notify(self, method, path, query, headers, body, response, start, retries, error=None):
+        if not self.observers:
+            return
+        content_range = response.content_range if response is not None else None
+        event = RequestEvent(
+            method=method,
+            path=path,
+            query=query,
+            status=response.status if response is not None else 0,
+            seconds=time.perf_counter() - start,
+            request_bytes=len(body) if body else 0,
+            response_bytes=len(response.body) if response is not None else 0,
+            retries=retries,
+            total_rows=content_range[2] if content_range else None,
+            error=error,
+            body=bytes(body) if body else None,
+            prefer=headers.get("Prefer"),
+        )
+        for observer in self.observers:
+            try:
+                observer(event)
+            except Exception:
+                # bookkeeping must never replace the request's own result or error
+                log.exception("request observer %r failed", observer)
+
+    def select(self, table, columns="*", filters=None, order=None, limit=None,
+               offset=None, count=None, headers=None):
+        """GET /rest/v1/<table>; returns the decoded rows"""
+        return self.select_response(
+            table, columns, filters, order, limit, offset, count, headers
+        ).json() or []
+
+    def select_response(self, table, columns="*", filters=None, order=None,
+                        limit=None, offset=None, count=None, headers=None):
+        params = [("select", columns)] + filter_params(filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset is not None:
+            params.append(("offset", str(offset)))
+        headers = dict(headers or {})
+        if count:
+            headers["Prefer"] = f"count={count}"
+        return self.request("GET", f"/rest/v1/{table}", params, headers=headers)
+
+    def insert(self, table, rows, returning=True, on_conflict=None, resolution=None,
+               columns=None):
+        """POST one row or a list of rows; `resolution` is merge/ignore for upserts
+
+        `columns` narrows the returned representation (e.g. "id").
+        """
+        prefer = ["return=representation" if returning else "return=minimal"]
+        if resolution:
+            prefer.append(f"resolution={resolution}-duplicates")
+        params = []
+        if returning and columns:
+            params.append(("select", columns))
+        if on_conflict:
+            params.append(("on_conflict", on_conflict))
+        response = self.request(
+            "POST", f"/rest/v1/{table}", params or None, rows, {"Prefer": ",".join(prefer)}
+        )
+        return response.json() if returning else None
+
+    def update(self, table, values, filters, returning=True):
+        prefer = "return=representation" if returning else "return=minimal"
+        response = self.request(
+            "PATCH", f"/rest/v1/{table}", filter_params(filters), values, {"Prefer": prefer}
+        )
+        return response.json() if returning else None
+
+    def delete(self, table, filters, returning=False):
+        prefer = "return=representation" if returning else "return=minimal"
+        response = self.request(
+            "DELETE", f"/rest/v1/{table}", filter_params(filters), headers={"Prefer": prefer}
+        )
+        return response.json() if returning else None
+
+    def rpc(self, name, args=None):
+        """POST /rest/v1/rpc/<name>; returns the decoded result"""
+        return self.request("POST", f"/rest/v1/rpc/{name}", body=args or {}).json()
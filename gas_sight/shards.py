@@ -0,0 +1,423 @@
+"""
+Location-based sharding across several PostgREST backends
+
+ShardedClient has the RestClient interface (select, select_response,
+insert, update, delete, rpc) over a set of named backends. Each shard owns
+location prefixes; a device lives on the shard with the longest prefix of
+its `devices.location` (the default shard if none matches), and its
+readings, comments and alerts live on the same shard.
+
+* Reads and writes that name their devices (`device_id=eq.`/`in.`,
+  `devices?id=...`, `devices?location=eq....`) go to the owning shards.
+* Other reads fan out to every shard in parallel. Rows are merged in the
+  requested order before `offset`/`limit` apply, and exact counts are
+  summed.
+* Fleet-wide RPCs (get_device_stats, device_stats_since, sensor_matrix,
+  sensor_columns, sensor_history, apply_device_counters, purge_sensor_data
+  and the rollup maintenance calls) are split per shard and merged.
+* alert_rules is a reference table written to every shard; other tables
+  without a device (backfill_batches) live on the default shard.
+
+Where a device lives is looked up once and cached. Changing a device's
+location to one owned by another shard raises ShardError; move it by
+re-creating it there.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from . import config
+from .metrics import REGISTRY
+from .postgrest import Filter, filter_params, parse_order, parse_query, parse_select
+from .replicas import ReplicatedClient
+from .rest import Response, RestClient, RestError
+from .wire import pack, packed_rows
+
+# Column that names the owning device, per relation
+DEVICE_COLUMNS = {
+    "devices": "id",
+    "device_stats": "id",
+    "sensor_data": "device_id",
+    "alerts": "device_id",
+}
+REPLICATED = ("alert_rules",)
+ETAG_SEPARATOR = ";"
+
+
+class ShardError(Exception):
+    """A request the shard layout cannot serve"""
+
+
+@dataclass(eq=False)
+class Shard:
+    name: str
+    client: object
+    locations: tuple = ()
+
+    def match(self, location):
+        """Length of the longest owned prefix of `location` (0: not owned)"""
+        return max((len(p) for p in self.locations if location and location.startswith(p)), default=0)
+
+
+def _pinned(filters, column):
+    """Values a query pins `column` to with top-level eq./in. filters, or None"""
+    values = None
+    for f in parse_query(filter_params(filters)).filters:
+        if isinstance(f, Filter) and f.column == column and not f.negate and f.op in ("eq", "in"):
+            pinned = set(f.value) if f.op == "in" else {str(f.value)}
+            values = pinned if values is None else values & pinned
+    return values
+
+
+def _sort(rows, orders):
+    """Order merged rows the way PostgREST would (nulls last ascending, first descending)"""
+    for o in reversed(orders):
+        nulls_first = o.descending if o.nulls_first is None else o.nulls_first
+        present = [r for r in rows if r.get(o.column) is not None]
+        missing = [r for r in rows if r.get(o.column) is None]
+        present.sort(key=lambda r: r[o.column], reverse=o.descending)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def _foreign_key_error(table, column, value):
+    return RestError(
+        409, "23503",
+        f'insert or update on table "{table}" violates foreign key constraint',
+        f"Key ({column})=({value}) is not present on any shard.",
+    )
+
+
+class ShardedClient:
+    """RestClient-compatible router over location-owning shards"""
+
+    def __init__(self, shards, default=None, registry=REGISTRY):
+        if not shards:
+            raise ValueError("at least one shard is required")
+        self.shards = list(shards)
+        names = [s.name for s in self.shards]
+        if len(set(names)) != len(names):
+            raise ValueError("shard names must be unique")
+        self.default = next((s for s in self.shards if s.name == default), None) if default else self.shards[0]
+        if self.default is None:
+            raise ValueError(f"unknown default shard {default!r}")
+        self._placement = {}
+        self._pool = None
+        self.requests = registry.counter(
+            "gas_sight_shard_requests_total", "Requests sent to each shard", ("shard", "route")
+        )
+
+    @classmethod
+    def from_config(cls, spec, timeout=config.DEFAULT_TIMEOUT, registry=REGISTRY):
+        """Build from {"default": name, "shards": [{"name", "url", "key", "locations"}]}
+
+        `spec` is the parsed document or the path of a JSON file holding it.
+        A shard with "replicas" is a ReplicatedClient (see gas_sight.replicas).
+        """
+        if isinstance(spec, str):
+            with open(spec, encoding="utf-8") as f:
+                spec = json.load(f)
+        shards = [
+            Shard(s["name"],
+                  ReplicatedClient.from_config(s, timeout, registry) if s.get("replicas")
+                  else RestClient(url=s.get("url"), key=s.get("key"), timeout=timeout),
+                  tuple(s.get("locations") or ()))
+            for s in spec["shards"]
+        ]
+        return cls(shards, spec.get("default"), registry)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    # -- placement ------------------------------------------------------
+
+    def shard_for_location(self, location):
+        best = max(self.shards, key=lambda s: s.match(location))
+        return best if best.match(location) else self.default
+
+    def locate(self, device_ids):
+        """{device_id: Shard} for the devices that exist; looks up unknown ones on every shard"""
+        device_ids = list(dict.fromkeys(device_ids))
+        missing = [d for d in device_ids if d not in self._placement]
+        if missing:
+            found = self._each(self.shards, lambda c: c.select(
+                "devices", "id", [Filter("id", "in", tuple(missing))]
+            ))
+            for shard, rows in zip(self.shards, found):
+                for row in rows:
+                    self._placement[row["id"]] = shard
+        return {d: self._placement[d] for d in device_ids if d in self._placement}
+
+    def _shards_for(self, table, filters, write=False):
+        if table in REPLICATED:
+            return self.shards if write else [self.default]
+        column = DEVICE_COLUMNS.get(table)
+        if column is None:
+            return self.shards if table == "comments" else [self.default]
+        device_ids = _pinned(filters, column)
+        if device_ids is not None:
+            located = set(self.locate(device_ids).values())
+            return [s for s in self.shards if s in located]
+        locations = _pinned(filters, "location") if column == "id" else None
+        if locations is not None:
+            owners = {self.shard_for_location(location) for location in locations}
+            return [s for s in self.shards if s in owners]
+        return self.shards
+
+
+    # -- execution ------------------------------------------------------
+
+    def _run(self, jobs):
+        """Run [(shard, call)] with call(client), in parallel when there are several"""
+        if not jobs:
+            return []
+        route = "fanout" if len(jobs) > 1 else "routed"
+        for shard, _ in jobs:
+            self.requests.inc(shard=shard.name, route=route)
+        if len(jobs) == 1:
+            shard, call = jobs[0]
+            return [call(shard.client)]
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(len(self.shards), thread_name_prefix="shard")
+        return list(self._pool.map(lambda job: job[1](job[0].client), jobs))
+
+    def _each(self, shards, call):
+        return self._run([(shard, call) for shard in shards])
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Raw request against the default shard (e.g. the API description)"""
+        return self.default.client.request(method, path, params, body, headers)
+
+    # -- tables ---------------------------------------------------------
+
+    def select(self, table, columns="*", filters=None, order=None, limit=None,
+               offset=None, count=None, headers=None):
+        return self.select_response(
+            table, columns, filters, order, limit, offset, count, headers
+        ).json() or []
+
+    def select_response(self, table, columns="*", filters=None, order=None,
+                        limit=None, offset=None, count=None, headers=None):
+        shards = self._shards_for(table, filters)
+        if len(shards) == 1:
+            return self._each(shards, lambda c: c.select_response(
+                table, columns, filters, order, limit, offset, count, headers
+            ))[0]
+        accept = {k.lower(): v for k, v in (headers or {}).items()}.get("accept", "application/json")
+        if accept != "application/json":
+            raise ShardError(f"fan-out reads of {table} can only be merged as JSON")
+        window = None if limit is None else limit + (offset or 0)
+        orders = parse_order(order) if order else []
+        # The merge sorts on the order columns, so fetch them even when not selected
+        selected = {alias for alias, _ in parse_select(columns)}
+        extra = [] if "*" in selected else [o.column for o in orders if o.column not in selected]
+        fetch = ",".join([columns, *extra]) if extra else columns
+        responses = self._each(shards, lambda c: c.select_response(
+            table, fetch, filters, order, window, None, count, headers
+        ))
+        rows = _sort([row for response in responses for row in response.json() or []], orders)
+        if extra:
+            rows = [{k: v for k, v in row.items() if k not in extra} for row in rows]
+        start = offset or 0
+        rows = rows[start:] if limit is None else rows[start:start + limit]
+        total = "*"
+        if count:
+            total = sum((r.content_range or (0, 0, 0))[2] or 0 for r in responses)
+        span = f"{start}-{start + len(rows) - 1}" if rows else "*"
+        return Response(200, {"Content-Range": f"{span}/{total}"}, json.dumps(rows).encode("utf-8"))
+
+    def _group_rows(self, table, rows):
+        """[(shard, rows)] for an insert, in shard order"""
+        if table in REPLICATED:
+            return [(shard, rows) for shard in self.shards]
+        groups = {}
+        if table == "devices":
+            known = self.locate([row["id"] for row in rows])
+            for row in rows:
+                shard = self.shard_for_location(row.get("location"))
+                if known.get(row["id"], shard) is not shard:
+                    raise ShardError(f"device {row['id']} lives on shard {known[row['id']].name}")
+                groups.setdefault(shard.name, []).append(row)
+        elif table in DEVICE_COLUMNS:
+            located = self.locate([row["device_id"] for row in rows])
+            for row in rows:
+                if row["device_id"] not in located:
+                    raise _foreign_key_error(table, "device_id", row["device_id"])
+                groups.setdefault(located[row["device_id"]].name, []).append(row)
+        elif table == "comments":
+            readings = tuple({row["sensor_data_id"] for row in rows})
+            found = self._each(self.shards, lambda c: c.select(
+                "sensor_data", "id", [Filter("id", "in", readings)]
+            ))
+            owners = {row["id"]: shard for shard, part in zip(self.shards, found) for row in part}
+            for row in rows:
+                if row["sensor_data_id"] not in owners:
+                    raise _foreign_key_error(table, "sensor_data_id", row["sensor_data_id"])
+                groups.setdefault(owners[row["sensor_data_id"]].name, []).append(row)
+        else:
+            groups[self.default.name] = rows
+        return [(shard, groups[shard.name]) for shard in self.shards if shard.name in groups]
+
+    def insert(self, table, rows, returning=True, on_conflict=None, resolution=None,
+               columns=None):
+        """Insert on the shards owning each row; alert_rules go to every shard"""
+        groups = self._group_rows(table, [rows] if isinstance(rows, dict) else list(rows))
+        results = self._run([
+            (shard, lambda c, part=part: c.insert(table, part, returning, on_conflict, resolution, columns))
+            for shard, part in groups
+        ])
+        if table == "devices":
+            for shard, part in groups:
+                self._placement.update((row["id"], shard) for row in part)
+        return self._merge_written(table, results, returning)
+
+    def update(self, table, values, filters, returning=True):
+        shards = self._shards_for(table, filters, write=True)
+        if table == "devices" and "location" in values:
+            target = self.shard_for_location(values["location"])
+            for shard in shards:
+                if shard is not target and shard.client.select("devices", "id", filters, limit=1):
+                    raise ShardError(
+                        f"devices on shard {shard.name} cannot move to {target.name} by an update"
+                    )
+        results = self._each(shards, lambda c: c.update(table, values, filters, returning))
+        return self._merge_written(table, results, returning)
+
+    def delete(self, table, filters, returning=False):
+        shards = self._shards_for(table, filters, write=True)
+        results = self._each(shards, lambda c: c.delete(table, filters, returning))
+        if table == "devices":
+            pinned = _pinned(filters, "id")
+            if pinned is None:
+                self._placement.clear()
+            for device_id in pinned or ():
+                self._placement.pop(device_id, None)
+        return self._merge_written(table, results, returning)
+
+    @staticmethod
+    def _merge_written(table, results, returning):
+        if not returning:
+            return None
+        if table in REPLICATED:
+            return results[0] if results else []
+        return [row for result in results for row in result or []]
+
+    # -- RPCs -----------------------------------------------------------
+
+    def rpc(self, name, args=None):
+        """Split fleet-wide RPCs per shard and merge; others run on the default shard"""
+        handler = getattr(self, f"_rpc_{name}", None)
+        if handler is None:
+            return self._each([self.default], lambda c: c.rpc(name, args))[0]
+        return handler(dict(args or {}))
+
+    def _by_shard(self, device_ids):
+        """[(shard, device_ids)]; unknown devices go to the default shard (they read as empty)"""
+        located = self.locate(device_ids)
+        groups = {}
+        for device_id in dict.fromkeys(device_ids):
+            groups.setdefault(located.get(device_id, self.default).name, []).append(device_id)
+        return [(shard, groups[shard.name]) for shard in self.shards if shard.name in groups]
+
+    def _rpc_get_device_stats(self, args):
+        return [row for part in self._each(self.shards, lambda c: c.rpc("get_device_stats", args))
+                for row in part or []]
+
+    def _rpc_device_stats_since(self, args):
+        since = (args.get("since") or "").split(ETAG_SEPARATOR)
+        if len(since) != len(self.shards):
+            since = [None] * len(self.shards)
+        results = self._run([
+            (shard, lambda c, etag=etag: c.rpc("device_stats_since", {"since": etag}))
+            for shard, etag in zip(self.shards, since)
+        ])
+        full = [r.get("full") for r in results]
+        if any(full) and not all(full):
+            # The caller drops its snapshot on a full answer, so every shard must send one
+            refetch = [n for n, f in enumerate(full) if not f]
+            for n, result in zip(refetch, self._each(
+                [self.shards[n] for n in refetch], lambda c: c.rpc("device_stats_since", {"since": None})
+            )):
+                results[n] = result
+        return {
+            "etag": ETAG_SEPARATOR.join(r["etag"] for r in results),
+            "not_modified": all(r.get("not_modified") for r in results),
+            "full": all(r.get("full") for r in results),
+            "devices": [row for r in results for row in r.get("devices") or []],
+            "removed": [device_id for r in results for device_id in r.get("removed") or []],
+        }
+
+    def _rpc_sensor_matrix(self, args):
+        device_ids = list(dict.fromkeys(args.get("device_ids") or []))
+        groups = self._by_shard(device_ids) or [(self.default, [])]
+        results = self._run([
+            (shard, lambda c, ids=ids: c.rpc("sensor_matrix", {**args, "device_ids": ids}))
+            for shard, ids in groups
+        ])
+        columns = {d: (r, n) for r in results for n, d in enumerate(r["devices"])}
+        first = results[0]
+        return {
+            **first,
+            "devices": device_ids,
+            "values": {
+                metric: [
+                    [columns[d][0]["values"][metric][bucket][columns[d][1]] for d in device_ids]
+                    for bucket in range(len(buckets))
+                ]
+                for metric, buckets in first["values"].items()
+            },
+        }
+
+    def _rpc_sensor_columns(self, args):
+        device_ids = list(dict.fromkeys(args.get("device_ids") or []))
+        groups = self._by_shard(device_ids) or [(self.default, [])]
+        results = self._run([
+            (shard, lambda c, ids=ids: c.rpc("sensor_columns", {**args, "device_ids": ids}))
+            for shard, ids in groups
+        ])
+        if len(results) == 1:
+            return results[0]
+        rows = [row for result in results for row in packed_rows(result)]
+        rows.sort(key=lambda r: (r["created_at"], r["id"]))
+        return pack(rows, device_ids)
+
+    def _rpc_apply_device_counters(self, args):
+        counters = {c["id"]: c for c in args.get("counters") or []}
+        located = self.locate(counters)
+        groups = {}
+        for device_id, counter in counters.items():
+            if device_id in located:
+                groups.setdefault(located[device_id].name, []).append(counter)
+        return sum(self._run([
+            (shard, lambda c, part=groups[shard.name]: c.rpc("apply_device_counters", {"counters": part}))
+            for shard in self.shards if shard.name in groups
+        ]))
+
+    def _rpc_sensor_history(self, args):
+        results = self._run([
+            (shard, lambda c, ids=ids: c.rpc("sensor_history", {**args, "device_ids": ids}))
+            for shard, ids in self._by_shard(args.get("device_ids") or []) or [(self.default, [])]
+        ])
+        rows = [row for result in results for row in result["rows"]]
+        rows.sort(key=lambda r: (r["created_at"], r["device_id"]))
+        return {"resolution": max(r["resolution"] for r in results), "rows": rows}
+
+    def _rpc_rebuild_sensor_rollups(self, args):
+        located = self.locate(args.get("device_ids") or [])
+        return sum(self._run([
+            (shard, lambda c, ids=ids: c.rpc("rebuild_sensor_rollups", {**args, "device_ids": ids}))
+            for shard, ids in self._by_shard(list(located))
+        ]))
+
+    def _rpc_prune_sensor_rollups(self, args):
+        return sum(self._each(self.shards, lambda c: c.rpc("prune_sensor_rollups", args)))
+
+    def _rpc_purge_sensor_data(self, args):
+        """A device's batch on its shard; a retention batch on every shard (up to batch_size each)"""
+        device_id = args.get("target_device_id")
+        if device_id is None:
+            return sum(self._each(self.shards, lambda c: c.rpc("purge_sensor_data", args)))
+        shard = self.locate([device_id]).get(device_id, self.default)
+        return self._each([shard], lambda c: c.rpc("purge_sensor_data", args))[0]
@@ -0,0 +1,295 @@
+"""
+Disk-backed store-and-forward queue for gateways during uplink outages
+
+Readings are appended to a Spool before they are sent, so a site that
+loses its uplink keeps hours of tank data on disk instead of printing an
+error per reading. The spool is a directory of append-only segment files
+(`<n>.seg`) holding length + CRC32 framed JSON records, plus a `cursor`
+file with the position of the first record not yet forwarded:
+
+* appends are buffered and fsynced every `fsync_every` records or
+  `fsync_interval` seconds, so a crash loses at most that unsynced tail;
+  a torn frame at the end of the last segment is truncated on open
+* segments are read back through mmap and deleted once the cursor has
+  moved past them
+* the directory is capped at `max_bytes`; when it is full the oldest
+  segment is dropped (and counted) so the newest readings survive
+
+SpooledWriter puts a Spool in front of SensorWriter. When the uplink is
+back it drains the spool in order, in batches of `batch_size` readings,
+and backs off with jitter after a failure so that reconnecting gateways
+do not all retry at once. Only data errors (400, 409, 422 and SQLSTATE
+class 23, e.g. an unknown device) are looked for row by row and set aside
+in `rejected.ndjson`; auth, not-found, timeout and rate-limit responses
+leave the readings spooled and back off like an outage.
+"""
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+
+from .metrics import REGISTRY
+from .rest import RestError
+
+_FRAME = struct.Struct("<II")  # payload length, crc32
+SEGMENT_BYTES = 8 << 20
+MAX_BYTES = 1 << 30
+DATA_ERROR_STATUSES = (400, 409, 422)
+
+
+def is_data_error(error):
+    """True when the database rejected the rows themselves, not the request"""
+    return error.status in DATA_ERROR_STATUSES or str(error.code or "").startswith("23")
+
+
+def _frames(buffer, offset=0, limit=None):
+    """Yield (record, end_offset) for the intact frames of a segment buffer"""
+    size = len(buffer)
+    count = 0
+    while offset + _FRAME.size <= size and (limit is None or count < limit):
+        length, crc = _FRAME.unpack_from(buffer, offset)
+        end = offset + _FRAME.size + length
+        if end > size:
+            return
+        payload = bytes(buffer[offset + _FRAME.size:end])
+        if zlib.crc32(payload) != crc:
+            return
+        yield json.loads(payload), end
+        offset = end
+        count += 1
+
+
+class Spool:
+    """Append-only segmented on-disk queue of JSON records"""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, max_bytes=MAX_BYTES,
+                 fsync_every=64, fsync_interval=1.0, registry=REGISTRY):
+        if segment_bytes * 2 > max_bytes:
+            raise ValueError("max_bytes must hold at least two segments")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._lock = threading.RLock()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self.appended = registry.counter("gas_sight_spool_appended_total", "Records appended to the spool")
+        self.acked = registry.counter("gas_sight_spool_acked_total", "Records forwarded and acknowledged")
+        self.dropped = registry.counter(
+            "gas_sight_spool_dropped_total", "Unsent records dropped to stay within the disk budget"
+        )
+        self.size = registry.gauge("gas_sight_spool_bytes", "Bytes on disk in spool segments")
+        self._segments = sorted(
+            int(name[:-4]) for name in os.listdir(directory) if name.endswith(".seg")
+        )
+        self._cursor = self._load_cursor()
+        if not self._segments:
+            self._segments = [self._cursor[0]]
+        self._recover_tail()
+        self._file = open(self._path(self._segments[-1]), "ab")
+        self._update_size()
+
+    # -- files ----------------------------------------------------------
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:016d}.seg")
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, "cursor")) as f:
+                cursor = json.load(f)
+            return cursor["segment"], cursor["offset"]
+        except FileNotFoundError:
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, "cursor")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _recover_tail(self):
+        """Cut a frame torn by a crash off the end of the last segment"""
+        path = self._path(self._segments[-1])
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        end = 0
+        for _, end in _frames(data):
+            pass
+        if end < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+                os.fsync(f.fileno())
+
+    def _update_size(self):
+        total = 0
+        for segment in self._segments[:-1]:
+            total += os.path.getsize(self._path(segment))
+        total += self._file.tell()
+        self.size.set(total)
+        return total
+
+    # -- writing --------------------------------------------------------
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        """Append records in order; fsyncs when a batch boundary is reached"""
+        with self._lock:
+            for record in records:
+                payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+                if self._file.tell() + len(payload) + _FRAME.size > self.segment_bytes and self._file.tell():
+                    self._roll()
+                self._file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+                self._unsynced += 1
+                self.appended.inc()
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._synced_at >= self.fsync_interval):
+                self.sync()
+            if self._update_size() > self.max_bytes:
+                self._enforce_budget()
+
+    def sync(self):
+        """Flush and fsync everything appended so far"""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._synced_at = time.monotonic()
+
+    def _roll(self):
+        self.sync()
+        self._file.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._file = open(self._path(self._segments[-1]), "ab")
+
+    def _enforce_budget(self):
+        while len(self._segments) > 1 and self._update_size() > self.max_bytes:
+            oldest = self._segments.pop(0)
+            path = self._path(oldest)
+            if self._cursor[0] <= oldest:
+                offset = self._cursor[1] if self._cursor[0] == oldest else 0
+                with open(path, "rb") as f:
+                    self.dropped.inc(sum(1 for _ in _frames(f.read(), offset)))
+                self._cursor = (self._segments[0], 0)
+                self._save_cursor()
+            os.remove(path)
+
+    # -- reading --------------------------------------------------------
+
+    def read(self, max_records):
+        """Up to `max_records` unacknowledged records and the position after them"""
+        with self._lock:
+            self._file.flush()
+            records = []
+            segment, offset = self._cursor
+            position = self._cursor
+            for current in self._segments:
+                if current < segment:
+                    continue
+                start = offset if current == segment else 0
+                position = (current, start)
+                path = self._path(current)
+                if os.path.getsize(path) > start:
+                    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        for record, end in _frames(mm, start, max_records - len(records)):
+                            records.append(record)
+                            position = (current, end)
+                if len(records) >= max_records or current == self._segments[-1]:
+                    break
+                # This sealed segment is exhausted; carry on in the next one
+                position = (current + 1, 0)
+            return records, position
+
+    def ack(self, position, count=0):
+        """Mark everything before `position` as forwarded and delete finished segments"""
+        with self._lock:
+            self._cursor = position
+            self._save_cursor()
+            while len(self._segments) > 1 and self._segments[0] < position[0]:
+                os.remove(self._path(self._segments.pop(0)))
+            if count:
+                self.acked.inc(count)
+            self._update_size()
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            self._file.close()
+
+
+class SpooledWriter:
+    """Spool readings to disk, then forward them in large ordered batches"""
+
+    def __init__(self, spool, writer, batch_size=2000, backoff=1.0, max_backoff=300.0):
+        self.spool = spool
+        self.writer = writer
+        self.batch_size = batch_size
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._retry_at = 0.0
+        self._drain_lock = threading.Lock()
+
+    def write(self, readings):
+        """Spool readings and forward whatever the uplink accepts right now"""
+        self.spool.extend(readings)
+        if time.monotonic() >= self._retry_at:
+            return self.drain()
+        return 0
+
+    def drain(self):
+        """Forward spooled readings oldest first; returns how many left the spool"""
+        sent = 0
+        with self._drain_lock:
+            self.spool.sync()
+            while True:
+                records, position = self.spool.read(self.batch_size)
+                if not records:
+                    self.failures = 0
+                    return sent
+                try:
+                    try:
+                        self.writer.write(records)
+                    except RestError as e:
+                        if is_data_error(e):
+                            # Something in the batch is invalid; find it row by row
+                            self._write_singly(records)
+                        else:
+                            raise
+                except (RestError, OSError):
+                    self._fail()
+                    return sent
+                self.spool.ack(position, len(records))
+                sent += len(records)
+
+    def _fail(self):
+        self.failures += 1
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        self._retry_at = time.monotonic() + delay * random.uniform(0.5, 1.5)
+
+    def _write_singly(self, records):
+        """Forward records one at a time, setting aside the ones the database rejects"""
+        for record in records:
+            try:
+                self.writer.write([record])
+            except RestError as e:
+                if not is_data_error(e):
+                    raise
+                self._dead_letter(record, e)
+
+    def _dead_letter(self, record, error):
+        """Keep a reading the database rejected instead of retrying it forever"""
+        with open(os.path.join(self.spool.directory, "rejected.ndjson"), "a") as f:
+            f.write(json.dumps({"error": str(error), "record": record}) + "\n")
@@ -0,0 +1,153 @@
+"""
+Multi-resolution sensor history: raw readings plus 1 minute, 15 minute and
+hourly rollups
+
+Reference implementation of the tiers in
+supabase/migrations/20261019170000_sensor_rollups.sql. An insert trigger
+folds every reading into one `sensor_rollups` row per tier (count, sum,
+min, max and the bucket's latest reading), and `sensor_history` answers a
+window from the coarsest tier that still yields `max_points` buckets and
+whose retention reaches back to the window start:
+
+    {"resolution": 3600, "rows": [{"id", "device_id", "created_at",
+     "readings", "measurement", "measurement_min", "measurement_max",
+     "tank_level", "connection_strength", "battery"}, ...]}
+
+Rollup rows carry the bucket start as created_at, the means of the
+metrics, and the id and battery of the latest reading in the bucket (so
+chart comments still attach to a real reading). Raw rows use the same
+shape with readings=1.
+"""
+import re
+from datetime import datetime, timedelta, timezone
+
+from .resample import _parse_time
+
+# resolution in seconds (0 = raw sensor_data) -> retention (None = forever)
+TIERS = {0: None, 60: timedelta(days=35), 900: timedelta(days=400), 3600: None}
+DEFAULT_MAX_POINTS = 720
+MEAN_DECIMALS = 2
+
+_INTERVAL = re.compile(r"^\s*(?:(\d+) days?)?\s*(?:(\d+):(\d\d):(\d\d))?\s*$")
+
+
+def parse_interval(text):
+    """Postgres interval text ("35 days", "1 day 02:00:00") as a timedelta; None stays None"""
+    if text is None or isinstance(text, timedelta):
+        return text
+    match = _INTERVAL.match(text)
+    if not match or not any(match.groups()):
+        raise ValueError(f"unsupported interval {text!r}")
+    days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def choose_tier(start, end, max_points=DEFAULT_MAX_POINTS, tiers=TIERS, now=None):
+    """Coarsest resolution with at least `max_points` buckets over [start, end) still retained at start"""
+    start, end = _parse_time(start), _parse_time(end)
+    if end <= start:
+        raise ValueError("window end must be after window start")
+    if not max_points or max_points <= 0:
+        raise ValueError("max_points must be positive")
+    now = now or datetime.now(timezone.utc)
+    wanted = (end - start).total_seconds() / max_points
+    usable = [
+        resolution for resolution, retention in tiers.items()
+        if resolution <= wanted and (retention is None or start >= now - retention)
+    ]
+    return max(usable, default=0)
+
+
+def bucket_start(value, resolution):
+    """Start of the `resolution`-second bucket holding `value` (UTC)"""
+    epoch = _parse_time(value).timestamp()
+    return datetime.fromtimestamp(epoch // resolution * resolution, timezone.utc)
+
+
+def rollup(readings, resolution):
+    """sensor_rollups rows for `readings` at one resolution (what the trigger accumulates)"""
+    buckets = {}
+    for reading in sorted(readings, key=lambda r: (_parse_time(r["created_at"]), r["id"])):
+        key = (reading["device_id"], bucket_start(reading["created_at"], resolution))
+        row = buckets.get(key)
+        if row is None:
+            row = buckets[key] = {
+                "device_id": key[0], "resolution": resolution, "bucket": key[1].isoformat(),
+                "readings": 0, "measurement_sum": 0.0, "tank_level_sum": 0.0,
+                "connection_strength_sum": 0,
+                "measurement_min": reading["measurement"], "measurement_max": reading["measurement"],
+                "tank_level_min": reading["tank_level"], "tank_level_max": reading["tank_level"],
+            }
+        row["readings"] += 1
+        row["measurement_sum"] += reading["measurement"]
+        row["measurement_min"] = min(row["measurement_min"], reading["measurement"])
+        row["measurement_max"] = max(row["measurement_max"], reading["measurement"])
+        row["tank_level_sum"] += reading["tank_level"]
+        row["tank_level_min"] = min(row["tank_level_min"], reading["tank_level"])
+        row["tank_level_max"] = max(row["tank_level_max"], reading["tank_level"])
+        row["connection_strength_sum"] += reading["connection_strength"]
+        row["last_id"] = reading["id"]
+        row["last_at"] = reading["created_at"]
+        row["last_battery"] = reading["battery"]
+    return list(buckets.values())
+
+
+def history_row(rollup_row):
+    """A sensor_rollups row in the shape sensor_history returns"""
+    n = rollup_row["readings"]
+    return {
+        "id": rollup_row["last_id"],
+        "device_id": rollup_row["device_id"],
+        "created_at": rollup_row["bucket"],
+        "readings": n,
+        "measurement": round(rollup_row["measurement_sum"] / n, MEAN_DECIMALS),
+        "measurement_min": rollup_row["measurement_min"],
+        "measurement_max": rollup_row["measurement_max"],
+        "tank_level": round(rollup_row["tank_level_sum"] / n, MEAN_DECIMALS),
+        "connection_strength": int(rollup_row["connection_strength_sum"] / n + 0.5),
+        "battery": rollup_row["last_battery"],
+    }
+
+
+def raw_history_row(reading):
+    """A sensor_data row in the shape sensor_history returns"""
+    return {
+        "id": reading["id"],
+        "device_id": reading["device_id"],
+        "created_at": reading["created_at"],
+        "readings": 1,
+        "measurement": reading["measurement"],
+        "measurement_min": reading["measurement"],
+        "measurement_max": reading["measurement"],
+        "tank_level": reading["tank_level"],
+        "connection_strength": reading["connection_strength"],
+        "battery": reading["battery"],
+    }
+
+
+def _iso(value):
+    return _parse_time(value).isoformat()
+
+
+def history(client, device_ids, start, end, max_points=DEFAULT_MAX_POINTS):
+    """Call the sensor_history RPC: {"resolution": seconds, "rows": [...]}"""
+    return client.rpc("sensor_history", {
+        "device_ids": list(device_ids),
+        "window_start": _iso(start),
+        "window_end": _iso(end),
+        "max_points": max_points,
+    })
+
+
+def rebuild(client, device_ids, start, end):
+    """Recompute the rollups covering [start, end) from raw rows (after deletes); returns readings folded"""
+    return client.rpc("rebuild_sensor_rollups", {
+        "device_ids": list(device_ids),
+        "window_start": _iso(start),
+        "window_end": _iso(end),
+    })
+
+
+def prune(client):
+    """Drop rollup buckets older than their tier's retention; returns rows removed"""
+    return client.rpc("prune_sensor_rollups")
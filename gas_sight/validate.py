@@ -0,0 +1,269 @@
+"""
+Pre-flight validation of bulk writes
+
+One bad row makes PostgREST reject a whole bulk insert, and the error does
+not say which row it was. validate_readings() and validate_devices() check
+a batch against the same rules the database enforces and split it into
+rows that will insert and Rejection(index, row, reasons):
+
+* sensor_data: NOT NULL columns, `battery in ('Full','Ok','Low')`,
+  `connection_strength` an integer in 0..100, numeric metrics, a parsable
+  created_at, ids unique within the batch, and device_id present in a
+  DeviceRegistry (the foreign key)
+* devices: NOT NULL columns, MAC addresses in `AA:BB:CC:DD:EE:FF` form,
+  ids and MACs unique within the batch (MACs compared case-insensitively),
+  and MACs not already taken by another device in the registry
+
+Each rule runs over a whole column at once: the batch is turned into
+columns first, then every check yields the indexes that fail it. NumPy is
+used when it is installed; the pure-Python path gives the same answer.
+
+DeviceRegistry caches device ids and MAC addresses (one select, then kept
+current from a ChangeFeed or refreshed on demand). write_valid() inserts
+the rows that pass in one request and returns the rejections.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List
+
+try:
+    import numpy
+except ImportError:  # optional speed-up
+    numpy = None
+
+BATTERY_LEVELS = ("Full", "Ok", "Low")
+CONNECTION_RANGE = (0, 100)
+MAC_PATTERN = re.compile(r"^[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}$")
+REQUIRED = {
+    "sensor_data": ("device_id", "title_name", "tank_level", "updated_refresh", "battery",
+                    "connection_strength", "measurement"),
+    "devices": ("id", "name", "mac_address", "title"),
+}
+
+
+@dataclass
+class Rejection:
+    index: int
+    row: dict
+    reasons: List[str]
+
+
+@dataclass
+class Validation:
+    valid: List[dict] = field(default_factory=list)
+    rejected: List[Rejection] = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return not self.rejected
+
+
+class DeviceRegistry:
+    """Known device ids and their MAC addresses, for foreign key and uniqueness checks"""
+
+    def __init__(self, client=None, devices=None):
+        self.client = client
+        self._macs = {}
+        self._lock = threading.Lock()
+        if devices is not None:
+            self._macs = {d["id"]: d.get("mac_address") for d in devices}
+        elif client is not None:
+            self.refresh()
+
+    def refresh(self):
+        rows = self.client.select("devices", "id,mac_address")
+        with self._lock:
+            self._macs = {row["id"]: row["mac_address"] for row in rows}
+
+    def ids(self):
+        with self._lock:
+            return set(self._macs)
+
+    def owners(self):
+        """Upper-cased MAC address -> device id"""
+        with self._lock:
+            return {mac.upper(): device_id for device_id, mac in self._macs.items() if mac}
+
+    def on_change(self, change):
+        with self._lock:
+            if change.type == "DELETE":
+                self._macs.pop(change.old_record.get("id"), None)
+            elif change.record.get("id"):
+                self._macs[change.record["id"]] = change.record.get("mac_address")
+
+    def attach(self, feed):
+        return feed.subscribe(self.on_change, tables=("devices",), on_gap=self.refresh)
+
+
+class _Checks:
+    """Reasons per row index, collected column by column"""
+
+    def __init__(self, rows, use_numpy):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise RuntimeError("the NumPy path needs numpy (pip install numpy)")
+        self.rows = rows
+        self.np = numpy if use_numpy else None
+        self.reasons = {}
+
+    def column(self, name):
+        return [row.get(name) for row in self.rows]
+
+    def flag(self, indexes, reason):
+        for index in indexes:
+            self.reasons.setdefault(int(index), []).append(reason)
+
+    def _where(self, mask):
+        if self.np is not None:
+            return self.np.flatnonzero(mask)
+        return [n for n, bad in enumerate(mask) if bad]
+
+    def required(self, columns):
+        for name in columns:
+            missing = [row.get(name) is None for row in self.rows]
+            self.flag(self._where(self.np.array(missing, dtype=bool) if self.np is not None else missing),
+                      f"{name} is required")
+
+    def one_of(self, name, allowed):
+        values = self.column(name)
+        if self.np is not None:
+            # None passes here (required() reports it); other non-strings never match
+            text = self.np.array([
+                v if isinstance(v, str) else allowed[0] if v is None else "\0" for v in values
+            ], dtype=object)
+            bad = ~self.np.isin(text, list(allowed))
+        else:
+            bad = [v is not None and v not in allowed for v in values]
+        self.flag(self._where(bad), f"{name} must be one of {', '.join(allowed)}")
+
+    def _numbers(self, values):
+        """Values as floats (NaN where not a number) and a mask of non-numbers"""
+        numbers = [v if isinstance(v, (int, float)) and not isinstance(v, bool) else None for v in values]
+        not_number = [v is not None and n is None for v, n in zip(values, numbers)]
+        if self.np is not None:
+            return (self.np.array([self.np.nan if n is None else n for n in numbers], dtype=float),
+                    self.np.array(not_number, dtype=bool))
+        return numbers, not_number
+
+    def numeric(self, name):
+        _, not_number = self._numbers(self.column(name))
+        self.flag(self._where(not_number), f"{name} must be a number")
+
+    def integer_range(self, name, low, high):
+        values, not_number = self._numbers(self.column(name))
+        if self.np is not None:
+            present = ~self.np.isnan(values)
+            with self.np.errstate(invalid="ignore"):
+                bad = not_number | (present & ((values < low) | (values > high) | (values % 1 != 0)))
+        else:
+            bad = [
+                nn or (v is not None and not (low <= v <= high and float(v).is_integer()))
+                for v, nn in zip(values, not_number)
+            ]
+        self.flag(self._where(bad), f"{name} must be an integer between {low} and {high}")
+
+    def pattern(self, name, regex, description):
+        bad = [v is not None and not (isinstance(v, str) and regex.match(v)) for v in self.column(name)]
+        self.flag(self._where(self.np.array(bad, dtype=bool) if self.np is not None else bad),
+                  f"{name} must look like {description}")
+
+    def timestamp(self, name):
+        def bad(value):
+            if value is None:
+                return False
+            try:
+                datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+            except (AttributeError, TypeError, ValueError):
+                return True
+            return False
+
+        mask = [bad(v) for v in self.column(name)]
+        self.flag(self._where(self.np.array(mask, dtype=bool) if self.np is not None else mask),
+                  f"{name} must be an ISO-8601 timestamp")
+
+    def unique(self, name, normalise=None):
+        values = [v if v is None or normalise is None else normalise(v) for v in self.column(name)]
+        if self.np is not None:
+            present = self.np.array([n for n, v in enumerate(values) if v is not None], dtype=int)
+            if len(present):
+                keys = self.np.array([str(values[n]) for n in present])
+                _, first, inverse = self.np.unique(keys, return_index=True, return_inverse=True)
+                originals = present[first][inverse.ravel()]
+                for index, original in zip(present[present != originals], originals[present != originals]):
+                    self.flag([index], f"{name} duplicates row {original}")
+            return
+        seen = {}
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            if value in seen:
+                self.flag([index], f"{name} duplicates row {seen[value]}")
+            else:
+                seen[value] = index
+
+    def known(self, name, allowed, reason):
+        values = self.column(name)
+        if self.np is not None:
+            text = self.np.array([str(v) for v in values], dtype=object)
+            present = self.np.array([v is not None for v in values], dtype=bool)
+            bad = present & ~self.np.isin(text, list(allowed) or [""])
+        else:
+            bad = [v is not None and v not in allowed for v in values]
+        self.flag(self._where(bad), reason)
+
+    def result(self):
+        out = Validation()
+        for index, row in enumerate(self.rows):
+            reasons = self.reasons.get(index)
+            if reasons:
+                out.rejected.append(Rejection(index, row, reasons))
+            else:
+                out.valid.append(row)
+        return out
+
+
+def validate_readings(rows, registry=None, use_numpy=None):
+    """Split sensor_data rows into insertable ones and rejections"""
+    rows = list(rows)
+    checks = _Checks(rows, use_numpy)
+    checks.required(REQUIRED["sensor_data"])
+    checks.one_of("battery", BATTERY_LEVELS)
+    checks.integer_range("connection_strength", *CONNECTION_RANGE)
+    checks.numeric("measurement")
+    checks.numeric("tank_level")
+    checks.timestamp("created_at")
+    checks.unique("id")
+    if registry is not None:
+        checks.known("device_id", registry.ids(), "device_id is not a known device")
+    return checks.result()
+
+
+def validate_devices(rows, registry=None, use_numpy=None):
+    """Split devices rows into insertable ones and rejections"""
+    rows = list(rows)
+    checks = _Checks(rows, use_numpy)
+    checks.required(REQUIRED["devices"])
+    checks.pattern("mac_address", MAC_PATTERN, "AA:BB:CC:DD:EE:FF")
+    checks.unique("id")
+    checks.unique("mac_address", normalise=lambda mac: mac.upper() if isinstance(mac, str) else mac)
+    if registry is not None:
+        owners = registry.owners()
+        for index, row in enumerate(rows):
+            mac = row.get("mac_address")
+            owner = owners.get(mac.upper()) if isinstance(mac, str) else None
+            if owner is not None and owner != row.get("id"):
+                checks.flag([index], f"mac_address belongs to device {owner}")
+    return checks.result()
+
+
+VALIDATORS = {"sensor_data": validate_readings, "devices": validate_devices}
+
+
+def write_valid(client, table, rows, registry=None, use_numpy=None, **insert_options):
+    """Insert the rows of `table` that pass validation in one request; returns (stored, rejected)"""
+    validation = VALIDATORS[table](rows, registry, use_numpy)
+    stored = client.insert(table, validation.valid, **insert_options) if validation.valid else []
+    return stored, validation.rejected
@@ -0,0 +1,190 @@
+"""
+Lean projections and compact wire formats for the hot read paths
+
+`select=*` on sensor_data ships technical_data (the raw BLE packet as
+JSONB), updated_refresh, title_name and both units with every chart point,
+although a chart needs a timestamp and three numbers. PROJECTIONS lists
+the columns each consumer actually reads; src/lib/wire.ts has the same
+table for the app.
+
+For long ranges there are two columnar formats:
+
+* CSV: any PostgREST read with `Accept: text/csv` (fetch_csv)
+* packed-v1: the `sensor_columns` RPC returns one base64 string per column
+  instead of one JSON object per row. Values are big-endian (the byte
+  order of Postgres' *send functions): `uuid` 16 bytes, `i8` / `i4`
+  integers, `f8` doubles (NaN for NULL). `created_at` is epoch
+  milliseconds; `device` and `battery` are i4 indexes into the column's
+  `labels` (-1 for NULL).
+
+unpack() decodes packed-v1 into column lists and packed_rows() into row
+dicts; pack() is the reference encoder used by the local stand-in and
+benchmarks/bench_wire.py.
+"""
+import base64
+import csv
+import io
+import sys
+import uuid
+from array import array
+from datetime import datetime, timezone
+
+FORMAT = "packed-v1"
+
+PROJECTIONS = {
+    # Charts.tsx: one point per reading
+    "chart_point": "id,device_id,created_at,measurement,tank_level,connection_strength,battery",
+    # useSensorData: the latest reading card
+    "latest_reading": (
+        "device_id,title_name,tank_level,tank_level_unit,updated_refresh,battery,"
+        "connection_strength,measurement,measurement_unit,updated_at"
+    ),
+    # Charts.tsx comment markers
+    "comment": "id,sensor_data_id,comment_text,user_name,created_at,sensor_data(created_at)",
+    # useDeviceData: device cards (no discovery metadata)
+    "device_card": (
+        "id,name,title,location,color,enabled,is_connected,last_connected,mac_address,"
+        "service_uuid,data_characteristic_uuid,connection_attempts,total_packets_received,"
+        "device_created_at,latest_tank_level,latest_measurement,latest_battery,"
+        "latest_connection_strength,latest_reading_at,tank_level_unit,measurement_unit,"
+        "total_readings,readings_last_24h,avg_measurement_24h"
+    ),
+}
+
+BATTERY_LABELS = ("Full", "Ok", "Low")
+PACKED_COLUMNS = {
+    "id": "uuid",
+    "created_at": "i8",
+    "device": "i4",
+    "measurement": "f8",
+    "tank_level": "f8",
+    "connection_strength": "i4",
+    "battery": "i4",
+}
+_ARRAY_CODES = {"f8": "d", "i8": "q", "i4": "i"}
+_NUMERIC = {"measurement": float, "tank_level": float, "connection_strength": int}
+
+
+def _epoch_ms(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return round(value.timestamp() * 1000)
+
+
+def _encode(kind, values):
+    if kind == "uuid":
+        data = b"".join(uuid.UUID(v).bytes for v in values)
+    else:
+        packed = array(_ARRAY_CODES[kind], values)
+        if sys.byteorder == "little":
+            packed.byteswap()
+        data = packed.tobytes()
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode(kind, data):
+    raw = base64.b64decode(data)  # Postgres' encode() wraps lines; b64decode skips newlines
+    if kind == "uuid":
+        h = raw.hex()
+        return [
+            f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+            for i in range(0, len(h), 32)
+        ]
+    values = array(_ARRAY_CODES[kind])
+    values.frombytes(raw)
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values.tolist()
+
+
+def pack(rows, device_ids):
+    """Encode sensor_data rows (ordered by created_at, id) as a packed-v1 payload"""
+    position = {device_id: n for n, device_id in enumerate(device_ids)}
+    battery = {label: n for n, label in enumerate(BATTERY_LABELS)}
+    values = {
+        "id": [row["id"] for row in rows],
+        "created_at": [_epoch_ms(row["created_at"]) for row in rows],
+        "device": [position.get(row["device_id"], -1) for row in rows],
+        "measurement": [float("nan") if row["measurement"] is None else float(row["measurement"])
+                        for row in rows],
+        "tank_level": [float("nan") if row["tank_level"] is None else float(row["tank_level"])
+                       for row in rows],
+        "connection_strength": [row["connection_strength"] for row in rows],
+        "battery": [battery.get(row["battery"], -1) for row in rows],
+    }
+    columns = {name: {"type": kind, "data": _encode(kind, values[name])}
+               for name, kind in PACKED_COLUMNS.items()}
+    columns["device"]["labels"] = list(device_ids)
+    columns["battery"]["labels"] = list(BATTERY_LABELS)
+    return {"format": FORMAT, "rows": len(rows), "columns": columns}
+
+
+def unpack(payload):
+    """Decode a packed-v1 payload into {column: list}; labelled columns become strings"""
+    if payload.get("format") != FORMAT:
+        raise ValueError(f"unsupported wire format {payload.get('format')!r}")
+    out = {}
+    for name, column in payload["columns"].items():
+        values = _decode(column["type"], column["data"])
+        labels = column.get("labels")
+        if labels is not None:
+            values = [labels[v] if v >= 0 else None for v in values]
+        elif column["type"] == "f8":
+            values = [None if v != v else v for v in values]
+        out[name] = values
+    if len(out.get("id", ())) != payload["rows"]:
+        raise ValueError("packed payload is truncated")
+    return out
+
+
+def packed_rows(payload):
+    """packed-v1 payload as chart_point rows (created_at as ISO-8601 UTC)"""
+    columns = unpack(payload)
+    stamps = [
+        datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat() for ms in columns["created_at"]
+    ]
+    return [
+        {"id": i, "device_id": d, "created_at": t, "measurement": m, "tank_level": tl,
+         "connection_strength": c, "battery": b}
+        for i, d, t, m, tl, c, b in zip(
+            columns["id"], columns["device"], stamps, columns["measurement"],
+            columns["tank_level"], columns["connection_strength"], columns["battery"],
+        )
+    ]
+
+
+def parse_csv(text):
+    """PostgREST CSV into {column: list}, with the chart's numeric columns converted"""
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, [])
+    columns = {name: [] for name in header}
+    convert = [_NUMERIC.get(name) for name in header]
+    for record in reader:
+        for name, value, cast in zip(header, record, convert):
+            if value == "":
+                value = None
+            elif cast is not None:
+                value = cast(value)
+            columns[name].append(value)
+    return columns
+
+
+def sensor_columns(client, device_ids, start, end):
+    """Readings of `device_ids` in [start, end) via the sensor_columns RPC, as chart_point rows"""
+    payload = client.rpc("sensor_columns", {
+        "device_ids": list(device_ids),
+        "window_start": start.isoformat() if hasattr(start, "isoformat") else start,
+        "window_end": end.isoformat() if hasattr(end, "isoformat") else end,
+    })
+    return packed_rows(payload)
+
+
+def fetch_csv(client, table, projection="chart_point", filters=None, order=None, limit=None):
+    """A PostgREST read returned as CSV and decoded into columns"""
+    columns = PROJECTIONS.get(projection, projection)
+    response = client.select_response(
+        table, columns, filters, order, limit, headers={"Accept": "text/csv"}
+    )
+    return parse_csv(response.body.decode("utf-8"))
@@ -0,0 +1,363 @@
+"""
+Record the REST workload and replay it, time-compressed, against a stand-in
+
+WorkloadRecorder is a RestClient observer that appends one JSON line per
+request: when it started, method, endpoint, the query as sent and its
+shape (postgrest.query_shape: columns and operators, no values), the
+Prefer header and body needed to issue it again, status, duration and
+payload sizes. Auth headers are never written. Any tool records its
+traffic when $GAS_SIGHT_RECORD names a trace file, or explicitly with
+`RestClient(observers=[default_rest_metrics(), WorkloadRecorder(path)])`.
+
+Replayer re-issues a trace against another client, normally the local
+stand-in, keeping the recorded spacing divided by `speed` (None for as
+fast as possible) with up to `concurrency` requests in flight, and
+reports latency percentiles and errors per query shape next to the
+recorded ones. To check that a migration helps before it ships, replay
+the same trace with and without it:
+
+    python -m gas_sight.workload trace.jsonl --database mirror.db --speed 10
+    python -m gas_sight.workload trace.jsonl --database mirror.db --speed 10 \\
+        --sql add_index.sql
+
+`--database` copies a SQLite file (e.g. a gas_sight.mirror file) into
+memory first, so replayed writes never touch it. The stand-in runs every
+request under one lock, so `--concurrency` there only queues requests:
+replayed latency includes the wait for the lock, and shapes compare
+fairly only against a replay at the same concurrency.
+
+`--url` replays against a live project instead, and then only the GET and
+HEAD traces unless `--writes` is given, since re-issuing recorded inserts,
+updates and deletes changes that project's data.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from . import config
+from .metrics import REGISTRY
+from .postgrest import query_shape
+from .rest import RestClient, RestError
+
+PERCENTILES = (0.5, 0.95, 0.99)
+READ_METHODS = ("GET", "HEAD")
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def shape_key(method, endpoint, shape):
+    """How replay results are grouped, e.g. `GET sensor_data?select=*&device_id=eq`"""
+    return f"{method} {endpoint}?{shape}" if shape else f"{method} {endpoint}"
+
+
+class WorkloadRecorder:
+    """RestClient observer writing one JSON line per request to a trace file"""
+
+    def __init__(self, path, bodies=True):
+        self.path = path
+        self.bodies = bodies
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        body = None
+        if self.bodies and event.body:
+            body = event.body.decode("utf-8", "replace")
+        trace = {
+            "at": round(time.time() - event.seconds, 6),
+            "method": event.method,
+            "endpoint": event.endpoint,
+            "path": event.path,
+            "query": event.query,
+            "shape": self._shape(event.query),
+            "prefer": event.prefer,
+            "body": body,
+            "status": event.status,
+            "seconds": round(event.seconds, 6),
+            "request_bytes": event.request_bytes,
+            "response_bytes": event.response_bytes,
+            "error": event.error,
+        }
+        line = json.dumps(trace, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+    @staticmethod
+    def _shape(query):
+        try:
+            return query_shape(query)
+        except ValueError:
+            # a malformed query PostgREST rejected; it is still recorded
+            return "other"
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_recorder = None
+
+
+def default_recorder():
+    """The process-wide WorkloadRecorder on $GAS_SIGHT_RECORD"""
+    global _default_recorder
+    if _default_recorder is None:
+        _default_recorder = WorkloadRecorder(config.record_file())
+    return _default_recorder
+
+
+def load(path):
+    """The traces in a file, oldest first; lines that do not parse are skipped"""
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(trace, dict) and {"at", "method", "path"} <= trace.keys():
+                traces.append(trace)
+    traces.sort(key=lambda trace: trace["at"])
+    return traces
+
+
+@dataclass
+class ShapeStats:
+    """Replay results for one query shape"""
+
+    key: str
+    seconds: list = field(default_factory=list)
+    recorded: list = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def count(self):
+        return len(self.seconds)
+
+    def to_dict(self):
+        out = {"requests": self.count, "errors": sum(self.errors.values())}
+        for fraction in PERCENTILES:
+            name = f"p{round(fraction * 100)}_ms"
+            out[name] = round(_percentile(self.seconds, fraction) * 1000, 3)
+            if self.recorded:
+                out[f"recorded_{name}"] = round(_percentile(self.recorded, fraction) * 1000, 3)
+        out["max_ms"] = round(max(self.seconds) * 1000, 3)
+        if self.errors:
+            out["error_counts"] = dict(self.errors)
+        return out
+
+
+@dataclass
+class ReplayReport:
+    """Per-shape results of one replay"""
+
+    shapes: dict
+    wall_seconds: float
+    speed: float = None
+    concurrency: int = 1
+
+    @property
+    def requests(self):
+        return sum(stats.count for stats in self.shapes.values())
+
+    @property
+    def errors(self):
+        return sum(sum(stats.errors.values()) for stats in self.shapes.values())
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "speed": self.speed,
+            "concurrency": self.concurrency,
+            "shapes": {key: stats.to_dict() for key, stats in sorted(self.shapes.items())},
+        }
+
+    def lines(self):
+        """One line per shape, slowest p95 first"""
+        rows = sorted(self.shapes.values(), key=lambda s: -_percentile(s.seconds, 0.95))
+        for stats in rows:
+            d = stats.to_dict()
+            recorded = (f" (recorded {d['recorded_p50_ms']:.1f}/{d['recorded_p95_ms']:.1f})"
+                        if stats.recorded else "")
+            yield (f"{d['requests']:>6} {d['errors']:>4}  p50 {d['p50_ms']:8.1f}  p95 {d['p95_ms']:8.1f}"
+                   f"  p99 {d['p99_ms']:8.1f}{recorded}  {stats.key}")
+
+
+class Replayer:
+    """Re-issues recorded requests on `client` at `speed` with `concurrency` in flight"""
+
+    def __init__(self, client, speed=1.0, concurrency=4, registry=REGISTRY,
+                 clock=time.perf_counter, sleep=time.sleep):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive (None replays as fast as possible)")
+        self.client = client
+        self.speed = speed
+        self.concurrency = concurrency
+        self.clock = clock
+        self.sleep = sleep
+        self.latency = registry.histogram(
+            "gas_sight_replay_latency_seconds", "Replayed request latency", ("endpoint", "method")
+        )
+        self.failures = registry.counter(
+            "gas_sight_replay_errors_total", "Replayed requests that failed", ("endpoint", "method")
+        )
+
+    def _issue(self, trace):
+        """Send one trace; returns (seconds, error or None)"""
+        params = urllib.parse.parse_qsl(trace.get("query") or "", keep_blank_values=True)
+        body = trace.get("body")
+        headers = {"Prefer": trace["prefer"]} if trace.get("prefer") else None
+        start = self.clock()
+        error = None
+        try:
+            self.client.request(trace["method"], trace["path"], params or None,
+                                body.encode("utf-8") if body is not None else None, headers)
+        except RestError as e:
+            error = f"{e.status} {e.code}" if e.code else str(e.status)
+        except OSError as e:
+            error = type(e).__name__
+        return self.clock() - start, error
+
+    def replay(self, traces):
+        """Replay `traces` (as returned by load) and return a ReplayReport"""
+        shapes = {}
+        lock = threading.Lock()
+
+        def run(trace):
+            seconds, error = self._issue(trace)
+            endpoint = trace.get("endpoint") or trace["path"]
+            key = shape_key(trace["method"], endpoint, trace.get("shape", ""))
+            self.latency.observe(seconds, endpoint=endpoint, method=trace["method"])
+            if error:
+                self.failures.inc(endpoint=endpoint, method=trace["method"])
+            with lock:
+                stats = shapes.setdefault(key, ShapeStats(key))
+                stats.seconds.append(seconds)
+                if trace.get("seconds") is not None:
+                    stats.recorded.append(trace["seconds"])
+                if error:
+                    stats.errors[error] += 1
+
+        start = self.clock()
+        first = traces[0]["at"] if traces else 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = []
+            for trace in traces:
+                if self.speed is not None:
+                    wait = (trace["at"] - first) / self.speed - (self.clock() - start)
+                    if wait > 0:
+                        self.sleep(wait)
+                futures.append(pool.submit(run, trace))
+            for future in futures:
+                future.result()
+        return ReplayReport(shapes, self.clock() - start, self.speed, self.concurrency)
+
+
+def reads(traces):
+    """The traces that only read (GET and HEAD), safe to replay against a live project"""
+    return [trace for trace in traces if trace["method"].upper() in READ_METHODS]
+
+
+def summarize(traces):
+    """{shape key: request count} for a trace, busiest first"""
+    counts = Counter(
+        shape_key(t["method"], t.get("endpoint") or t["path"], t.get("shape", "")) for t in traces
+    )
+    return dict(counts.most_common())
+
+
+def local_client(database=None, sql=()):
+    """A RestClient on an in-memory stand-in, optionally copied from a SQLite file"""
+    from .local import LocalDatabase, LocalTransport
+
+    db = LocalDatabase()
+    if database:
+        source = sqlite3.connect(database)
+        try:
+            source.backup(db.conn)
+        finally:
+            source.close()
+    for path in sql:
+        with open(path, encoding="utf-8") as f:
+            db.conn.executescript(f.read())
+    return RestClient(transport=LocalTransport(db), observers=[])
+
+
+def _speed(value):
+    value = value.lower()
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x×"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded REST workload against a stand-in")
+    parser.add_argument("trace", help="JSON-lines trace written by WorkloadRecorder ($GAS_SIGHT_RECORD)")
+    parser.add_argument("--speed", type=_speed, default=1.0,
+                        help="1, 10, ... times the recorded pace, or max (default 1)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="requests in flight (default 4); the local stand-in serializes them,"
+                             " so its latency includes lock wait")
+    parser.add_argument("--database", help="SQLite file to copy into the stand-in (e.g. a mirror)")
+    parser.add_argument("--sql", action="append", default=[], metavar="FILE",
+                        help="SQL to run on the stand-in before replaying (repeatable)")
+    parser.add_argument("--url", help="replay against this project instead of a local stand-in")
+    parser.add_argument("--key", help="API key for --url")
+    parser.add_argument("--writes", action="store_true",
+                        help="with --url, also replay inserts, updates and deletes (default reads only)")
+    parser.add_argument("--summary", action="store_true", help="only count the trace's query shapes")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    traces = load(args.trace)
+    if args.summary:
+        print(json.dumps(summarize(traces), indent=2))
+        return 0
+    if args.url:
+        client = RestClient(url=args.url, key=args.key, observers=[])
+        if not args.writes:
+            skipped = len(traces)
+            traces = reads(traces)
+            skipped -= len(traces)
+            if skipped:
+                print(f"⚠️  skipping {skipped} write requests against {args.url} (--writes to replay them)",
+                      file=sys.stderr)
+    else:
+        client = local_client(args.database, args.sql)
+    report = Replayer(client, args.speed, args.concurrency).replay(traces)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        pace = "max speed" if args.speed is None else f"{args.speed:g}×"
+        print(f"✅ replayed {report.requests} requests in {report.wall_seconds:.2f}s"
+              f" ({pace}, concurrency {args.concurrency}), {report.errors} errors")
+        print("  reqs  err  latency ms (replayed, recorded p50/p95)  shape")
+        for line in report.lines():
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import { useEffect, useRef, useState } from 'react';
+import { buildSeries, concatSeries, startsAfter, type ChartRow, type SeriesColumns } from '@/lib/chartPipeline';
+import type { ChartWorkerReply, ChartWorkerRequest } from '@/workers/chartData.worker';
+
+export interface ChartSeries {
+  version: number;
+  // the version this one extends, or null when it was built from scratch
+  base: number | null;
+  // the rows series.source indexes into
+  rows: ChartRow[];
+  series: SeriesColumns;
+}
+
+interface Sent {
+  version: number;
+  rows: ChartRow[];
+  gapMinutes: number;
+}
+
+const createWorker = (): Worker | null => {
+  if (typeof Worker === 'undefined') return null;
+  try {
+    return new Worker(new URL('../workers/chartData.worker.ts', import.meta.url), { type: 'module' });
+  } catch (error) {
+    console.warn('Chart worker unavailable, building series on the main thread:', error);
+    return null;
+  }
+};
+
+const lastTime = (series: SeriesColumns) => series.time.length ? series.time[series.time.length - 1] : NaN;
+
+// Single-device chart series, built in a Web Worker and memoized on the rows
+// array and the gap threshold. A rows array that only adds readings after the
+// previous one (same leading objects, later timestamps) is sent as an append,
+// so a live update lays out one reading instead of the whole window.
+export const useChartSeries = (rows: ChartRow[], gapMinutes: number, enabled = true): ChartSeries | null => {
+  const [result, setResult] = useState<ChartSeries | null>(null);
+  const resultRef = useRef<ChartSeries | null>(null);
+  const workerRef = useRef<Worker | null>(null);
+  const sentRef = useRef<Sent | null>(null);
+  // requests sent and not yet answered, by version
+  const inFlightRef = useRef(new Map<number, Sent>());
+
+  const show = (series: ChartSeries) => {
+    resultRef.current = series;
+    setResult(series);
+  };
+
+  const build = (worker: Worker, sent: Sent) => {
+    inFlightRef.current.set(sent.version, sent);
+    const request: ChartWorkerRequest = { type: 'build', ...sent };
+    worker.postMessage(request);
+  };
+
+  useEffect(() => {
+    const worker = createWorker();
+    workerRef.current = worker;
+    if (!worker) return;
+
+    worker.onmessage = (event: MessageEvent<ChartWorkerReply>) => {
+      const reply = event.data;
+      const inFlight = inFlightRef.current;
+      const sent = inFlight.get(reply.version);
+      inFlight.delete(reply.version);
+      const shown = resultRef.current;
+      if (!sent || (shown && shown.version >= reply.version)) return;
+
+      if (reply.type === 'replace') {
+        show({ version: reply.version, base: null, rows: sent.rows, series: reply.series });
+      } else if (reply.type === 'append' && shown?.version === reply.base) {
+        show({
+          version: reply.version, base: shown.version, rows: sent.rows,
+          series: concatSeries(shown.series, reply.series),
+        });
+      } else {
+        // the worker or the page no longer holds the series this extended
+        build(worker, sent);
+      }
+    };
+
+    return () => {
+      worker.terminate();
+      workerRef.current = null;
+      inFlightRef.current.clear();
+      sentRef.current = null;
+    };
+  }, []);
+
+  useEffect(() => {
+    if (!enabled) return;
+    const previous = sentRef.current;
+    const sent = { version: (previous?.version ?? 0) + 1, rows, gapMinutes };
+    sentRef.current = sent;
+    const last = previous ? previous.rows.length - 1 : -1;
+    const tail = previous !== null
+      && previous.gapMinutes === gapMinutes
+      && last >= 0
+      && rows.length > previous.rows.length
+      && rows[0] === previous.rows[0]
+      && rows[last] === previous.rows[last]
+      ? rows.slice(previous.rows.length)
+      : null;
+
+    const worker = workerRef.current;
+    if (worker) {
+      if (!tail) {
+        build(worker, sent);
+        return;
+      }
+      inFlightRef.current.set(sent.version, sent);
+      const request: ChartWorkerRequest = {
+        type: 'append', version: sent.version, base: previous.version, rows: tail, gapMinutes,
+      };
+      worker.postMessage(request);
+      return;
+    }
+
+    // No worker (old browser, tests): same result, on this thread
+    const shown = resultRef.current;
+    if (tail && shown?.version === previous.version && startsAfter(tail, lastTime(shown.series))) {
+      const extra = buildSeries(tail, gapMinutes, previous.rows.length, lastTime(shown.series));
+      show({ version: sent.version, base: shown.version, rows, series: concatSeries(shown.series, extra) });
+    } else {
+      show({ version: sent.version, base: null, rows, series: buildSeries(rows, gapMinutes) });
+    }
+  }, [rows, gapMinutes, enabled]);
+
+  return enabled ? result : null;
+};
@@ -1,6 +1,7 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { supabase } from "@/integrations/supabase/client";
 import type { Database } from "@/integrations/supabase/types";
+import { PROJECTIONS } from "@/lib/wire";
 
 // Types from database
 type DeviceRow = Database['public']['Tables']['devices']['Row'];
@@ -110,18 +111,64 @@ const transformDevice = (device: DeviceRow): Partial<Device> => ({
   totalPacketsReceived: device.total_packets_received,
 });
 
+// Response of the device_stats_since RPC
+interface DeviceStatsDelta {
+  etag: string;
+  not_modified: boolean;
+  full: boolean;
+  devices: DeviceStatsRow[];
+  removed: string[];
+}
+
+const byNewestDevice = (a: DeviceStatsRow, b: DeviceStatsRow) =>
+  (b.device_created_at || '').localeCompare(a.device_created_at || '');
+
 export function useDeviceData(): DeviceManagementHook {
-  const [devices, setDevices] = useState<Device[]>([]);
+  const [allDevices, setDevices] = useState<Device[]>([]);
+  // Devices with an open device_purges row: deleted as far as the UI is concerned
+  const [purgingIds, setPurgingIds] = useState<Set<string>>(new Set());
+  const devices = allDevices.filter(device => !purgingIds.has(device.id));
   const [selectedDeviceId, setSelectedDeviceId] = useState<string | null>(null);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  // Last device_stats snapshot and its change token, for conditional refreshes
+  const statsEtag = useRef<string | null>(null);
+  const statsRows = useRef<Map<string, DeviceStatsRow>>(new Map());
 
   // Fetch devices with their statistics
   const fetchDevices = async () => {
     try {
-      setIsLoading(true);
+      if (statsEtag.current === null) {
+        setIsLoading(true);
+      }
       setError(null);
 
+      // Conditional read: nothing, the changed devices, or the full list
+      const { data: delta, error: deltaError } = await supabase
+        .rpc('device_stats_since', { since: statsEtag.current });
+
+      if (!deltaError && delta) {
+        const result = delta as unknown as DeviceStatsDelta;
+        statsEtag.current = result.etag;
+        if (result.not_modified) {
+          return;
+        }
+        if (result.full) {
+          statsRows.current = new Map();
+        }
+        result.devices.forEach(row => statsRows.current.set(row.id, row));
+        result.removed.forEach(id => statsRows.current.delete(id));
+
+        const rows = Array.from(statsRows.current.values()).sort(byNewestDevice);
+        const statsDevices = rows.map(stats => transformDeviceStats(stats));
+        setDevices(statsDevices);
+        if (!selectedDeviceId && statsDevices.length > 0) {
+          setSelectedDeviceId(statsDevices[0].id);
+        }
+        return;
+      }
+      statsEtag.current = null;
+
       // Try device_stats view first, fallback to devices table
       let devices: Device[] = [];
       
@@ -129,7 +176,8 @@ export function useDeviceData(): DeviceManagementHook {
         // Try device_stats view with proper error handling
         const { data: deviceStats, error: statsError } = await supabase
           .from('device_stats')
-          .select('*')
+          .select(PROJECTIONS.device_card)
+          .eq('synthetic', false) // e.g. the latency probe's canary
           .order('created_at', { ascending: false }); // Use created_at instead of device_created_at
 
         if (!statsError && deviceStats) {
@@ -145,6 +193,7 @@ export function useDeviceData(): DeviceManagementHook {
         const { data: deviceData, error: deviceError } = await supabase
           .from('devices')
           .select('*')
+          .eq('synthetic', false)
           .order('created_at', { ascending: false });
 
         if (deviceError) {
@@ -195,9 +244,22 @@ export function useDeviceData(): DeviceManagementHook {
     }
   };
 
+  // Purges the worker has not finished yet
+  const fetchPurges = async () => {
+    const { data, error } = await supabase
+      .from('device_purges')
+      .select('device_id')
+      .is('finished_at', null);
+
+    if (!error && data) {
+      setPurgingIds(new Set(data.map(purge => purge.device_id)));
+    }
+  };
+
   // Initial load
   useEffect(() => {
     fetchDevices();
+    fetchPurges();
   }, []);
 
   // Set up real-time subscriptions
@@ -236,9 +298,26 @@ export function useDeviceData(): DeviceManagementHook {
       )
       .subscribe();
 
+    // Purges queued here or elsewhere, and finished by the worker
+    const purgeSubscription = supabase
+      .channel('device_purge_changes')
+      .on(
+        'postgres_changes',
+        {
+          event: '*',
+          schema: 'public',
+          table: 'device_purges'
+        },
+        () => {
+          fetchPurges();
+        }
+      )
+      .subscribe();
+
     return () => {
       deviceSubscription.unsubscribe();
       sensorSubscription.unsubscribe();
+      purgeSubscription.unsubscribe();
     };
   }, []);
 
@@ -286,16 +365,30 @@ export function useDeviceData(): DeviceManagementHook {
     }
   };
 
+  // Deleting cascades through every reading, so the device is only disabled
+  // here and its purge queued; the purge worker (`gas-sight purge pending
+  // --watch 30`, python -m gas_sight.purge) removes the history in small
+  // batches and then the device row. Nothing is deleted unless a worker is
+  // running. Until it finishes, the device is hidden from the list.
   const deleteDevice = async (deviceId: string): Promise<boolean> => {
     try {
-      const { error } = await supabase
+      const { error: disableError } = await supabase
         .from('devices')
-        .delete()
+        .update({ enabled: false })
         .eq('id', deviceId);
 
+      if (disableError) {
+        throw new Error(`Error deleting device: ${disableError.message}`);
+      }
+
+      const { error } = await supabase
+        .from('device_purges')
+        .insert({ device_id: deviceId });
+
       if (error) {
         throw new Error(`Error deleting device: ${error.message}`);
       }
+      setPurgingIds(previous => new Set(previous).add(deviceId));
 
       // Clear selection if deleted device was selected
       if (selectedDeviceId === deviceId) {
@@ -1,6 +1,7 @@
 import { useState, useEffect } from "react";
 import { supabase } from "@/integrations/supabase/client";
 import type { Database } from "@/integrations/supabase/types";
+import { PROJECTIONS } from "@/lib/wire";
 
 export interface SensorData {
   id: string;
@@ -31,9 +32,12 @@ export interface TechnicalData {
 }
 
 type SensorDataRow = Database['public']['Tables']['sensor_data']['Row'];
+type LatestReading = Pick<SensorDataRow,
+  'device_id' | 'title_name' | 'tank_level' | 'tank_level_unit' | 'updated_refresh' | 'battery' |
+  'connection_strength' | 'measurement' | 'measurement_unit' | 'updated_at'>;
 
 // Transform Supabase data to component format
-const transformSupabaseData = (data: SensorDataRow): SensorData => {
+const transformSupabaseData = (data: LatestReading): SensorData => {
   return {
     id: data.device_id,
     titlename: data.title_name,
@@ -70,7 +74,7 @@ export function useSensorData(deviceId?: string) {
       try {
         let query = supabase
           .from('sensor_data')
-          .select('*')
+          .select(PROJECTIONS.latest_reading)
           .order('created_at', { ascending: false });
 
         // Filter by device ID if specified
@@ -49,6 +49,48 @@ export type Database = {
           },
         ]
       }
+      device_purges: {
+        Row: {
+          batches: number
+          device_id: string
+          error: string | null
+          finished_at: string | null
+          id: string
+          lease_until: string | null
+          readings_deleted: number
+          readings_total: number | null
+          requested_at: string
+          started_at: string | null
+          status: string
+        }
+        Insert: {
+          batches?: number
+          device_id: string
+          error?: string | null
+          finished_at?: string | null
+          id?: string
+          lease_until?: string | null
+          readings_deleted?: number
+          readings_total?: number | null
+          requested_at?: string
+          started_at?: string | null
+          status?: string
+        }
+        Update: {
+          batches?: number
+          device_id?: string
+          error?: string | null
+          finished_at?: string | null
+          id?: string
+          lease_until?: string | null
+          readings_deleted?: number
+          readings_total?: number | null
+          requested_at?: string
+          started_at?: string | null
+          status?: string
+        }
+        Relationships: []
+      }
       devices: {
         Row: {
           color: string
@@ -66,6 +108,7 @@ export type Database = {
           name: string
           rssi: number | null
           service_uuid: string
+          synthetic: boolean
           title: string
           total_packets_received: number
           updated_at: string
@@ -86,6 +129,7 @@ export type Database = {
           name: string
           rssi?: number | null
           service_uuid: string
+          synthetic?: boolean
           title: string
           total_packets_received?: number
           updated_at?: string
@@ -106,6 +150,7 @@ export type Database = {
           name?: string
           rssi?: number | null
           service_uuid?: string
+          synthetic?: boolean
           title?: string
           total_packets_received?: number
           updated_at?: string
@@ -188,6 +233,7 @@ export type Database = {
           readings_last_24h: number | null
           rssi: number | null
           service_uuid: string | null
+          synthetic: boolean | null
           tank_level_unit: string | null
           title: string | null
           total_packets_received: number | null
@@ -230,6 +276,47 @@ export type Database = {
           avg_measurement_24h: number
         }[]
       }
+      device_stats_since: {
+        Args: {
+          since?: string | null
+        }
+        Returns: Json
+      }
+      purge_sensor_data: {
+        Args: {
+          target_device_id?: string | null
+          older_than?: string | null
+          batch_size?: number
+        }
+        Returns: number
+      }
+      sensor_columns: {
+        Args: {
+          device_ids: string[]
+          window_start: string
+          window_end: string
+        }
+        Returns: Json
+      }
+      sensor_history: {
+        Args: {
+          device_ids: string[]
+          window_start: string
+          window_end: string
+          max_points?: number
+        }
+        Returns: Json
+      }
+      sensor_matrix: {
+        Args: {
+          device_ids: string[]
+          window_start: string
+          window_end: string
+          step_seconds?: number
+          mode?: string
+        }
+        Returns: Json
+      }
     }
     Enums: {
       [_ in never]: never
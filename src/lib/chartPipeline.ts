@@ -0,0 +1,123 @@
+// Single-device chart series as typed-array columns. The chart worker
+// (src/workers/chartData.worker.ts) runs buildSeries off the main thread and
+// transfers the buffers back; the page only turns columns into Recharts
+// points when the data, range or comments change, not on every render.
+// Nothing here touches the DOM, so the same code runs in the worker and in
+// the synchronous fallback.
+
+export interface ChartRow {
+  id: string;
+  created_at: string;
+  measurement: number | null;
+  tank_level: number | null;
+  connection_strength: number | null;
+  battery: string | null;
+}
+
+export interface SeriesColumns {
+  // epoch milliseconds, ascending
+  time: Float64Array;
+  // NaN where the reading had no value and on gap markers
+  gasLevel: Float64Array;
+  tankLevel: Float64Array;
+  connectionQuality: Float64Array;
+  batteryLevel: Float64Array;
+  // index of the row in the input, -1 for a gap marker
+  source: Int32Array;
+}
+
+export const SERIES_COLUMNS = [
+  'time', 'gasLevel', 'tankLevel', 'connectionQuality', 'batteryLevel', 'source',
+] as const;
+
+// Gap markers sit this long after the last reading before a disconnection
+const GAP_MARKER_MS = 5 * 60000;
+
+// A break of more than 10 minutes (or two rollup buckets) is drawn as a gap
+export const gapMinutesFor = (resolutionSeconds: number) => Math.max(10, (2 * resolutionSeconds) / 60);
+
+// Date.parse only promises millisecond fractions; created_at carries microseconds
+export const parseTime = (createdAt: string) => Date.parse(createdAt.replace(/(\.\d{3})\d+/, '$1'));
+
+const batteryLevel = (battery: string | null) => battery === 'Full' ? 100 : battery === 'Ok' ? 75 : 25;
+
+const value = (v: number | null | undefined) => v === null || v === undefined ? NaN : v;
+
+// Whole minutes between two readings, truncated like date-fns differenceInMinutes
+const isGap = (previous: number, next: number, gapMinutes: number) =>
+  Math.trunc((next - previous) / 60000) > gapMinutes;
+
+export const emptySeries = (length = 0): SeriesColumns => ({
+  time: new Float64Array(length),
+  gasLevel: new Float64Array(length),
+  tankLevel: new Float64Array(length),
+  connectionQuality: new Float64Array(length),
+  batteryLevel: new Float64Array(length),
+  source: new Int32Array(length),
+});
+
+export const seriesBuffers = (series: SeriesColumns): ArrayBuffer[] =>
+  SERIES_COLUMNS.map(name => series[name].buffer as ArrayBuffer);
+
+// Sort rows by time and lay them out as columns with gap markers. `offset`
+// is added to the source indexes and `previousTime` is the last reading of
+// the series these rows extend (NaN for a new series).
+export const buildSeries = (
+  rows: ChartRow[],
+  gapMinutes: number,
+  offset = 0,
+  previousTime = NaN,
+): SeriesColumns => {
+  const times = new Float64Array(rows.length);
+  let sorted = true;
+  for (let i = 0; i < rows.length; i++) {
+    times[i] = parseTime(rows[i].created_at);
+    if (i > 0 && times[i] < times[i - 1]) sorted = false;
+  }
+  const order = new Int32Array(rows.length);
+  for (let i = 0; i < rows.length; i++) order[i] = i;
+  if (!sorted) order.sort((a, b) => times[a] - times[b] || a - b);
+
+  let gaps = 0;
+  let last = previousTime;
+  for (let i = 0; i < order.length; i++) {
+    if (!Number.isNaN(last) && isGap(last, times[order[i]], gapMinutes)) gaps++;
+    last = times[order[i]];
+  }
+
+  const series = emptySeries(rows.length + gaps);
+  let out = 0;
+  last = previousTime;
+  for (let i = 0; i < order.length; i++) {
+    const n = order[i];
+    const row = rows[n];
+    if (!Number.isNaN(last) && isGap(last, times[n], gapMinutes)) {
+      series.time[out] = last + GAP_MARKER_MS;
+      series.gasLevel[out] = series.tankLevel[out] = NaN;
+      series.connectionQuality[out] = series.batteryLevel[out] = NaN;
+      series.source[out++] = -1;
+    }
+    series.time[out] = times[n];
+    series.gasLevel[out] = value(row.measurement);
+    series.tankLevel[out] = value(row.tank_level);
+    series.connectionQuality[out] = value(row.connection_strength);
+    series.batteryLevel[out] = batteryLevel(row.battery);
+    series.source[out++] = n + offset;
+    last = times[n];
+  }
+  return series;
+};
+
+// Whether rows can extend a series whose last reading is at `time`
+export const startsAfter = (rows: ChartRow[], time: number) =>
+  Number.isNaN(time) || rows.every(row => !(parseTime(row.created_at) < time));
+
+// A new series with `tail` after `head`
+export const concatSeries = (head: SeriesColumns, tail: SeriesColumns): SeriesColumns => {
+  const series = emptySeries(head.time.length + tail.time.length);
+  for (const name of SERIES_COLUMNS) {
+    series[name].set(head[name]);
+    series[name].set(tail[name], head.time.length);
+  }
+  return series;
+};
@@ -0,0 +1,67 @@
+// Client for the live-window service (gas_sight/live.py). Set VITE_LIVE_URL
+// to its base URL; without it live charts query sensor_data directly.
+
+export const LIVE_URL: string | undefined = import.meta.env.VITE_LIVE_URL;
+
+export interface LivePoint {
+  id: string;
+  device_id: string;
+  created_at: string;
+  measurement: number;
+  tank_level: number;
+  connection_strength: number;
+  battery: string;
+  seq: number;
+}
+
+export interface LiveWindow {
+  epoch: string;
+  seq: number;
+  rows: LivePoint[];
+  // devices whose rows replace the client's copy instead of extending it
+  reset: string[];
+}
+
+export interface LiveCursor {
+  epoch: string;
+  seq: number;
+}
+
+const liveRequest = async (params: URLSearchParams): Promise<LiveWindow> => {
+  const response = await fetch(`${LIVE_URL}/live?${params}`);
+  if (!response.ok) {
+    throw new Error(`live service answered ${response.status}`);
+  }
+  return response.json();
+};
+
+export const fetchLiveWindow = (deviceIds: string[], limit: number) =>
+  liveRequest(new URLSearchParams([
+    ...deviceIds.map(id => ['device', id]),
+    ['limit', String(limit)],
+  ]));
+
+export const fetchLiveSince = (deviceIds: string[], limit: number, cursor: LiveCursor) =>
+  liveRequest(new URLSearchParams([
+    ...deviceIds.map(id => ['device', id]),
+    ['limit', String(limit)],
+    ['since', String(cursor.seq)],
+    ['epoch', cursor.epoch],
+  ]));
+
+// Apply a window or delta to the points a chart holds: reset devices are
+// replaced, other rows are upserted by id, and the newest `limit` are kept.
+export const mergeLive = <T extends { id: string; device_id: string; created_at: string }>(
+  current: T[],
+  update: LiveWindow,
+  limit: number,
+  toPoint: (row: LivePoint) => T,
+): T[] => {
+  const byId = new Map(
+    current.filter(point => !update.reset.includes(point.device_id)).map(point => [point.id, point])
+  );
+  update.rows.forEach(row => byId.set(row.id, toPoint(row)));
+  return Array.from(byId.values())
+    .sort((a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime())
+    .slice(-limit);
+};
@@ -0,0 +1,125 @@
+// Lean projections and the packed-v1 columnar format (see gas_sight/wire.py
+// and the sensor_columns migration for the layout). Keep PROJECTIONS in
+// sync with the Python table.
+
+export const PROJECTIONS = {
+  // Charts: one point per reading
+  chart_point: 'id,device_id,created_at,measurement,tank_level,connection_strength,battery',
+  // useSensorData: the latest reading card
+  latest_reading:
+    'device_id,title_name,tank_level,tank_level_unit,updated_refresh,battery,' +
+    'connection_strength,measurement,measurement_unit,updated_at',
+  // Charts comment markers
+  comment: 'id,sensor_data_id,comment_text,user_name,created_at,sensor_data(created_at)',
+  // useDeviceData: device cards (no discovery metadata)
+  device_card:
+    'id,name,title,location,color,enabled,is_connected,last_connected,mac_address,' +
+    'service_uuid,data_characteristic_uuid,connection_attempts,total_packets_received,' +
+    'device_created_at,latest_tank_level,latest_measurement,latest_battery,' +
+    'latest_connection_strength,latest_reading_at,tank_level_unit,measurement_unit,' +
+    'total_readings,readings_last_24h,avg_measurement_24h',
+} as const;
+
+export const PACKED_FORMAT = 'packed-v1';
+
+interface PackedColumn {
+  type: 'uuid' | 'i8' | 'i4' | 'f8';
+  data: string;
+  labels?: string[];
+}
+
+export interface PackedPayload {
+  format: string;
+  rows: number;
+  columns: Record<string, PackedColumn>;
+}
+
+export interface PackedPoint {
+  id: string;
+  device_id: string;
+  created_at: string;
+  measurement: number | null;
+  tank_level: number | null;
+  connection_strength: number;
+  battery: string | null;
+}
+
+const WIDTH = { uuid: 16, i8: 8, i4: 4, f8: 8 } as const;
+
+const toBytes = (data: string): Uint8Array => {
+  // Postgres' encode() wraps base64 every 76 characters
+  const binary = atob(data.replace(/\s+/g, ''));
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return bytes;
+};
+
+const hex = Array.from({ length: 256 }, (_, n) => n.toString(16).padStart(2, '0'));
+
+const uuidAt = (bytes: Uint8Array, offset: number): string => {
+  let out = '';
+  for (let i = 0; i < 16; i++) {
+    if (i === 4 || i === 6 || i === 8 || i === 10) out += '-';
+    out += hex[bytes[offset + i]];
+  }
+  return out;
+};
+
+// Decode one column; values are big-endian, NaN doubles become null
+export const decodeColumn = (column: PackedColumn, rows: number): (string | number | null)[] => {
+  const bytes = toBytes(column.data);
+  if (bytes.length !== rows * WIDTH[column.type]) {
+    throw new Error(`packed column has ${bytes.length} bytes for ${rows} rows`);
+  }
+  const view = new DataView(bytes.buffer);
+  const values: (string | number | null)[] = new Array(rows);
+  for (let n = 0; n < rows; n++) {
+    const offset = n * WIDTH[column.type];
+    switch (column.type) {
+      case 'uuid':
+        values[n] = uuidAt(bytes, offset);
+        break;
+      case 'i8':
+        values[n] = Number(view.getBigInt64(offset, false));
+        break;
+      case 'i4': {
+        const value = view.getInt32(offset, false);
+        values[n] = column.labels ? (value >= 0 ? column.labels[value] : null) : value;
+        break;
+      }
+      case 'f8': {
+        const value = view.getFloat64(offset, false);
+        values[n] = Number.isNaN(value) ? null : value;
+        break;
+      }
+    }
+  }
+  return values;
+};
+
+// packed-v1 payload from sensor_columns as chart points
+export const unpackPoints = (payload: PackedPayload): PackedPoint[] => {
+  if (payload.format !== PACKED_FORMAT) {
+    throw new Error(`unsupported wire format ${payload.format}`);
+  }
+  const column = (name: string) => decodeColumn(payload.columns[name], payload.rows);
+  const ids = column('id') as string[];
+  const createdAt = column('created_at') as number[];
+  const devices = column('device') as string[];
+  const measurement = column('measurement') as (number | null)[];
+  const tankLevel = column('tank_level') as (number | null)[];
+  const connection = column('connection_strength') as number[];
+  const battery = column('battery') as (string | null)[];
+
+  return ids.map((id, n) => ({
+    id,
+    device_id: devices[n],
+    created_at: new Date(createdAt[n]).toISOString(),
+    measurement: measurement[n],
+    tank_level: tankLevel[n],
+    connection_strength: connection[n],
+    battery: battery[n],
+  }));
+};
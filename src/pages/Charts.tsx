@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useRef } from "react";
+import React, { useState, useEffect, useMemo, useRef } from "react";
 import { useDeviceData } from "@/hooks/useDeviceData";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
@@ -11,9 +11,13 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, ReferenceDot } from 'recharts';
-import { format, subHours, subDays, subWeeks, subMinutes, parseISO, differenceInMinutes } from 'date-fns';
+import { format, subHours, subDays, subWeeks, subMinutes, parseISO } from 'date-fns';
 import { TrendingUp, Download, Calendar, Palette, Layers, MessageCircle, Send, User } from "lucide-react";
 import { supabase } from "@/integrations/supabase/client";
+import { PROJECTIONS, unpackPoints, type PackedPayload } from "@/lib/wire";
+import { LIVE_URL, fetchLiveSince, fetchLiveWindow, mergeLive, type LiveCursor, type LivePoint } from "@/lib/live";
+import { gapMinutesFor, parseTime } from "@/lib/chartPipeline";
+import { useChartSeries } from "@/hooks/useChartSeries";
 import Navigation from "@/components/Navigation";
 import { toast } from "sonner";
 
@@ -50,6 +54,35 @@ interface Comment {
   user_name: string;
   created_at: string;
   updated_at: string;
+  sensor_data?: { created_at: string } | null;
+}
+
+// Dense time x device matrix returned by the sensor_matrix RPC
+interface SensorMatrix {
+  t0: string;
+  step: number;
+  mode: 'locf' | 'mean';
+  devices: string[];
+  values: {
+    measurement: (number | null)[][];
+    tank_level: (number | null)[][];
+    connection_strength: (number | null)[][];
+    // Full 100, Ok 75, Low 25, as the charts plot battery
+    battery_level: (number | null)[][];
+  };
+}
+
+const batteryLabel = (level: number | null | undefined) =>
+  level === null || level === undefined ? '' : level >= 100 ? 'Full' : level >= 75 ? 'Ok' : 'Low';
+
+// Aim for about this many x positions in multi-device mode
+const MATRIX_TARGET_POINTS = 240;
+// Points per single-device history window; decides which rollup tier serves it
+const HISTORY_TARGET_POINTS = 720;
+
+interface SensorHistory {
+  resolution: number;
+  rows: Omit<SensorDataPoint, 'title_name'>[];
 }
 
 interface DataPointWithComments extends ChartDataPoint {
@@ -60,6 +93,8 @@ interface DataPointWithComments extends ChartDataPoint {
 const Charts = () => {
   const { devices, selectedDeviceId, getEnabledDevices } = useDeviceData();
   const [historicalData, setHistoricalData] = useState<SensorDataPoint[]>([]);
+  const [matrix, setMatrix] = useState<SensorMatrix | null>(null);
+  const [historyResolution, setHistoryResolution] = useState(0);
   const [loading, setLoading] = useState(true);
   const [selectedRange, setSelectedRange] = useState("24h");
   const [deviceVisibility, setDeviceVisibility] = useState<DeviceVisibility>({});
@@ -73,8 +108,11 @@ const Charts = () => {
   const [lastDataUpdate, setLastDataUpdate] = useState<Date | null>(null);
   const [isLiveMode, setIsLiveMode] = useState(false);
   const [maxLiveDataPoints] = useState(20);
+  const liveCursorRef = useRef<LiveCursor | null>(null);
   const chartContainerRef = useRef<HTMLDivElement>(null);
   const connectionTimeoutRef = useRef<NodeJS.Timeout | null>(null);
+  // One pending refetch for a burst of realtime inserts
+  const refetchTimeoutRef = useRef<NodeJS.Timeout | null>(null);
   const [refreshInterval, setRefreshInterval] = useState<number>(60000); // Default 1 minute
   const [isAutoRefresh, setIsAutoRefresh] = useState(false);
   const [countdown, setCountdown] = useState<number>(0);
@@ -127,9 +165,105 @@ const Charts = () => {
 
       console.log(`Fetching data for ${range}: from ${startDate.toISOString()} to ${now.toISOString()}`);
 
+      if (chartMode === 'multi') {
+        // Resample on the server so every device shares the same time axis
+        const windowSeconds = (now.getTime() - startDate.getTime()) / 1000;
+        const { data, error } = await supabase.rpc('sensor_matrix', {
+          device_ids: enabledDevices.map(d => d.id),
+          window_start: startDate.toISOString(),
+          window_end: now.toISOString(),
+          step_seconds: Math.max(5, Math.ceil(windowSeconds / MATRIX_TARGET_POINTS)),
+          mode: 'locf'
+        });
+
+        if (error) {
+          console.error('Error fetching sensor matrix:', error);
+          return;
+        }
+
+        const result = data as unknown as SensorMatrix;
+        setIsLiveMode('live' in rangeData);
+        console.log(`Retrieved ${result.values.measurement.length} x ${result.devices.length} matrix for ${range}`);
+        setMatrix(result);
+        return;
+      }
+
+      const titles = new Map(enabledDevices.map(d => [d.id, d.title]));
+
+      if (!('live' in rangeData) && chartMode === 'single' && selectedDeviceId) {
+        const windowSeconds = (now.getTime() - startDate.getTime()) / 1000;
+        if (windowSeconds / HISTORY_TARGET_POINTS >= 60) {
+          // Week and month views read the rollup tiers: ~720 rows instead of one per reading
+          const { data, error } = await supabase.rpc('sensor_history', {
+            device_ids: [selectedDeviceId],
+            window_start: startDate.toISOString(),
+            window_end: now.toISOString(),
+            max_points: HISTORY_TARGET_POINTS
+          });
+
+          if (error) {
+            console.error('Error fetching sensor history:', error);
+            return;
+          }
+
+          const history = data as unknown as SensorHistory;
+          const points = history.rows.map(point => ({
+            ...point,
+            title_name: titles.get(point.device_id) ?? point.device_id
+          })) as SensorDataPoint[];
+          setIsLiveMode(false);
+          setHistoryResolution(history.resolution);
+          console.log(`Retrieved ${points.length} data points for ${range} at ${history.resolution}s resolution`);
+          setHistoricalData(points);
+          return;
+        }
+
+        // Shorter ranges come back columnar: a few bytes per reading instead of a JSON row
+        const { data, error } = await supabase.rpc('sensor_columns', {
+          device_ids: [selectedDeviceId],
+          window_start: startDate.toISOString(),
+          window_end: now.toISOString()
+        });
+
+        if (error) {
+          console.error('Error fetching sensor columns:', error);
+          return;
+        }
+
+        const points = unpackPoints(data as unknown as PackedPayload).map(point => ({
+          ...point,
+          title_name: titles.get(point.device_id) ?? point.device_id
+        })) as SensorDataPoint[];
+        setIsLiveMode(false);
+        setHistoryResolution(0);
+        console.log(`Retrieved ${points.length} data points for ${range}`);
+        setHistoricalData(points);
+        return;
+      }
+
+      liveCursorRef.current = null;
+      if ('live' in rangeData && LIVE_URL && chartMode === 'single' && selectedDeviceId) {
+        // The live window comes from the in-memory ring buffer service, not a sensor_data query
+        try {
+          const live = await fetchLiveWindow([selectedDeviceId], maxLiveDataPoints);
+          const toPoint = (row: LivePoint) => ({
+            ...row,
+            title_name: titles.get(row.device_id) ?? row.device_id
+          }) as SensorDataPoint;
+          liveCursorRef.current = { epoch: live.epoch, seq: live.seq };
+          setIsLiveMode(true);
+          setHistoryResolution(0);
+          console.log(`Retrieved ${live.rows.length} live data points at seq ${live.seq}`);
+          setHistoricalData(mergeLive([], live, maxLiveDataPoints, toPoint));
+          return;
+        } catch (error) {
+          console.warn('Live service unavailable, querying sensor_data:', error);
+        }
+      }
+
       let query = supabase
         .from('sensor_data')
-        .select('*');
+        .select(PROJECTIONS.chart_point);
 
       if ('live' in rangeData) {
         // For live mode, get the most recent data points
@@ -155,7 +289,10 @@ const Charts = () => {
         return;
       }
 
-      let processedData = (data || []) as SensorDataPoint[];
+      let processedData = ((data || []) as Omit<SensorDataPoint, 'title_name'>[]).map(point => ({
+        ...point,
+        title_name: titles.get(point.device_id) ?? point.device_id
+      })) as SensorDataPoint[];
       
       // For live mode, reverse the data to show chronologically (newest first becomes newest last)
       if ('live' in rangeData) {
@@ -166,6 +303,7 @@ const Charts = () => {
       }
 
       console.log(`Retrieved ${processedData.length} data points for ${range}`);
+      setHistoryResolution(0);
       setHistoricalData(processedData);
     } catch (error) {
       console.error('Error:', error);
@@ -260,6 +398,17 @@ const Charts = () => {
 
   // Set up real-time subscription for new data with optimistic updates and auto-scroll
   useEffect(() => {
+    // Inserts arriving within a second of each other share one refetch
+    const scheduleRefetch = () => {
+      if (refetchTimeoutRef.current) {
+        clearTimeout(refetchTimeoutRef.current);
+      }
+      refetchTimeoutRef.current = setTimeout(() => {
+        refetchTimeoutRef.current = null;
+        fetchHistoricalData(selectedRange);
+      }, 1000);
+    };
+
     const subscription = supabase
       .channel('sensor_data_realtime_charts')
       .on(
@@ -300,7 +449,10 @@ const Charts = () => {
             }
           }
           
-          if (shouldUpdate) {
+          if (shouldUpdate && chartMode === 'multi') {
+            // The matrix is resampled server-side; refetch it once the burst settles
+            scheduleRefetch();
+          } else if (shouldUpdate) {
             // Optimistic update - add new data point immediately
             setHistoricalData(prevData => {
               if (isLiveMode) {
@@ -311,11 +463,14 @@ const Charts = () => {
                 }
                 return updatedData;
               } else {
-                // For historical mode, sort by timestamp
-                const updatedData = [...prevData, newData];
-                return updatedData.sort((a, b) => 
-                  new Date(a.created_at).getTime() - new Date(b.created_at).getTime()
-                );
+                // For historical mode, keep timestamp order; a reading newer than the
+                // last one extends the array, so the chart worker only lays out the tail
+                const at = parseTime(newData.created_at);
+                let index = prevData.length;
+                while (index > 0 && parseTime(prevData[index - 1].created_at) > at) {
+                  index--;
+                }
+                return [...prevData.slice(0, index), newData, ...prevData.slice(index)];
               }
             });
             
@@ -340,9 +495,7 @@ const Charts = () => {
             
             // Refresh data from server to ensure consistency (skip for live mode as it manages its own data)
             if (!isLiveMode) {
-              setTimeout(() => {
-                fetchHistoricalData(selectedRange);
-              }, 1000);
+              scheduleRefetch();
             }
           }
         }
@@ -364,6 +517,19 @@ const Charts = () => {
         console.log('Real-time subscription status:', status);
         if (status === 'SUBSCRIBED') {
           setIsLiveConnected(true);
+          // Catch up on readings missed while disconnected with a delta from the live service
+          const cursor = liveCursorRef.current;
+          if (cursor && selectedDeviceId) {
+            fetchLiveSince([selectedDeviceId], maxLiveDataPoints, cursor)
+              .then(delta => {
+                liveCursorRef.current = { epoch: delta.epoch, seq: delta.seq };
+                setHistoricalData(prevData => mergeLive(prevData, delta, maxLiveDataPoints, row => ({
+                  ...row,
+                  title_name: enabledDevices.find(d => d.id === row.device_id)?.title ?? row.device_id
+                }) as SensorDataPoint));
+              })
+              .catch(error => console.warn('Live delta failed:', error));
+          }
           // Only show success toast on initial connection, not on every reconnect
           if (!isLiveConnected) {
             toast.success('🟢 Live updates connected!', { 
@@ -389,6 +555,10 @@ const Charts = () => {
       if (connectionTimeoutRef.current) {
         clearTimeout(connectionTimeoutRef.current);
       }
+      if (refetchTimeoutRef.current) {
+        clearTimeout(refetchTimeoutRef.current);
+        refetchTimeoutRef.current = null;
+      }
     };
   }, [selectedRange, chartMode, selectedDeviceId, enabledDevices]); // eslint-disable-line react-hooks/exhaustive-deps
 
@@ -397,7 +567,7 @@ const Charts = () => {
     try {
       const { data, error } = await supabase
         .from('comments')
-        .select('*')
+        .select(PROJECTIONS.comment)
         .order('created_at', { ascending: false });
 
       if (error) {
@@ -437,104 +607,121 @@ const Charts = () => {
     };
   }, []);
 
-  const formatChartData = (data: SensorDataPoint[]): DataPointWithComments[] => {
-    if (chartMode === 'single') {
-      // Single device mode - add disconnection gaps
-      const sortedData = data.sort((a, b) => new Date(a.created_at).getTime() - new Date(b.created_at).getTime());
-      const result: DataPointWithComments[] = [];
-      
-      for (let i = 0; i < sortedData.length; i++) {
-        const point = sortedData[i];
-        const timestamp = parseISO(point.created_at);
-        
-        // Add gap if there's more than 10 minutes between data points
-        if (i > 0) {
-          const prevTimestamp = parseISO(sortedData[i - 1].created_at);
-          const timeDiff = differenceInMinutes(timestamp, prevTimestamp);
-          
-          if (timeDiff > 10) {
-            // Add a gap marker (null values)
-            result.push({
-              timestamp: new Date(prevTimestamp.getTime() + 5 * 60000), // 5 minutes after last point
-              time: '',
-              gasLevel: null as unknown as number,
-              tankLevel: null as unknown as number,
-              connectionQuality: null as unknown as number,
-              batteryLevel: null as unknown as number,
-              raw_timestamp: '',
-              sensor_data_id: undefined,
-              comments: []
-            });
-          }
-        }
-        
-        const pointComments = comments.filter(c => c.sensor_data_id === point.id);
-        const timeFormat = selectedRange === "1min" ? "HH:mm:ss" : 
-                         selectedRange === "1m" ? "MMM dd" : 
-                         selectedRange === "1w" ? "MMM dd HH:mm" : 
-                         selectedRange === "live" ? "HH:mm:ss" : "HH:mm";
-        
-        result.push({
+  const timeFormat = selectedRange === "1min" ? "HH:mm:ss" : 
+                     selectedRange === "1m" ? "MMM dd" : 
+                     selectedRange === "1w" ? "MMM dd HH:mm" : 
+                     selectedRange === "live" ? "HH:mm:ss" : "HH:mm";
+
+  const commentsByReading = useMemo(() => {
+    const byReading = new Map<string, Comment[]>();
+    comments.forEach(comment => {
+      const list = byReading.get(comment.sensor_data_id);
+      if (list) {
+        list.push(comment);
+      } else {
+        byReading.set(comment.sensor_data_id, [comment]);
+      }
+    });
+    return byReading;
+  }, [comments]);
+
+  // Single device mode: sorting, timestamp parsing and disconnection gaps run in
+  // the chart worker; only new series versions are turned into Recharts points here
+  const singleSeries = useChartSeries(
+    historicalData, gapMinutesFor(historyResolution), chartMode === 'single'
+  );
+  const singlePointsRef = useRef<{
+    version: number;
+    commentsByReading: Map<string, Comment[]>;
+    timeFormat: string;
+    points: DataPointWithComments[];
+  } | null>(null);
+
+  const singleChartData = useMemo((): DataPointWithComments[] => {
+    if (!singleSeries) return [];
+    const { series, rows } = singleSeries;
+    const previous = singlePointsRef.current;
+    // After an append only the new tail needs labels and comments
+    const reuse = previous !== null
+      && singleSeries.base === previous.version
+      && previous.commentsByReading === commentsByReading
+      && previous.timeFormat === timeFormat;
+    const points = reuse ? previous.points.slice() : [];
+    const orNull = (value: number) => (Number.isNaN(value) ? null : value) as number;
+
+    for (let i = points.length; i < series.time.length; i++) {
+      const timestamp = new Date(series.time[i]);
+      const source = series.source[i];
+      if (source < 0) {
+        // Gap marker (null values) after a disconnection
+        points.push({
           timestamp,
-          time: format(timestamp, timeFormat),
-          gasLevel: point.measurement,
-          tankLevel: point.tank_level,
-          connectionQuality: point.connection_strength,
-          batteryLevel: point.battery === 'Full' ? 100 : point.battery === 'Ok' ? 75 : 25,
-          raw_timestamp: point.created_at,
-          sensor_data_id: point.id,
-          comments: pointComments
+          time: '',
+          gasLevel: null as unknown as number,
+          tankLevel: null as unknown as number,
+          connectionQuality: null as unknown as number,
+          batteryLevel: null as unknown as number,
+          raw_timestamp: '',
+          sensor_data_id: undefined,
+          comments: []
         });
+        continue;
       }
-      
-      return result;
-    } else {
-      // Multi-device mode
-      const timeGroups: { [timestamp: string]: SensorDataPoint[] } = {};
-      
-      data.forEach(point => {
-        const timeKey = point.created_at;
-        if (!timeGroups[timeKey]) {
-          timeGroups[timeKey] = [];
-        }
-        timeGroups[timeKey].push(point);
+      const point = rows[source];
+      points.push({
+        timestamp,
+        time: format(timestamp, timeFormat),
+        gasLevel: orNull(series.gasLevel[i]),
+        tankLevel: orNull(series.tankLevel[i]),
+        connectionQuality: orNull(series.connectionQuality[i]),
+        batteryLevel: series.batteryLevel[i],
+        raw_timestamp: point.created_at,
+        sensor_data_id: point.id,
+        comments: commentsByReading.get(point.id) || []
       });
+    }
 
-      const chartPoints: DataPointWithComments[] = [];
-      
-      Object.entries(timeGroups).forEach(([timestamp, points]) => {
-        const timeFormat = selectedRange === "1min" ? "HH:mm:ss" : 
-                         selectedRange === "1m" ? "MMM dd" : 
-                         selectedRange === "1w" ? "MMM dd HH:mm" : 
-                         selectedRange === "live" ? "HH:mm:ss" : "HH:mm";
-        
-        const chartPoint: DataPointWithComments = {
-          timestamp: parseISO(timestamp),
-          time: format(parseISO(timestamp), timeFormat),
-          raw_timestamp: timestamp,
-          comments: []
-        };
-
-        points.forEach(point => {
-          const devicePrefix = point.device_id;
-          chartPoint[`${devicePrefix}_gasLevel`] = point.measurement;
-          chartPoint[`${devicePrefix}_tankLevel`] = point.tank_level;
-          chartPoint[`${devicePrefix}_connection`] = point.connection_strength;
-          chartPoint[`${devicePrefix}_battery`] = point.battery === 'Full' ? 100 : point.battery === 'Ok' ? 75 : 25;
-          
-          // Collect comments for this data point
-          const pointComments = comments.filter(c => c.sensor_data_id === point.id);
-          chartPoint.comments = [...(chartPoint.comments || []), ...pointComments];
-        });
+    singlePointsRef.current = { version: singleSeries.version, commentsByReading, timeFormat, points };
+    return points;
+  }, [singleSeries, commentsByReading, timeFormat]);
 
-        chartPoints.push(chartPoint);
+  // Multi-device mode - one chart point per matrix row
+  const matrixChartData = useMemo((): DataPointWithComments[] => {
+    if (chartMode !== 'multi' || !matrix) return [];
+
+    const t0 = parseISO(matrix.t0).getTime();
+    const stepMs = matrix.step * 1000;
+
+    // Comments land in the bucket of the reading they belong to
+    const bucketComments: { [bucket: number]: Comment[] } = {};
+    comments.forEach(comment => {
+      if (!comment.sensor_data) return;
+      const bucket = Math.floor((parseISO(comment.sensor_data.created_at).getTime() - t0) / stepMs);
+      (bucketComments[bucket] = bucketComments[bucket] || []).push(comment);
+    });
+
+    return matrix.values.measurement.map((row, bucket) => {
+      const timestamp = new Date(t0 + bucket * stepMs);
+      const chartPoint: DataPointWithComments = {
+        timestamp,
+        time: format(timestamp, timeFormat),
+        raw_timestamp: timestamp.toISOString(),
+        comments: bucketComments[bucket] || []
+      };
+
+      matrix.devices.forEach((devicePrefix, column) => {
+        if (row[column] === null) return;
+        chartPoint[`${devicePrefix}_gasLevel`] = row[column] as number;
+        chartPoint[`${devicePrefix}_tankLevel`] = matrix.values.tank_level[bucket][column] as number;
+        chartPoint[`${devicePrefix}_connection`] = matrix.values.connection_strength[bucket][column] as number;
+        chartPoint[`${devicePrefix}_battery`] = matrix.values.battery_level?.[bucket]?.[column] as number;
       });
 
-      return chartPoints.sort((a, b) => a.timestamp.getTime() - b.timestamp.getTime());
-    }
-  };
+      return chartPoint;
+    });
+  }, [chartMode, matrix, comments, timeFormat]);
 
-  const chartData = formatChartData(historicalData);
+  const chartData = chartMode === 'single' ? singleChartData : matrixChartData;
 
   // Handle adding comments
   const handleAddComment = async () => {
@@ -575,15 +762,27 @@ const Charts = () => {
   };
 
   const downloadData = (fileFormat: 'csv' | 'json') => {
-    const dataToDownload = historicalData.map(point => ({
-      timestamp: point.created_at,
-      device_id: point.device_id,
-      device_title: point.title_name,
-      gas_level: point.measurement,
-      tank_level: point.tank_level,
-      battery: point.battery,
-      connection_strength: point.connection_strength
-    }));
+    const dataToDownload = chartMode === 'multi' && matrix
+      ? chartData.flatMap(point => matrix.devices
+          .filter(deviceId => point[`${deviceId}_gasLevel`] !== undefined)
+          .map(deviceId => ({
+            timestamp: point.raw_timestamp,
+            device_id: deviceId,
+            device_title: devices.find(d => d.id === deviceId)?.title ?? deviceId,
+            gas_level: point[`${deviceId}_gasLevel`] as number,
+            tank_level: point[`${deviceId}_tankLevel`] as number,
+            battery: batteryLabel(point[`${deviceId}_battery`] as number | undefined),
+            connection_strength: point[`${deviceId}_connection`] as number
+          })))
+      : historicalData.map(point => ({
+          timestamp: point.created_at,
+          device_id: point.device_id,
+          device_title: point.title_name,
+          gas_level: point.measurement,
+          tank_level: point.tank_level,
+          battery: point.battery,
+          connection_strength: point.connection_strength
+        }));
 
     if (fileFormat === 'json') {
       const blob = new Blob([JSON.stringify(dataToDownload, null, 2)], { type: 'application/json' });
@@ -0,0 +1,56 @@
+// Builds single-device chart series off the main thread (src/lib/chartPipeline.ts).
+// Replies transfer the column buffers instead of copying them. An append only
+// lays out the new rows; when they do not extend the series the page holds
+// (wrong base version, or readings older than its last one) the worker asks
+// for a full build instead.
+import { buildSeries, seriesBuffers, startsAfter, type ChartRow, type SeriesColumns } from '@/lib/chartPipeline';
+
+export type ChartWorkerRequest =
+  | { type: 'build'; version: number; rows: ChartRow[]; gapMinutes: number }
+  | { type: 'append'; version: number; base: number; rows: ChartRow[]; gapMinutes: number };
+
+export type ChartWorkerReply =
+  | { type: 'replace'; version: number; series: SeriesColumns }
+  | { type: 'append'; version: number; base: number; series: SeriesColumns }
+  | { type: 'rebuild'; version: number };
+
+// The last series built: enough to extend it without the rows themselves
+let current = { version: -1, rows: 0, lastTime: NaN, gapMinutes: NaN };
+
+const lastTime = (series: SeriesColumns, fallback: number) =>
+  series.time.length ? series.time[series.time.length - 1] : fallback;
+
+self.onmessage = (event: MessageEvent<ChartWorkerRequest>) => {
+  const request = event.data;
+  let reply: ChartWorkerReply;
+
+  if (request.type === 'append') {
+    const extendsSeries = current.version === request.base
+      && current.gapMinutes === request.gapMinutes
+      && startsAfter(request.rows, current.lastTime);
+    if (!extendsSeries) {
+      const rebuild: ChartWorkerReply = { type: 'rebuild', version: request.version };
+      self.postMessage(rebuild);
+      return;
+    }
+    const series = buildSeries(request.rows, request.gapMinutes, current.rows, current.lastTime);
+    current = {
+      version: request.version,
+      rows: current.rows + request.rows.length,
+      lastTime: lastTime(series, current.lastTime),
+      gapMinutes: request.gapMinutes,
+    };
+    reply = { type: 'append', version: request.version, base: request.base, series };
+  } else {
+    const series = buildSeries(request.rows, request.gapMinutes);
+    current = {
+      version: request.version,
+      rows: request.rows.length,
+      lastTime: lastTime(series, NaN),
+      gapMinutes: request.gapMinutes,
+    };
+    reply = { type: 'replace', version: request.version, series };
+  }
+
+  self.postMessage(reply, { transfer: seriesBuffers(reply.series) });
+};
@@ -0,0 +1,67 @@
+-- Support bulk historical backfill from offline data loggers
+
+-- Expose the BLE packet counter from technical_data so duplicates can be
+-- found with an index instead of a JSON scan. (Adding a stored generated
+-- column rewrites sensor_data once.)
+ALTER TABLE public.sensor_data
+  ADD COLUMN IF NOT EXISTS packet_number bigint GENERATED ALWAYS AS (
+    CASE
+      WHEN jsonb_typeof(technical_data -> '_technical' -> 'packet_number') = 'number'
+      THEN (technical_data -> '_technical' ->> 'packet_number')::numeric::bigint
+    END
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS sensor_data_device_packet_idx
+  ON public.sensor_data (device_id, packet_number, created_at)
+  WHERE packet_number IS NOT NULL;
+
+-- Rows loaded by a quiet backfill carry their batch id and are filtered out
+-- of the realtime publication below.
+ALTER TABLE public.sensor_data
+  ADD COLUMN IF NOT EXISTS backfill_batch_id uuid;
+
+-- One row per backfill: the single realtime event dashboards receive
+-- instead of one INSERT per historical reading.
+CREATE TABLE IF NOT EXISTS public.backfill_batches (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  source text NOT NULL,
+  device_ids text[] NOT NULL DEFAULT '{}',
+  rows_received integer NOT NULL DEFAULT 0,
+  rows_inserted integer NOT NULL DEFAULT 0,
+  rows_duplicate integer NOT NULL DEFAULT 0,
+  rows_rejected integer NOT NULL DEFAULT 0,
+  first_reading_at timestamp with time zone,
+  last_reading_at timestamp with time zone,
+  created_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now())
+);
+
+ALTER TABLE public.backfill_batches ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Public read access to backfill_batches"
+ON public.backfill_batches FOR SELECT
+USING (true);
+
+CREATE POLICY "Public insert access to backfill_batches"
+ON public.backfill_batches FOR INSERT
+WITH CHECK (true);
+
+GRANT SELECT, INSERT ON public.backfill_batches TO anon, authenticated;
+
+-- Publish only live readings (row filters need Postgres 15; sensor_data
+-- already has REPLICA IDENTITY FULL, which row filters on UPDATE/DELETE require)
+DO $$
+BEGIN
+    BEGIN
+        ALTER PUBLICATION supabase_realtime DROP TABLE public.sensor_data;
+    EXCEPTION WHEN undefined_object THEN
+        NULL;
+    END;
+    ALTER PUBLICATION supabase_realtime ADD TABLE public.sensor_data
+        WHERE (backfill_batch_id IS NULL);
+
+    BEGIN
+        ALTER PUBLICATION supabase_realtime ADD TABLE public.backfill_batches;
+    EXCEPTION WHEN duplicate_object THEN
+        NULL;
+    END;
+END $$;
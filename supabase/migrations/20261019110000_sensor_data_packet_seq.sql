@@ -0,0 +1,18 @@
+-- Packet-level deduplication for BLE retransmissions
+--
+-- Gateways often deliver the same notification several times. The ingest
+-- writer (gas_sight.ingest) drops repeats in memory and stamps each reading
+-- with packet_seq: the BLE packet counter unwrapped into a per-device
+-- sequence that keeps increasing across counter wraparounds. The unique
+-- index is the backstop for repeats the in-memory window cannot see (a
+-- second gateway, a restarted process); the writer inserts with
+-- ON CONFLICT (device_id, packet_seq) DO NOTHING.
+--
+-- Rows without packet_seq (older readings, backfills, other writers) are
+-- unaffected: NULLs never conflict in a unique index.
+
+ALTER TABLE public.sensor_data
+  ADD COLUMN IF NOT EXISTS packet_seq bigint;
+
+-- The unique index is built concurrently in 20261019110500, outside this
+-- transaction, so sensor_data keeps taking writes while it builds.
@@ -0,0 +1,13 @@
+-- Unique (device_id, packet_seq) index behind the ingest writer's
+-- ON CONFLICT (device_id, packet_seq) DO NOTHING
+--
+-- Built CONCURRENTLY so inserts into sensor_data are not blocked for the
+-- length of the build. CREATE INDEX CONCURRENTLY cannot run inside a
+-- transaction block, so this file holds this one statement only and must
+-- be applied on its own (not wrapped in BEGIN/COMMIT). If a build fails it
+-- leaves an INVALID index behind: DROP INDEX CONCURRENTLY it and re-run.
+-- Until the index is valid, ON CONFLICT (device_id, packet_seq) inserts
+-- are rejected, so deploy the ingest writer after this migration.
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS sensor_data_device_packet_seq_key
+  ON public.sensor_data (device_id, packet_seq);
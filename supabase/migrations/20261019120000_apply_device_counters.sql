@@ -0,0 +1,32 @@
+-- Write-behind device counters
+--
+-- gas_sight.counters buffers per-poll changes to total_packets_received,
+-- connection_attempts, last_connected and is_connected and applies them
+-- here in one UPDATE for all devices, instead of one devices write (plus
+-- its set_devices_updated_at trigger and realtime event) per reading.
+--
+-- counters is a JSON array of
+--   {"id": ..., "packets": n, "attempts": n, "is_connected": bool?, "last_connected": ts?}
+-- Returns the number of device rows updated.
+
+CREATE OR REPLACE FUNCTION public.apply_device_counters(counters jsonb)
+RETURNS integer
+LANGUAGE sql
+SET search_path = public
+AS $$
+    WITH updated AS (
+        UPDATE public.devices d
+        SET total_packets_received = d.total_packets_received + coalesce(c.packets, 0),
+            connection_attempts = d.connection_attempts + coalesce(c.attempts, 0),
+            is_connected = coalesce(c.is_connected, d.is_connected),
+            last_connected = greatest(d.last_connected, c.last_connected)
+        FROM jsonb_to_recordset(counters)
+            AS c(id text, packets integer, attempts integer, is_connected boolean,
+                 last_connected timestamptz)
+        WHERE d.id = c.id
+        RETURNING d.id
+    )
+    SELECT count(*)::integer FROM updated;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.apply_device_counters(jsonb) TO anon, authenticated;
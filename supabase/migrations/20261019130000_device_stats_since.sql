@@ -0,0 +1,136 @@
+-- Conditional device_stats reads
+--
+-- get_device_stats and the device_stats view re-run the full aggregate on
+-- every refresh, and the dashboard refreshes on every devices or
+-- sensor_data realtime event. device_stats_versions records, per device,
+-- the version (from one sequence) of the last statement that changed its
+-- stats; triggers bump it once per statement for all affected devices.
+--
+-- device_stats_since(since) returns
+--   {"etag": "<version>.<bucket>", "not_modified": bool, "full": bool,
+--    "devices": [device_stats rows], "removed": [device ids]}
+-- The etag is max(version) (one index lookup) plus a 5-minute time
+-- bucket, because readings_last_24h / avg_measurement_24h drift as time
+-- passes without any write. When `since` is the current etag nothing is
+-- shipped; when it is from the same bucket only the changed devices are;
+-- otherwise (first call, new bucket, unknown token) the full list is.
+
+CREATE SEQUENCE IF NOT EXISTS public.device_stats_version_seq;
+
+CREATE TABLE IF NOT EXISTS public.device_stats_versions (
+    device_id text PRIMARY KEY,
+    version bigint NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS device_stats_versions_version_idx
+  ON public.device_stats_versions (version);
+
+-- Only read through device_stats_since
+REVOKE ALL ON public.device_stats_versions FROM anon, authenticated;
+
+-- TG_ARGV[0] is the device id column of the transition table `changed`
+CREATE OR REPLACE FUNCTION public.bump_device_stats_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO public.device_stats_versions (device_id, version)
+         SELECT DISTINCT %I, $1 FROM changed WHERE %I IS NOT NULL
+         ON CONFLICT (device_id) DO UPDATE SET version = excluded.version',
+        TG_ARGV[0], TG_ARGV[0]
+    ) USING nextval('public.device_stats_version_seq');
+    RETURN NULL;
+END;
+$$;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS device_stats_version_devices_insert ON public.devices;
+CREATE TRIGGER device_stats_version_devices_insert
+  AFTER INSERT ON public.devices REFERENCING NEW TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('id');
+
+DROP TRIGGER IF EXISTS device_stats_version_devices_update ON public.devices;
+CREATE TRIGGER device_stats_version_devices_update
+  AFTER UPDATE ON public.devices REFERENCING NEW TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('id');
+
+DROP TRIGGER IF EXISTS device_stats_version_devices_delete ON public.devices;
+CREATE TRIGGER device_stats_version_devices_delete
+  AFTER DELETE ON public.devices REFERENCING OLD TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('id');
+
+DROP TRIGGER IF EXISTS device_stats_version_sensor_data_insert ON public.sensor_data;
+CREATE TRIGGER device_stats_version_sensor_data_insert
+  AFTER INSERT ON public.sensor_data REFERENCING NEW TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('device_id');
+
+DROP TRIGGER IF EXISTS device_stats_version_sensor_data_delete ON public.sensor_data;
+CREATE TRIGGER device_stats_version_sensor_data_delete
+  AFTER DELETE ON public.sensor_data REFERENCING OLD TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('device_id');
+
+-- Existing devices start at version 1
+INSERT INTO public.device_stats_versions (device_id, version)
+SELECT id, nextval('public.device_stats_version_seq') FROM public.devices
+ON CONFLICT (device_id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION public.device_stats_since(since text DEFAULT NULL)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    current_version bigint;
+    bucket bigint := floor(extract(epoch FROM now()) / 300)::bigint;
+    etag text;
+    since_version bigint;
+BEGIN
+    SELECT coalesce(max(version), 0) INTO current_version FROM public.device_stats_versions;
+    etag := current_version || '.' || bucket;
+
+    IF since = etag THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', true, 'full', false,
+            'devices', '[]'::jsonb, 'removed', '[]'::jsonb
+        );
+    END IF;
+
+    IF since ~ '^[0-9]+\.[0-9]+$' AND split_part(since, '.', 2)::bigint = bucket THEN
+        since_version := split_part(since, '.', 1)::bigint;
+    END IF;
+
+    IF since_version IS NULL OR since_version > current_version THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', false, 'full', true,
+            'devices', coalesce(
+                (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+                 FROM public.device_stats s),
+                '[]'::jsonb),
+            'removed', '[]'::jsonb
+        );
+    END IF;
+
+    RETURN jsonb_build_object(
+        'etag', etag, 'not_modified', false, 'full', false,
+        'devices', coalesce(
+            (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+             FROM public.device_stats s
+             JOIN public.device_stats_versions v ON v.device_id = s.id
+             WHERE v.version > since_version),
+            '[]'::jsonb),
+        'removed', coalesce(
+            (SELECT jsonb_agg(v.device_id)
+             FROM public.device_stats_versions v
+             WHERE v.version > since_version
+               AND NOT EXISTS (SELECT 1 FROM public.devices d WHERE d.id = v.device_id)),
+            '[]'::jsonb)
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.device_stats_since(text) TO anon, authenticated;
@@ -0,0 +1,69 @@
+-- Threshold alerting
+--
+-- gas_sight.alerts evaluates alert_rules incrementally as readings are
+-- ingested (no periodic scans of sensor_data). A rule applies to one
+-- device, to every device at a location, or (both NULL) to all devices:
+--
+--   kind threshold: fire when the metric is below/above/equal to threshold
+--   kind rate:      the same test on the metric's change per hour between
+--                   consecutive readings (e.g. a gas level falling fast)
+--
+-- clear_threshold adds hysteresis: a firing alert resolves only once the
+-- value is back past it, so a level hovering at the threshold does not
+-- flap. alerts holds one row per (rule, device) with its current state;
+-- the engine upserts on that key, so an alert that keeps firing is stored
+-- (and realtime-published) once, not once per reading.
+
+CREATE TABLE IF NOT EXISTS public.alert_rules (
+  id text PRIMARY KEY,
+  name text NOT NULL DEFAULT '',
+  metric text NOT NULL
+    CHECK (metric IN ('measurement', 'tank_level', 'connection_strength', 'battery')),
+  kind text NOT NULL DEFAULT 'threshold' CHECK (kind IN ('threshold', 'rate')),
+  op text NOT NULL CHECK (op IN ('below', 'above', 'equals')),
+  threshold jsonb NOT NULL,
+  clear_threshold jsonb,
+  device_id text REFERENCES public.devices(id) ON DELETE CASCADE,
+  location text,
+  severity text NOT NULL DEFAULT 'warning' CHECK (severity IN ('info', 'warning', 'critical')),
+  enabled boolean NOT NULL DEFAULT true,
+  created_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now())
+);
+
+CREATE TABLE IF NOT EXISTS public.alerts (
+  rule_id text NOT NULL REFERENCES public.alert_rules(id) ON DELETE CASCADE,
+  device_id text NOT NULL REFERENCES public.devices(id) ON DELETE CASCADE,
+  state text NOT NULL CHECK (state IN ('firing', 'resolved')),
+  severity text NOT NULL DEFAULT 'warning',
+  message text NOT NULL DEFAULT '',
+  value jsonb,
+  fired_at timestamp with time zone NOT NULL,
+  resolved_at timestamp with time zone,
+  updated_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now()),
+  PRIMARY KEY (rule_id, device_id)
+);
+
+-- The dashboard and the engine's restart only look at firing alerts
+CREATE INDEX IF NOT EXISTS alerts_firing_idx
+  ON public.alerts (device_id) WHERE state = 'firing';
+
+DROP TRIGGER IF EXISTS update_alerts_updated_at ON public.alerts;
+CREATE TRIGGER update_alerts_updated_at
+  BEFORE UPDATE ON public.alerts
+  FOR EACH ROW EXECUTE FUNCTION public.handle_updated_at();
+
+ALTER TABLE public.alert_rules ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.alerts ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Public access to alert_rules"
+ON public.alert_rules FOR ALL
+USING (true) WITH CHECK (true);
+
+CREATE POLICY "Public access to alerts"
+ON public.alerts FOR ALL
+USING (true) WITH CHECK (true);
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON public.alert_rules TO anon, authenticated;
+GRANT SELECT, INSERT, UPDATE, DELETE ON public.alerts TO anon, authenticated;
+
+ALTER PUBLICATION supabase_realtime ADD TABLE public.alerts;
@@ -0,0 +1,69 @@
+-- Columnar sensor history for long chart ranges
+--
+-- A month of one-minute readings is ~43k rows; as JSON objects with every
+-- sensor_data column (technical_data included) that is tens of megabytes.
+-- sensor_columns returns the columns a chart needs as one base64 string
+-- each (format packed-v1, decoded by gas_sight/wire.py and src/lib/wire.ts):
+--
+--   id                  uuid   uuid_send
+--   created_at          i8     epoch milliseconds
+--   device              i4     index into labels (= device_ids), -1 if unknown
+--   measurement         f8     NaN for NULL
+--   tank_level          f8     NaN for NULL
+--   connection_strength i4
+--   battery             i4     index into labels ('Full', 'Ok', 'Low')
+--
+-- All values are big-endian, as produced by the *send functions. Rows are
+-- ordered by (created_at, id) and served by sensor_data_device_created_idx.
+
+CREATE OR REPLACE FUNCTION public.sensor_columns(
+    device_ids text[],
+    window_start timestamptz,
+    window_end timestamptz
+)
+RETURNS jsonb
+LANGUAGE sql
+STABLE
+SET search_path = public
+AS $$
+    SELECT jsonb_build_object(
+        'format', 'packed-v1',
+        'rows', count(*),
+        'columns', jsonb_build_object(
+            'id', jsonb_build_object('type', 'uuid', 'data', encode(coalesce(
+                string_agg(uuid_send(s.id), ''::bytea ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'created_at', jsonb_build_object('type', 'i8', 'data', encode(coalesce(
+                string_agg(int8send((extract(epoch FROM s.created_at) * 1000)::bigint), ''::bytea
+                           ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'device', jsonb_build_object('type', 'i4', 'labels', to_jsonb(device_ids), 'data', encode(coalesce(
+                string_agg(int4send(coalesce(array_position(device_ids, s.device_id), 0) - 1), ''::bytea
+                           ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'measurement', jsonb_build_object('type', 'f8', 'data', encode(coalesce(
+                string_agg(float8send(coalesce(s.measurement::float8, 'NaN')), ''::bytea
+                           ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'tank_level', jsonb_build_object('type', 'f8', 'data', encode(coalesce(
+                string_agg(float8send(coalesce(s.tank_level::float8, 'NaN')), ''::bytea
+                           ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'connection_strength', jsonb_build_object('type', 'i4', 'data', encode(coalesce(
+                string_agg(int4send(s.connection_strength), ''::bytea ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64')),
+            'battery', jsonb_build_object('type', 'i4', 'labels', '["Full", "Ok", "Low"]'::jsonb,
+                'data', encode(coalesce(
+                string_agg(int4send(coalesce(array_position(ARRAY['Full', 'Ok', 'Low'], s.battery), 0) - 1),
+                           ''::bytea ORDER BY s.created_at, s.id),
+                ''::bytea), 'base64'))
+        )
+    )
+    FROM public.sensor_data s
+    WHERE s.device_id = ANY(device_ids)
+      AND s.created_at >= window_start
+      AND s.created_at < window_end;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.sensor_columns(text[], timestamptz, timestamptz)
+  TO anon, authenticated;
@@ -0,0 +1,22 @@
+-- Replica lag for read routing
+--
+-- gas_sight.replicas sends dashboard reads to read replicas when they are
+-- fresh enough for the query. replication_lag() answers, on any node, how
+-- many seconds behind the primary it is: 0 on the primary, and 0 on a
+-- replica that has replayed everything it received (otherwise an idle
+-- primary would look like growing lag), else the age of the last replayed
+-- transaction.
+
+CREATE OR REPLACE FUNCTION public.replication_lag()
+RETURNS double precision
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::double precision;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.replication_lag() TO anon, authenticated;
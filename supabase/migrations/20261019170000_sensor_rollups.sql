@@ -0,0 +1,267 @@
+-- Multi-resolution sensor history
+--
+-- Every chart range used to read raw sensor_data rows, so a one month view
+-- of a tank reporting every minute pulled ~43k rows. sensor_rollups keeps
+-- per-device aggregates at the resolutions listed in sensor_rollup_tiers
+-- (1 minute, 15 minutes, 1 hour). A statement-level trigger folds each
+-- INSERT into sensor_data into every tier (count, sum, min, max, plus the
+-- latest reading of the bucket), so the tiers are never behind the raw
+-- table.
+--
+-- sensor_history(device_ids, window_start, window_end, max_points) picks
+-- the coarsest tier that still gives at least max_points buckets over the
+-- window and whose retention covers window_start, falling back to raw
+-- rows (tier 0):
+--
+--   {"resolution": 3600, "rows": [{"device_id", "created_at" (bucket start),
+--     "id" (latest reading in the bucket), "readings", "measurement" (mean),
+--     "measurement_min", "measurement_max", "tank_level",
+--     "connection_strength", "battery"}, ...]}
+--
+-- A month at 720 points reads the hourly tier: 720 rows per device.
+--
+-- Deleting readings does not shrink the tiers; rebuild_sensor_rollups()
+-- recomputes them for a window (gas_sight.tiers.rebuild), and
+-- prune_sensor_rollups() drops buckets past their tier's retention.
+
+CREATE TABLE IF NOT EXISTS public.sensor_rollup_tiers (
+    resolution integer PRIMARY KEY CHECK (resolution >= 0),
+    retention interval
+);
+
+-- 0 is the raw table; rollups are kept for every other tier
+INSERT INTO public.sensor_rollup_tiers (resolution, retention) VALUES
+    (0, NULL),
+    (60, interval '35 days'),
+    (900, interval '400 days'),
+    (3600, NULL)
+ON CONFLICT (resolution) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS public.sensor_rollups (
+    device_id text NOT NULL REFERENCES public.devices(id) ON DELETE CASCADE,
+    resolution integer NOT NULL,
+    bucket timestamptz NOT NULL,
+    readings integer NOT NULL,
+    measurement_sum numeric NOT NULL,
+    measurement_min numeric NOT NULL,
+    measurement_max numeric NOT NULL,
+    tank_level_sum numeric NOT NULL,
+    tank_level_min numeric NOT NULL,
+    tank_level_max numeric NOT NULL,
+    connection_strength_sum bigint NOT NULL,
+    last_id uuid NOT NULL,
+    last_at timestamptz NOT NULL,
+    last_battery text NOT NULL,
+    PRIMARY KEY (device_id, resolution, bucket)
+);
+
+ALTER TABLE public.sensor_rollup_tiers ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sensor_rollups ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow read access to sensor_rollup_tiers" ON public.sensor_rollup_tiers
+  FOR SELECT USING (true);
+CREATE POLICY "Allow read access to sensor_rollups" ON public.sensor_rollups
+  FOR SELECT USING (true);
+
+GRANT SELECT ON public.sensor_rollup_tiers, public.sensor_rollups TO anon, authenticated;
+
+-- Fold each inserted batch into every tier, aggregating the transition
+-- table in place; rebuild_sensor_rollups runs the same aggregate over
+-- sensor_data
+CREATE OR REPLACE FUNCTION public.rollup_inserted_sensor_data()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO public.sensor_rollups AS r (
+        device_id, resolution, bucket, readings,
+        measurement_sum, measurement_min, measurement_max,
+        tank_level_sum, tank_level_min, tank_level_max,
+        connection_strength_sum, last_id, last_at, last_battery
+    )
+    SELECT s.device_id, t.resolution,
+        to_timestamp(floor(extract(epoch FROM s.created_at) / t.resolution) * t.resolution),
+        count(*),
+        sum(s.measurement), min(s.measurement), max(s.measurement),
+        sum(s.tank_level), min(s.tank_level), max(s.tank_level),
+        sum(s.connection_strength),
+        (array_agg(s.id ORDER BY s.created_at DESC, s.id DESC))[1],
+        max(s.created_at),
+        (array_agg(s.battery ORDER BY s.created_at DESC, s.id DESC))[1]
+    FROM inserted s
+    CROSS JOIN public.sensor_rollup_tiers t
+    WHERE t.resolution > 0
+    GROUP BY 1, 2, 3
+    ON CONFLICT (device_id, resolution, bucket) DO UPDATE SET
+        readings = r.readings + EXCLUDED.readings,
+        measurement_sum = r.measurement_sum + EXCLUDED.measurement_sum,
+        measurement_min = least(r.measurement_min, EXCLUDED.measurement_min),
+        measurement_max = greatest(r.measurement_max, EXCLUDED.measurement_max),
+        tank_level_sum = r.tank_level_sum + EXCLUDED.tank_level_sum,
+        tank_level_min = least(r.tank_level_min, EXCLUDED.tank_level_min),
+        tank_level_max = greatest(r.tank_level_max, EXCLUDED.tank_level_max),
+        connection_strength_sum = r.connection_strength_sum + EXCLUDED.connection_strength_sum,
+        last_id = CASE WHEN EXCLUDED.last_at >= r.last_at THEN EXCLUDED.last_id ELSE r.last_id END,
+        last_battery = CASE WHEN EXCLUDED.last_at >= r.last_at THEN EXCLUDED.last_battery ELSE r.last_battery END,
+        last_at = greatest(r.last_at, EXCLUDED.last_at);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS sensor_data_rollups ON public.sensor_data;
+CREATE TRIGGER sensor_data_rollups
+    AFTER INSERT ON public.sensor_data
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION public.rollup_inserted_sensor_data();
+
+CREATE OR REPLACE FUNCTION public.sensor_history(
+    device_ids text[],
+    window_start timestamptz,
+    window_end timestamptz,
+    max_points integer DEFAULT 720
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SET search_path = public
+AS $$
+DECLARE
+    wanted double precision;
+    tier integer;
+    result jsonb;
+BEGIN
+    IF window_end <= window_start THEN
+        RAISE EXCEPTION 'window end must be after window start' USING ERRCODE = '22023';
+    END IF;
+    IF max_points IS NULL OR max_points <= 0 THEN
+        RAISE EXCEPTION 'max_points must be positive' USING ERRCODE = '22023';
+    END IF;
+
+    wanted := extract(epoch FROM window_end - window_start) / max_points;
+    SELECT t.resolution INTO tier
+    FROM public.sensor_rollup_tiers t
+    WHERE t.resolution <= wanted
+      AND (t.retention IS NULL OR window_start >= now() - t.retention)
+    ORDER BY t.resolution DESC
+    LIMIT 1;
+    tier := coalesce(tier, 0);
+
+    IF tier = 0 THEN
+        SELECT coalesce(jsonb_agg(jsonb_build_object(
+            'id', s.id, 'device_id', s.device_id, 'created_at', s.created_at, 'readings', 1,
+            'measurement', s.measurement, 'measurement_min', s.measurement,
+            'measurement_max', s.measurement, 'tank_level', s.tank_level,
+            'connection_strength', s.connection_strength, 'battery', s.battery
+        ) ORDER BY s.created_at, s.id), '[]'::jsonb) INTO result
+        FROM public.sensor_data s
+        WHERE s.device_id = ANY (device_ids)
+          AND s.created_at >= window_start
+          AND s.created_at < window_end;
+    ELSE
+        SELECT coalesce(jsonb_agg(jsonb_build_object(
+            'id', r.last_id, 'device_id', r.device_id, 'created_at', r.bucket, 'readings', r.readings,
+            'measurement', round(r.measurement_sum / r.readings, 2),
+            'measurement_min', r.measurement_min, 'measurement_max', r.measurement_max,
+            'tank_level', round(r.tank_level_sum / r.readings, 2),
+            'connection_strength', round(r.connection_strength_sum::numeric / r.readings),
+            'battery', r.last_battery
+        ) ORDER BY r.bucket, r.device_id), '[]'::jsonb) INTO result
+        FROM public.sensor_rollups r
+        WHERE r.device_id = ANY (device_ids)
+          AND r.resolution = tier
+          AND r.bucket >= to_timestamp(floor(extract(epoch FROM window_start) / tier) * tier)
+          AND r.bucket < window_end;
+    END IF;
+
+    RETURN jsonb_build_object('resolution', tier, 'rows', result);
+END;
+$$;
+
+-- Recompute the tiers for a window (after deletes or a repair)
+CREATE OR REPLACE FUNCTION public.rebuild_sensor_rollups(
+    device_ids text[],
+    window_start timestamptz,
+    window_end timestamptz
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    coarsest integer;
+    aligned_start timestamptz;
+    aligned_end timestamptz;
+    affected integer;
+BEGIN
+    SELECT max(resolution) INTO coarsest FROM public.sensor_rollup_tiers;
+    -- Whole buckets of the coarsest tier, so every tier's buckets are complete
+    aligned_start := to_timestamp(floor(extract(epoch FROM window_start) / coarsest) * coarsest);
+    aligned_end := to_timestamp(ceil(extract(epoch FROM window_end) / coarsest) * coarsest);
+
+    DELETE FROM public.sensor_rollups
+    WHERE device_id = ANY (device_ids) AND bucket >= aligned_start AND bucket < aligned_end;
+
+    SELECT count(*) INTO affected
+    FROM public.sensor_data
+    WHERE device_id = ANY (device_ids) AND created_at >= aligned_start AND created_at < aligned_end;
+
+    -- One set-based pass; the window's buckets were just emptied
+    INSERT INTO public.sensor_rollups (
+        device_id, resolution, bucket, readings,
+        measurement_sum, measurement_min, measurement_max,
+        tank_level_sum, tank_level_min, tank_level_max,
+        connection_strength_sum, last_id, last_at, last_battery
+    )
+    SELECT s.device_id, t.resolution,
+        to_timestamp(floor(extract(epoch FROM s.created_at) / t.resolution) * t.resolution),
+        count(*),
+        sum(s.measurement), min(s.measurement), max(s.measurement),
+        sum(s.tank_level), min(s.tank_level), max(s.tank_level),
+        sum(s.connection_strength),
+        (array_agg(s.id ORDER BY s.created_at DESC, s.id DESC))[1],
+        max(s.created_at),
+        (array_agg(s.battery ORDER BY s.created_at DESC, s.id DESC))[1]
+    FROM public.sensor_data s
+    CROSS JOIN public.sensor_rollup_tiers t
+    WHERE t.resolution > 0
+      AND s.device_id = ANY (device_ids)
+      AND s.created_at >= aligned_start
+      AND s.created_at < aligned_end
+    GROUP BY 1, 2, 3;
+    RETURN affected;
+END;
+$$;
+
+-- Drop buckets older than their tier's retention
+CREATE OR REPLACE FUNCTION public.prune_sensor_rollups()
+RETURNS integer
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    WITH pruned AS (
+        DELETE FROM public.sensor_rollups r
+        USING public.sensor_rollup_tiers t
+        WHERE t.resolution = r.resolution
+          AND t.retention IS NOT NULL
+          AND r.bucket < now() - t.retention
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM pruned;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.sensor_history(text[], timestamptz, timestamptz, integer)
+  TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.rebuild_sensor_rollups(text[], timestamptz, timestamptz)
+  TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.prune_sensor_rollups() TO anon, authenticated;
+
+-- Existing history, in one INSERT ... SELECT ... GROUP BY over sensor_data
+SELECT public.rebuild_sensor_rollups(
+    ARRAY(SELECT id FROM public.devices), min(created_at), max(created_at) + interval '1 second'
+)
+FROM public.sensor_data
+HAVING count(*) > 0;
@@ -0,0 +1,105 @@
+-- Batched purges of device history and expired readings
+--
+-- Deleting a device used to be a single DELETE FROM devices. That cascades
+-- through every reading and every comment in one transaction, holds row
+-- locks on all of them until it commits and hands the realtime publication
+-- one event per deleted row at once. gas_sight.purge now:
+--
+-- 1. disables the device (the gateway stops polling it, the dashboard
+--    shows it as disabled),
+-- 2. calls purge_sensor_data() until it returns less than a full batch:
+--    each call deletes up to batch_size of the oldest readings (and their
+--    comments) in its own short transaction, with a pause between calls,
+--    so realtime sees at most one batch of DELETE events per pause,
+-- 3. deletes the now empty device row.
+--
+-- device_purges holds one row per purge. The dashboard queues a purge by
+-- inserting a row; the purge job claims pending rows, reports progress on
+-- them after every batch and resumes the ones left running. The same
+-- function deletes readings past a retention cutoff.
+
+CREATE TABLE IF NOT EXISTS public.device_purges (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  device_id text NOT NULL,
+  status text NOT NULL DEFAULT 'pending'
+    CHECK (status IN ('pending', 'running', 'done', 'failed')),
+  readings_total bigint,
+  readings_deleted bigint NOT NULL DEFAULT 0,
+  batches integer NOT NULL DEFAULT 0,
+  error text,
+  requested_at timestamp with time zone NOT NULL DEFAULT timezone('utc'::text, now()),
+  started_at timestamp with time zone,
+  finished_at timestamp with time zone
+);
+
+CREATE INDEX IF NOT EXISTS device_purges_open_idx
+  ON public.device_purges (requested_at)
+  WHERE finished_at IS NULL;
+
+ALTER TABLE public.device_purges ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Public read access to device_purges"
+ON public.device_purges FOR SELECT
+USING (true);
+
+CREATE POLICY "Public insert access to device_purges"
+ON public.device_purges FOR INSERT
+WITH CHECK (true);
+
+CREATE POLICY "Public update access to device_purges"
+ON public.device_purges FOR UPDATE
+USING (true);
+
+GRANT SELECT, INSERT, UPDATE ON public.device_purges TO anon, authenticated;
+
+-- Delete up to batch_size of the oldest readings of one device and/or older
+-- than a cutoff; returns how many were deleted. Rows locked by another
+-- purge are skipped rather than waited for.
+CREATE OR REPLACE FUNCTION public.purge_sensor_data(
+    target_device_id text DEFAULT NULL,
+    older_than timestamptz DEFAULT NULL,
+    batch_size integer DEFAULT 1000
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    deleted integer;
+BEGIN
+    IF target_device_id IS NULL AND older_than IS NULL THEN
+        RAISE EXCEPTION 'purge_sensor_data needs target_device_id or older_than'
+            USING ERRCODE = '22023';
+    END IF;
+    IF batch_size IS NULL OR batch_size < 1 OR batch_size > 50000 THEN
+        RAISE EXCEPTION 'batch_size must be between 1 and 50000' USING ERRCODE = '22023';
+    END IF;
+
+    WITH doomed AS (
+        SELECT sd.id
+        FROM public.sensor_data sd
+        WHERE (target_device_id IS NULL OR sd.device_id = target_device_id)
+          AND (older_than IS NULL OR sd.created_at < older_than)
+        ORDER BY sd.created_at
+        LIMIT batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    DELETE FROM public.sensor_data sd
+    USING doomed
+    WHERE sd.id = doomed.id;
+
+    GET DIAGNOSTICS deleted = ROW_COUNT;
+    RETURN deleted;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.purge_sensor_data(text, timestamptz, integer)
+  TO anon, authenticated;
+
+DO $$
+BEGIN
+    ALTER PUBLICATION supabase_realtime ADD TABLE public.device_purges;
+EXCEPTION WHEN duplicate_object THEN
+    NULL;
+END $$;
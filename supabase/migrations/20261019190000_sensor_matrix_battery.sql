@@ -0,0 +1,136 @@
+-- Battery in the sensor_matrix document
+--
+-- The multi-device Battery tab plotted `<device>_battery`, which the first
+-- version of sensor_matrix did not return. This adds a battery_level
+-- metric mapped the way the charts always drew it (Full 100, Ok 75,
+-- Low 25), resampled like the other metrics. gas_sight/resample.py is the
+-- reference implementation.
+
+CREATE OR REPLACE FUNCTION public.sensor_matrix(
+    device_ids text[],
+    window_start timestamptz,
+    window_end timestamptz,
+    step_seconds integer DEFAULT 60,
+    mode text DEFAULT 'locf'
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SET search_path = public
+AS $$
+DECLARE
+    buckets integer;
+    result jsonb;
+BEGIN
+    IF step_seconds IS NULL OR step_seconds <= 0 THEN
+        RAISE EXCEPTION 'step must be a positive number of seconds' USING ERRCODE = '22023';
+    END IF;
+    IF window_end <= window_start THEN
+        RAISE EXCEPTION 'window end must be after window start' USING ERRCODE = '22023';
+    END IF;
+    IF mode NOT IN ('locf', 'mean') THEN
+        RAISE EXCEPTION 'unknown mode %', mode USING ERRCODE = '22023';
+    END IF;
+
+    buckets := ceil(extract(epoch FROM window_end - window_start) / step_seconds)::integer;
+    IF buckets > 10000 THEN
+        RAISE EXCEPTION 'window needs % buckets (limit 10000); use a larger step', buckets
+            USING ERRCODE = '22023';
+    END IF;
+
+    WITH devices AS (
+        SELECT DISTINCT ON (d.device_id) d.device_id, d.ord
+        FROM unnest(device_ids) WITH ORDINALITY AS d(device_id, ord)
+        ORDER BY d.device_id, d.ord
+    ),
+    readings AS (
+        SELECT s.device_id,
+            floor(extract(epoch FROM s.created_at - window_start) / step_seconds)::integer AS bucket,
+            s.created_at, s.measurement, s.tank_level, s.connection_strength,
+            CASE s.battery WHEN 'Full' THEN 100 WHEN 'Ok' THEN 75 WHEN 'Low' THEN 25 END AS battery_level
+        FROM public.sensor_data s
+        WHERE s.device_id = ANY (device_ids)
+          AND s.created_at >= window_start
+          AND s.created_at < window_end
+        UNION ALL
+        -- Bucket -1 holds the last reading before the window (locf seed)
+        SELECT seed.*
+        FROM devices d
+        CROSS JOIN LATERAL (
+            SELECT s.device_id, -1, s.created_at, s.measurement, s.tank_level, s.connection_strength,
+                CASE s.battery WHEN 'Full' THEN 100 WHEN 'Ok' THEN 75 WHEN 'Low' THEN 25 END
+            FROM public.sensor_data s
+            WHERE s.device_id = d.device_id
+              AND s.created_at < window_start
+            ORDER BY s.created_at DESC
+            LIMIT 1
+        ) seed
+        WHERE mode = 'locf'
+    ),
+    per_bucket AS (
+        SELECT r.device_id, r.bucket,
+            CASE WHEN mode = 'mean' THEN round(avg(r.measurement), 2)
+                 ELSE (array_agg(r.measurement ORDER BY r.created_at DESC))[1] END AS measurement,
+            CASE WHEN mode = 'mean' THEN round(avg(r.tank_level), 2)
+                 ELSE (array_agg(r.tank_level ORDER BY r.created_at DESC))[1] END AS tank_level,
+            CASE WHEN mode = 'mean' THEN round(avg(r.connection_strength), 2)
+                 ELSE (array_agg(r.connection_strength ORDER BY r.created_at DESC))[1] END AS connection_strength,
+            CASE WHEN mode = 'mean' THEN round(avg(r.battery_level), 2)
+                 ELSE (array_agg(r.battery_level ORDER BY r.created_at DESC))[1] END AS battery_level
+        FROM readings r
+        GROUP BY r.device_id, r.bucket
+    ),
+    grid AS (
+        SELECT d.device_id, d.ord, b.bucket, p.measurement, p.tank_level, p.connection_strength,
+            p.battery_level,
+            -- Every observed bucket starts a new run; locf reads the run's first row
+            count(p.bucket) OVER (PARTITION BY d.device_id ORDER BY b.bucket) AS run
+        FROM devices d
+        CROSS JOIN generate_series(-1, buckets - 1) AS b(bucket)
+        LEFT JOIN per_bucket p ON p.device_id = d.device_id AND p.bucket = b.bucket
+    ),
+    filled AS (
+        SELECT g.ord, g.bucket,
+            CASE WHEN mode = 'mean' THEN g.measurement
+                 ELSE max(g.measurement) OVER (PARTITION BY g.device_id, g.run) END AS measurement,
+            CASE WHEN mode = 'mean' THEN g.tank_level
+                 ELSE max(g.tank_level) OVER (PARTITION BY g.device_id, g.run) END AS tank_level,
+            CASE WHEN mode = 'mean' THEN g.connection_strength
+                 ELSE max(g.connection_strength) OVER (PARTITION BY g.device_id, g.run) END AS connection_strength,
+            CASE WHEN mode = 'mean' THEN g.battery_level
+                 ELSE max(g.battery_level) OVER (PARTITION BY g.device_id, g.run) END AS battery_level
+        FROM grid g
+        WHERE g.run > 0 OR mode = 'mean'
+    ),
+    matrix_rows AS (
+        SELECT b.bucket,
+            jsonb_agg(to_jsonb(f.measurement) ORDER BY d.ord) AS measurement,
+            jsonb_agg(to_jsonb(f.tank_level) ORDER BY d.ord) AS tank_level,
+            jsonb_agg(to_jsonb(f.connection_strength) ORDER BY d.ord) AS connection_strength,
+            jsonb_agg(to_jsonb(f.battery_level) ORDER BY d.ord) AS battery_level
+        FROM generate_series(0, buckets - 1) AS b(bucket)
+        CROSS JOIN devices d
+        LEFT JOIN filled f ON f.ord = d.ord AND f.bucket = b.bucket
+        GROUP BY b.bucket
+    )
+    SELECT jsonb_build_object(
+        't0', window_start,
+        'step', step_seconds,
+        'mode', mode,
+        'devices', coalesce((SELECT jsonb_agg(device_id ORDER BY ord) FROM devices), '[]'::jsonb),
+        'values', jsonb_build_object(
+            'measurement', coalesce(jsonb_agg(m.measurement ORDER BY m.bucket), '[]'::jsonb),
+            'tank_level', coalesce(jsonb_agg(m.tank_level ORDER BY m.bucket), '[]'::jsonb),
+            'connection_strength', coalesce(jsonb_agg(m.connection_strength ORDER BY m.bucket), '[]'::jsonb),
+            'battery_level', coalesce(jsonb_agg(m.battery_level ORDER BY m.bucket), '[]'::jsonb)
+        )
+    )
+    INTO result
+    FROM matrix_rows m;
+
+    RETURN result;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.sensor_matrix(text[], timestamptz, timestamptz, integer, text)
+    TO anon, authenticated;
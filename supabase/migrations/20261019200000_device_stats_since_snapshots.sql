@@ -0,0 +1,113 @@
+-- device_stats_since: do not skip changes that commit late
+--
+-- Versions come from nextval() when the writing statement runs, not when
+-- its transaction commits. A batch that takes version 10 and commits after
+-- a batch with version 11 was never shipped to a client that had already
+-- read etag 11. Versions also missed UPDATEs of sensor_data.
+--
+-- Each device_stats_versions row now records the transaction that last
+-- bumped it (txid), and the etag carries the reader's snapshot instead of
+-- max(version):
+--   "<bucket>.<pg_current_snapshot()>", e.g. "5870112.1200:1204:1201"
+-- A device has changed since an etag when its txid is not visible in that
+-- snapshot: either it committed later, or it was still in flight then.
+-- Only rows with txid >= the snapshot's xmin can qualify, which the txid
+-- index narrows to the few recent writers. Etags in the old
+-- "<version>.<bucket>" form get the full list once.
+
+ALTER TABLE public.device_stats_versions
+  ADD COLUMN IF NOT EXISTS txid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS device_stats_versions_txid_idx
+  ON public.device_stats_versions (txid);
+
+-- TG_ARGV[0] is the device id column of the transition tables; UPDATE
+-- triggers also pass the old rows as `previous`, since a reading or device
+-- can change ids
+CREATE OR REPLACE FUNCTION public.bump_device_stats_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    ids text := format('SELECT %I AS device_id FROM changed', TG_ARGV[0]);
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        ids := ids || format(' UNION SELECT %I FROM previous', TG_ARGV[0]);
+    END IF;
+    EXECUTE format(
+        'INSERT INTO public.device_stats_versions (device_id, version, txid)
+         SELECT DISTINCT device_id, $1, pg_current_xact_id() FROM (%s) ids WHERE device_id IS NOT NULL
+         ON CONFLICT (device_id) DO UPDATE SET version = excluded.version, txid = excluded.txid',
+        ids
+    ) USING nextval('public.device_stats_version_seq');
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS device_stats_version_devices_update ON public.devices;
+CREATE TRIGGER device_stats_version_devices_update
+  AFTER UPDATE ON public.devices REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('id');
+
+DROP TRIGGER IF EXISTS device_stats_version_sensor_data_update ON public.sensor_data;
+CREATE TRIGGER device_stats_version_sensor_data_update
+  AFTER UPDATE ON public.sensor_data REFERENCING OLD TABLE AS previous NEW TABLE AS changed
+  FOR EACH STATEMENT EXECUTE FUNCTION public.bump_device_stats_version('device_id');
+
+CREATE OR REPLACE FUNCTION public.device_stats_since(since text DEFAULT NULL)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    bucket bigint := floor(extract(epoch FROM now()) / 300)::bigint;
+    etag text := bucket || '.' || pg_current_snapshot()::text;
+    since_snapshot pg_snapshot;
+    changed text[];
+BEGIN
+    IF since ~ '^[0-9]+\.[0-9]+:[0-9]+:[0-9,]*$' AND split_part(since, '.', 1)::bigint = bucket THEN
+        since_snapshot := substr(since, strpos(since, '.') + 1)::pg_snapshot;
+    END IF;
+
+    IF since_snapshot IS NULL THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', false, 'full', true,
+            'devices', coalesce(
+                (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+                 FROM public.device_stats s),
+                '[]'::jsonb),
+            'removed', '[]'::jsonb
+        );
+    END IF;
+
+    SELECT coalesce(array_agg(v.device_id), '{}') INTO changed
+    FROM public.device_stats_versions v
+    WHERE v.txid >= pg_snapshot_xmin(since_snapshot)
+      AND NOT pg_visible_in_snapshot(v.txid, since_snapshot);
+
+    IF cardinality(changed) = 0 THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', true, 'full', false,
+            'devices', '[]'::jsonb, 'removed', '[]'::jsonb
+        );
+    END IF;
+
+    RETURN jsonb_build_object(
+        'etag', etag, 'not_modified', false, 'full', false,
+        'devices', coalesce(
+            (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+             FROM public.device_stats s
+             WHERE s.id = ANY (changed)),
+            '[]'::jsonb),
+        'removed', coalesce(
+            (SELECT jsonb_agg(c.device_id)
+             FROM unnest(changed) AS c(device_id)
+             WHERE NOT EXISTS (SELECT 1 FROM public.devices d WHERE d.id = c.device_id)),
+            '[]'::jsonb)
+    );
+END;
+$$;
@@ -0,0 +1,26 @@
+-- replication_lag: unknown when the replica is not streaming
+--
+-- A replica whose WAL receiver is down (primary unreachable, slot lost,
+-- restarting) has replayed everything it received, so replication_lag()
+-- reported 0 and gas_sight.replicas kept routing reads to it while it fell
+-- further behind. It now returns NULL unless pg_stat_wal_receiver shows a
+-- streaming connection; the client treats NULL as "skip this replica".
+-- The function is SECURITY DEFINER because pg_stat_wal_receiver hides its
+-- status column from roles without pg_read_all_stats.
+
+CREATE OR REPLACE FUNCTION public.replication_lag()
+RETURNS double precision
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = pg_catalog
+AS $$
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::double precision;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.replication_lag() TO anon, authenticated;
@@ -0,0 +1,16 @@
+-- Leases on device_purges
+--
+-- The purge job read the open purges and then marked each one running, so
+-- two workers watching the queue could both run the same purge. A worker
+-- now claims a row with a single conditional UPDATE ... RETURNING
+--
+--   UPDATE device_purges SET status = 'running', lease_until = now() + 5 min
+--   WHERE id = ... AND finished_at IS NULL
+--     AND (lease_until IS NULL OR lease_until < now())
+--
+-- and only works on the purge when a row comes back. The lease is renewed
+-- after every batch and cleared when the purge finishes or fails, so the
+-- purge of a worker that died is taken over once its lease runs out.
+
+ALTER TABLE public.device_purges
+  ADD COLUMN IF NOT EXISTS lease_until timestamp with time zone;
@@ -0,0 +1,134 @@
+-- Synthetic devices
+--
+-- The latency probe (gas_sight.probe) writes a reading for its canary
+-- device every 30 seconds, and the canary showed up in the device list,
+-- the fleet statistics and fleet-wide exports. devices.synthetic marks
+-- such devices:
+--
+-- * device_stats exposes the flag (as its last column) so the probe can
+--   still time its own row, and the dashboard filters on it
+-- * device_stats_since leaves synthetic devices out of what it ships, and
+--   their readings do not count as changes: a probe reading leaves every
+--   dashboard's etag not modified
+-- * gas_sight.export skips them unless they are asked for by id
+--
+-- Rollups of a synthetic device are kept like any other device's; they
+-- are only read when that device is asked for.
+
+ALTER TABLE public.devices
+  ADD COLUMN IF NOT EXISTS synthetic boolean NOT NULL DEFAULT false;
+
+UPDATE public.devices SET synthetic = true WHERE id = 'latency_probe_canary';
+
+-- Same definition as before, plus the flag
+CREATE OR REPLACE VIEW public.device_stats AS
+SELECT d.id,
+    d.name,
+    d.title,
+    d.location,
+    d.color,
+    d.enabled,
+    d.is_connected,
+    d.last_connected,
+    d.mac_address,
+    d.service_uuid,
+    d.data_characteristic_uuid,
+    d.rssi,
+    d.confidence_score,
+    d.last_discovered,
+    d.connection_attempts,
+    d.total_packets_received,
+    d.created_at AS device_created_at,
+    d.updated_at AS device_updated_at,
+    latest_data.tank_level AS latest_tank_level,
+    latest_data.measurement AS latest_measurement,
+    latest_data.battery AS latest_battery,
+    latest_data.connection_strength AS latest_connection_strength,
+    latest_data.created_at AS latest_reading_at,
+    latest_data.tank_level_unit,
+    latest_data.measurement_unit,
+    COALESCE(stats.total_readings, 0::bigint) AS total_readings,
+    COALESCE(stats.readings_last_24h, 0::bigint) AS readings_last_24h,
+    COALESCE(stats.avg_measurement_24h, 0::numeric) AS avg_measurement_24h,
+    d.synthetic
+FROM devices d
+LEFT JOIN LATERAL (
+    SELECT sd.tank_level,
+        sd.measurement,
+        sd.battery,
+        sd.connection_strength,
+        sd.created_at,
+        sd.tank_level_unit,
+        sd.measurement_unit
+    FROM sensor_data sd
+    WHERE sd.device_id = d.id
+    ORDER BY sd.created_at DESC
+    LIMIT 1
+) latest_data ON true
+LEFT JOIN LATERAL (
+    SELECT count(*) AS total_readings,
+        count(*) FILTER (WHERE sd.created_at >= now() - interval '24 hours') AS readings_last_24h,
+        avg(sd.measurement) FILTER (WHERE sd.created_at >= now() - interval '24 hours') AS avg_measurement_24h
+    FROM sensor_data sd
+    WHERE sd.device_id = d.id
+) stats ON true;
+
+CREATE OR REPLACE FUNCTION public.device_stats_since(since text DEFAULT NULL)
+RETURNS jsonb
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    bucket bigint := floor(extract(epoch FROM now()) / 300)::bigint;
+    etag text := bucket || '.' || pg_current_snapshot()::text;
+    since_snapshot pg_snapshot;
+    changed text[];
+BEGIN
+    IF since ~ '^[0-9]+\.[0-9]+:[0-9]+:[0-9,]*$' AND split_part(since, '.', 1)::bigint = bucket THEN
+        since_snapshot := substr(since, strpos(since, '.') + 1)::pg_snapshot;
+    END IF;
+
+    IF since_snapshot IS NULL THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', false, 'full', true,
+            'devices', coalesce(
+                (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+                 FROM public.device_stats s
+                 WHERE NOT s.synthetic),
+                '[]'::jsonb),
+            'removed', '[]'::jsonb
+        );
+    END IF;
+
+    -- deleted devices have no row left and still count, for `removed`
+    SELECT coalesce(array_agg(v.device_id), '{}') INTO changed
+    FROM public.device_stats_versions v
+    LEFT JOIN public.devices d ON d.id = v.device_id
+    WHERE v.txid >= pg_snapshot_xmin(since_snapshot)
+      AND NOT pg_visible_in_snapshot(v.txid, since_snapshot)
+      AND NOT coalesce(d.synthetic, false);
+
+    IF cardinality(changed) = 0 THEN
+        RETURN jsonb_build_object(
+            'etag', etag, 'not_modified', true, 'full', false,
+            'devices', '[]'::jsonb, 'removed', '[]'::jsonb
+        );
+    END IF;
+
+    RETURN jsonb_build_object(
+        'etag', etag, 'not_modified', false, 'full', false,
+        'devices', coalesce(
+            (SELECT jsonb_agg(to_jsonb(s) ORDER BY s.device_created_at DESC)
+             FROM public.device_stats s
+             WHERE s.id = ANY (changed)),
+            '[]'::jsonb),
+        'removed', coalesce(
+            (SELECT jsonb_agg(c.device_id)
+             FROM unnest(changed) AS c(device_id)
+             WHERE NOT EXISTS (SELECT 1 FROM public.devices d WHERE d.id = c.device_id)),
+            '[]'::jsonb)
+    );
+END;
+$$;
@@ -0,0 +1,76 @@
+"""
+Shared fixtures: every test runs against an in-process copy of the schema
+inside a savepoint that is rolled back afterwards, so tests never clean up
+after themselves, never see each other's rows and can run in parallel
+(`pytest -n auto` with pytest-xdist gives each worker its own database).
+"""
+import pytest
+
+from gas_sight.local import LocalDatabase, LocalTransport
+from gas_sight.rest import RestClient
+
+SERVICE_UUID = "0000fff0-0000-1000-8000-00805f9b34fb"
+DATA_CHARACTERISTIC_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
+
+
+@pytest.fixture(scope="session")
+def local_db():
+    return LocalDatabase()
+
+
+@pytest.fixture
+def db(local_db):
+    with local_db.rollback():
+        yield local_db
+
+
+@pytest.fixture
+def client(db):
+    return RestClient(transport=LocalTransport(db))
+
+
+@pytest.fixture
+def make_device(client):
+    """Insert a device through the REST layer and return the stored row"""
+    counter = iter(range(1, 256))
+
+    def make(device_id="device_main_tank_001", **overrides):
+        n = next(counter)
+        device = {
+            "id": device_id,
+            "name": f"@TNK{n:05d}",
+            "mac_address": f"C5:BA:A0:16:CF:{n:02X}",
+            "title": f"Gas Tank #{n}",
+            "location": "Warehouse A - Section 1",
+            "enabled": True,
+            "color": "#22c55e",
+            "service_uuid": SERVICE_UUID,
+            "data_characteristic_uuid": DATA_CHARACTERISTIC_UUID,
+            **overrides,
+        }
+        return client.insert("devices", device)[0]
+
+    return make
+
+
+@pytest.fixture
+def make_reading(client):
+    """Insert one sensor_data row through the REST layer"""
+
+    def make(device_id="device_main_tank_001", **overrides):
+        reading = {
+            "device_id": device_id,
+            "title_name": "Main Gas Tank #1",
+            "tank_level": 68.5,
+            "tank_level_unit": "cm",
+            "updated_refresh": "2 minutes ago",
+            "battery": "Full",
+            "connection_strength": 95,
+            "measurement": 82.3,
+            "measurement_unit": "%",
+            "technical_data": {"source": "test_suite"},
+            **overrides,
+        }
+        return client.insert("sensor_data", reading)[0]
+
+    return make
@@ -0,0 +1,132 @@
+"""
+Incremental alert rules
+"""
+import pytest
+
+from gas_sight.alerts import AlertEngine, AlertStore, Rule
+from gas_sight.ingest import Deduplicator, SensorWriter
+from gas_sight.metrics import MetricsRegistry
+
+
+def _reading(device_id, minute=0, **values):
+    return {
+        "device_id": device_id, "created_at": f"2025-08-14T10:{minute:02d}:00+00:00",
+        "measurement": 50.0, "tank_level": 60.0, "connection_strength": 80, "battery": "Ok",
+        **values,
+    }
+
+
+def _engine(rules, locations=None, store=None):
+    return AlertEngine(rules, locations, store=store, registry=MetricsRegistry())
+
+
+def test_hysteresis_fires_once_and_resolves_past_clear():
+    engine = _engine([Rule("low_gas", "measurement", "below", 20, clear=25)])
+
+    states = []
+    for level in (30, 19, 15, 21, 24, 26, 18):
+        states.append([a.state for a in engine.process(_reading("tank_a", measurement=level))])
+
+    assert states == [[], ["firing"], [], [], [], ["resolved"], ["firing"]]
+
+
+def test_rules_only_reach_their_devices_and_locations():
+    engine = _engine(
+        [
+            Rule("a_only", "tank_level", "below", 10, device_id="tank_a"),
+            Rule("warehouse", "connection_strength", "below", 30, location="Warehouse A"),
+            Rule("battery", "battery", "equals", "Low"),
+        ],
+        locations={"tank_a": "Warehouse A", "tank_b": "Warehouse B"},
+    )
+
+    assert len(engine.rules_for("tank_a")[0]) == 3
+    assert len(engine.rules_for("tank_b")[0]) == 1
+
+    fired = engine.process(_reading("tank_b", tank_level=5, connection_strength=10, battery="Low"))
+    assert [a.rule.id for a in fired] == ["battery"]
+
+
+def test_rate_rule_uses_change_per_hour():
+    engine = _engine([Rule("leak", "measurement", "below", -10, kind="rate")])
+
+    assert engine.process(_reading("tank_a", minute=0, measurement=80)) == []
+    assert engine.process(_reading("tank_a", minute=30, measurement=78)) == []
+    fired = engine.process(_reading("tank_a", minute=45, measurement=72))
+
+    assert [a.state for a in fired] == ["firing"]
+    assert fired[0].value == pytest.approx(-24.0)
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        Rule("bad", "pressure", "below", 1)
+    with pytest.raises(ValueError):
+        Rule("bad", "battery", "equals", "Low", kind="rate")
+    with pytest.raises(ValueError):
+        Rule("bad", "battery", "below", 50)
+    with pytest.raises(ValueError):
+        Rule("bad", "measurement", "below", "20")
+    with pytest.raises(ValueError):
+        Rule("bad", "measurement", "below", 20, clear="Ok")
+
+
+def test_battery_compares_by_level_and_missing_values_are_skipped():
+    engine = _engine([Rule("battery", "battery", "below", "Ok", clear="Full"),
+                      Rule("low_gas", "measurement", "below", 20)])
+
+    assert engine.process(_reading("tank_a", battery="Full", measurement=None)) == []
+    assert [a.rule.id for a in engine.process(_reading("tank_a", battery="Low"))] == ["battery"]
+    assert engine.process(_reading("tank_a", battery="Ok")) == []
+    assert engine.process(_reading("tank_a", battery=None)) == []
+    resolved = engine.process(_reading("tank_a", battery="Full"))
+    assert [(a.state, a.value) for a in resolved] == [("resolved", "Full")]
+
+
+def test_alert_state_is_persisted_once_and_survives_restart(client, make_device):
+    make_device("tank_a", location="Warehouse A")
+    rule = Rule("low_gas", "measurement", "below", 20, clear=25, location="Warehouse A")
+    client.insert("alert_rules", rule.to_row(), returning=False)
+    store = AlertStore(client)
+    engine = AlertEngine.from_store(store, registry=MetricsRegistry())
+
+    engine.process_many([_reading("tank_a", 0, measurement=15), _reading("tank_a", 1, measurement=12)])
+    rows = client.select("alerts", "*")
+    assert [(r["rule_id"], r["state"], r["value"]) for r in rows] == [("low_gas", "firing", 15)]
+
+    restarted = AlertEngine.from_store(store, registry=MetricsRegistry())
+    assert restarted.process_many([_reading("tank_a", 2, measurement=10)]) == []
+    restarted.process_many([_reading("tank_a", 3, measurement=40)])
+
+    row = client.select("alerts", "*")[0]
+    assert row["state"] == "resolved"
+    assert row["fired_at"].startswith("2025-08-14T10:00:00")
+    assert row["resolved_at"].startswith("2025-08-14T10:03:00")
+
+
+def test_sensor_writer_feeds_the_engine(client, make_device):
+    make_device("tank_a")
+    engine = _engine([Rule("weak", "connection_strength", "below", 20)])
+    writer = SensorWriter(client, Deduplicator(client, registry=MetricsRegistry()), alerts=engine)
+
+    writer.write([{**_reading("tank_a", connection_strength=10), "title_name": "A",
+                   "updated_refresh": "now"}])
+
+    assert [a.rule.id for a in engine.active()] == ["weak"]
+
+
+def test_readings_dropped_as_conflicts_do_not_alert(client, make_device):
+    make_device("tank_a")
+    engine = _engine([Rule("weak", "connection_strength", "below", 20)])
+
+    def reading(strength):
+        return {**_reading("tank_a", connection_strength=strength), "title_name": "A",
+                "updated_refresh": "now", "technical_data": {"_technical": {"packet_number": 7}}}
+
+    SensorWriter(client, Deduplicator(registry=MetricsRegistry())).write([reading(50)])
+    # Another gateway relays the same packet; the unique index drops it
+    writer = SensorWriter(client, Deduplicator(registry=MetricsRegistry()), alerts=engine)
+    result = writer.write([reading(10)])
+
+    assert result.conflicts == 1
+    assert engine.active() == []
@@ -0,0 +1,145 @@
+"""
+Bulk backfill of logged readings
+"""
+import csv
+from datetime import timedelta
+
+import pytest
+
+from gas_sight.backfill import BACKFILL_COLUMNS, MERGE_SQL, backfill
+
+
+def _row(device_id, created_at, packet, measurement=50.0):
+    return {
+        "device_id": device_id,
+        "created_at": created_at,
+        "tank_level": 40.0,
+        "battery": "Ok",
+        "connection_strength": 70,
+        "measurement": measurement,
+        "technical_data": f'{{"_technical": {{"packet_number": {packet}}}}}',
+    }
+
+
+@pytest.fixture
+def write_csv(tmp_path):
+    def write(rows):
+        path = tmp_path / "logger.csv"
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=[c for c in BACKFILL_COLUMNS if c in rows[0]])
+            writer.writeheader()
+            writer.writerows(rows)
+        return str(path)
+
+    return write
+
+
+def test_retransmissions_are_dropped(client, make_device, write_csv):
+    make_device("tank_a", title="Tank A")
+    path = write_csv([
+        _row("tank_a", "2025-08-14T10:00:00Z", 1),
+        _row("tank_a", "2025-08-14T10:00:02Z", 1),
+        _row("tank_a", "2025-08-14T10:01:00Z", 2),
+    ])
+
+    result = backfill(path, client=client)
+
+    assert (result.received, result.inserted, result.duplicates) == (3, 2, 1)
+    rows = client.select("sensor_data", "packet_number,title_name,updated_refresh", order="created_at")
+    assert rows == [
+        {"packet_number": 1, "title_name": "Tank A", "updated_refresh": "backfill"},
+        {"packet_number": 2, "title_name": "Tank A", "updated_refresh": "backfill"},
+    ]
+
+
+def test_packet_numbers_may_wrap_outside_the_window(client, make_device, write_csv):
+    make_device("tank_a")
+    path = write_csv([
+        _row("tank_a", "2025-08-14T10:00:00Z", 7),
+        _row("tank_a", "2025-08-15T10:00:00Z", 7),
+    ])
+
+    result = backfill(path, client=client, window=timedelta(minutes=30))
+
+    assert result.inserted == 2
+
+
+def test_rows_already_stored_are_duplicates(client, make_device, make_reading, write_csv):
+    make_device("tank_a")
+    make_reading("tank_a", created_at="2025-08-14T10:00:00Z",
+                 technical_data={"_technical": {"packet_number": 3}})
+    path = write_csv([
+        _row("tank_a", "2025-08-14T10:00:05Z", 3),
+        _row("tank_a", "2025-08-14T10:00:10Z", 4),
+    ])
+
+    result = backfill(path, client=client, chunk_size=1)
+
+    assert (result.inserted, result.duplicates) == (1, 1)
+
+
+def test_unknown_devices_are_rejected(client, make_device, write_csv):
+    make_device("tank_a")
+    path = write_csv([_row("tank_a", "2025-08-14T10:00:00Z", 1), _row("ghost", "2025-08-14T10:00:00Z", 1)])
+
+    result = backfill(path, client=client)
+
+    assert (result.inserted, result.rejected) == (1, 1)
+
+
+def test_quiet_backfill_is_summarised_in_one_event(client, make_device, write_csv):
+    make_device("tank_a")
+    make_device("tank_b")
+    path = write_csv([
+        _row("tank_b", "2025-08-14T10:00:00Z", 1),
+        _row("tank_a", "2025-08-14T11:00:00Z", 1),
+    ])
+
+    result = backfill(path, client=client, source="logger-7")
+
+    stamped = client.select("sensor_data", "backfill_batch_id")
+    assert {row["backfill_batch_id"] for row in stamped} == {result.batch_id}
+    [summary] = client.select("backfill_batches")
+    assert summary["source"] == "logger-7"
+    assert summary["device_ids"] == ["tank_a", "tank_b"]
+    assert summary["rows_inserted"] == 2
+    assert summary["first_reading_at"].startswith("2025-08-14T10:00:00")
+
+
+def test_broadcast_backfill_leaves_rows_published(client, make_device, write_csv):
+    make_device("tank_a")
+    path = write_csv([_row("tank_a", "2025-08-14T10:00:00Z", 1)])
+
+    backfill(path, client=client, quiet=False)
+
+    assert client.select("sensor_data", "backfill_batch_id") == [{"backfill_batch_id": None}]
+
+
+def test_rows_breaking_checks_are_rejected_not_fatal(client, make_device, write_csv):
+    make_device("tank_a")
+    bad_battery = {**_row("tank_a", "2025-08-14T10:00:00Z", 1), "battery": "Empty"}
+    bad_signal = {**_row("tank_a", "2025-08-14T10:01:00Z", 2), "connection_strength": 140}
+    path = write_csv([bad_battery, bad_signal, _row("tank_a", "2025-08-14T10:02:00Z", 3)])
+
+    result = backfill(path, client=client)
+
+    assert (result.received, result.inserted, result.rejected, result.duplicates) == (3, 1, 2, 0)
+
+
+def test_repeats_are_measured_from_the_last_kept_packet(client, make_device, write_csv):
+    make_device("tank_a")
+    path = write_csv([
+        _row("tank_a", "2025-08-14T10:00:00Z", 5),
+        _row("tank_a", "2025-08-14T10:40:00Z", 5),
+        _row("tank_a", "2025-08-14T11:20:00Z", 5),
+    ])
+
+    result = backfill(path, client=client)
+
+    assert (result.inserted, result.duplicates) == (2, 1)
+
+
+def test_merge_dedupes_inside_one_statement():
+    assert "with recursive" in MERGE_SQL and "kept_at" in MERGE_SQL
+    assert "not exists" in MERGE_SQL
+    assert "s.battery in ('Full', 'Ok', 'Low')" in MERGE_SQL
@@ -0,0 +1,135 @@
+"""
+Query cache invalidated by row changes
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from gas_sight.cache import CachedClient, row_matches
+from gas_sight.changes import Change
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.postgrest import parse_query
+
+
+@pytest.fixture
+def cached(client, db):
+    cache = CachedClient(client, feed=db.changes, registry=MetricsRegistry())
+    yield cache
+    cache.close()
+
+
+def _filters(query):
+    return parse_query(query).filters
+
+
+def test_row_matching_is_exact_or_undecidable():
+    row = {"device_id": "tank_a", "measurement": 40.0, "created_at": "2025-08-14T10:00:00+00:00",
+           "battery": None}
+    assert [row_matches(f, row) for f in _filters(
+        "device_id=eq.tank_a&measurement=gt.30&created_at=lt.2025-08-14T11:00:00%2B00:00"
+        "&device_id=in.(tank_a,tank_b)&battery=is.null&measurement=not.eq.40"
+    )] == [True, True, True, True, True, False]
+    assert [row_matches(f, row) for f in _filters(
+        "title_name=eq.x&device_id=like.tank*&or=(measurement.lt.10,device_id.eq.tank_b)"
+        "&created_at=gte.yesterday"
+    )] == [None, None, False, None]
+
+
+def test_repeated_reads_hit_until_a_matching_change(cached, client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    make_reading("tank_a", created_at="2025-08-14T10:00:00+00:00")
+
+    def last_day(device_id):
+        return cached.select("sensor_data", "id,measurement",
+                             {"device_id": f"eq.{device_id}",
+                              "created_at": "gte.2025-08-14T00:00:00+00:00"},
+                             order="created_at.desc")
+
+    assert len(last_day("tank_a")) == 1
+    assert len(last_day("tank_a")) == 1
+    assert len(last_day("tank_b")) == 0
+    assert cached.lookups.value(relation="sensor_data", result="hit") == 1
+
+    # other device, and the same device outside the window: both entries survive
+    make_reading("tank_b", created_at="2025-08-13T10:00:00+00:00")
+    make_reading("tank_a", created_at="2025-08-13T10:00:00+00:00")
+    assert len(last_day("tank_a")) == 1
+    assert len(last_day("tank_b")) == 0
+    assert cached.lookups.value(relation="sensor_data", result="hit") == 3
+
+    make_reading("tank_a", created_at="2025-08-14T11:00:00+00:00")
+    assert len(last_day("tank_a")) == 2
+    assert cached.invalidations.value(relation="sensor_data", table="sensor_data") == 1
+
+
+def test_device_stats_follow_their_devices(cached, client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    stats_a = cached.select("device_stats", "id,total_readings", {"id": "eq.tank_a"})
+    assert stats_a[0]["total_readings"] == 0
+    assert len(cached.rpc("get_device_stats")) == 2
+
+    make_reading("tank_b")
+    assert cached.select("device_stats", "id,total_readings", {"id": "eq.tank_a"}) == stats_a
+    assert cached.lookups.value(relation="device_stats", result="hit") == 1
+    assert cached.invalidations.value(relation="device_stats", table="sensor_data") == 1  # the RPC
+
+    cached.update("devices", {"title": "Renamed"}, {"id": "eq.tank_a"})
+    assert cached.select("device_stats", "title", {"id": "eq.tank_a"})[0]["title"] == "Renamed"
+
+
+def test_writes_through_the_cache_and_gaps(client, make_device):
+    make_device("tank_a")
+    cached = CachedClient(client, registry=MetricsRegistry())
+    assert [d["id"] for d in cached.select("devices", "id")] == ["tank_a"]
+
+    cached.insert("devices", {**client.select("devices")[0], "id": "tank_b", "name": "@TNK09999",
+                              "mac_address": "C5:BA:A0:16:CF:99"})
+    assert [d["id"] for d in cached.select("devices", "id", order="id")] == ["tank_a", "tank_b"]
+
+    cached.on_change(Change("sensor_data", "INSERT", record={"device_id": "tank_a"}))
+    assert cached.lookups.value(relation="devices", result="hit") == 0
+    cached.select("devices", "id", order="id")
+    assert cached.lookups.value(relation="devices", result="hit") == 1
+    cached.clear()
+    cached.select("devices", "id", order="id")
+    assert cached.lookups.value(relation="devices", result="miss") == 3
+
+
+def test_lru_bounds(client, make_device):
+    make_device("tank_a")
+    cached = CachedClient(client, max_entries=2, registry=MetricsRegistry())
+    for column in ("id", "title", "id", "location", "title"):
+        cached.select("devices", column)
+    assert cached.lookups.value(relation="devices", result="hit") == 1
+    assert cached.evictions.value() == 2
+    assert cached.entries.value() == 2
+
+
+def test_device_stats_expire_as_readings_leave_the_day(client, db, make_device, make_reading):
+    make_device("tank_a")
+    start = time.time()
+    now = [start]
+    cache = CachedClient(client, feed=db.changes, registry=MetricsRegistry(), clock=lambda: now[0])
+    day = timedelta(hours=24)
+    leaving = datetime.fromtimestamp(start, timezone.utc) - day + timedelta(seconds=2)
+    make_reading("tank_a", created_at=(leaving - timedelta(hours=1)).isoformat())  # already out
+    make_reading("tank_a", created_at=leaving.isoformat())
+    make_reading("tank_a")
+    try:
+        def stats():
+            return cache.select("device_stats", "readings_last_24h", {"id": "eq.tank_a"})
+
+        assert stats() == [{"readings_last_24h": 2}]
+        now[0] = start + 1
+        stats()
+        assert cache.lookups.value(relation="device_stats", result="hit") == 1
+
+        now[0] = start + 3
+        stats()
+        assert cache.expirations.value(relation="device_stats") == 1
+        assert cache.lookups.value(relation="device_stats", result="miss") == 2
+    finally:
+        cache.close()
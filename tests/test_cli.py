@@ -0,0 +1,118 @@
+"""
+gas-sight command line
+"""
+import json
+import subprocess
+import sys
+
+import pytest
+
+from gas_sight import cli
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.probe import LatencyProbe
+
+
+def _run(capsys, client, *argv):
+    status = cli.main(["--json", *argv], client=client)
+    return status, json.loads(capsys.readouterr().out)
+
+
+def test_help_does_not_import_the_rest_client():
+    code = (
+        "import sys, gas_sight.cli as cli\n"
+        "cli.build_parser().format_help()\n"
+        "print(sorted(m for m in ('gas_sight.rest', 'urllib.request', 'http.server', 'sqlite3')"
+        " if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+
+def test_module_entry_point_prints_help():
+    out = subprocess.run([sys.executable, "-m", "gas_sight", "--help"], capture_output=True, text=True)
+    assert out.returncode == 0
+    assert "schema-check" in out.stdout
+
+
+def test_provision_is_idempotent(capsys, client):
+    status, first = _run(capsys, client, "provision")
+    assert status == 0
+    assert first["created"] == sorted(d["id"] for d in cli.TEST_DEVICES)
+    assert len(client.select("sensor_data", "id")) == 3
+
+    status, second = _run(capsys, client, "provision", "--no-readings")
+    assert status == 0
+    assert second["created"] == []
+    assert len(client.select("devices", "id")) == 3
+
+
+def test_verify_reports_counts_and_write_access(capsys, client, make_device, make_reading):
+    make_device("tank_a")
+    make_reading("tank_a")
+
+    status, report = _run(capsys, client, "verify", "--write")
+
+    assert status == 0
+    assert report["counts"] == {"devices": 1, "device_stats": 1, "sensor_data": 1, "comments": 0}
+    assert {c["name"] for c in report["checks"]} >= {"device_stats covers every device", "devices writable"}
+    assert client.select("devices", "id", {"id": f"eq.{cli.VERIFY_PROBE_ID}"}) == []
+
+
+def test_verify_counts_synthetic_devices(capsys, client):
+    _run(capsys, client, "provision", "--no-readings")
+    LatencyProbe(client, registry=MetricsRegistry()).ensure_device()
+
+    status, report = _run(capsys, client, "verify")
+    assert status == 0
+    assert report["counts"]["devices"] == report["counts"]["device_stats"] == 4
+
+
+def test_schema_check_flags_missing_columns(capsys, client):
+    status, report = _run(capsys, client, "schema-check")
+    assert status == 0
+
+    described = client.request("GET", "/rest/v1/").json()
+    del described["definitions"]["device_stats"]["properties"]["latest_reading_at"]
+
+    class _Stale:
+        def request(self, method, path, *args, **kwargs):
+            return type("R", (), {"json": lambda self: described})()
+
+    status, report = _run(capsys, _Stale(), "schema-check", "device_stats")
+    assert status == 1
+    check = next(c for c in report["checks"] if c["name"] == "device_stats")
+    assert check["missing"] == ["latest_reading_at"]
+
+
+def test_failures_set_the_exit_status(capsys):
+    class _Down:
+        def select_response(self, *args, **kwargs):
+            raise OSError("connection refused")
+
+        def rpc(self, *args, **kwargs):
+            raise OSError("connection refused")
+
+    status, report = _run(capsys, _Down(), "verify")
+
+    assert status == 1
+    assert report["ok"] is False
+    assert "connection refused" in report["checks"][0]["detail"]
+
+
+def test_bench_reports_percentiles(capsys, client):
+    status, report = _run(capsys, client, "bench", "-n", "3", "--query", "device_stats")
+    assert status == 0
+    assert report["timings"]["device_stats"]["requests"] == 3
+
+
+def test_global_options_are_not_dropped_by_passthrough_commands(capsys, tmp_path):
+    trace = tmp_path / "trace.jsonl"
+    trace.write_text("")
+
+    with pytest.raises(SystemExit) as exit:
+        cli.main(["--url", "https://example.supabase.co", "workload", str(trace)])
+    assert exit.value.code == 2
+    assert "--url must come after 'workload'" in capsys.readouterr().err
+
+    assert cli.main(["workload", str(trace), "--summary"]) == 0
+    assert json.loads(capsys.readouterr().out) == {}
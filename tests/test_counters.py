@@ -0,0 +1,79 @@
+"""
+Write-behind device counters
+"""
+import asyncio
+
+import pytest
+
+from gas_sight.counters import DeviceCounters
+from gas_sight.gateway import GatewayScheduler, ScaledClock, SimulatedRadio, load_devices
+from gas_sight.metrics import MetricsRegistry
+
+
+def _device(client, device_id):
+    return client.select("devices", "*", {"id": f"eq.{device_id}"})[0]
+
+
+def test_increments_are_flushed_in_one_batch(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    counters = DeviceCounters(client, registry=MetricsRegistry())
+    for _ in range(5):
+        counters.record("tank_a", packets=1, attempts=1, connected=True)
+    counters.record("tank_b", attempts=2, connected=False)
+
+    assert _device(client, "tank_a")["total_packets_received"] == 0
+    assert counters.flush() == 2
+
+    tank_a, tank_b = _device(client, "tank_a"), _device(client, "tank_b")
+    assert (tank_a["total_packets_received"], tank_a["connection_attempts"]) == (5, 5)
+    assert tank_a["is_connected"] is True
+    assert tank_a["last_connected"] is not None
+    assert (tank_b["connection_attempts"], tank_b["is_connected"]) == (2, False)
+    assert counters.flushes.value(result="ok") == 1
+
+
+def test_max_pending_bounds_unflushed_increments(client, make_device):
+    make_device("tank_a")
+    counters = DeviceCounters(client, interval=3600, max_pending=10, registry=MetricsRegistry())
+    for _ in range(25):
+        counters.record("tank_a", packets=1)
+
+    assert _device(client, "tank_a")["total_packets_received"] == 20
+    assert counters.pending.value() == 5
+
+
+class _Unreachable:
+    def rpc(self, name, args=None):
+        raise OSError("uplink down")
+
+
+def test_failed_flush_keeps_the_batch():
+    counters = DeviceCounters(_Unreachable(), registry=MetricsRegistry())
+    counters.record("tank_a", packets=3, connected=True)
+
+    with pytest.raises(OSError):
+        counters.flush()
+    counters.record("tank_a", packets=2)
+
+    assert counters._pending["tank_a"]["packets"] == 5
+    assert counters._pending["tank_a"]["is_connected"] is True
+    assert counters.flushes.value(result="failed") == 1
+
+
+def test_gateway_polls_do_not_write_device_rows(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    clock = ScaledClock(speedup=500)
+    registry = MetricsRegistry()
+    with DeviceCounters(client, registry=registry) as counters:
+        scheduler = GatewayScheduler(
+            load_devices(client), SimulatedRadio(clock, failure_rate=0, weak_failure_rate=0),
+            interval=10, counters=counters, clock=clock, registry=registry,
+        )
+        asyncio.run(scheduler.run(duration=60))
+        assert counters.flushes.value(result="ok") == 0
+
+    total = sum(_device(client, d)["total_packets_received"] for d in ("tank_a", "tank_b"))
+    assert total == scheduler.readings >= 8
+    assert counters.flushes.value(result="ok") == 1
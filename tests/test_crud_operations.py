@@ -0,0 +1,98 @@
+"""
+Insert / update / delete through the REST layer, verified via get_device_stats
+"""
+import pytest
+
+from gas_sight.rest import RestError
+
+
+def test_insert_returns_representation(make_device):
+    device = make_device("test_crud_device_001", title="CRUD Test Device", color="#ff6b6b")
+
+    assert device["id"] == "test_crud_device_001"
+    assert device["title"] == "CRUD Test Device"
+    assert device["connection_attempts"] == 0
+
+
+def test_update_device(client, make_device):
+    make_device()
+
+    rows = client.update(
+        "devices",
+        {"title": "Updated Main Gas Tank #1", "location": "Updated Location - Warehouse A"},
+        {"id": "eq.device_main_tank_001"},
+    )
+
+    assert len(rows) == 1
+    assert rows[0]["title"] == "Updated Main Gas Tank #1"
+    stats = client.rpc("get_device_stats")
+    assert [(d["title"], d["location"]) for d in stats] == [
+        ("Updated Main Gas Tank #1", "Updated Location - Warehouse A")
+    ]
+
+
+def test_delete_device(client, make_device):
+    make_device("test_simple_001")
+    make_device("device_main_tank_001")
+
+    deleted = client.delete("devices", {"id": "eq.test_simple_001"}, returning=True)
+
+    assert [row["id"] for row in deleted] == ["test_simple_001"]
+    assert [d["id"] for d in client.rpc("get_device_stats")] == ["device_main_tank_001"]
+
+
+def test_delete_cascades_to_readings_and_comments(client, make_device, make_reading):
+    make_device()
+    reading = make_reading()
+    client.insert("comments", {"sensor_data_id": reading["id"], "comment_text": "refilled"})
+
+    client.delete("devices", {"id": "eq.device_main_tank_001"})
+
+    assert client.select("sensor_data") == []
+    assert client.select("comments") == []
+
+
+def test_reading_for_unknown_device_is_rejected(make_reading):
+    with pytest.raises(RestError) as error:
+        make_reading("missing_device")
+
+    assert error.value.status == 409
+    assert error.value.code == "23503"
+
+
+@pytest.mark.parametrize("overrides", [
+    {"battery": "Empty"},
+    {"connection_strength": 101},
+    {"connection_strength": -1},
+])
+def test_sensor_data_check_constraints(make_device, make_reading, overrides):
+    make_device()
+
+    with pytest.raises(RestError) as error:
+        make_reading(**overrides)
+
+    assert error.value.status == 400
+    assert error.value.code == "23514"
+
+
+def test_failed_bulk_insert_writes_nothing(client, make_device):
+    make_device()
+    good = {
+        "device_id": "device_main_tank_001", "title_name": "Tank", "tank_level": 1,
+        "updated_refresh": "now", "battery": "Ok", "connection_strength": 50, "measurement": 1,
+    }
+
+    with pytest.raises(RestError):
+        client.insert("sensor_data", [good, {**good, "battery": "Broken"}])
+
+    assert client.select("sensor_data") == []
+
+
+def test_count_header(client, make_device):
+    for n in range(3):
+        make_device(f"device_{n}")
+
+    response = client.select_response("devices", "id", limit=2, count="exact")
+
+    assert len(response.json()) == 2
+    assert response.content_range == (0, 1, 3)
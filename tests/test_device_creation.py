@@ -0,0 +1,65 @@
+"""
+Device creation and the columns exposed by devices / device_stats
+"""
+import pytest
+
+from gas_sight.rest import RestError
+
+
+def test_created_device_has_timestamps(client, make_device):
+    make_device("test-column-check")
+
+    rows = client.select("devices", filters={"id": "eq.test-column-check"})
+
+    assert len(rows) == 1
+    assert rows[0]["created_at"]
+    assert rows[0]["updated_at"]
+    assert rows[0]["enabled"] is True
+    assert rows[0]["is_connected"] is False
+
+
+def test_device_stats_exposes_device_created_at(client, make_device):
+    device = make_device("test-column-check")
+
+    rows = client.select("device_stats", filters={"id": "eq.test-column-check"})
+
+    assert len(rows) == 1
+    assert rows[0]["device_created_at"] == device["created_at"]
+    assert rows[0]["total_readings"] == 0
+    assert rows[0]["latest_tank_level"] is None
+
+
+def test_device_stats_orders_by_device_created_at(client, make_device):
+    make_device("older", created_at="2025-08-01T00:00:00Z")
+    make_device("newer", created_at="2025-08-14T00:00:00Z")
+
+    rows = client.select("device_stats", "id", order="device_created_at.desc")
+
+    assert [row["id"] for row in rows] == ["newer", "older"]
+
+
+def test_device_stats_reports_latest_reading(client, make_device, make_reading):
+    make_device()
+    make_reading(measurement=10, created_at="2025-08-14T14:00:00Z")
+    make_reading(measurement=20, battery="Low", created_at="2025-08-14T14:30:00Z")
+
+    stats = client.select("device_stats", filters={"id": "eq.device_main_tank_001"})[0]
+
+    assert stats["total_readings"] == 2
+    assert stats["latest_measurement"] == 20
+    assert stats["latest_battery"] == "Low"
+
+
+def test_duplicate_mac_address_is_rejected(make_device):
+    make_device("first", mac_address="AA:BB:CC:DD:EE:01")
+
+    with pytest.raises(RestError) as error:
+        make_device("second", mac_address="AA:BB:CC:DD:EE:01")
+
+    assert error.value.status == 409
+    assert error.value.code == "23505"
+
+
+def test_each_test_starts_empty(client):
+    assert client.select("devices") == []
+    assert client.select("sensor_data") == []
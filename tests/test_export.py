@@ -0,0 +1,81 @@
+"""
+Streaming sensor_data export
+"""
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from gas_sight.export import copy_statement, export_sensor_data, iter_pages
+
+
+def _reading(device_id, created_at, measurement):
+    return {
+        "device_id": device_id, "title_name": device_id, "tank_level": 50,
+        "updated_refresh": "now", "battery": "Ok", "connection_strength": 80,
+        "measurement": measurement, "technical_data": {"packet": measurement},
+        "created_at": created_at,
+    }
+
+
+@pytest.fixture
+def history(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    rows = [_reading("tank_a", "2025-08-14T10:00:00Z", n) for n in range(5)]
+    rows += [_reading("tank_b", f"2025-08-14T1{n}:30:00Z", 100 + n) for n in range(3)]
+    client.insert("sensor_data", rows)
+
+
+def test_pages_walk_ties_on_created_at(client, history):
+    pages = list(iter_pages(client, page_size=2))
+
+    ids = [row["id"] for page in pages for row in page]
+    assert len(ids) == 8
+    assert len(set(ids)) == 8
+    assert max(len(page) for page in pages) == 2
+
+
+def test_csv_gzip_export(client, history):
+    out = io.BytesIO()
+
+    count = export_sensor_data(out, ["tank_b"], client=client, page_size=2)
+
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(out.getvalue()).decode())))
+    assert count == 3
+    assert [float(r["measurement"]) for r in rows] == [100, 101, 102]
+    assert json.loads(rows[0]["technical_data"]) == {"packet": 100}
+
+
+def test_ndjson_export_with_time_range(client, history):
+    out = io.BytesIO()
+
+    count = export_sensor_data(
+        out, start="2025-08-14T11:00:00Z", end="2025-08-14T12:00:00Z",
+        fmt="ndjson", compression="none", client=client,
+    )
+
+    lines = [json.loads(line) for line in out.getvalue().decode().splitlines()]
+    assert count == 1
+    assert lines[0]["device_id"] == "tank_b"
+    assert lines[0]["measurement"] == 101
+
+
+def test_zstd_export(client, history):
+    zstandard = pytest.importorskip("zstandard")
+    out = io.BytesIO()
+
+    export_sensor_data(out, fmt="ndjson", compression="zstd", client=client)
+
+    data = zstandard.ZstdDecompressor().decompressobj().decompress(out.getvalue())
+    assert len(data.decode().splitlines()) == 8
+
+
+def test_copy_statement_streams_server_side():
+    statement = copy_statement("ndjson")
+
+    assert statement.startswith("copy (select row_to_json(t)")
+    assert "to stdout" in statement
+    assert "order by created_at, id" in statement
@@ -0,0 +1,75 @@
+"""
+Conditional device_stats refreshes
+"""
+from gas_sight.fleet import FleetStats, make_etag, parse_etag
+from gas_sight.metrics import MetricsRegistry
+
+
+def _fleet(client):
+    return FleetStats(client, registry=MetricsRegistry())
+
+
+def test_unchanged_fleet_is_not_modified(client, make_device):
+    make_device("tank_a")
+    fleet = _fleet(client)
+
+    assert fleet.refresh() is True
+    assert fleet.refresh() is False
+
+    assert [d["id"] for d in fleet.devices()] == ["tank_a"]
+    assert fleet.refreshes.value(result="full") == 1
+    assert fleet.refreshes.value(result="not_modified") == 1
+
+
+def test_only_changed_devices_are_shipped(client, make_device, make_reading):
+    for device_id in ("tank_a", "tank_b", "tank_c"):
+        make_device(device_id)
+    fleet = _fleet(client)
+    fleet.refresh()
+
+    make_reading("tank_b", tank_level=12.5)
+    result = client.rpc("device_stats_since", {"since": fleet.etag})
+    assert [row["id"] for row in result["devices"]] == ["tank_b"]
+    assert result["full"] is False
+
+    fleet.refresh()
+    assert fleet.get("tank_b")["latest_tank_level"] == 12.5
+    assert fleet.get("tank_b")["total_readings"] == 1
+    assert fleet.refreshes.value(result="diff") == 1
+
+
+def test_corrected_readings_are_shipped(client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    reading = make_reading("tank_a", tank_level=30.0)
+    fleet = _fleet(client)
+    fleet.refresh()
+
+    client.update("sensor_data", {"tank_level": 31.0}, {"id": f"eq.{reading['id']}"})
+    result = client.rpc("device_stats_since", {"since": fleet.etag})
+
+    assert [row["id"] for row in result["devices"]] == ["tank_a"]
+    assert result["devices"][0]["latest_tank_level"] == 31.0
+
+
+def test_deleted_devices_are_removed(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    fleet = _fleet(client)
+    fleet.refresh()
+
+    client.delete("devices", {"id": "eq.tank_a"})
+    fleet.refresh()
+
+    assert [d["id"] for d in fleet.devices()] == ["tank_b"]
+
+
+def test_new_time_bucket_or_foreign_token_returns_everything(client, make_device):
+    make_device("tank_a")
+    version, bucket = parse_etag(make_etag(7))
+    stale = f"{version}.{bucket - 1}"
+
+    for since in (stale, "not-an-etag", None):
+        result = client.rpc("device_stats_since", {"since": since})
+        assert result["full"] is True
+        assert [row["id"] for row in result["devices"]] == ["tank_a"]
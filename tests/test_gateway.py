@@ -0,0 +1,97 @@
+"""
+Gateway scheduling over a simulated radio
+"""
+import asyncio
+import time
+
+from gas_sight.gateway import (
+    GatewayDevice, GatewayScheduler, ScaledClock, SimulatedRadio, load_devices,
+)
+from gas_sight.ingest import Deduplicator, SensorWriter
+from gas_sight.metrics import MetricsRegistry
+
+
+def _scheduler(devices, failure_rate=0.0, **kwargs):
+    clock = ScaledClock(speedup=500)
+    radio = SimulatedRadio(clock, connect_time=(1.0, 1.0), read_time=0.0,
+                           failure_rate=failure_rate, weak_failure_rate=failure_rate, seed=1)
+    scheduler = GatewayScheduler(devices, radio, clock=clock, registry=MetricsRegistry(), **kwargs)
+    return scheduler, radio
+
+
+def test_priority_prefers_stale_then_strong_devices():
+    scheduler, _ = _scheduler([
+        GatewayDevice("fresh", rssi=-50, last_read=95.0),
+        GatewayDevice("stale_weak", rssi=-90, last_read=10.0),
+        GatewayDevice("stale_strong", rssi=-55, last_read=10.0),
+    ])
+
+    assert scheduler.next_device(100.0).id == "stale_strong"
+
+
+def test_slots_bound_concurrency_and_every_device_is_polled():
+    devices = [GatewayDevice(f"tank_{n}", rssi=-60 - n) for n in range(10)]
+    readings = []
+    scheduler, radio = _scheduler(devices, slots=3, interval=60, on_reading=readings.append)
+
+    asyncio.run(scheduler.run(duration=90))
+
+    assert radio.max_active == 3
+    assert {r["device_id"] for r in readings} == {d.id for d in devices}
+    assert 20 <= scheduler.readings <= 30
+    assert readings[0]["technical_data"]["_technical"]["source"] == "gateway"
+
+
+def test_slow_sinks_do_not_stall_polling():
+    devices = [GatewayDevice(f"tank_{n}", rssi=-60 - n) for n in range(10)]
+    readings = []
+
+    def slow_sink(reading):
+        time.sleep(0.02)  # 10 s of clock time per call at this speedup
+        readings.append(reading)
+
+    scheduler, _ = _scheduler(devices, slots=3, interval=60, on_reading=slow_sink)
+
+    asyncio.run(scheduler.run(duration=90))
+
+    assert 20 <= scheduler.readings <= 30
+    assert len(readings) == scheduler.readings
+
+
+def test_sink_errors_are_counted():
+    def broken(reading):
+        raise ValueError("bad sink")
+
+    scheduler, _ = _scheduler([GatewayDevice("tank_a", rssi=-60)], interval=60, on_reading=broken)
+
+    asyncio.run(scheduler.run(duration=30))
+
+    assert scheduler.readings == 1 and scheduler.sink_errors.value() == 1
+
+
+def test_failing_device_backs_off():
+    device = GatewayDevice("tank_down", rssi=-95)
+    scheduler, _ = _scheduler([device], failure_rate=1.0, backoff=5, interval=60)
+
+    asyncio.run(scheduler.run(duration=120))
+
+    assert scheduler.readings == 0
+    assert 3 <= device.connection_attempts <= 6
+
+
+def test_readings_feed_the_ingest_writer(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    writer = SensorWriter(client, Deduplicator(client, registry=MetricsRegistry()))
+
+    async def on_reading(reading):
+        # on the loop thread: the test database is held by this thread
+        writer.write([reading])
+
+    scheduler, _ = _scheduler(load_devices(client), interval=30, on_reading=on_reading)
+
+    asyncio.run(scheduler.run(duration=70))
+
+    stored = client.select("sensor_data", "device_id,packet_seq", order="created_at")
+    assert len(stored) == scheduler.readings >= 4
+    assert all(row["packet_seq"] is not None for row in stored)
@@ -0,0 +1,120 @@
+"""
+Packet-level deduplication at ingest
+"""
+import pytest
+
+from gas_sight.ingest import Deduplicator, PacketWindow, SensorWriter
+from gas_sight.metrics import MetricsRegistry
+
+
+def _reading(device_id, packet, created_at="2025-08-14T10:00:00Z", measurement=50.0):
+    return {
+        "device_id": device_id, "title_name": device_id, "tank_level": 40.0,
+        "updated_refresh": "now", "battery": "Ok", "connection_strength": 70,
+        "measurement": measurement, "created_at": created_at,
+        "technical_data": {"_technical": {"packet_number": packet}},
+    }
+
+
+def test_window_drops_repeats_and_accepts_reordering():
+    window = PacketWindow(size=8, modulus=256)
+
+    assert [window.check(p)[0] for p in (1, 2, 4, 2, 3, 4, 1)] == [
+        True, True, True, False, True, False, False,
+    ]
+
+
+def test_window_unwraps_counter_wraparound():
+    window = PacketWindow(size=8, modulus=256)
+
+    assert window.check(254) == (True, 254)
+    assert window.check(255) == (True, 255)
+    assert window.check(0) == (True, 256)
+    assert window.check(255) == (False, 255)
+
+
+def test_window_treats_far_or_late_backward_jump_as_reboot():
+    window = PacketWindow(size=8, modulus=256, horizon=60)
+    window.check(100, at=0)
+
+    assert window.check(3, at=10) == (True, 259)
+    assert window.check(3, at=15) == (False, 259)
+    assert window.check(1, at=100) == (True, 513)
+
+
+def test_window_rejects_oversized_window():
+    with pytest.raises(ValueError):
+        PacketWindow(size=200, modulus=256)
+
+
+def test_deduplicator_is_lru_bounded():
+    dedup = Deduplicator(max_devices=2, registry=MetricsRegistry())
+    for device_id in ("a", "b", "a", "c"):
+        dedup.check(device_id, 1)
+
+    assert list(dedup._windows) == ["a", "c"]
+    assert dedup.tracked.value() == 2
+
+
+def test_writer_drops_retransmissions_before_writing(client, make_device):
+    make_device("tank_a")
+    registry = MetricsRegistry()
+    writer = SensorWriter(client, Deduplicator(client, registry=registry))
+
+    result = writer.write([_reading("tank_a", 7), _reading("tank_a", 7), _reading("tank_a", 8)])
+
+    assert (result.received, result.inserted, result.duplicates) == (3, 2, 1)
+    stored = client.select("sensor_data", "packet_seq", {"device_id": "eq.tank_a"},
+                           order="packet_seq")
+    assert [row["packet_seq"] for row in stored] == [7, 8]
+    assert registry.get("gas_sight_ingest_readings_total").value(result="duplicate") == 1
+    assert registry.get("gas_sight_ingest_dedup_hit_ratio").value() == pytest.approx(1 / 3)
+
+
+def test_unique_index_catches_what_the_window_missed(client, make_device):
+    make_device("tank_a")
+    SensorWriter(client, Deduplicator(registry=MetricsRegistry())).write([_reading("tank_a", 7)])
+    registry = MetricsRegistry()
+    other_gateway = SensorWriter(client, Deduplicator(registry=registry))
+
+    result = other_gateway.write([_reading("tank_a", 7), _reading("tank_a", 8)])
+
+    assert (result.inserted, result.conflicts) == (1, 1)
+    assert registry.get("gas_sight_ingest_readings_total").value(result="conflict") == 1
+
+
+def test_window_is_seeded_from_stored_sequence(client, make_device):
+    make_device("tank_a")
+    SensorWriter(client, Deduplicator(client, registry=MetricsRegistry())).write(
+        [_reading("tank_a", p) for p in (65534, 65535, 0)]
+    )
+    restarted = SensorWriter(client, Deduplicator(client, registry=MetricsRegistry()))
+
+    result = restarted.write([_reading("tank_a", 0), _reading("tank_a", 1)])
+
+    assert (result.inserted, result.duplicates) == (1, 1)
+    stored = client.select("sensor_data", "packet_seq", {"device_id": "eq.tank_a"},
+                           order="packet_seq.desc", limit=1)
+    assert stored[0]["packet_seq"] == 65537
+
+
+def test_window_is_seeded_from_backfilled_packets(client, make_device):
+    make_device("tank_a")
+    backfilled = _reading("tank_a", 41)
+    client.insert("sensor_data", backfilled)
+
+    result = SensorWriter(client, Deduplicator(client, registry=MetricsRegistry())).write(
+        [_reading("tank_a", 41), _reading("tank_a", 42)]
+    )
+
+    assert (result.inserted, result.duplicates) == (1, 1)
+
+
+def test_unnumbered_readings_pass_through(client, make_device):
+    make_device("tank_a")
+    reading = _reading("tank_a", 1)
+    reading["technical_data"] = {"source": "manual"}
+
+    result = SensorWriter(client, Deduplicator(registry=MetricsRegistry())).write([reading, reading])
+
+    assert result.inserted == 2
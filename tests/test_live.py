@@ -0,0 +1,154 @@
+"""
+Live-window ring buffers fed by ingest and the change stream
+"""
+import json
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from gas_sight.changes import Change, ChangeFeed, RealtimeFeed
+from gas_sight.ingest import Deduplicator, SensorWriter
+from gas_sight.live import LiveBuffer
+from gas_sight.metrics import MetricsRegistry
+
+START = datetime(2025, 8, 14, 10, 0, tzinfo=timezone.utc)
+
+
+def _reading(device_id, n, measurement=None):
+    return {
+        "id": f"00000000-0000-0000-0000-{n:012d}", "device_id": device_id,
+        "created_at": (START + timedelta(minutes=n)).isoformat(),
+        "measurement": float(n) if measurement is None else measurement,
+        "tank_level": 40.0, "connection_strength": 70, "battery": "Ok",
+    }
+
+
+@pytest.fixture
+def buffer():
+    return LiveBuffer(capacity=5, registry=MetricsRegistry())
+
+
+def test_ring_keeps_the_latest_readings_in_order(buffer):
+    buffer.extend([_reading("tank_a", n) for n in (3, 1, 2)])
+    buffer.extend([_reading("tank_a", n) for n in range(4, 9)] + [_reading("tank_b", 1)])
+
+    window = buffer.window(["tank_a"])
+    assert [row["measurement"] for row in window["rows"]] == [4.0, 5.0, 6.0, 7.0, 8.0]
+    assert window["rows"][0]["created_at"] == "2025-08-14T10:04:00+00:00"
+    assert window["seq"] == 9
+    assert [row["measurement"] for row in buffer.window(["tank_a", "tank_b"], limit=2)["rows"]] \
+        == [1.0, 7.0, 8.0]
+    assert buffer.add(_reading("tank_a", 8)) is False  # already buffered
+
+
+def test_late_readings_do_not_evict_newer_ones(buffer):
+    buffer.extend([_reading("tank_a", n) for n in range(10, 15)])
+    seq = buffer.seq
+
+    assert buffer.add(_reading("tank_a", 2)) is False  # older than the whole window
+    assert buffer.add(_reading("tank_a", 16)) is True
+    buffer.extend([_reading("tank_a", 15)])
+
+    assert [row["measurement"] for row in buffer.window(["tank_a"])["rows"]] \
+        == [12.0, 13.0, 14.0, 15.0, 16.0]
+    assert buffer.seq == seq + 2
+
+
+def test_since_returns_deltas_or_resets(buffer):
+    buffer.extend([_reading("tank_a", n) for n in range(3)])
+    cursor = buffer.window(["tank_a"])
+
+    buffer.extend([_reading("tank_a", 3), _reading("tank_b", 3)])
+    delta = buffer.since(cursor["seq"], ["tank_a"], epoch=cursor["epoch"])
+    assert [row["measurement"] for row in delta["rows"]] == [3.0]
+    assert delta["reset"] == []
+
+    # more readings than the ring holds: the client cannot catch up from a delta
+    buffer.extend([_reading("tank_a", n) for n in range(4, 10)])
+    behind = buffer.since(delta["seq"], ["tank_a"], epoch=cursor["epoch"])
+    assert behind["reset"] == ["tank_a"]
+    assert len(behind["rows"]) == 5
+
+    restarted = buffer.since(delta["seq"], ["tank_a"], epoch="older-buffer")
+    assert restarted["reset"] == ["tank_a"]
+    assert buffer.requests.value(kind="reset") == 1
+
+
+def test_change_feed_updates_and_deletes(buffer):
+    feed = ChangeFeed(registry=MetricsRegistry())
+    unsubscribe = buffer.attach(feed)
+    reading = _reading("tank_a", 1)
+    feed.publish(Change("sensor_data", "INSERT", record=reading))
+    cursor = buffer.window(["tank_a"])
+
+    feed.publish(Change("sensor_data", "UPDATE", record={**reading, "measurement": 9.5}))
+    assert buffer.since(cursor["seq"], ["tank_a"])["rows"][0]["measurement"] == 9.5
+
+    feed.publish(Change("sensor_data", "DELETE", old_record=reading))
+    assert buffer.since(cursor["seq"], ["tank_a"]) == {
+        "epoch": buffer.epoch, "seq": buffer.seq, "rows": [], "reset": ["tank_a"],
+    }
+
+    feed.publish(Change("devices", "DELETE", old_record={"id": "tank_a"}))
+    unsubscribe()
+    feed.publish(Change("sensor_data", "INSERT", record=_reading("tank_a", 2)))
+    assert buffer.window(["tank_a"])["rows"] == []
+
+
+def test_ingest_and_local_changes_feed_the_buffer(client, db, make_device, make_reading):
+    make_device("tank_a")
+    make_reading("tank_a", created_at="2025-08-14T09:00:00+00:00")
+    live = LiveBuffer(capacity=3, client=client, registry=MetricsRegistry())
+    live.seed()
+    unsubscribe = live.attach(db.changes)
+    try:
+        writer = SensorWriter(client, Deduplicator(registry=MetricsRegistry()), live=live)
+        readings = [{**_reading("tank_a", n), "title_name": "tank_a", "updated_refresh": "now",
+                     "technical_data": {"_technical": {"packet_number": n}}} for n in (1, 2)]
+        writer.write([{k: v for k, v in r.items() if k != "id"} for r in readings])
+    finally:
+        unsubscribe()
+
+    stored = client.select("sensor_data", "id", {"device_id": "eq.tank_a"}, order="created_at")
+    rows = live.window(["tank_a"])["rows"]
+    assert [row["id"] for row in rows] == [row["id"] for row in stored]
+    assert live.added.value(source="seed") == 1
+    assert live.added.value(source="change") == 2
+    assert live.added.value(source="ingest") == 0  # the change stream got there first
+
+
+def test_serve_answers_from_memory(buffer):
+    buffer.extend([_reading("tank_a", n) for n in range(3)])
+    server = buffer.serve(port=0)
+    try:
+        base = f"http://127.0.0.1:{server.server_port}/live"
+        with urllib.request.urlopen(f"{base}?device=tank_a&limit=2") as response:
+            window = json.load(response)
+        assert [row["measurement"] for row in window["rows"]] == [1.0, 2.0]
+        buffer.add(_reading("tank_a", 3))
+        with urllib.request.urlopen(f"{base}?device=tank_a&since={window['seq']}"
+                                    f"&epoch={window['epoch']}") as response:
+            assert [row["measurement"] for row in json.load(response)["rows"]] == [3.0]
+    finally:
+        server.shutdown()
+
+
+def test_realtime_messages_become_changes():
+    feed = RealtimeFeed("https://example.supabase.co", "key", registry=MetricsRegistry())
+    seen = []
+    feed.subscribe(seen.append, tables=("sensor_data",))
+
+    join = feed.join_message()
+    assert [c["table"] for c in join["payload"]["config"]["postgres_changes"]] == \
+        ["devices", "sensor_data", "comments"]
+    assert feed.socket_url().startswith("wss://example.supabase.co/realtime/v1/websocket?apikey=key")
+    feed.handle({"topic": feed.topic, "event": "phx_reply", "payload": {"status": "ok"}})
+    feed.handle({"topic": feed.topic, "event": "postgres_changes", "payload": {"data": {
+        "schema": "public", "table": "sensor_data", "type": "INSERT",
+        "commit_timestamp": "2025-08-14T10:00:00Z", "record": _reading("tank_a", 1),
+    }}})
+
+    assert feed.joined
+    assert [(c.table, c.type, c.record["measurement"]) for c in seen] == \
+        [("sensor_data", "INSERT", 1.0)]
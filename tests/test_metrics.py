@@ -0,0 +1,151 @@
+"""
+Request instrumentation in the shared REST layer
+"""
+import json
+import urllib.request
+
+import pytest
+
+from gas_sight.local import LocalTransport
+from gas_sight.metrics import MetricsRegistry, RestMetrics
+from gas_sight.rest import Response, RestClient, RestError
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+@pytest.fixture
+def metrics(registry):
+    return RestMetrics(registry, slow_threshold=60.0)
+
+
+@pytest.fixture
+def instrumented(db, metrics):
+    return RestClient(transport=LocalTransport(db), observers=[metrics])
+
+
+def test_latency_is_grouped_by_filter_shape(instrumented, metrics, make_device):
+    make_device("a")
+    make_device("b")
+
+    instrumented.select("device_stats", filters={"id": "eq.a"})
+    instrumented.select("device_stats", filters={"id": "eq.b"})
+    instrumented.select("device_stats", order="device_created_at.desc")
+
+    assert metrics.duration.count(endpoint="device_stats", method="GET", shape="select=*&id=eq") == 2
+    assert metrics.duration.count(
+        endpoint="device_stats", method="GET", shape="select=*&order=device_created_at.desc"
+    ) == 1
+    assert metrics.requests.value(endpoint="device_stats", method="GET", status=200) == 3
+
+
+def test_payload_bytes_and_content_range(instrumented, metrics, make_device):
+    for n in range(3):
+        make_device(f"device_{n}")
+
+    response = instrumented.select_response("devices", "id", limit=1, count="exact")
+
+    assert metrics.response_bytes.value(endpoint="devices", method="GET") == len(response.body)
+    assert metrics.content_range.value(endpoint="devices", shape="select=id&limit") == 3
+
+
+def test_errors_are_counted(instrumented, metrics):
+    with pytest.raises(RestError):
+        instrumented.select("no_such_table")
+
+    assert metrics.requests.value(endpoint="no_such_table", method="GET", status=404) == 1
+
+
+def test_malformed_filters_still_raise_rest_error(instrumented, metrics):
+    with pytest.raises(RestError) as error:
+        instrumented.select("devices", filters={"or": "(id.eq.a"})
+
+    assert error.value.status == 400
+    assert metrics.requests.value(endpoint="devices", method="GET", status=400) == 1
+    assert metrics.duration.count(endpoint="devices", method="GET", shape="other") == 1
+
+
+def test_observer_failures_do_not_mask_the_request(metrics):
+    def broken(event):
+        raise RuntimeError("observer bug")
+
+    def refused(method, path, query, headers, body):
+        raise ConnectionRefusedError("down")
+
+    client = RestClient(transport=refused, observers=[broken, metrics])
+    with pytest.raises(ConnectionRefusedError):
+        client.select("devices")
+    assert metrics.requests.value(endpoint="devices", method="GET", status=0) == 1
+
+
+def test_retries_are_counted(metrics):
+    responses = [Response(503), Response(503), Response(200, {}, b"[]")]
+
+    def flaky(method, path, query, headers, body):
+        return responses.pop(0)
+
+    client = RestClient(transport=flaky, retries=3, backoff=0, observers=[metrics])
+
+    assert client.select("devices") == []
+    assert metrics.retries.value(endpoint="devices", method="GET") == 2
+
+
+def test_writes_are_not_retried(metrics):
+    calls = []
+
+    def unavailable(method, path, query, headers, body):
+        calls.append(method)
+        return Response(503)
+
+    client = RestClient(transport=unavailable, retries=3, backoff=0, observers=[metrics])
+
+    with pytest.raises(RestError):
+        client.insert("devices", {"id": "x"})
+    assert calls == ["POST"]
+
+
+def test_slow_calls_are_sampled_with_query(db, registry, make_device):
+    metrics = RestMetrics(registry, slow_threshold=0.0)
+    client = RestClient(transport=LocalTransport(db), observers=[metrics])
+
+    client.select("sensor_data", filters=[("device_id", "eq.tank_1")], limit=5)
+
+    [sample] = registry.to_dict()["samples"]["gas_sight_rest_slow_calls"]
+    assert sample["endpoint"] == "sensor_data"
+    assert sample["query"] == "select=*&device_id=eq.tank_1&limit=5"
+
+
+def test_prometheus_text(instrumented, registry):
+    instrumented.select("devices")
+
+    text = registry.render_prometheus()
+
+    assert "# TYPE gas_sight_rest_request_duration_seconds histogram" in text
+    assert ('gas_sight_rest_request_duration_seconds_bucket'
+            '{endpoint="devices",method="GET",shape="select=*",le="+Inf"} 1') in text
+    assert 'gas_sight_rest_requests_total{endpoint="devices",method="GET",status="200"} 1' in text
+
+
+def test_histogram_quantiles(registry):
+    histogram = registry.histogram("latency", "test", buckets=(0.1, 0.2, 0.4))
+    for value in (0.05, 0.15, 0.15, 0.3):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == pytest.approx(0.15)
+    assert histogram.quantile(1.0) == pytest.approx(0.4)
+
+
+def test_metrics_endpoint(instrumented, registry):
+    instrumented.select("devices")
+    server = registry.serve(port=0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+            assert b"gas_sight_rest_requests_total" in response.read()
+        with urllib.request.urlopen(f"{base}/metrics.json", timeout=5) as response:
+            dump = json.loads(response.read())
+        assert "gas_sight_rest_request_duration_seconds" in dump["metrics"]
+    finally:
+        server.shutdown()
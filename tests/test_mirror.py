@@ -0,0 +1,117 @@
+"""
+Local SQLite mirror fed by change data capture
+"""
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from gas_sight.changes import Change
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.mirror import Mirror
+
+
+def _ago(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+@pytest.fixture
+def mirror(client, tmp_path):
+    return Mirror(str(tmp_path / "mirror.db"), client, registry=MetricsRegistry())
+
+
+def test_catch_up_copies_recent_rows_and_resumes_from_the_cursor(client, make_device, make_reading,
+                                                                 mirror, tmp_path):
+    make_device("tank_a")
+    recent = make_reading("tank_a")
+    make_reading("tank_a", created_at=_ago(days=30))
+    client.insert("comments", {"sensor_data_id": recent["id"], "comment_text": "refilled"})
+
+    assert mirror.journal_mode == "wal"
+    assert mirror.catch_up() == {"devices": 1, "sensor_data": 1, "comments": 1}
+    local = mirror.client()
+    assert [row["id"] for row in local.select("sensor_data")] == [recent["id"]]
+    assert local.select("comments", "comment_text") == [{"comment_text": "refilled"}]
+    assert local.rpc("get_device_stats")[0]["total_readings"] == 1
+
+    # a second run only re-reads the overlap, and replays change nothing
+    assert mirror.catch_up() == {"devices": 0, "sensor_data": 0, "comments": 0}
+    client.update("sensor_data", {"battery": "Low"}, {"id": f"eq.{recent['id']}"})
+
+    reopened = Mirror(str(tmp_path / "mirror.db"), client, registry=MetricsRegistry())
+    assert reopened.cursor("sensor_data")[1] == recent["id"]
+    assert reopened.catch_up()["sensor_data"] == 1
+    assert reopened.client().select("sensor_data", "battery") == [{"battery": "Low"}]
+
+
+def test_changes_apply_in_place_and_gaps_trigger_a_catch_up(client, db, make_device, make_reading,
+                                                            mirror):
+    make_device("tank_a")
+    mirror.catch_up()
+    unsubscribe = mirror.attach(db.changes)
+    try:
+        reading = make_reading("tank_a")
+        client.update("sensor_data", {"measurement": 12.5}, {"id": f"eq.{reading['id']}"})
+        stored = mirror.client().select("sensor_data", "id,measurement,updated_at")
+        assert stored[0]["measurement"] == 12.5
+
+        # an out-of-date copy of the row does not overwrite the newer one
+        assert not mirror.apply(Change("sensor_data", "UPDATE", record={
+            **reading, "measurement": 1.0, "updated_at": _ago(hours=1)}))
+        assert mirror.skipped.value(table="sensor_data", reason="stale") == 1
+        assert not mirror.apply(Change("comments", "INSERT", record={
+            "id": "00000000-0000-0000-0000-000000000001", "sensor_data_id": "00000000-0000-0000-0000-0000000000ff",
+            "comment_text": "orphan"}))
+
+        # changes missed while disconnected arrive with the next gap
+        unsubscribe()
+        make_device("tank_b")
+        unsubscribe = mirror.attach(db.changes)
+        db.changes.gap()
+        assert {row["id"] for row in mirror.client().select("devices", "id")} == {"tank_a", "tank_b"}
+
+        client.delete("devices", {"id": "eq.tank_a"})
+        assert mirror.client().select("sensor_data") == []
+        assert mirror.applied.value(table="devices", source="change") == 1
+    finally:
+        unsubscribe()
+
+
+def test_http_api_serves_reads_only(make_device, mirror):
+    make_device("tank_a")
+    mirror.catch_up()
+    server = mirror.serve(port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}/rest/v1"
+    try:
+        with urllib.request.urlopen(f"{base}/devices?select=id,enabled") as response:
+            assert response.headers["Access-Control-Allow-Origin"] == "*"
+            assert json.loads(response.read()) == [{"id": "tank_a", "enabled": True}]
+
+        stats = urllib.request.Request(f"{base}/rpc/get_device_stats", data=b"{}", method="POST",
+                                       headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(stats) as response:
+            assert json.loads(response.read())[0]["id"] == "tank_a"
+
+        write = urllib.request.Request(f"{base}/devices?id=eq.tank_a", method="DELETE")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(write)
+        assert error.value.code == 405
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_reads_do_not_wait_for_the_writer(make_device, mirror):
+    make_device("tank_a")
+    mirror.catch_up()
+    server = mirror.serve(port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}/rest/v1"
+    try:
+        with mirror.db.lock:  # a sync in progress
+            with urllib.request.urlopen(f"{base}/devices?select=id", timeout=5) as response:
+                assert json.loads(response.read()) == [{"id": "tank_a"}]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,66 @@
+"""
+Slotted row models and column batches
+"""
+import math
+
+import pytest
+
+from gas_sight.models import Device, ReadingBatch, SensorReading
+from gas_sight.wire import PROJECTIONS
+
+
+def test_models_decode_response_bytes(client, make_device, make_reading):
+    make_device("tank_a", location="Warehouse B")
+    make_reading("tank_a", created_at="2025-08-14T10:00:00+00:00")
+    make_reading("tank_a", created_at="2025-08-14T10:01:00+00:00", battery="Low")
+
+    device = Device.from_json(client.select_response("devices", headers={
+        "Accept": "application/vnd.pgrst.object+json"}))
+    assert (device.id, device.location, device.enabled) == ("tank_a", "Warehouse B", True)
+
+    readings = SensorReading.from_json(client.select_response("sensor_data", order="created_at"))
+    assert [r.battery for r in readings] == ["Full", "Low"]
+    assert readings[0].get("measurement") == 82.3
+    assert readings[0].get("rssi", "n/a") == "n/a"
+    assert readings[0].technical_data == {"source": "test_suite"}
+    assert readings[0].device_id is readings[1].device_id
+    assert readings[0] == SensorReading.from_row(readings[0].to_dict())
+    assert not hasattr(readings[0], "__dict__")
+
+    with pytest.raises(TypeError):
+        SensorReading(colour="red")
+
+
+def test_batch_round_trips_json_and_packed(client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    for n, device_id in enumerate(["tank_a", "tank_b", "tank_a"]):
+        make_reading(device_id, created_at=f"2025-08-14T10:0{n}:00.250000+00:00",
+                     measurement=float(n), connection_strength=90 + n)
+    response = client.select_response("sensor_data", PROJECTIONS["chart_point"], order="created_at")
+
+    batch = ReadingBatch.from_json(response)
+    rows = response.json()
+    assert len(batch) == 3
+    assert [r.to_dict() for r in batch] == [SensorReading.from_row(row).to_dict() for row in rows]
+    assert batch[-1].created_at == "2025-08-14T10:02:00.250000+00:00"
+    assert batch.device_indexes("tank_a") == [0, 2]
+    assert batch.nbytes() == 3 * (16 + 4 + 8 + 8 + 8 + 2 + 1)
+
+    packed = ReadingBatch.from_packed(client.rpc("sensor_columns", {
+        "device_ids": ["tank_a", "tank_b"],
+        "window_start": "2025-08-14T00:00:00+00:00", "window_end": "2025-08-15T00:00:00+00:00",
+    }))
+    assert list(packed.created_at) == list(batch.created_at)
+    assert [r.id for r in packed] == [row["id"] for row in rows]
+
+
+def test_batch_nulls_and_bad_labels():
+    row = {"id": "00000000-0000-0000-0000-000000000001", "device_id": "tank_a",
+           "created_at": "2025-08-14T10:00:00Z", "measurement": None, "tank_level": 1.5,
+           "connection_strength": None, "battery": None}
+    batch = ReadingBatch.from_rows([row])
+    assert math.isnan(batch.measurement[0])
+    assert batch[0].measurement is None and batch[0].battery is None
+    with pytest.raises(ValueError):
+        ReadingBatch.from_rows([{**row, "battery": "Empty"}])
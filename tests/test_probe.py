@@ -0,0 +1,81 @@
+"""
+Ingest-to-dashboard latency probe against the local stand-in
+"""
+import io
+
+from gas_sight.export import export_sensor_data
+from gas_sight.fleet import FleetStats
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.probe import CANARY_DEVICE, LatencyProbe, RollingQuantiles
+
+
+def test_probe_times_every_stage(client, db):
+    registry = MetricsRegistry()
+    probe = LatencyProbe(client, db.changes, timeout=2.0, registry=registry)
+    seen = []
+    try:
+        summary = probe.run(interval=0, count=3, on_result=seen.append)
+    finally:
+        probe.close()
+
+    assert len(seen) == 3 and all(r.error is None for r in seen)
+    assert all(None not in (r.insert_ack, r.realtime, r.stats) for r in seen)
+    assert {stage: s["count"] for stage, s in summary.items()} == {
+        "insert_ack": 3, "realtime": 3, "stats": 3,
+    }
+    assert probe.latency.count(stage="stats") == 3
+    assert probe.probes.value(result="ok") == 3
+    assert probe.window_latency.value(stage="realtime", quantile="0.99") is not None
+    device = client.select("devices", "id,enabled", {"id": f"eq.{CANARY_DEVICE['id']}"})
+    assert device == [{"id": CANARY_DEVICE["id"], "enabled": False}]
+    assert len(client.select("sensor_data", "id", {"device_id": f"eq.{CANARY_DEVICE['id']}"})) == 3
+
+
+def test_missing_realtime_delivery_counts_as_timeout(client, db):
+    class SilentFeed:
+        def subscribe(self, callback, tables=None, on_gap=None):
+            return lambda: None
+
+    probe = LatencyProbe(client, SilentFeed(), timeout=0.05, registry=MetricsRegistry())
+    probe.ensure_device()
+    probe.attach()
+    result = probe.probe_once()
+    assert result.realtime is None and result.insert_ack is not None and result.stats is not None
+    assert probe.timeouts.value(stage="realtime") == 1
+    assert probe.probes.value(result="timeout") == 1
+
+
+def test_rolling_quantiles_forget_old_values():
+    now = [0.0]
+    rolling = RollingQuantiles(window=60, clock=lambda: now[0])
+    for value in range(1, 101):
+        rolling.add(value / 100)
+    assert rolling.quantiles() == {0.5: 0.5, 0.95: 0.95, 0.99: 0.99}
+    now[0] = 61.0
+    rolling.add(3.0)
+    assert len(rolling) == 1 and rolling.quantiles()[0.5] == 3.0
+
+
+def test_canary_stays_out_of_fleet_views(client, db, make_device):
+    make_device("tank_a")
+    probe = LatencyProbe(client, timeout=2.0, registry=MetricsRegistry())
+    assert probe.run(interval=0, count=1)["stats"]["count"] == 1
+
+    canary = CANARY_DEVICE["id"]
+    assert client.select("device_stats", "synthetic", {"id": f"eq.{canary}"}) == [{"synthetic": True}]
+    assert [row["id"] for row in client.rpc("device_stats_since", {"since": None})["devices"]] == ["tank_a"]
+    out = io.BytesIO()
+    assert export_sensor_data(out, fmt="ndjson", compression="none", client=client) == 0
+    assert export_sensor_data(io.BytesIO(), [canary], compression="none", client=client) == 1
+
+
+def test_probe_readings_leave_fleet_etags_not_modified(client, make_device):
+    make_device("tank_a")
+    probe = LatencyProbe(client, timeout=2.0, registry=MetricsRegistry())
+    probe.ensure_device()
+    fleet = FleetStats(client, registry=MetricsRegistry())
+    fleet.refresh()
+
+    assert probe.probe_once().error is None
+    assert not fleet.refresh()
+    assert fleet.refreshes.value(result="not_modified") == 1
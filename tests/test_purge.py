@@ -0,0 +1,126 @@
+"""
+Batched purges of device history and expired readings
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.purge import Purger
+from gas_sight.rest import RestError
+
+
+def _ago(**delta):
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+def test_device_purge_disables_then_deletes_in_batches(client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    readings = [make_reading("tank_a", created_at=_ago(minutes=n)) for n in range(5)]
+    make_reading("tank_b")
+    client.insert("comments", {"sensor_data_id": readings[0]["id"], "comment_text": "refilled"})
+    pauses, seen = [], []
+    purger = Purger(client, batch_size=2, pause=0.25, sleep=pauses.append,
+                    progress=lambda p: seen.append((p.deleted, p.fraction)), registry=MetricsRegistry())
+
+    purge = purger.request("tank_a")
+    assert client.select("devices", "enabled", {"id": "eq.tank_a"}) == [{"enabled": False}]
+    assert purge["status"] == "pending"
+
+    progress = purger.run(purge)
+    assert (progress.deleted, progress.total, progress.batches) == (5, 5, 3)
+    assert seen == [(2, 0.4), (4, 0.8), (5, 1.0)]
+    assert pauses == [0.25, 0.25]
+    assert [d["id"] for d in client.select("devices", "id")] == ["tank_b"]
+    assert len(client.select("sensor_data")) == 1 and client.select("comments") == []
+    row = client.select("device_purges", "*", {"id": f"eq.{purge['id']}"})[0]
+    assert (row["status"], row["readings_deleted"], row["batches"]) == ("done", 5, 3)
+    assert row["finished_at"] is not None
+    assert purger.deleted.value(kind="device") == 5
+
+
+def test_interrupted_purges_are_resumed(client, make_device, make_reading):
+    make_device("tank_a")
+    for n in range(3):
+        make_reading("tank_a", created_at=_ago(minutes=n))
+
+    def drop_connection(seconds):
+        raise ConnectionResetError("network went away")
+
+    failing = Purger(client, batch_size=2, sleep=drop_connection, registry=MetricsRegistry())
+    purge = failing.request("tank_a")
+    with pytest.raises(ConnectionResetError):
+        failing.run(purge)
+    row = client.select("device_purges", "*")[0]
+    assert (row["status"], row["readings_deleted"], row["error"]) == ("failed", 2, "network went away")
+
+    done = Purger(client, batch_size=2, sleep=lambda s: None, registry=MetricsRegistry()).run_pending()
+    assert [(p.device_id, p.deleted, p.total, p.batches) for p in done] == [("tank_a", 3, 3, 2)]
+    assert client.select("devices") == [] and client.select("device_purges", "status") == [{"status": "done"}]
+
+
+def test_retention_purge_keeps_recent_readings(client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    for device_id in ("tank_a", "tank_b"):
+        make_reading(device_id, created_at=_ago(days=40))
+        make_reading(device_id, created_at=_ago(days=31))
+        make_reading(device_id)
+
+    purger = Purger(client, batch_size=3, sleep=lambda s: None, registry=MetricsRegistry())
+    progress = purger.purge_older_than(datetime.now(timezone.utc) - timedelta(days=30))
+    assert (progress.device_id, progress.deleted, progress.total, progress.batches) == (None, 4, 4, 2)
+    assert len(client.select("sensor_data")) == 2
+
+    with pytest.raises(RestError):
+        client.rpc("purge_sensor_data", {"batch_size": 10})
+
+
+def test_workers_do_not_take_each_others_purges(client, make_device, make_reading):
+    make_device("tank_a")
+    make_reading("tank_a")
+    first = Purger(client, sleep=lambda s: None, registry=MetricsRegistry())
+    second = Purger(client, sleep=lambda s: None, registry=MetricsRegistry())
+
+    purge = first.request("tank_a")
+    assert first.claim(purge)["status"] == "running"
+    assert second.claim(purge) is None
+    assert second.run_pending() == []
+    assert len(client.select("sensor_data")) == 1
+
+    # the first worker died; its purge is taken over once the lease runs out
+    client.update("device_purges", {"lease_until": _ago(seconds=1)}, {"id": f"eq.{purge['id']}"})
+    assert [p.device_id for p in second.run_pending()] == ["tank_a"]
+
+
+class _Flaky:
+    """Client whose purge_sensor_data calls fail for one device"""
+
+    def __init__(self, client, device_id):
+        self.client = client
+        self.device_id = device_id
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def rpc(self, name, args=None):
+        if name == "purge_sensor_data" and args["target_device_id"] == self.device_id:
+            raise ConnectionResetError("network went away")
+        return self.client.rpc(name, args)
+
+
+def test_a_failing_purge_does_not_stop_the_queue(client, make_device, make_reading):
+    for device_id in ("tank_a", "tank_b"):
+        make_device(device_id)
+        make_reading(device_id)
+    purger = Purger(_Flaky(client, "tank_a"), sleep=lambda s: None, registry=MetricsRegistry())
+    purger.request("tank_a")
+    purger.request("tank_b")
+
+    assert [p.device_id for p in purger.run_pending()] == ["tank_b"]
+    assert purger.failures.value() == 1
+    rows = client.select("device_purges", "device_id,status,lease_until", order="device_id")
+    assert [(r["device_id"], r["status"], r["lease_until"]) for r in rows] == [
+        ("tank_a", "failed", None), ("tank_b", "done", None),
+    ]
@@ -0,0 +1,108 @@
+"""
+Read-replica routing with simulated replication lag
+"""
+import pytest
+
+from gas_sight.local import LocalDatabase, LocalTransport
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.replicas import Replica, ReplicatedClient
+from gas_sight.rest import RestClient
+
+from conftest import DATA_CHARACTERISTIC_UUID, SERVICE_UUID
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _device(title):
+    return {"id": "tank_a", "name": "@TNK00001", "mac_address": "C5:BA:A0:16:CF:01", "title": title,
+            "service_uuid": SERVICE_UUID, "data_characteristic_uuid": DATA_CHARACTERISTIC_UUID}
+
+
+@pytest.fixture
+def setup():
+    """A primary and a replica that already holds an older copy of tank_a"""
+    primary_db, replica_db = LocalDatabase(), LocalDatabase()
+    primary = RestClient(transport=LocalTransport(primary_db), observers=[])
+    replica = RestClient(transport=LocalTransport(replica_db), observers=[])
+    primary.insert("devices", _device("current"))
+    replica.insert("devices", _device("replicated"))
+    clock = Clock()
+    client = ReplicatedClient(primary, [Replica("r1", replica)], max_staleness=5.0,
+                              staleness={"device_stats": 60.0}, lag_interval=1.0, clock=clock,
+                              registry=MetricsRegistry())
+    return client, replica_db, clock
+
+
+def _title(client, **options):
+    return client.select("devices", "title", **options)[0]["title"]
+
+
+def test_reads_use_a_fresh_replica_and_writes_the_primary(setup):
+    client, _, _ = setup
+
+    assert _title(client) == "replicated"
+    assert client.rpc("get_device_stats")[0]["title"] == "replicated"
+    assert _title(client, consistent=True) == "current"
+
+    client.update("devices", {"title": "renamed"}, {"id": "eq.tank_a"})
+    assert client.primary.select("devices", "title")[0]["title"] == "renamed"
+    assert client.reads.value(target="r1", reason="fresh") == 2
+    assert client.reads.value(target="primary", reason="consistent") == 1
+
+
+def test_lagging_replica_falls_back_per_query_bound(setup):
+    client, replica_db, clock = setup
+    assert _title(client) == "replicated"
+    replica_db.replication_lag = 30.0
+
+    assert _title(client) == "replicated"  # the lag measured a moment ago is still cached
+    clock.now += 1
+    assert _title(client) == "current"
+    assert client.reads.value(target="primary", reason="lagging") == 1
+    assert client.lag_seconds.value(replica="r1") == 30.0
+
+    assert _title(client, max_staleness=60) == "replicated"
+    assert client.select("device_stats", "title")[0]["title"] == "replicated"
+
+
+def test_replica_that_is_not_streaming_is_skipped(setup):
+    client, replica_db, _ = setup
+    replica_db.replication_lag = None  # replication_lag() without a WAL receiver
+
+    assert _title(client) == "current"
+    assert client.reads.value(target="primary", reason="lagging") == 1
+
+
+def test_read_your_writes_waits_for_the_replica_to_catch_up(setup):
+    client, replica_db, clock = setup
+    replica_db.replication_lag = 2.0
+    client.update("devices", {"color": "#000000"}, {"id": "eq.tank_a"})
+
+    clock.now += 1
+    assert _title(client, read_your_writes=True) == "current"
+    assert _title(client) == "replicated"
+    clock.now += 2
+    assert _title(client, read_your_writes=True) == "replicated"
+    assert client.reads.value(target="primary", reason="read_your_writes") == 1
+
+
+def test_failing_replica_is_skipped(setup):
+    client, _, clock = setup
+
+    def down(*args):
+        raise ConnectionRefusedError("replica down")
+
+    client.replicas[0].lag, client.replicas[0].checked = 0.0, clock.now
+    client.replicas[0].client.transport = down
+
+    assert _title(client) == "current"
+    assert client.reads.value(target="primary", reason="error") == 1
+    clock.now += 1
+    assert _title(client) == "current"  # the lag probe fails too
+    assert client.reads.value(target="primary", reason="lagging") == 1
@@ -0,0 +1,78 @@
+"""
+Time-aligned multi-device matrix (sensor_matrix RPC)
+"""
+import pytest
+
+from gas_sight.resample import resample, sensor_matrix
+from gas_sight.rest import RestError
+
+
+def _reading(device_id, created_at, measurement, tank_level=50):
+    return {
+        "device_id": device_id, "title_name": device_id, "tank_level": tank_level,
+        "updated_refresh": "now", "battery": "Ok", "connection_strength": 80,
+        "measurement": measurement, "created_at": created_at,
+    }
+
+
+READINGS = [
+    _reading("tank_a", "2025-08-14T09:59:00Z", 10),
+    _reading("tank_a", "2025-08-14T10:00:30Z", 20),
+    _reading("tank_a", "2025-08-14T10:00:50Z", 30),
+    _reading("tank_b", "2025-08-14T10:01:10Z", 70, tank_level=120),
+    _reading("tank_a", "2025-08-14T10:03:00Z", 40),
+]
+WINDOW = ("2025-08-14T10:00:00Z", "2025-08-14T10:04:00Z")
+
+
+def test_locf_carries_last_reading_forward():
+    matrix = resample(READINGS, ["tank_a", "tank_b"], *WINDOW, step=60, use_numpy=False)
+
+    assert matrix["t0"] == "2025-08-14T10:00:00+00:00"
+    assert matrix["devices"] == ["tank_a", "tank_b"]
+    assert matrix["values"]["measurement"] == [[30, None], [30, 70], [30, 70], [40, 70]]
+    assert matrix["values"]["tank_level"][1] == [50, 120]
+
+
+def test_mean_averages_inside_buckets_only():
+    matrix = resample(READINGS, ["tank_a", "tank_b"], *WINDOW, step=120, mode="mean",
+                      use_numpy=False)
+
+    assert matrix["values"]["measurement"] == [[25.0, 70.0], [40.0, None]]
+
+
+def test_numpy_matches_pure_python():
+    pytest.importorskip("numpy")
+    for mode in ("locf", "mean"):
+        expected = resample(READINGS, ["tank_b", "tank_a"], *WINDOW, 45, mode, use_numpy=False)
+        assert resample(READINGS, ["tank_b", "tank_a"], *WINDOW, 45, mode, use_numpy=True) == expected
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"step": 0},
+    {"step": 60, "mode": "median"},
+    {"step": 0.001},
+])
+def test_rejects_bad_arguments(kwargs):
+    with pytest.raises(ValueError):
+        resample(READINGS, ["tank_a"], *WINDOW, **kwargs)
+
+
+def test_rpc_through_local_transport(client, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    client.insert("sensor_data", READINGS)
+
+    matrix = sensor_matrix(client, ["tank_a", "tank_b"], *WINDOW, step=60)
+
+    assert matrix["step"] == 60
+    assert matrix["values"]["measurement"] == [[30, None], [30, 70], [30, 70], [40, 70]]
+    assert matrix["values"]["battery_level"] == [[75, None], [75, 75], [75, 75], [75, 75]]
+
+
+def test_rpc_rejects_bad_window(client):
+    with pytest.raises(RestError) as error:
+        sensor_matrix(client, ["tank_a"], WINDOW[1], WINDOW[0])
+
+    assert error.value.status == 400
+    assert error.value.code == "22023"
@@ -0,0 +1,133 @@
+"""
+Location-based sharding over several local backends
+"""
+import pytest
+
+from gas_sight.export import iter_pages
+from gas_sight.fleet import FleetStats
+from gas_sight.local import LocalDatabase, LocalTransport
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.purge import Purger
+from gas_sight.rest import RestClient, RestError
+from gas_sight.shards import Shard, ShardedClient, ShardError
+from gas_sight.wire import sensor_columns
+
+from conftest import DATA_CHARACTERISTIC_UUID, SERVICE_UUID
+
+
+@pytest.fixture
+def sharded():
+    shards = [
+        Shard(name, RestClient(transport=LocalTransport(LocalDatabase()), observers=[]), locations)
+        for name, locations in (("north", ("Warehouse A",)), ("south", ("Warehouse B", "Emergency")))
+    ]
+    client = ShardedClient(shards, default="north", registry=MetricsRegistry())
+    yield client
+    client.close()
+
+
+def _device(device_id, location, n):
+    return {"id": device_id, "name": f"@TNK{n:05d}", "mac_address": f"C5:BA:A0:16:CF:{n:02X}",
+            "title": device_id, "location": location, "service_uuid": SERVICE_UUID,
+            "data_characteristic_uuid": DATA_CHARACTERISTIC_UUID}
+
+
+def _reading(device_id, minute, measurement=50.0):
+    return {"device_id": device_id, "title_name": device_id, "tank_level": 10.0, "tank_level_unit": "cm",
+            "updated_refresh": "now", "measurement_unit": "%", "battery": "Ok",
+            "connection_strength": 80, "measurement": measurement,
+            "created_at": f"2025-08-14T10:{minute:02d}:00+00:00"}
+
+
+@pytest.fixture
+def fleet(sharded):
+    sharded.insert("devices", [
+        _device("tank_a", "Warehouse A - Section 1", 1),
+        _device("tank_b", "Warehouse B - Section 3", 2),
+        _device("tank_c", "Rooftop", 3),
+    ])
+    sharded.insert("sensor_data", [_reading(d, m, float(m)) for m, d in enumerate(
+        ["tank_a", "tank_b", "tank_c", "tank_b", "tank_a", "tank_b"]
+    )], returning=False)
+    return sharded
+
+
+def _ids(shard, table="devices", column="id"):
+    return sorted(row[column] for row in shard.client.select(table, column))
+
+
+def test_rows_are_written_to_the_owning_shard(fleet):
+    north, south = fleet.shards
+
+    assert _ids(north) == ["tank_a", "tank_c"]  # Rooftop matches nothing -> default shard
+    assert _ids(south) == ["tank_b"]
+    assert _ids(north, "sensor_data", "device_id") == ["tank_a", "tank_a", "tank_c"]
+    assert _ids(south, "sensor_data", "device_id") == ["tank_b"] * 3
+
+
+def test_pinned_reads_go_to_one_shard_and_the_rest_fan_out(fleet):
+    rows = fleet.select("sensor_data", "device_id", {"device_id": "eq.tank_b"})
+    assert len(rows) == 3
+    assert fleet.requests.value(shard="south", route="routed") == 1
+    assert fleet.requests.value(shard="north", route="routed") == 0
+
+    latest = fleet.select("sensor_data", "device_id,measurement", order="created_at.desc", limit=2, offset=1)
+    assert latest == [{"device_id": "tank_a", "measurement": 4.0}, {"device_id": "tank_b", "measurement": 3.0}]
+
+    response = fleet.select_response("sensor_data", "id", count="exact", limit=1)
+    assert response.content_range == (0, 0, 6)
+
+
+def test_keyset_export_pages_across_shards(fleet):
+    pages = list(iter_pages(fleet, page_size=4, columns=("device_id", "measurement")))
+
+    assert [len(page) for page in pages] == [4, 2]
+    assert [row["measurement"] for page in pages for row in page] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_fleet_rpcs_are_merged(fleet):
+    stats = FleetStats(fleet, registry=MetricsRegistry())
+    assert stats.refresh() is True
+    assert {d["id"]: d["total_readings"] for d in stats.devices()} == {"tank_a": 2, "tank_b": 3, "tank_c": 1}
+    assert stats.refresh() is False
+
+    fleet.insert("sensor_data", _reading("tank_b", 30), returning=False)
+    assert stats.refresh() is True
+    assert stats.get("tank_b")["total_readings"] == 4
+
+    points = sensor_columns(fleet, ["tank_b", "tank_a"], "2025-08-14T00:00:00Z", "2025-08-15T00:00:00Z")
+    assert [(p["device_id"], p["measurement"]) for p in points] == [
+        ("tank_a", 0.0), ("tank_b", 1.0), ("tank_b", 3.0), ("tank_a", 4.0), ("tank_b", 5.0), ("tank_b", 50.0),
+    ]
+
+    updated = fleet.rpc("apply_device_counters", {"counters": [
+        {"id": "tank_a", "packets": 2}, {"id": "tank_b", "packets": 1}, {"id": "missing", "packets": 1},
+    ]})
+    assert updated == 2
+
+
+def test_purges_reach_the_owning_shard_or_every_shard(fleet):
+    purger = Purger(fleet, batch_size=2, sleep=lambda s: None, registry=MetricsRegistry())
+    north, south = fleet.shards
+
+    progress = purger.purge_older_than("2025-08-14T10:02:00+00:00")
+    assert progress.deleted == 2
+    assert _ids(north, "sensor_data", "device_id") == ["tank_a", "tank_c"]
+    assert _ids(south, "sensor_data", "device_id") == ["tank_b"] * 2
+
+    assert fleet.rpc("purge_sensor_data", {"target_device_id": "tank_b", "batch_size": 10}) == 2
+    assert _ids(south, "sensor_data", "device_id") == []
+    assert _ids(north, "sensor_data", "device_id") == ["tank_a", "tank_c"]
+
+
+def test_unknown_devices_and_cross_shard_moves_are_rejected(fleet):
+    with pytest.raises(RestError) as e:
+        fleet.insert("sensor_data", _reading("ghost", 1))
+    assert e.value.code == "23503"
+
+    with pytest.raises(ShardError):
+        fleet.update("devices", {"location": "Warehouse B - Section 1"}, {"id": "eq.tank_a"})
+    fleet.update("devices", {"location": "Warehouse A - Section 2"}, {"id": "eq.tank_a"})
+
+    fleet.delete("devices", {"id": "eq.tank_b"})
+    assert fleet.locate(["tank_a", "tank_b"]) == {"tank_a": fleet.shards[0]}
@@ -0,0 +1,142 @@
+"""
+Store-and-forward spool for uplink outages
+"""
+import os
+
+import pytest
+
+from gas_sight.ingest import Deduplicator, SensorWriter
+from gas_sight.local import LocalTransport
+from gas_sight.metrics import MetricsRegistry
+from gas_sight.rest import RestClient, RestError
+from gas_sight.spool import Spool, SpooledWriter
+
+
+def _spool(path, **kwargs):
+    return Spool(str(path), registry=MetricsRegistry(), **kwargs)
+
+
+def _reading(device_id, packet):
+    return {
+        "device_id": device_id, "title_name": device_id, "tank_level": 40.0,
+        "updated_refresh": "now", "battery": "Ok", "connection_strength": 70,
+        "measurement": 50.0, "technical_data": {"_technical": {"packet_number": packet}},
+    }
+
+
+def test_records_survive_reopen_across_segments(tmp_path):
+    spool = _spool(tmp_path, segment_bytes=256, max_bytes=1 << 20)
+    spool.extend({"n": n} for n in range(50))
+    records, position = spool.read(20)
+    spool.ack(position, len(records))
+    spool.close()
+
+    reopened = _spool(tmp_path, segment_bytes=256, max_bytes=1 << 20)
+    records, _ = reopened.read(1000)
+
+    assert [r["n"] for r in records] == list(range(20, 50))
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".seg")]) > 1
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    spool = _spool(tmp_path)
+    spool.extend([{"n": 1}, {"n": 2}])
+    spool.close()
+    segment = next(n for n in os.listdir(tmp_path) if n.endswith(".seg"))
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b"\x40\x00\x00\x00garbage")
+
+    reopened = _spool(tmp_path)
+    reopened.append({"n": 3})
+
+    assert [r["n"] for r in reopened.read(10)[0]] == [1, 2, 3]
+
+
+def test_disk_budget_drops_oldest_segments(tmp_path):
+    spool = _spool(tmp_path, segment_bytes=512, max_bytes=1024)
+    spool.extend({"n": n, "pad": "x" * 40} for n in range(100))
+
+    records, _ = spool.read(1000)
+    assert spool.size.value() <= 1024
+    assert records[-1]["n"] == 99
+    assert spool.dropped.value() == 100 - len(records)
+
+
+class _Uplink:
+    """LocalTransport that can be switched off"""
+
+    def __init__(self, db):
+        self.transport = LocalTransport(db)
+        self.down = False
+
+    def __call__(self, *args):
+        if self.down:
+            raise OSError("network unreachable")
+        return self.transport(*args)
+
+
+@pytest.fixture
+def uplink(db):
+    return _Uplink(db)
+
+
+def test_outage_is_spooled_then_drained_in_bulk(tmp_path, uplink, make_device):
+    make_device("tank_a")
+    make_device("tank_b")
+    events = []
+    client = RestClient(transport=uplink, observers=[events.append])
+    writer = SensorWriter(client, Deduplicator(client, registry=MetricsRegistry()), batch_size=1000)
+    spooled = SpooledWriter(_spool(tmp_path), writer, batch_size=1000, backoff=0)
+
+    uplink.down = True
+    for packet in range(1, 101):
+        spooled.write([_reading("tank_a", packet), _reading("tank_b", packet)])
+    assert spooled.failures > 0
+
+    uplink.down = False
+    events.clear()
+    assert spooled.drain() == 200
+
+    inserts = [e for e in events if e.method == "POST"]
+    assert len(inserts) == 1
+    stored = client.select("sensor_data", "device_id,packet_seq", {"device_id": "eq.tank_a"},
+                           order="created_at,id")
+    assert len(stored) == 100
+    assert spooled.spool.read(10)[0] == []
+
+
+def test_rejected_readings_are_set_aside(tmp_path, client, make_device):
+    make_device("tank_a")
+    writer = SensorWriter(client, Deduplicator(registry=MetricsRegistry()))
+    spooled = SpooledWriter(_spool(tmp_path), writer)
+
+    sent = spooled.write([_reading("tank_a", 1), _reading("unknown_tank", 1), _reading("tank_a", 2)])
+
+    assert sent == 3
+    assert len(client.select("sensor_data", "id")) == 2
+    assert "unknown_tank" in (tmp_path / "rejected.ndjson").read_text()
+
+
+class _Refusing:
+    """Writer whose uplink answers every request with the same error"""
+
+    def __init__(self, status, code=None):
+        self.error = RestError(status, code)
+        self.calls = 0
+
+    def write(self, readings):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.mark.parametrize("status", [401, 403, 404, 408, 429])
+def test_request_errors_keep_readings_spooled(tmp_path, status):
+    writer = _Refusing(status)
+    spooled = SpooledWriter(_spool(tmp_path), writer, backoff=0)
+
+    assert spooled.write([_reading("tank_a", 1), _reading("tank_a", 2)]) == 0
+
+    assert writer.calls == 1
+    assert spooled.failures == 1
+    assert len(spooled.spool.read(10)[0]) == 2
+    assert not (tmp_path / "rejected.ndjson").exists()
@@ -0,0 +1,74 @@
+"""
+Rollup tiers and range routing for sensor history
+"""
+from datetime import datetime, timedelta, timezone
+
+from gas_sight.tiers import choose_tier, history, prune, rebuild, rollup
+
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+def _readings(make_reading, start, minutes, step=1, device_id="tank_a"):
+    return [
+        make_reading(device_id, created_at=(start + timedelta(minutes=n)).isoformat(),
+                     measurement=float(n % 50), tank_level=100.0 - n % 7,
+                     connection_strength=60 + n % 3, battery=("Full", "Ok")[n % 2])
+        for n in range(0, minutes, step)
+    ]
+
+
+def test_choose_tier_is_coarsest_that_meets_points_and_retention():
+    day = NOW - timedelta(days=1)
+    assert choose_tier(NOW - timedelta(minutes=1), NOW, now=NOW) == 0
+    assert choose_tier(day, NOW, now=NOW) == 60
+    assert choose_tier(NOW - timedelta(days=7), NOW, now=NOW) == 60
+    assert choose_tier(NOW - timedelta(days=30), NOW, now=NOW) == 3600
+    assert choose_tier(NOW - timedelta(days=7), NOW, max_points=100, now=NOW) == 3600
+    # the 1 minute tier only keeps 35 days
+    assert choose_tier(day - timedelta(days=60), NOW - timedelta(days=60), now=NOW) == 0
+
+
+def test_trigger_matches_reference_rollups(db, make_device, make_reading):
+    make_device("tank_a")
+    readings = _readings(make_reading, datetime(2025, 8, 14, 9, 50, tzinfo=timezone.utc), 40)
+    stored = db.rows("sensor_data")
+
+    for resolution in (60, 900, 3600):
+        expected = sorted(rollup(stored, resolution), key=lambda r: r["bucket"])
+        actual = db.rows("sensor_rollups", "where resolution = ? order by bucket", (resolution,))
+        assert len(actual) == {60: 40, 900: 3, 3600: 2}[resolution]
+        for want, got in zip(expected, actual):
+            assert {k: got[k] for k in want} == {**want, "bucket": got["bucket"]}
+    assert readings[-1]["id"] == actual[-1]["last_id"]
+
+
+def test_month_window_reads_the_hourly_tier(client, make_device, make_reading):
+    make_device("tank_a")
+    start = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    _readings(make_reading, start, 3 * 60, step=10)
+
+    result = history(client, ["tank_a"], start, start + timedelta(days=30))
+    assert result["resolution"] == 3600
+    assert [row["readings"] for row in result["rows"]] == [6, 6, 6]
+    assert result["rows"][0]["measurement"] == 16.67  # 0, 10, 20, 30, 40, 0
+    assert result["rows"][0]["created_at"].startswith("2025-08-01T00:00:00")
+
+    raw = history(client, ["tank_a"], start, start + timedelta(hours=1))
+    assert raw["resolution"] == 0
+    assert len(raw["rows"]) == 6
+
+
+def test_rebuild_after_delete_and_prune(client, db, make_device, make_reading):
+    make_device("tank_a")
+    start = datetime(2025, 8, 1, tzinfo=timezone.utc)
+    readings = _readings(make_reading, start, 30)
+    client.delete("sensor_data", {"id": f"eq.{readings[0]['id']}"})
+
+    assert rebuild(client, ["tank_a"], start, start + timedelta(minutes=5)) == 29
+    hourly = db.rows("sensor_rollups", "where resolution = 3600")
+    assert [row["readings"] for row in hourly] == [29]
+    assert len(db.rows("sensor_rollups", "where resolution = 60")) == 29
+
+    # 2025 minute and 15 minute buckets are past their retention; hourly ones are kept
+    assert prune(client) == 29 + 2
+    assert {row["resolution"] for row in db.rows("sensor_rollups")} == {3600}
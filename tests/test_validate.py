@@ -0,0 +1,91 @@
+"""
+Pre-flight validation of bulk writes
+"""
+import pytest
+
+from gas_sight.changes import Change
+from gas_sight.validate import DeviceRegistry, validate_devices, validate_readings, write_valid
+
+from conftest import DATA_CHARACTERISTIC_UUID, SERVICE_UUID
+
+
+def _reading(device_id="tank_a", **overrides):
+    return {"device_id": device_id, "title_name": "Tank", "tank_level": 40.0, "updated_refresh": "now",
+            "battery": "Ok", "connection_strength": 70, "measurement": 50.0, **overrides}
+
+
+def _device(device_id, mac):
+    return {"id": device_id, "name": f"@{device_id}", "mac_address": mac, "title": device_id,
+            "service_uuid": SERVICE_UUID, "data_characteristic_uuid": DATA_CHARACTERISTIC_UUID}
+
+
+BAD_READINGS = [
+    _reading(),
+    _reading(battery="Empty"),
+    _reading(connection_strength=101),
+    _reading(connection_strength=50.5, measurement="high"),
+    _reading("tank_x"),
+    _reading(title_name=None, created_at="yesterday"),
+    _reading(id="00000000-0000-0000-0000-000000000001"),
+    _reading(id="00000000-0000-0000-0000-000000000001", created_at="2025-08-14T10:00:00Z"),
+]
+
+
+def test_readings_are_split_with_reasons():
+    registry = DeviceRegistry(devices=[{"id": "tank_a", "mac_address": "C5:BA:A0:16:CF:01"}])
+    result = validate_readings(BAD_READINGS, registry, use_numpy=False)
+
+    assert [r.index for r in result.rejected] == [1, 2, 3, 4, 5, 7]
+    reasons = {r.index: r.reasons for r in result.rejected}
+    assert reasons[1] == ["battery must be one of Full, Ok, Low"]
+    assert reasons[2] == reasons[3][:1] == ["connection_strength must be an integer between 0 and 100"]
+    assert reasons[3][1] == "measurement must be a number"
+    assert reasons[4] == ["device_id is not a known device"]
+    assert reasons[5] == ["title_name is required", "created_at must be an ISO-8601 timestamp"]
+    assert reasons[7] == ["id duplicates row 6"]
+    assert len(result.valid) == 2 and not result.ok
+
+
+def test_numpy_matches_pure_python():
+    pytest.importorskip("numpy")
+    registry = DeviceRegistry(devices=[{"id": "tank_a", "mac_address": "C5:BA:A0:16:CF:01"}])
+    devices = [_device("a", "aa:bb:cc:dd:ee:01"), _device("b", "AA:BB:CC:DD:EE:01"), _device("c", "nope")]
+    assert validate_readings(BAD_READINGS, registry, use_numpy=True) == \
+        validate_readings(BAD_READINGS, registry, use_numpy=False)
+    assert validate_devices(devices, registry, use_numpy=True) == \
+        validate_devices(devices, registry, use_numpy=False)
+
+
+def test_devices_check_macs_within_the_batch_and_the_registry(client, make_device):
+    make_device("tank_a", mac_address="C5:BA:A0:16:CF:01")
+    registry = DeviceRegistry(client)
+    batch = [
+        _device("tank_b", "AA:BB:CC:DD:EE:01"),
+        _device("tank_c", "aa:bb:cc:dd:ee:01"),
+        _device("tank_d", "AABBCCDDEE02"),
+        _device("tank_a", "C5:BA:A0:16:CF:01"),
+        _device("tank_e", "c5:ba:a0:16:cf:01"),
+    ]
+
+    stored, rejected = write_valid(client, "devices", batch, registry, use_numpy=False,
+                                   on_conflict="id", resolution="merge")
+
+    assert [row["id"] for row in stored] == ["tank_b", "tank_a"]
+    assert [(r.index, r.reasons) for r in rejected] == [
+        (1, ["mac_address duplicates row 0"]),
+        (2, ["mac_address must look like AA:BB:CC:DD:EE:FF"]),
+        (4, ["mac_address duplicates row 3", "mac_address belongs to device tank_a"]),
+    ]
+
+
+def test_registry_follows_changes_and_writes_reach_the_database_once(client, make_device):
+    make_device("tank_a")
+    registry = DeviceRegistry(client)
+    stored, rejected = write_valid(client, "sensor_data", [_reading("tank_b"), _reading()], registry)
+    assert len(stored) == 1 and rejected[0].index == 0
+
+    make_device("tank_b")
+    registry.on_change(Change("devices", "INSERT", record={"id": "tank_b", "mac_address": "x"}))
+    registry.on_change(Change("devices", "DELETE", old_record={"id": "tank_a"}))
+    assert registry.ids() == {"tank_b"}
+    assert validate_readings([_reading("tank_b")], registry).ok
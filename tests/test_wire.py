@@ -0,0 +1,72 @@
+"""
+Lean projections and columnar wire formats
+"""
+import base64
+import json
+
+import pytest
+
+from gas_sight.wire import PROJECTIONS, fetch_csv, pack, sensor_columns, unpack
+
+
+def test_packed_round_trip_keeps_nulls_and_labels():
+    rows = [
+        {"id": "0b6f1c3e-0000-4000-8000-000000000001", "device_id": "tank_b",
+         "created_at": "2025-08-14T10:00:00.250000+00:00", "measurement": 82.3,
+         "tank_level": None, "connection_strength": 95, "battery": "Low"},
+        {"id": "0b6f1c3e-0000-4000-8000-000000000002", "device_id": "tank_x",
+         "created_at": "2025-08-14T10:01:00+00:00", "measurement": 81.9,
+         "tank_level": 98.3, "connection_strength": 0, "battery": None},
+    ]
+
+    columns = unpack(json.loads(json.dumps(pack(rows, ["tank_a", "tank_b"]))))
+
+    assert columns["id"] == [r["id"] for r in rows]
+    assert columns["created_at"] == [1755165600250, 1755165660000]
+    assert columns["device"] == ["tank_b", None]
+    assert columns["measurement"] == [82.3, 81.9]
+    assert columns["tank_level"] == [None, 98.3]
+    assert columns["battery"] == ["Low", None]
+
+
+def test_unpack_accepts_postgres_line_wrapped_base64():
+    payload = pack([{"id": "0b6f1c3e-0000-4000-8000-%012d" % n, "device_id": "tank_a",
+                     "created_at": "2025-08-14T10:00:00+00:00", "measurement": float(n),
+                     "tank_level": 1.0, "connection_strength": 50, "battery": "Ok"}
+                    for n in range(20)], ["tank_a"])
+    data = payload["columns"]["measurement"]["data"]
+    payload["columns"]["measurement"]["data"] = "\n".join(data[i:i + 76] for i in range(0, len(data), 76))
+
+    assert unpack(payload)["measurement"] == [float(n) for n in range(20)]
+    assert len(base64.b64decode(data)) == 20 * 8
+
+
+def test_sensor_columns_rpc_matches_the_row_api(client, make_device, make_reading):
+    make_device("tank_a")
+    make_device("tank_b")
+    for minute, device_id in enumerate(("tank_a", "tank_b", "tank_a")):
+        make_reading(device_id, created_at=f"2025-08-14T10:0{minute}:00+00:00", measurement=50.0 + minute)
+    make_reading("tank_a", created_at="2025-08-15T00:00:00+00:00")
+
+    points = sensor_columns(client, ["tank_a"], "2025-08-14T00:00:00Z", "2025-08-15T00:00:00Z")
+    rows = client.select("sensor_data", PROJECTIONS["chart_point"], {"device_id": "eq.tank_a",
+                         "created_at": "lt.2025-08-15T00:00:00Z"}, order="created_at,id")
+
+    assert [p["id"] for p in points] == [r["id"] for r in rows]
+    assert [p["measurement"] for p in points] == [50.0, 52.0]
+    assert points[0]["created_at"] == "2025-08-14T10:00:00+00:00"
+
+
+def test_csv_projection(client, make_device, make_reading):
+    make_device("tank_a")
+    make_reading("tank_a", measurement=12.5, connection_strength=40)
+
+    columns = fetch_csv(client, "sensor_data", "chart_point")
+
+    assert list(columns) == PROJECTIONS["chart_point"].split(",")
+    assert (columns["measurement"], columns["connection_strength"]) == ([12.5], [40])
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        unpack({"format": "packed-v9", "rows": 0, "columns": {}})
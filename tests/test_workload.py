@@ -0,0 +1,90 @@
+"""
+Recording the REST workload and replaying it against the stand-in
+"""
+import json
+
+import pytest
+
+from gas_sight.metrics import MetricsRegistry, default_rest_metrics
+from gas_sight.rest import RestClient, RestError
+from gas_sight.workload import Replayer, WorkloadRecorder, load, local_client, reads, summarize
+
+
+def _record(path, client):
+    recorder = WorkloadRecorder(path)
+    client = RestClient(transport=client.transport, observers=[default_rest_metrics(), recorder])
+    client.insert("devices", {"id": "tank_a", "name": "@A", "mac_address": "aa:bb:cc:dd:ee:01",
+                              "title": "A", "location": "Yard"})
+    for device_id in ("tank_a", "tank_b"):
+        client.select("sensor_data", "*", {"device_id": f"eq.{device_id}"},
+                      order="created_at.desc", limit=50)
+    client.rpc("get_device_stats")
+    recorder.close()
+
+
+def test_recorder_writes_normalized_traces_without_credentials(tmp_path, client):
+    path = tmp_path / "trace.jsonl"
+    _record(path, client)
+
+    traces = load(path)
+    assert [t["endpoint"] for t in traces] == ["devices", "sensor_data", "sensor_data", "rpc/get_device_stats"]
+    select = traces[1]
+    assert select["shape"] == "select=*&device_id=eq&order=created_at.desc&limit"
+    assert select["query"].endswith("device_id=eq.tank_a&order=created_at.desc&limit=50")
+    assert select["status"] == 200 and select["seconds"] >= 0 and select["response_bytes"] > 0
+    assert json.loads(traces[0]["body"])["id"] == "tank_a"
+    assert traces[0]["prefer"] == "return=representation" and traces[0]["request_bytes"] > 0
+    assert "Bearer" not in path.read_text() and "apikey" not in path.read_text()
+    assert summarize(traces)["GET sensor_data?select=*&device_id=eq&order=created_at.desc&limit"] == 2
+
+
+def test_replay_reports_latency_and_errors_per_shape(tmp_path, client):
+    path = tmp_path / "trace.jsonl"
+    _record(path, client)
+    traces = load(path)
+
+    target = local_client()
+    report = Replayer(target, speed=None, concurrency=2, registry=MetricsRegistry()).replay(traces)
+    assert report.requests == 4 and report.errors == 0
+    shapes = report.to_dict()["shapes"]
+    assert shapes["GET sensor_data?select=*&device_id=eq&order=created_at.desc&limit"]["requests"] == 2
+    assert "recorded_p95_ms" in shapes["POST rpc/get_device_stats"]
+    assert target.select("devices", "id") == [{"id": "tank_a"}]
+
+    again = Replayer(target, speed=None, registry=MetricsRegistry()).replay(traces)
+    assert again.errors == 1
+    assert again.shapes["POST devices"].errors == {"409 23505": 1}
+
+
+def test_replay_keeps_recorded_spacing_divided_by_speed():
+    traces = [{"at": 100.0 + n * 10, "method": "GET", "path": "/rest/v1/devices", "query": "select=id"}
+              for n in range(3)]
+    now, waits = [0.0], []
+
+    def sleep(seconds):
+        waits.append(round(seconds, 6))
+        now[0] += seconds
+
+    replayer = Replayer(local_client(), speed=10, concurrency=1, registry=MetricsRegistry(),
+                        clock=lambda: now[0], sleep=sleep)
+    report = replayer.replay(traces)
+    assert waits == [1.0, 1.0]
+    assert report.requests == 3 and report.wall_seconds == 2.0
+
+
+def test_malformed_queries_are_still_recorded(tmp_path, client):
+    path = tmp_path / "trace.jsonl"
+    with WorkloadRecorder(path) as recorder:
+        recording = RestClient(transport=client.transport, observers=[recorder])
+        with pytest.raises(RestError):
+            recording.select("devices", filters={"or": "(id.eq.a"})
+
+    [trace] = load(path)
+    assert trace["shape"] == "other" and trace["status"] == 400
+
+
+def test_only_reads_are_replayed_against_a_live_project(tmp_path, client):
+    path = tmp_path / "trace.jsonl"
+    _record(path, client)
+
+    assert [t["endpoint"] for t in reads(load(path))] == ["sensor_data", "sensor_data"]